@@ -4,19 +4,29 @@
 
 import argparse
 import datetime
+import math
+import multiprocessing as mp
 import os
 import shutil
 import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import pyproj
-import rioxarray
+import rasterio
+import rasterio.features
+import rasterio.windows
 import tqdm
-import xarray as xr
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import calculate_default_transform
 from shapely.geometry import mapping
 
+import national_datasets_cache as ndc
+import ras2fim_logger
 import shared_functions as sf
 import shared_variables as sv
 
@@ -25,6 +35,7 @@ import shared_variables as sv
 # null value in the exported DEMs
 INT_NO_DATA_VAL = -9999
 RLOG = sv.R2F_LOG
+MP_LOG = ras2fim_logger.RAS2FIM_logger()  # the mp version
 pd.options.mode.chained_assignment = None
 
 
@@ -38,6 +49,100 @@ def fn_is_valid_file(parser, arg):
         # return open(arg, 'r')  # return an open file handle
 
 
+# -------------------------------------------------
+def mp_clip_dem_for_model(var_d: dict):
+    # Clips (and reprojects) the terrain DEM for one model.
+    # Only the part of the source DEM covering the model domain is read.
+
+    # This function is included as part of a multiproc so each process needs to have
+    # it's own instance of ras2fim logger.
+
+    try:
+        model_id = var_d["model_id"]
+        model_geometries = var_d["model_geometries"]
+        model_crs = var_d["model_crs"]
+        terrain_file_path = var_d["terrain_file_path"]
+        output_dir = var_d["output_dir"]
+        model_unit = var_d["model_unit"]
+
+        file_id = sf.get_date_with_milli()
+        log_file_name = f"{var_d['log_file_prefix']}-{file_id}.log"
+        MP_LOG.setup(os.path.join(var_d["rlog_file_path"], log_file_name))
+
+        MP_LOG.trace(f"Processing model_id of {model_id}")
+
+        with rasterio.open(terrain_file_path) as src:
+            # The VRT grid is the grid a full reprojection of the DEM gets (what rio.reproject
+            # did before), so the output pixels line up the same way.
+            dem_transform, dem_width, dem_height = calculate_default_transform(
+                src.crs, model_crs, src.width, src.height, *src.bounds
+            )
+            vrt_nodata = src.nodata
+            if (vrt_nodata is None) and (np.dtype(src.dtypes[0]).kind == "f"):
+                vrt_nodata = np.nan  # so areas outside the DEM are not read as 0
+
+            with WarpedVRT(
+                src,
+                crs=model_crs,
+                transform=dem_transform,
+                width=dem_width,
+                height=dem_height,
+                nodata=vrt_nodata,
+                resampling=Resampling.nearest,
+            ) as vrt:
+                # only the window of the VRT that covers the model domain is read (and reprojected)
+                window = rasterio.features.geometry_window(vrt, model_geometries)
+                arr_dem = vrt.read(1, window=window, masked=True)
+                window_transform = vrt.window_transform(window)
+                dem_crs = vrt.crs
+
+        # the pixels whose centers are in the model domain, the same as rio.clip did
+        arr_in_domain = rasterio.features.geometry_mask(
+            model_geometries, arr_dem.shape, window_transform, invert=True
+        )
+        if bool(arr_in_domain.any()) is False:
+            raise Exception(f"The model domain of model_id {model_id} does not cover any DEM pixel")
+
+        # drop the rows and columns with no pixels in the model domain, the same as rio.clip did
+        data_window = rasterio.windows.get_data_window(np.ma.masked_array(arr_in_domain, ~arr_in_domain))
+        row_slice, col_slice = data_window.toslices()
+        arr_dem = arr_dem[row_slice, col_slice]
+        arr_in_domain = arr_in_domain[row_slice, col_slice]
+        clip_transform = rasterio.windows.transform(data_window, window_transform)
+
+        arr_nodata = np.ma.getmaskarray(arr_dem) | ~arr_in_domain | np.isnan(arr_dem.data)
+        arr_clipped = arr_dem.data.astype("float32")
+        if model_unit == "feet":
+            arr_clipped = arr_clipped * np.float32(3.28084)
+        arr_clipped[arr_nodata] = INT_NO_DATA_VAL
+
+        str_dem_out = os.path.join(output_dir, str(model_id) + ".tif")
+        with rasterio.open(
+            str_dem_out,
+            "w",
+            driver="GTiff",
+            height=arr_clipped.shape[0],
+            width=arr_clipped.shape[1],
+            count=1,
+            dtype="float32",
+            crs=dem_crs,
+            transform=clip_transform,
+            nodata=INT_NO_DATA_VAL,
+            compress="lzw",
+        ) as dst:
+            dst.write(arr_clipped, 1)
+
+        return True
+
+    except Exception:
+        if MP_LOG.LOG_SYSTEM_IS_SETUP is True:
+            MP_LOG.error(f"An error occurred while clipping the DEM for model_id {var_d['model_id']}")
+            MP_LOG.error(traceback.format_exc())
+        else:
+            print(traceback.format_exc())
+        return False
+
+
 # -------------------------------------------------
 def fn_cut_dems_from_shapes(
     huc8,
@@ -122,9 +227,10 @@ def fn_cut_dems_from_shapes(
     # read models xsections
     gdf_xs_lines = gpd.read_file(cross_sections_file_path)
 
-    # read HUC12s
-    RLOG.lprint("Reading HUC12 polygons for CONUS...this may take a few minutes")
-    gdf_huc12s = gpd.read_file(huc12_features_file)
+    # read HUC12s, only the ones in the bounding box of the cross sections (from the WBD huc8 cache
+    # if it has been made, see tools/preprocess_national_datasets.py)
+    RLOG.lprint("Reading HUC12 polygons...this may take a few minutes")
+    gdf_huc12s = ndc.fn_read_huc8_layer(huc12_features_file, bbox=gdf_xs_lines)
 
     # important to reproject to model crs especially if the inputs
     # HUC12s are for the entire US with geographic crs
@@ -138,19 +244,12 @@ def fn_cut_dems_from_shapes(
         conflated_models, on='ras_path', how='inner'
     )  # this filters conflated xsections
 
-    # read dem as Xarray DataArray.use rio for reproject,crop, save. The rest is Xr DataArray operations.
-    dem = rioxarray.open_rasterio(terrain_file_path)
-    dem = dem.rio.reproject(gdf_huc12s.crs)
-
-    # note that because of the large size of the input DEM, there is no benefit in using multiprocessing here
-    for model_id in tqdm.tqdm(
-        conflated_model_ids,
-        total=len(conflated_model_ids),
-        desc="Clipping DEMs",
-        bar_format="{desc}:({n_fmt}/{total_fmt})|{bar}| {percentage:.1f}%",
-        ncols=65,
-    ):
-        RLOG.trace(f"Processing model_id of {model_id}")
+    # Each model is clipped in its own process. Each process reads only the DEM window
+    # that covers its model domain, reprojecting that window on the fly through a WarpedVRT.
+    # The full HUC DEM is never loaded or reprojected in memory, so memory use does not
+    # grow with the size of the HUC.
+    clip_args = []
+    for model_id in conflated_model_ids:
         this_model_xsections = gdf_xs_lines[gdf_xs_lines['model_id'] == model_id]
 
         # find HUC12s intersected with this model xsections
@@ -161,21 +260,44 @@ def fn_cut_dems_from_shapes(
             gdf_intersected_hucs.loc[:, 'dissolve_index'] = 1
             gdf_intersected_hucs = gdf_intersected_hucs.dissolve(by="dissolve_index").reset_index()
 
-        # now clip dem with rio and the intersected HUC12s
-        clipped_dem = dem.rio.clip(gdf_intersected_hucs.geometry.apply(mapping))
-
-        if model_unit == "feet":
-            clipped_dem = xr.where(
-                clipped_dem == clipped_dem.rio.nodata, INT_NO_DATA_VAL, clipped_dem * 3.28084
-            )
-
-        # xr.where operation above may remove the attributes (nodata, crs) so always reassign them as below
-        clipped_dem = clipped_dem.assign_attrs({'_FillValue': INT_NO_DATA_VAL})
-        if clipped_dem.rio.crs is None:
-            clipped_dem.rio.write_crs(gdf_huc12s.crs, inplace=True)
-
-        str_dem_out = os.path.join(output_dir, str(model_id) + ".tif")
-        clipped_dem.rio.to_raster(str_dem_out, compress="lzw", dtype="float32")
+        clip_args.append(
+            {
+                "model_id": model_id,
+                "model_geometries": list(gdf_intersected_hucs.geometry.apply(mapping)),
+                "model_crs": gdf_huc12s.crs.to_wkt(),
+                "terrain_file_path": terrain_file_path,
+                "output_dir": output_dir,
+                "model_unit": model_unit,
+                "log_file_prefix": "mp_clip_dem_for_model",
+                "rlog_file_path": RLOG.LOG_DEFAULT_FOLDER,
+            }
+        )
+
+    num_processors = max(1, round(math.floor(mp.cpu_count() * 0.85)))
+    failed_model_ids = []
+    with ProcessPoolExecutor(max_workers=num_processors) as executor:
+        futures = {
+            executor.submit(mp_clip_dem_for_model, arg_item): arg_item["model_id"] for arg_item in clip_args
+        }
+
+        for future in tqdm.tqdm(
+            as_completed(futures),
+            total=len(futures),
+            desc="Clipping DEMs",
+            bar_format="{desc}:({n_fmt}/{total_fmt})|{bar}| {percentage:.1f}%",
+            ncols=65,
+        ):
+            if future.exception() is not None or future.result() is False:
+                failed_model_ids.append(futures[future])
+
+    # Now that multi-proc is done, lets merge all of the independent log file from each
+    RLOG.merge_log_files(RLOG.LOG_FILE_PATH, "mp_clip_dem_for_model")
+
+    # Fail the step, so it is not recorded as complete (ie. by step_manifest) with DEMs missing
+    if len(failed_model_ids) > 0:
+        msg = f"DEMs could not be clipped for model ids: {sorted(failed_model_ids)}"
+        RLOG.critical(msg)
+        raise Exception(msg)
 
     RLOG.success("COMPLETE")
     flt_end_run = time.time()
@@ -3,105 +3,146 @@
 
 import argparse
 import datetime as dt
-import multiprocessing as mp
 import os
 import sys
+import time
 import traceback
 
-# import warnings
-from functools import partial
-from multiprocessing import Pool
-from time import sleep
-
 import geopandas as gpd
 
 # may need to pip install netcdf4 for xarray
 import numpy as np
 import pandas as pd
-import tqdm
-import xarray as xr
+import shapely
 from fiona import collection
-from geopandas.tools import sjoin
-from shapely import wkt
 from shapely.geometry import Point, mapping
 
-import ras2fim_logger
+import national_datasets_cache as ndc
 import shared_functions as sf
 import shared_variables as sv
 
 
 # Global Variables
 RLOG = sv.R2F_LOG
-MP_LOG = ras2fim_logger.RAS2FIM_logger()  # the mp version
-
-
-# -------------------------------------------------
-def fn_wkt_loads(x):
-    try:
-        return wkt.loads(x)
-    except Exception as ex:
-        RLOG.error("fn_wkt_loads errored out")
-        RLOG.error(x)
-        RLOG.error(f"Details: {ex}")
-        return None
 
 
 # -------------------------------------------------
-def mp_snap_point(shply_line, list_of_df_row):
-    # int_index, int_feature_id, str_huc12, shp_point = list_of_df_row
-    int_index, shp_point, int_feature_id, str_huc12 = list_of_df_row
+def fn_snap_points_to_lines(arr_points, arr_lines):
+    """
+    Overview:
+        Snaps each point to the closest point on the closest line, for all points at one time.
 
-    point_project_wkt = shply_line.interpolate(shply_line.project(shp_point)).wkt
+        An STRtree of the lines finds the closest line to each point, then each point is located
+        along (line_locate_point) and moved onto (line_interpolate_point) its closest line.
+        This is the same as snapping to the union of all of the lines, which has the same shape.
 
-    list_col_names = ["feature_id", "str_huc_12", "geometry_wkt"]
-    df = pd.DataFrame([[int_feature_id, str_huc12, point_project_wkt]], columns=list_col_names)
+    Inputs:
+        - arr_points: array (or GeoSeries) of shapely points
+        - arr_lines: array (or GeoSeries) of shapely lines (LineString or MultiLineString)
 
-    sleep(0.03)  # this allows the tqdm progress bar to update
+    Output:
+        numpy array of the snapped points, in the same order as arr_points.
+        A point is None if it is empty or there are no lines.
+    """
 
-    return df
+    arr_points = np.asarray(arr_points, dtype=object)
+    arr_lines = np.asarray(arr_lines, dtype=object)
 
+    arr_snapped_points = np.full(len(arr_points), None, dtype=object)
+    if len(arr_points) == 0 or len(arr_lines) == 0:
+        return arr_snapped_points
 
-# -------------------------------------------------
-def mp_create_gdf_of_points(rlog_file_path, rlog_file_prefix, tpl_request):
-    # function to create and return a geoDataframe from a list of shapely points
-
-    # This function is included as part of a multiproc so each process needs to have
-    # it's own instance of ras2fim logger.
-    # WHY? this stops file open concurrency as each proc has its own.
-    # We attempt to keep them somewhat sorted by using YYMMDD_HHMMSECMillecond)
+    # the index of each point and of its closest line (one line per point)
+    tree_lines = shapely.STRtree(arr_lines)
+    arr_point_idx, arr_line_idx = tree_lines.query_nearest(arr_points, all_matches=False)
 
-    # global MP
-    # MP_LOG = ras2fim_logger.RAS2FIM_logger()
+    arr_nearest_lines = arr_lines[arr_line_idx]
+    arr_distances = shapely.line_locate_point(arr_nearest_lines, arr_points[arr_point_idx])
+    arr_snapped_points[arr_point_idx] = shapely.line_interpolate_point(arr_nearest_lines, arr_distances)
 
-    try:
-        file_id = sf.get_date_with_milli()
-        log_file_name = f"{rlog_file_prefix}-{file_id}.log"
-        MP_LOG.setup(os.path.join(rlog_file_path, log_file_name))
+    return arr_snapped_points
 
-        feature_id = tpl_request[0]
-        str_huc_12 = tpl_request[1]
-        list_of_points = tpl_request[2]
 
-        MP_LOG.trace(f"feature_id is {feature_id} and huc_12 is {str_huc_12}")
-
-        # Create an empty dataframe
-        df_points_nwm = pd.DataFrame(list_of_points, columns=["geometry"])
+# -------------------------------------------------
+def fn_query_within_distance(tree_geoms, arr_query_geoms, flt_distance):
+    """
+    Overview:
+        Finds every pair of a query geometry and a tree geometry that are within flt_distance
+        of each other (the same as an STRtree "dwithin" query, which needs GEOS 3.10 or newer).
+
+        The tree returns the pairs whose bounding boxes are within the distance, then the
+        exact distance of just those pairs is checked, all at one time.
+
+    Inputs:
+        - tree_geoms: a shapely STRtree of the geometries to search
+        - arr_query_geoms: array (or GeoSeries) of shapely geometries to search for
+        - flt_distance: the max distance, in the geometries' projection units
+
+    Output:
+        A tuple of two numpy arrays, one value per pair: the index of the query geometry in
+        arr_query_geoms and the index of the geometry in the tree
+    """
+
+    arr_query_geoms = np.asarray(arr_query_geoms, dtype=object)
+
+    # each query geometry's bounding box, grown by the distance
+    arr_bounds = shapely.bounds(arr_query_geoms)
+    arr_boxes = shapely.box(
+        arr_bounds[:, 0] - flt_distance,
+        arr_bounds[:, 1] - flt_distance,
+        arr_bounds[:, 2] + flt_distance,
+        arr_bounds[:, 3] + flt_distance,
+    )
+    arr_query_idx, arr_tree_idx = tree_geoms.query(arr_boxes)
 
-        # convert dataframe to geodataframeclear
-        gdf_points_nwm = gpd.GeoDataFrame(df_points_nwm, geometry="geometry")
+    arr_distances = shapely.distance(arr_query_geoms[arr_query_idx], tree_geoms.geometries[arr_tree_idx])
+    arr_is_within = arr_distances <= flt_distance
 
-        gdf_points_nwm["feature_id"] = feature_id
-        gdf_points_nwm["huc_12"] = str_huc_12
+    return arr_query_idx[arr_is_within], arr_tree_idx[arr_is_within]
 
-    except Exception:
-        if ras2fim_logger.LOG_SYSTEM_IS_SETUP is True:
-            MP_LOG.critical(traceback.format_exc())
-        else:
-            print(traceback.format_exc())
 
-        sys.exit(1)
+# -------------------------------------------------
+def fn_densify_lines(arr_lines, flt_distance_delta):
+    """
+    Overview:
+        Creates points along all of the lines at one time: a point every flt_distance_delta
+        along each line (starting at 0), then one more point at the lower left (min x, min y)
+        corner of the line's end points.
+
+    Inputs:
+        - arr_lines: array (or GeoSeries) of shapely LineStrings
+        - flt_distance_delta: distance between points, in the lines' projection units
+
+    Output:
+        A tuple of numpy arrays, one value per point, in line order:
+            - arr_points: the shapely points
+            - arr_line_idx: the index (position) of the point's line in arr_lines
+            - arr_distances: the distance along the line (NaN for the end point corner)
+    """
+
+    arr_lines = np.asarray(arr_lines, dtype=object)
+
+    # the same number of points as np.arange(0, length, flt_distance_delta) for each line
+    arr_lengths = np.nan_to_num(shapely.length(arr_lines))
+    arr_counts = np.ceil(arr_lengths / flt_distance_delta).astype(np.int64)
+
+    # each line has its points along the line, then its end point corner
+    arr_line_point_counts = arr_counts + 1
+    arr_line_idx = np.repeat(np.arange(len(arr_lines)), arr_line_point_counts)
+    arr_offsets = np.cumsum(arr_line_point_counts) - arr_line_point_counts
+    arr_position = np.arange(arr_line_point_counts.sum()) - np.repeat(arr_offsets, arr_line_point_counts)
+    arr_is_corner = arr_position == arr_counts[arr_line_idx]
+
+    arr_distances = np.where(arr_is_corner, np.nan, arr_position * flt_distance_delta)
+
+    arr_points = np.empty(len(arr_line_idx), dtype=object)
+    arr_points[~arr_is_corner] = shapely.line_interpolate_point(
+        arr_lines[arr_line_idx[~arr_is_corner]], arr_distances[~arr_is_corner]
+    )
+    arr_corners = shapely.bounds(shapely.boundary(arr_lines))[:, :2]
+    arr_points[arr_is_corner] = shapely.points(arr_corners)
 
-    return gdf_points_nwm
+    return arr_points, arr_line_idx, arr_distances
 
 
 # -------------------------------------------------
@@ -139,9 +180,6 @@ def fn_conflate_hecras_to_nwm(huc8, ras_shp_file_dir, conflated_shp_dir, dir_dat
     # Input - National Water Model stream lines geopackage
     str_nwm_flowline_geopkg_path = os.path.join(dir_datasets, sv.INPUT_NWM_FLOWS_FILE)
 
-    # Input - Recurrance Intervals netCDF
-    str_netcdf_path = os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_FILE)
-
     # Geospatial projections
     nwm_prj = "ESRI:102039"
 
@@ -152,10 +190,11 @@ def fn_conflate_hecras_to_nwm(huc8, ras_shp_file_dir, conflated_shp_dir, dir_dat
     INPUT_WBD_HUC8_DIR = "WBD_HUC8"  # Pattern for huc files are 'HUC8_{huc number}.gpkg'
 
     # Use the HUC8 small vector to mask the large full WBD_Nation.gpkg.
-    # This is much faster
+    # This is much faster. If the WBD huc8 cache has been made (tools/preprocess_national_datasets.py),
+    # only this huc8's shard is read.
     wdb_huc8_file = os.path.join(dir_datasets, INPUT_WBD_HUC8_DIR, f"HUC8_{huc8}.gpkg")
     huc8_wbd_db = gpd.read_file(wdb_huc8_file)
-    gdf_ndgplusv21_wbd = gpd.read_file(str_wbd_geopkg_path, mask=huc8_wbd_db)
+    gdf_ndgplusv21_wbd = ndc.fn_read_huc8_layer(str_wbd_geopkg_path, list_huc8s=[huc8], mask=huc8_wbd_db)
 
     list_huc8 = []
     list_huc8.append(huc8)
@@ -209,22 +248,23 @@ def fn_conflate_hecras_to_nwm(huc8, ras_shp_file_dir, conflated_shp_dir, dir_dat
     # Create dataframe of the bounding coordiantes
     tuple_watershed_extents = shp_huc8_union_nwm_prj.bounds
 
-    # Read Geopackage with bounding box filter
-    gdf_stream = gpd.read_file(str_nwm_flowline_geopkg_path, bbox=tuple_watershed_extents)
+    # Read Geopackage with bounding box filter (only this huc8's shard if the nwm flows huc8 cache
+    # has been made)
+    gdf_stream = ndc.fn_read_huc8_layer(
+        str_nwm_flowline_geopkg_path, list_huc8s=[huc8], bbox=tuple_watershed_extents
+    )
 
     # reanme ID to feature_id
     gdf_stream = gdf_stream.rename(columns={"ID": "feature_id"})
 
     # -------------------------------------------------
-    # Load the netCDF file to pandas dataframe - 15 seconds
+    # Load the netCDF (recurrance interval) list of streams in the given huc.
+    # If the huc8 cache has been made (tools/preprocess_national_datasets.py), only this
+    # huc8's records are read, otherwise the netCDF is read lazily for just this huc8.
     RLOG.lprint("+-----------------------------------------------------------------+")
-    RLOG.lprint("Loading the National Water Model Recurrence Flows ~ 15 sec")
+    RLOG.lprint("Loading the National Water Model Recurrence Flows")
 
-    ds = xr.open_dataset(str_netcdf_path)
-    df_all_nwm_streams = ds.to_dataframe()
-
-    # get netCDF (recurrance interval) list of streams in the given huc
-    df_streams_huc_only = df_all_nwm_streams.query("huc8==@list_huc8")
+    df_streams_huc_only = ndc.fn_load_nwm_wbd_lookup_for_huc8(dir_datasets, huc8)
 
     # left join the recurrance stream table (dataFrame) with streams in watershed
     # this will remove the streams not within the HUC-8 boundary
@@ -247,67 +287,40 @@ def fn_conflate_hecras_to_nwm(huc8, ras_shp_file_dir, conflated_shp_dir, dir_dat
     # too small a value creates long buffering times
     int_distance_delta = 150  # distance between points in hec-ras projection units
 
-    int_count = 0
-
     # Multi-Linestrings to Linestrings
     gdf_streams_nwm_explode = gdf_streams_nwm_bleprj.explode(index_parts=True)
 
     # TODO - 2021.08.03 - Quicker to buffer the ras_streams first
     # and get the nwm streams that are inside or touch the buffer?
 
-    list_points_aggregate = []
-    RLOG.lprint("+-----------------------------------------------------------------+")
-
-    for index, row in gdf_streams_nwm_explode.iterrows():
-        str_current_linestring = row["geometry"]
-        distances = np.arange(0, str_current_linestring.length, int_distance_delta)
-        inter_distances = [str_current_linestring.interpolate(distance) for distance in distances]
-        boundary_point = Point(
-            str_current_linestring.boundary.bounds[0], str_current_linestring.boundary.bounds[1]
-        )
-        inter_distances.append(boundary_point)
-
-        tpl_request = (row["feature_id"], row["huc12"], inter_distances)
-        list_points_aggregate.append(tpl_request)
+    # the points are kept in feature_id and huc12 order
+    gdf_streams_nwm_explode = gdf_streams_nwm_explode.sort_values(["feature_id", "huc12"], kind="stable")
 
-    # Create a pool of processors
     RLOG.lprint("+-----------------------------------------------------------------+")
-    RLOG.lprint("start of creating gdf of points")
+    RLOG.lprint("Creating points along the nwm streams")
+    flt_start_densify = time.time()
 
-    # -------------------------------------------------
-    # A "partial" just extends the original function to add extra params on the fly
-    # e.g. The original mp_create_gdf_of_points has only sorted_list_points_aggregate being
-    # passed in. Now, but adding a partial, the args beign passed into mp_create_gdf_of_points
-    # are RLOG.LOG_DEFAULT_FOLDER, log_file_prefix, sorted_list_points_aggregate
-    # Notice.. the partial gets a temp name that gets passed into the function in the pool
-    log_file_prefix = "mp_create_gdf_of_points"
-    fn_create_gdf_of_points_partial = partial(
-        mp_create_gdf_of_points, RLOG.LOG_DEFAULT_FOLDER, log_file_prefix
+    arr_points, arr_line_idx, __ = fn_densify_lines(
+        gdf_streams_nwm_explode.geometry.values, int_distance_delta
     )
-    num_processors = mp.cpu_count() - 2
-    with Pool(processes=num_processors) as executor:
-        # TODO .. not how to sort as it is a list of tuples
-        sorted_list_points_aggregate = sorted(list_points_aggregate)
-
-        len_points_agg = len(sorted_list_points_aggregate)
-
-        list_gdf_points_all_lines = list(
-            tqdm.tqdm(
-                executor.imap(fn_create_gdf_of_points_partial, sorted_list_points_aggregate),
-                total=len_points_agg,
-                desc="Points on lines",
-                bar_format="{desc}:({n_fmt}/{total_fmt})|{bar}| {percentage:.1f}%",
-                ncols=67,
-            )
-        )
 
-    # Now that multi-proc is done, lets merge all of the independent log file from each
-    RLOG.merge_log_files(RLOG.LOG_FILE_PATH, log_file_prefix)
+    gdf_points_nwm = gpd.GeoDataFrame(
+        {
+            "geometry": arr_points,
+            "feature_id": gdf_streams_nwm_explode["feature_id"].values[arr_line_idx],
+            "huc_12": gdf_streams_nwm_explode["huc12"].values[arr_line_idx],
+        },
+        geometry="geometry",
+        crs=ras_prj,
+    )
+
+    RLOG.lprint(
+        f"{len(gdf_points_nwm)} points created along {len(gdf_streams_nwm_explode)} nwm streams"
+        f" in {time.time() - flt_start_densify:.2f} seconds"
+    )
 
     RLOG.lprint("+-----------------------------------------------------------------+")
     RLOG.lprint("Mapping points to nwm streams")
-    gdf_points_nwm = gpd.GeoDataFrame(pd.concat(list_gdf_points_all_lines, ignore_index=True))
-    gdf_points_nwm = gdf_points_nwm.set_crs(ras_prj)
 
     # -------------------------------------------------
     # Read in the model stream shapefile
@@ -322,8 +335,8 @@ def fn_conflate_hecras_to_nwm(huc8, ras_shp_file_dir, conflated_shp_dir, dir_dat
         shp_simplified_line = shp_geom.simplify(flt_tolerance, preserve_topology=False)
         gdf_segments.at[index, "geometry"] = shp_simplified_line
 
-    # create merged geometry of all streams
-    shply_line = gdf_segments.geometry.unary_union
+    # spatial index of the model streams
+    tree_segments = shapely.STRtree(gdf_segments.geometry.values)
 
     # read in the national water model points
     gdf_points = gdf_points_nwm
@@ -332,63 +345,41 @@ def fn_conflate_hecras_to_nwm(huc8, ras_shp_file_dir, conflated_shp_dir, dir_dat
     gdf_points = gdf_points.to_crs(gdf_segments.crs)
 
     RLOG.lprint("+-----------------------------------------------------------------+")
-    RLOG.lprint("Buffering stream centerlines ~ 60 sec")
+    RLOG.lprint("Finding the nwm points near the stream centerlines")
 
     # -------------------------------------------------
-    # buffer the merged stream ceterlines - distance to find valid conflation point
+    # find the points within a distance of the stream centerlines - valid conflation points
     # -------------------------------------------------
-    # distance to buffer around modeled stream centerlines
+    # distance around modeled stream centerlines
     int_buffer_dist = 600
-    shp_buff = shply_line.buffer(int_buffer_dist)
-
-    # convert shapely to geoDataFrame
-    gdf_buff = gpd.GeoDataFrame(geometry=[shp_buff])
-
-    # set the CRS of buff
-    gdf_buff = gdf_buff.set_crs(gdf_segments.crs)
+    arr_point_idx, __ = fn_query_within_distance(tree_segments, gdf_points.geometry.values, int_buffer_dist)
 
-    # spatial join - points in polygon
-    gdf_points_in_poly = sjoin(gdf_points, gdf_buff, how="left")
-
-    # drop all points that are not within polygon
-    gdf_points_within_buffer = gdf_points_in_poly.dropna()
+    # keep the points in their original order, dropping any with missing values
+    gdf_points_within_buffer = gdf_points.iloc[np.unique(arr_point_idx)].dropna()
 
     # need to reindex the returned geoDataFrame
     gdf_points_within_buffer = gdf_points_within_buffer.reset_index()
 
-    # delete the index_right field
-    del gdf_points_within_buffer["index_right"]
-
-    total_points = len(gdf_points_within_buffer)
-
-    df_points_within_buffer = pd.DataFrame(gdf_points_within_buffer)
-
-    list_dataframe_args_snap = df_points_within_buffer.values.tolist()
-
     RLOG.lprint("+-----------------------------------------------------------------+")
-    list_df_points_projected = []
-    with Pool(processes=(mp.cpu_count() - 2)) as executor:
-        list_df_points_projected = list(
-            tqdm.tqdm(
-                executor.imap(partial(mp_snap_point, shply_line), list_dataframe_args_snap),
-                total=total_points,
-                desc="Snap Points",
-                bar_format="{desc}:({n_fmt}/{total_fmt})|{bar}| {percentage:.1f}% ",
-                mininterval=3,
-                maxinterval=3,
-                ncols=67,
-            )
-        )
-    print()
+    RLOG.lprint(f"Snapping {len(gdf_points_within_buffer)} points to the HEC-RAS streams")
 
-    if len(list_df_points_projected) == 0:
+    if len(gdf_points_within_buffer) == 0:
         RLOG.critical("There are no points that can be snapped.")
         RLOG.critical("One possiblility is that you have an incorrect crs.")
         sys.exit(1)
 
-    gdf_points_snap_to_ble = gpd.GeoDataFrame(pd.concat(list_df_points_projected, ignore_index=True))
+    # snap all of the points at one time to the (simplified) model streams
+    arr_snapped_points = fn_snap_points_to_lines(
+        gdf_points_within_buffer.geometry.values, gdf_segments.geometry.values
+    )
 
-    gdf_points_snap_to_ble["geometry"] = gdf_points_snap_to_ble.geometry_wkt.apply(fn_wkt_loads)
+    gdf_points_snap_to_ble = gpd.GeoDataFrame(
+        {
+            "feature_id": gdf_points_within_buffer["feature_id"].values,
+            "str_huc_12": gdf_points_within_buffer["huc_12"].values,
+        },
+        geometry=gpd.GeoSeries(arr_snapped_points),
+    )
     gdf_points_snap_to_ble = gdf_points_snap_to_ble.dropna(subset=["geometry"])
     gdf_points_snap_to_ble = gdf_points_snap_to_ble.set_crs(gdf_segments.crs)
 
@@ -399,20 +390,18 @@ def fn_conflate_hecras_to_nwm(huc8, ras_shp_file_dir, conflated_shp_dir, dir_dat
     gdf_points_snap_to_ble.to_file(str_filepath_ras_points)
 
     # -------------------------------------------------
-    # Buffer the Base Level Engineering streams 0.1 feet (line to polygon)
-    gdf_segments_buffer = gdf_segments
-    gdf_segments["geometry"] = gdf_segments_buffer.geometry.buffer(0.1)
-
-    # Spatial join of the points and buffered stream
-    gdf_ras_points_feature_id = gpd.sjoin(
-        gdf_points_snap_to_ble,
-        gdf_segments_buffer[["geometry", "ras_path"]],
-        how="left",
-        predicate="intersects",
+    # Match the snapped points to the Base Level Engineering streams within 0.1 feet of them
+    arr_snap_point_idx, arr_segment_idx = fn_query_within_distance(
+        tree_segments, gdf_points_snap_to_ble.geometry.values, 0.1
     )
 
-    # delete the wkt_geom field
-    del gdf_ras_points_feature_id["index_right"]
+    # one row per point / stream match
+    gdf_ras_points_feature_id = pd.DataFrame(
+        {
+            "feature_id": gdf_points_snap_to_ble["feature_id"].values[arr_snap_point_idx],
+            "ras_path": gdf_segments["ras_path"].values[arr_segment_idx],
+        }
+    )
 
     # Intialize the variable
     gdf_ras_points_feature_id["count"] = 1
@@ -13,10 +13,12 @@
 
 import argparse
 import datetime
+import multiprocessing as mp
 import os
 import subprocess
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pyproj
 
@@ -27,6 +29,9 @@ import shared_variables as sv
 # Global Variables
 RLOG = sv.R2F_LOG
 
+# max time for one terrain conversion, a RasProcess.exe that runs longer is stopped
+TERRAIN_CONVERT_TIMEOUT_SECONDS = 60 * 60
+
 
 # -------------------------------------------------
 def fn_get_filepaths(str_directory, str_file_suffix):
@@ -73,9 +78,199 @@ def fn_print_progress_bar(
         print("")
 
 
+# -------------------------------------------------
+def fn_get_create_terrain_cmd(str_converter_path, model_unit, str_prj_file, str_out_file_path, str_dem_path):
+    """
+    Overview:
+        Returns the command (list of arguments) to convert one DEM to a HEC-RAS terrain.
+        ie) "C:\\Program Files (x86)\\HEC\\HEC-RAS\\6.3\\RasProcess.exe" CreateTerrain units=Feet
+            stitch=true prj="c:\\ras2fim_data\\output_ras2fim\\12030105_2276_231218
+            \\02_csv_shapes_from_conflation\\12030105_huc_12_ar.prj" out="...\\1234.hdf" "...\\1234.tif"
+
+    Inputs:
+        - str_converter_path: path to RasProcess.exe (or any program that takes the same arguments)
+        - model_unit: "feet" or "meter"
+        - str_prj_file: the projection file of the terrain
+        - str_out_file_path: the terrain (hdf) file to create
+        - str_dem_path: the DEM (tif) to convert
+    """
+
+    str_units = "Feet" if model_unit == "feet" else "Meter"
+
+    return [
+        str_converter_path,
+        "CreateTerrain",
+        f"units={str_units}",
+        "stitch=true",
+        f"prj={str_prj_file}",
+        f"out={str_out_file_path}",
+        str_dem_path,
+    ]
+
+
+# -------------------------------------------------
+def fn_is_output_current(str_source_path, str_output_path):
+    # True if the output file exists and is newer than (or as new as) its source file
+    if os.path.exists(str_output_path) is False:
+        return False
+    return os.path.getmtime(str_output_path) >= os.path.getmtime(str_source_path)
+
+
+# -------------------------------------------------
+def fn_remove_output_files(str_output_path):
+    # Removes an output file and its companion files, the files in the same folder named
+    # after it (ie. 1234.hdf, 1234.vrt and 1234.1234.tif for a RasProcess.exe terrain)
+    str_output_dir = os.path.dirname(str_output_path)
+    if os.path.isdir(str_output_dir) is False:
+        return
+
+    str_output_name = os.path.basename(str_output_path)
+    str_output_stem = os.path.splitext(str_output_name)[0] + "."
+    for file_name in os.listdir(str_output_dir):
+        if file_name == str_output_name or file_name.startswith(str_output_stem):
+            file_path = os.path.join(str_output_dir, file_name)
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
+
+# -------------------------------------------------
+def fn_run_conversion_job(conversion_job, timeout_seconds):
+    """
+    Overview:
+        Runs one conversion command and returns its result.
+
+        Any existing (out of date) output and its companion files are removed first, as
+        RasProcess.exe skips an output that already exists and still returns 0. A failed or
+        timed out conversion also has its output files removed, so it is not taken as current
+        on the next run.
+
+    Inputs:
+        - conversion_job: dictionary of source (file path), output (file path) and cmd (list)
+        - timeout_seconds: the max time the command can run for (None for no limit)
+
+    Output:
+        A dictionary of source, output, status ("converted", "failed" or "timed_out"),
+        seconds and error (message, "" if converted)
+    """
+
+    flt_start_time = time.time()
+    conversion_result = {
+        "source": conversion_job["source"],
+        "output": conversion_job["output"],
+        "status": "converted",
+        "seconds": 0,
+        "error": "",
+    }
+
+    try:
+        fn_remove_output_files(conversion_job["output"])
+
+        completed_process = subprocess.run(
+            conversion_job["cmd"], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout_seconds
+        )
+        if completed_process.returncode != 0:
+            conversion_result["status"] = "failed"
+            str_stderr = completed_process.stderr.decode("utf-8", "ignore").strip()
+            conversion_result["error"] = f"return code of {completed_process.returncode}. {str_stderr}"
+        elif os.path.exists(conversion_job["output"]) is False:
+            conversion_result["status"] = "failed"
+            conversion_result["error"] = "the output file was not created"
+
+    except subprocess.TimeoutExpired:
+        # subprocess.run has already stopped the process
+        conversion_result["status"] = "timed_out"
+        conversion_result["error"] = f"timed out after {timeout_seconds} seconds"
+
+    except Exception as ex:
+        conversion_result["status"] = "failed"
+        conversion_result["error"] = str(ex)
+
+    if conversion_result["status"] != "converted":
+        try:
+            fn_remove_output_files(conversion_job["output"])
+        except Exception as ex:
+            conversion_result["error"] += f". The output files could not be removed: {ex}"
+
+    conversion_result["seconds"] = time.time() - flt_start_time
+    return conversion_result
+
+
+# -------------------------------------------------
+def fn_run_conversion_jobs(list_conversion_jobs, num_workers=None, timeout_seconds=None, str_prefix=""):
+    """
+    Overview:
+        Runs a batch of conversion commands, at most num_workers at a time. A job whose output
+        is already newer than its source is skipped. A failed or timed out job does not stop
+        the batch, all of the results are returned.
+
+        The commands are separate processes, so the jobs are run from threads that just wait
+        on them.
+
+    Inputs:
+        - list_conversion_jobs: list of dictionaries of source, output and cmd
+            (see fn_run_conversion_job)
+        - num_workers: OPTIONAL: the max number of jobs running at a time. Defaults to the
+            number of cpus less 2
+        - timeout_seconds: OPTIONAL: the max time for each job (None for no limit)
+        - str_prefix: OPTIONAL: progress bar prefix
+
+    Output:
+        A list of results (see fn_run_conversion_job), in the same order as the jobs.
+        A skipped job has a status of "skipped".
+    """
+
+    if num_workers is None:
+        num_workers = max(1, mp.cpu_count() - 2)
+
+    list_results = [None] * len(list_conversion_jobs)
+    dict_jobs_to_run = {}
+    for job_idx, conversion_job in enumerate(list_conversion_jobs):
+        if fn_is_output_current(conversion_job["source"], conversion_job["output"]):
+            list_results[job_idx] = {
+                "source": conversion_job["source"],
+                "output": conversion_job["output"],
+                "status": "skipped",
+                "seconds": 0,
+                "error": "",
+            }
+        else:
+            dict_jobs_to_run[job_idx] = conversion_job
+
+    int_skipped = len(list_conversion_jobs) - len(dict_jobs_to_run)
+    if int_skipped > 0:
+        RLOG.lprint(f"{int_skipped} outputs are already newer than their source and are skipped")
+
+    len_jobs_to_run = len(dict_jobs_to_run)
+    if len_jobs_to_run == 0:
+        return list_results
+
+    int_count = 0
+    fn_print_progress_bar(0, len_jobs_to_run, prefix=str_prefix, suffix="Complete", length=29)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures_dict = {
+            executor.submit(fn_run_conversion_job, conversion_job, timeout_seconds): job_idx
+            for job_idx, conversion_job in dict_jobs_to_run.items()
+        }
+
+        for future in as_completed(futures_dict):
+            list_results[futures_dict[future]] = future.result()
+            int_count += 1
+            fn_print_progress_bar(int_count, len_jobs_to_run, prefix=str_prefix, suffix="Complete", length=29)
+
+    return list_results
+
+
 # -------------------------------------------------
 def fn_convert_tif_to_ras_hdf5(
-    str_hec_path, str_geotiff_dir, str_dir_to_write_hdf5, str_projection, model_unit
+    str_hec_path,
+    str_geotiff_dir,
+    str_dir_to_write_hdf5,
+    str_projection,
+    model_unit,
+    str_converter_path=None,
+    num_workers=None,
+    timeout_seconds=TERRAIN_CONVERT_TIMEOUT_SECONDS,
 ):
     # ~~~~~~~~~~~~~~~~~~~~~~~~
     # INPUT
@@ -94,6 +289,12 @@ def fn_convert_tif_to_ras_hdf5(
     # STR_HEC_RAS_6_PATH = r'C:\Program Files (x86)\HEC\HEC-RAS\6.3'
     STR_HEC_RAS_6_PATH += r"\RasProcess.exe"
 
+    # A different converter (with the same arguments as RasProcess.exe) can be used instead,
+    # ie) a stand in program for testing.
+    if str_converter_path is None:
+        str_converter_path = STR_HEC_RAS_6_PATH
+    RLOG.lprint(f"  ---(c) TERRAIN CONVERTER: {str_converter_path}")
+
     # path to walk to file geotiffs
     STR_CONVERT_FILEPATH = str_geotiff_dir
     RLOG.lprint(f"  ---(i) GEOTIFF INPUT PATH: {STR_CONVERT_FILEPATH}")
@@ -116,51 +317,39 @@ def fn_convert_tif_to_ras_hdf5(
     RLOG.lprint(f"Number of dems to convert to hdf5 is {len(list_processed_dems)}")
     print()
 
-    str_prefix = "Converting Terrains: "
-    fn_print_progress_bar(0, len_processed_dems, prefix=str_prefix, suffix="Complete", length=29)
-
-    int_count = 0
-    int_valid_count = 0
-
-    # Build a CLI call for RasProcess.exe CreateTerrain for each dem
-    cli_command_base = f"\"{STR_HEC_RAS_6_PATH}\" CreateTerrain"
-    cli_command_base += " units="
-    if model_unit == "feet":
-        cli_command_base += "Feet"
-    else:
-        cli_command_base += "Meter"
-    cli_command_base += " stitch=true"
-    cli_command_base += f" prj=\"{STR_PRJ_FILE}\""
-    # ie) '"C:\\Program Files (x86)\\HEC\\HEC-RAS\\6.3\\RasProcess.exe" CreateTerrain units=Feet stitch=true
-    #  prj="c:\\ras2fim_data\\output_ras2fim\\12030105_2276_231218
-    #      \\02_csv_shapes_from_conflation\\12030105_huc_12_ar.prj"
-
+    # One RasProcess.exe CreateTerrain job for each dem
+    list_conversion_jobs = []
     for dem_path in list_processed_dems:
-        int_count += 1
-
-        fn_print_progress_bar(int_count, len_processed_dems, prefix=str_prefix, suffix="Complete", length=29)
-
         dem_file_name = os.path.basename(dem_path)
         dem_file_name = dem_file_name.replace(".tif", ".hdf")
         out_file_path = os.path.join(STR_RAS_TERRAIN_OUT, dem_file_name)
 
-        cli_cmd = f"{cli_command_base} out=\"{out_file_path}\" \"{dem_path}\""
+        list_conversion_jobs.append(
+            {
+                "source": dem_path,
+                "output": out_file_path,
+                "cmd": fn_get_create_terrain_cmd(
+                    str_converter_path, model_unit, STR_PRJ_FILE, out_file_path, dem_path
+                ),
+            }
+        )
 
-        int_return_code = subprocess.check_call(cli_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-        if int_return_code == 0:
-            int_valid_count += 1
-        else:
-            RLOG.error(f"Error on: {dem_path} ({STR_CONVERT_FILEPATH})")
+    list_results = fn_run_conversion_jobs(
+        list_conversion_jobs, num_workers, timeout_seconds, str_prefix="Converting Terrains: "
+    )
 
-        # A '0' error code will be given if the file already exists in the
-        # output directory.  Terrain will not be over-written with this
-        # routine.  It will be skipped.
+    list_failed_results = [result for result in list_results if result["status"] in ["failed", "timed_out"]]
+    int_converted = len([result for result in list_results if result["status"] == "converted"])
+    int_skipped = len([result for result in list_results if result["status"] == "skipped"])
 
     RLOG.lprint("+-----------------------------------------------------------------+")
-    if int_valid_count == len(list_processed_dems):
-        RLOG.success("All terrains processed successfully")
-    else:
-        RLOG.error(F"Errors when processing {STR_CONVERT_FILEPATH} - Check output or logs")
+    RLOG.lprint(
+        f"Terrains converted: {int_converted}, skipped (already current): {int_skipped},"
+        f" failed: {len(list_failed_results)} of {len_processed_dems}"
+    )
+
+    for result in list_failed_results:
+        RLOG.error(f"Error on: {result['source']} ({result['status']}): {result['error']}")
 
     flt_end_convert_tif = time.time()
     flt_time_convert_tif = (flt_end_convert_tif - flt_start_convert_tif) // 1
@@ -169,6 +358,16 @@ def fn_convert_tif_to_ras_hdf5(
 
     RLOG.lprint("===================================================================")
 
+    if len(list_failed_results) > 0:
+        raise Exception(
+            f"{len(list_failed_results)} of {len_processed_dems} terrains could not be converted"
+            f" in {STR_CONVERT_FILEPATH} - Check output or logs"
+        )
+
+    RLOG.success("All terrains processed successfully")
+
+    return list_results
+
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 if __name__ == "__main__":
@@ -220,12 +419,47 @@ if __name__ == "__main__":
         type=str,
     )
 
+    parser.add_argument(
+        "-c",
+        dest="str_converter_path",
+        help="Optional: path to a program to use instead of RasProcess.exe (it is called with"
+        " the same arguments). ie) a stand in program for testing",
+        required=False,
+        default=None,
+        metavar="FILE PATH",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-w",
+        dest="num_workers",
+        help="Optional: max number of terrains converted at a time. Defaults to the number of cpus less 2",
+        required=False,
+        default=None,
+        metavar="",
+        type=int,
+    )
+
+    parser.add_argument(
+        "-t",
+        dest="timeout_seconds",
+        help="Optional: max number of seconds for one terrain conversion."
+        f" Defaults to {TERRAIN_CONVERT_TIMEOUT_SECONDS}",
+        required=False,
+        default=TERRAIN_CONVERT_TIMEOUT_SECONDS,
+        metavar="",
+        type=int,
+    )
+
     args = vars(parser.parse_args())
 
     str_hec_path = args["str_hec_path"]
     str_geotiff_dir = args["str_geotiff_dir"]
     str_dir_to_write_hdf5 = args["str_dir_to_write_hdf5"]
     str_projection = args["str_projection"]
+    str_converter_path = args["str_converter_path"]
+    num_workers = args["num_workers"]
+    timeout_seconds = args["timeout_seconds"]
 
     # find model unit using the given GIS prj file
     with open(str_projection, "r") as prj_file:
@@ -248,7 +482,14 @@ if __name__ == "__main__":
 
         # call main program
         fn_convert_tif_to_ras_hdf5(
-            str_hec_path, str_geotiff_dir, str_dir_to_write_hdf5, str_projection, model_unit
+            str_hec_path,
+            str_geotiff_dir,
+            str_dir_to_write_hdf5,
+            str_projection,
+            model_unit,
+            str_converter_path,
+            num_workers,
+            timeout_seconds,
         )
 
     except Exception:
@@ -15,8 +15,11 @@ import os
 import shutil
 import time
 import traceback
-from concurrent.futures import ProcessPoolExecutor
 
+import pandas as pd
+
+import hecras_model_checkpoints as hmc
+import hecras_model_scheduler as hms
 import shared_functions as sf
 import shared_variables as sv
 import worker_fim_rasters
@@ -25,6 +28,117 @@ import worker_fim_rasters
 # Global Variables
 RLOG = sv.R2F_LOG
 
+# A failed or hung model's folder is moved to the quarantine folder, see __move_to_quarantine
+QUARANTINE_MOVE_TRIES = 5
+QUARANTINE_MOVE_WAIT_SECONDS = 3
+
+
+# -------------------------------------------------
+def __get_model_name_keys(unit_output_folder, huc8_num):
+    # Returns the original model folder name (final_name_key) of each model id, which is the name
+    # used in config/bad_models_list.lst. Empty if the unit's model catalog can not be found.
+
+    path_model_catalog = os.path.join(unit_output_folder, "OWP_ras_models_catalog_" + huc8_num + ".csv")
+    if os.path.exists(path_model_catalog) is False:
+        return {}
+
+    model_catalog = pd.read_csv(path_model_catalog)
+    return dict(zip(model_catalog["model_id"].astype(str), model_catalog["final_name_key"]))
+
+
+# -------------------------------------------------
+def __move_to_quarantine(str_model_dir, str_quarantine_model_dir):
+    # A killed HEC-RAS process can take a moment to let go of the model's files, so the move is
+    # tried a few times. Both folders are in the unit folder, so the move is a rename.
+    for int_try in range(QUARANTINE_MOVE_TRIES):
+        try:
+            os.rename(str_model_dir, str_quarantine_model_dir)
+            return
+        except OSError:
+            if int_try == QUARANTINE_MOVE_TRIES - 1:
+                raise
+            time.sleep(QUARANTINE_MOVE_WAIT_SECONDS)
+
+
+# -------------------------------------------------
+def __run_hecras_models(ls_run_hecras_inputs, num_processors, unit_output_folder, huc8_num):
+    """
+    Overview:
+        Runs both passes of the HEC-RAS models, longest first with a time limit per model
+        (see hecras_model_scheduler.py).
+
+        Models that fail or hang are moved to the quarantine folder, so the rest of the steps
+        do not use them, and are added to the unit's candidate bad models list.
+
+    Inputs:
+        - ls_run_hecras_inputs: the worker_fim_rasters.fn_run_one_ras_model_both_passes inputs
+              of each model
+        - num_processors: the max number of models running at a time
+        - unit_output_folder: the unit folder
+        - huc8_num: the huc8 (for the model catalog)
+    """
+
+    list_results = hms.fn_run_models(
+        ls_run_hecras_inputs,
+        worker_fim_rasters.fn_run_one_ras_model_both_passes,
+        num_processors,
+        fn_kill_model_processes=hms.fn_kill_hecras_processes,
+    )
+
+    path_created_ras_models = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT)
+    path_quarantine = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_QUARANTINE)
+    dict_model_name_keys = __get_model_name_keys(unit_output_folder, huc8_num)
+
+    list_candidates = []
+    for result in list_results:
+        if result["status"] == "completed":
+            continue
+
+        model_folder = ls_run_hecras_inputs[result["index"]]["model_folder"]
+        if result["status"] == "timed_out":
+            reason = f"{model_folder}: hung, killed after {result['run_seconds']} seconds"
+        else:
+            reason = f"{model_folder}: failed (exit code {result['exit_code']}). See the log for details"
+
+        if result["status"] == "timed_out":
+            RLOG.trace(f"{model_folder}: {result['processes_killed']} HEC-RAS processes were killed")
+
+        os.makedirs(path_quarantine, exist_ok=True)
+        try:
+            __move_to_quarantine(
+                os.path.join(path_created_ras_models, model_folder),
+                os.path.join(path_quarantine, model_folder),
+            )
+            RLOG.error(f"{reason}. The model has been moved to {path_quarantine}")
+        except Exception as ex:
+            # ie) a HEC-RAS process that could not be killed still has the model's files open
+            reason += ". Quarantine pending, it could not be moved"
+            RLOG.error(
+                f"{reason} to {path_quarantine} ({ex}). Close any HEC-RAS window of the model and"
+                " move its folder there by hand before running the later steps"
+            )
+        # the model id is the start of the model folder name
+        model_name_key = dict_model_name_keys.get(model_folder.split("_")[0], model_folder)
+        list_candidates.append((model_name_key, reason))
+
+    path_candidates = os.path.join(unit_output_folder, hms.BAD_MODEL_CANDIDATES_FILE_NAME)
+    hms.fn_write_bad_model_candidates(
+        path_candidates, list_candidates, f"create_fim_rasters - {sf.get_stnd_date()}"
+    )
+
+    num_completed = len(list_results) - len(list_candidates)
+    RLOG.lprint(f"{num_completed} of {len(list_results)} models completed")
+    if len(list_candidates) > 0:
+        RLOG.warning(
+            f"{len(list_candidates)} models failed or hung. They have been added to"
+            f" {path_candidates}. Check them with the HEC-RAS UI tool before adding them to"
+            " config/bad_models_list.lst"
+        )
+
+    if len(list_results) > 0:
+        max_run_seconds = max(result["run_seconds"] for result in list_results)
+        RLOG.lprint(f"The longest model ran for {max_run_seconds} seconds")
+
 
 # -------------------------------------------------
 def fn_create_fim_rasters(
@@ -37,9 +151,21 @@ def fn_create_fim_rasters(
     start_dt = dt.datetime.utcnow()
 
     path_created_ras_models = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT)
-
-    # Remove it so it is perfectly clean, no residue from previous runs.
-    if os.path.exists(path_created_ras_models):
+    path_quarantine = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_QUARANTINE)
+    path_candidates = os.path.join(unit_output_folder, hms.BAD_MODEL_CANDIDATES_FILE_NAME)
+
+    # If "True", models that finished in an earlier run are not run again (see hecras_model_checkpoints.py)
+    use_model_checkpoints = os.getenv("USE_HECRAS_MODEL_CHECKPOINTS") == "True"
+
+    # Remove them so they are perfectly clean, no residue from previous runs.
+    if os.path.exists(path_candidates):
+        os.remove(path_candidates)
+    if os.path.exists(path_quarantine):
+        shutil.rmtree(path_quarantine)
+    if use_model_checkpoints is True:
+        # the previous model folders are kept until they have been checked against the new ones
+        path_previous_models = hmc.fn_set_aside_previous_models(unit_output_folder)
+    elif os.path.exists(path_created_ras_models):
         shutil.rmtree(path_created_ras_models)
         # shutil.rmtree is not instant, it sends a command to windows, so do a quick time out here
         # so sometimes mkdir can fail if rmtree isn't done
@@ -62,20 +188,61 @@ def fn_create_fim_rasters(
         huc8_num, int_fn_starting_flow, int_number_of_steps, unit_output_folder, model_unit
     )
     RLOG.lprint("*** All HEC-RAS Models Created ***")
+
+    names_created_ras_models = os.listdir(path_created_ras_models)
+
+    # model folder -> (number of passes that do not need to be run, input fingerprints)
+    dict_model_checkpoints = {}
+    if use_model_checkpoints is True:
+        for model_folder in names_created_ras_models:
+            dict_model_checkpoints[model_folder] = hmc.fn_restore_model(
+                unit_output_folder, model_folder, huc8_num, path_previous_models
+            )
+        if os.path.exists(path_previous_models):
+            shutil.rmtree(path_previous_models)
+
+        num_models_done = sum(1 for passes_done, __ in dict_model_checkpoints.values() if passes_done == 2)
+        num_models_pass_1 = sum(1 for passes_done, __ in dict_model_checkpoints.values() if passes_done == 1)
+        RLOG.lprint(
+            f"Model checkpoints: {num_models_done} models were finished in an earlier run and"
+            f" {num_models_pass_1} more only need their second pass"
+        )
+
     RLOG.lprint("")
     RLOG.lprint("")
     RLOG.lprint("+=================================================================+")
     RLOG.notice("|              PROCESSING CONFLATED HEC-RAS MODELS                |")
-    RLOG.notice("|                   (FIRST-PASS HEC-RAS RUN)                      |")
+    RLOG.notice("|     (FIRST-PASS RUN, SECOND-PASS MODELS AND SECOND-PASS RUN)    |")
+    RLOG.notice("|          AND CREATING DEPTH GRIDS FOR HEC-RAS STREAMS           |")
     RLOG.lprint("+-----------------------------------------------------------------+")
-
-    names_created_ras_models = os.listdir(path_created_ras_models)
+    print()
+    msg = (
+        f"A model still running after {hms.MODEL_TIMEOUT_SECONDS} seconds is taken as hung. It is"
+        " killed and added to the unit's candidate bad models list. You can prove it is a bad"
+        " model by using the actual HECRAS UI tool directly and running that model through it."
+        " If it fails, add it to config/bad_models_list.lst."
+    )
+    RLOG.notice(msg)
+    print()
 
     log_file_prefix = "fn_run_hecras"
 
+    flt_interval = 0.5  # feet
+
+    # Each model runs its first pass, creates its second-pass flow and rasmap files and runs its
+    # second pass in the same worker, so it does not wait for the first pass of all of the other
+    # models to finish (see worker_fim_rasters.fn_run_one_ras_model_both_passes)
+    names_models_to_run = [
+        model_folder
+        for model_folder in names_created_ras_models
+        if dict_model_checkpoints.get(model_folder, (0, None))[0] < 2
+    ]
+
     ls_run_hecras_inputs = []
     ctr = 0
-    for model_folder in names_created_ras_models:
+    for model_folder in names_models_to_run:
+        num_passes_done, dict_input_fingerprints = dict_model_checkpoints.get(model_folder, (0, None))
+
         folder_mame_splt = model_folder.split("_")
         project_file_name = "_".join(folder_mame_splt[1:])
 
@@ -86,141 +253,34 @@ def fn_create_fim_rasters(
             'int_number_of_steps': int_number_of_steps,
             'model_folder': model_folder,
             'unit_output_folder': unit_output_folder,
+            'huc8_num': huc8_num,
+            'model_unit': model_unit,
+            'flt_interval': flt_interval,
             'log_default_folder': RLOG.LOG_DEFAULT_FOLDER,
             'log_file_prefix': log_file_prefix,
             'index_number': ctr,
-            'total_number_models': len(names_created_ras_models),
-            'pass_num': 1,
+            'total_number_models': len(names_models_to_run),
+            'is_first_pass_done': num_passes_done == 1,
+            'dict_input_fingerprints': dict_input_fingerprints,
         }
 
         ls_run_hecras_inputs.append(run_hecras_inputs)
         ctr += 1
 
-    RLOG.lprint(f"Number of models to process (first pass) is {len(ls_run_hecras_inputs)}")
+    RLOG.lprint(f"Number of models to process is {len(ls_run_hecras_inputs)}")
     print()
 
     # create a pool of processors
     # num_processors = mp.cpu_count() - 2
-    num_processors = round(math.floor(mp.cpu_count() * 0.85))
+    num_processors = max(round(math.floor(mp.cpu_count() * 0.85)), 1)
 
-    import sys
-
-    with ProcessPoolExecutor(max_workers=num_processors) as executor:
-        executor_dict = {}
-        for dicts in ls_run_hecras_inputs:
-            try:
-                future = executor.submit(worker_fim_rasters.fn_run_one_ras_model, **dicts)
-                executor_dict[future] = dicts['model_folder']
-            except Exception:
-                RLOG.critical(traceback.format_exc())
-                sys.exit(1)
+    __run_hecras_models(ls_run_hecras_inputs, num_processors, unit_output_folder, huc8_num)
 
     # Now that multi-proc is done, lets merge all of the independent log file from each
     RLOG.merge_log_files(RLOG.LOG_FILE_PATH, log_file_prefix)
 
-    print()
-    RLOG.notice("          PROCESSING FIRST-PASS HEC-RAS MODELS COMPLETED           ")
-
-    # -------------------------------------------------
-    # Creating second-pass flow HEC-RAS files and
-    # Running created HEC-RAS models (multi-processing)
-    # -------------------------------------------------
-
-    print()
-    RLOG.lprint("+=================================================================+")
-    RLOG.notice("|              CREATING SECOND-PASS HEC-RAS MODELS                |")
-    RLOG.lprint("+-----------------------------------------------------------------+")
-    RLOG.lprint("  ---(w) HUC-8 WATERSHED: " + huc8_num)
-    RLOG.lprint("  ---(o) OUTPUT PATH: " + unit_output_folder)
-    print()
-    print()
-    msg = "If a model hangs in this stage for multiple mins  (ie > 5), it is probably a bad"
-    " model. You can prove that by using the actual HECRAS UI tool directly and running that"
-    " model through it. If it fails, add it to the exception list in the"
-    " 'create_shapes_from_hecras.py' -> bad_models_lst list."
-    RLOG.notice(msg)
-    print()
-    print()
-
-    flt_interval = 0.5  # feet
-
-    (
-        ls_number_of_steps_2ndpass,
-        ls_ls_second_pass_flows_xs,
-        ls_second_pass_flows_xs_df,
-    ) = worker_fim_rasters.create_datasets_2ndpass(unit_output_folder, flt_interval)
-
-    ls_slope_bc_nd, ls_wse_2nd_last_xs = worker_fim_rasters.compute_boundray_condition_2ndpass(
-        unit_output_folder, ls_second_pass_flows_xs_df
-    )
-
-    worker_fim_rasters.create_all_2ndpass_flow_files(
-        unit_output_folder,
-        ls_number_of_steps_2ndpass,
-        ls_ls_second_pass_flows_xs,
-        ls_slope_bc_nd,
-        ls_wse_2nd_last_xs,
-    )
-
-    worker_fim_rasters.create_all_2ndpass_rasmap_files(
-        unit_output_folder, huc8_num, model_unit, ls_number_of_steps_2ndpass
-    )
-
-    RLOG.lprint("*** All SECOND-PASS HEC-RAS Models Created ***")
-    print()
-    print()
-    RLOG.lprint("+=================================================================+")
-    RLOG.notice("|             PROCESSING SECOND-PASS HEC-RAS MODELS               |")
-    RLOG.notice("|          AND CREATING DEPTH GRIDS FOR HEC-RAS STREAMS           |")
-    RLOG.lprint("+-----------------------------------------------------------------+")
-    print()
-
-    ls_run_hecras_inputs_2nd = []
-    ctr2 = 0
-    for mf2 in range(len(names_created_ras_models)):
-        model_folder2 = names_created_ras_models[mf2]
-
-        folder_mame_splt2 = model_folder2.split("_")
-        project_file_name2 = "_".join(folder_mame_splt2[1:])
-
-        str_ras_projectpath2 = os.path.join(
-            path_created_ras_models, model_folder2, project_file_name2 + ".prj"
-        )
-
-        run_hecras_inputs_2nd = {
-            'str_ras_projectpath': str_ras_projectpath2,
-            'int_number_of_steps': ls_number_of_steps_2ndpass[mf2],
-            'model_folder': model_folder2,
-            'unit_output_folder': unit_output_folder,
-            'log_default_folder': RLOG.LOG_DEFAULT_FOLDER,
-            'log_file_prefix': log_file_prefix,
-            'index_number': ctr2,
-            'total_number_models': len(names_created_ras_models),
-            'pass_num': 2,
-        }
-
-        ls_run_hecras_inputs_2nd.append(run_hecras_inputs_2nd)
-        ctr2 += 1
-
-    RLOG.lprint(f"Number of models to process (second pass) is {len(ls_run_hecras_inputs_2nd)}")
-    print()
-
-    import sys
-
-    # Create a pool of processors
-    with ProcessPoolExecutor(max_workers=num_processors) as executor:
-        executor_dict = {}
-        for dicts2 in ls_run_hecras_inputs_2nd:
-            try:
-                future = executor.submit(worker_fim_rasters.fn_run_one_ras_model, **dicts2)
-                executor_dict[future] = dicts2['model_folder']
-                # print(dicts2['model_folder'],dicts2['int_number_of_steps']) #TODO
-            except Exception:
-                RLOG.critical(traceback.format_exc())
-                sys.exit(1)
-
-    # Now that multi-proc is done, lets merge all of the independent log file from each
-    RLOG.merge_log_files(RLOG.LOG_FILE_PATH, log_file_prefix)
+    if len(os.listdir(path_created_ras_models)) == 0:
+        raise Exception("None of the HEC-RAS models completed. See the log for details")
 
     print()
     RLOG.success(" COMPLETE: ALL HEC-RASS MODELS WERE PROCESSED ")
@@ -18,11 +18,12 @@ import numpy as np
 import pandas as pd
 import rasterio
 import tqdm
-from rasterio.features import shapes
-from rasterio.mask import mask
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask, geometry_window, shapes
 from shapely.geometry import LineString, MultiPolygon, Point
 from shapely.ops import split
 
+import geocurve_store as gs
 import ras2fim_logger
 import shared_functions as sf
 import shared_variables as sv
@@ -36,6 +37,9 @@ GEOMETRY_COL = 'geometry'
 # This is the distance to extent the boundary cross-sections to ensure that the inundation polygon is split
 xs_extension = 1000
 
+# Per process cache of the reach label rasters for the last model processed
+_LABEL_LAYERS_CACHE = {}
+
 
 # -------------------------------------------------
 def find_boundary_xs(nwm_seg_gdf, cross_section_gdf, station_column='stream_stn'):
@@ -99,6 +103,56 @@ def extend_cross_section(geom, extension_distance):
     return LineString([start_pnt] + coords + [end_pnt])
 
 
+# -------------------------------------------------
+def get_feature_label_layers(name_mid, mask_geometries, out_shape, transform):
+    """
+    Overview:
+        Rasterizes the reach inundation masks of a model into label rasters aligned with a depth
+        grid window. A pixel's label is the reach's position (feature_idx) + 1, and 0 is unlabeled.
+
+        The masks of neighbouring reaches overlap (they extend two cross sections past each end
+        of the reach), so one raster can not hold them all. Each reach is put in the first label
+        raster (layer) it does not overlap, which normally means only two or three layers.
+
+        The depth grids of a model share the same grid, so the layers are kept for the last model
+        and grid in each process, meaning each process rasterizes the masks just once per model.
+
+    Inputs:
+        - name_mid: the model key (ie. 1262811_UNT 213 in Village Cr Watershed)
+        - mask_geometries: dictionary of feature_idx -> reach inundation mask geometry
+        - out_shape: (rows, cols) of the depth grid window
+        - transform: affine transform of the depth grid window
+
+    Output:
+        A list of int32 label rasters
+    """
+
+    cache_key = (name_mid, tuple(transform), tuple(out_shape), tuple(mask_geometries.keys()))
+    if _LABEL_LAYERS_CACHE.get("key") == cache_key:
+        return _LABEL_LAYERS_CACHE["layers"]
+
+    label_layers = []
+    for feature_idx, geom in mask_geometries.items():
+        # the same pixels that rasterio's mask would keep for this reach (pixel centers)
+        feature_mask = geometry_mask([geom], out_shape=out_shape, transform=transform, invert=True)
+        if not feature_mask.any():
+            continue
+
+        for label_layer in label_layers:
+            if not (label_layer[feature_mask] > 0).any():
+                label_layer[feature_mask] = feature_idx + 1
+                break
+        else:
+            label_layer = np.zeros(out_shape, dtype="int32")
+            label_layer[feature_mask] = feature_idx + 1
+            label_layers.append(label_layer)
+
+    _LABEL_LAYERS_CACHE["key"] = cache_key
+    _LABEL_LAYERS_CACHE["layers"] = label_layers
+
+    return label_layers
+
+
 # -------------------------------------------------
 def mp_process_depth_grid_tif(var_d: dict):
     try:
@@ -127,102 +181,113 @@ def mp_process_depth_grid_tif(var_d: dict):
 
         geocurve_df_list = []
 
+        # Only the reaches that have a rating curve are labeled
+        rating_curve_paths = {}
+        mask_geometries = {}
+        for feature_idx, nwm_feature in enumerate(all_nwm_reach_inundation_masks_gdf.itertuples()):
+            rating_curve_dir = Path(
+                unit_output_path,
+                sv.R2F_OUTPUT_DIR_CREATE_RATING_CURVES,
+                name_mid,
+                f'rating_curve_{nwm_feature.feature_id}.csv',
+            )
+            if rating_curve_dir.exists() is False:
+                continue
+            rating_curve_paths[feature_idx] = rating_curve_dir
+            mask_geometries[feature_idx] = nwm_feature.geometry
+
+        if len(mask_geometries) == 0:
+            return pd.DataFrame()  # empty
+
         with rasterio.open(depth_tif_win_path) as depth_grid_rast:
             depth_grid_nodata = depth_grid_rast.profile['nodata']
             depth_grid_crs = depth_grid_rast.crs
 
-            # Mask raster using rasterio for each NWM reach
-            for ___, nwm_feature in all_nwm_reach_inundation_masks_gdf.iterrows():
-                # Load the rating curve
-                MP_LOG.trace(
-                    f"Processing {name_mid} for {depth_tif_win_path}:"
-                    f" feature ID = {nwm_feature.feature_id}"
-                )
-                rating_curve_dir = Path(
-                    unit_output_path,
-                    sv.R2F_OUTPUT_DIR_CREATE_RATING_CURVES,
-                    name_mid,
-                    f'rating_curve_{nwm_feature.feature_id}.csv',
-                )
+            try:
+                # the smallest window of the depth grid covering all of the reach masks
+                window = geometry_window(depth_grid_rast, list(mask_geometries.values()))
+            except WindowError:
+                MP_LOG.warning(f"None of the reach masks for {name_mid} overlap {depth_tif_win_path.name}")
+                return pd.DataFrame()  # empty
 
-                if rating_curve_dir.exists() is False:
-                    continue
+            window_transform = depth_grid_rast.window_transform(window)
+            window_shape = (int(window.height), int(window.width))
 
-                mask_shapes = list([nwm_feature.geometry])
-                masked_inundation, masked_inundation_transform = mask(depth_grid_rast, mask_shapes, crop=True)
-                masked_inundation = masked_inundation[0]
-                # Create binary raster
-                binary_arr = np.where(
-                    (masked_inundation > 0) & (masked_inundation != depth_grid_nodata), 1, 0
-                ).astype("uint8")
-
-                depth_poly_args = (
-                    {"properties": {"extent": 1}, "geometry": s}
-                    for i, (s, v) in enumerate(
-                        shapes(
-                            binary_arr,
-                            mask=binary_arr > 0,
-                            transform=masked_inundation_transform,
-                            connectivity=8,
-                        )
-                    )
-                )
-
-                # cur dev (2.0.2.1)
-                results_ls = list(depth_poly_args)
+            label_layers = get_feature_label_layers(name_mid, mask_geometries, window_shape, window_transform)
 
-                if len(results_ls) == 0:
-                    continue
+            # Read the depth grid just once for all reaches, then create a binary raster
+            depth_arr = depth_grid_rast.read(1, window=window)
+            if depth_grid_nodata is None:
+                is_wet = depth_arr > 0
+            else:
+                is_wet = (depth_arr > 0) & (depth_arr != depth_grid_nodata)
+
+            # One shapes() pass per label layer returns the wet polygons of every reach in that
+            # layer, each polygon carrying its reach label.
+            feature_shapes = {}
+            for label_layer in label_layers:
+                wet_labels = np.where(is_wet, label_layer, 0).astype("int32")
+                for s, v in shapes(
+                    wet_labels, mask=wet_labels > 0, transform=window_transform, connectivity=8
+                ):
+                    feature_shapes.setdefault(int(v) - 1, []).append(s)
+
+        for feature_idx in sorted(feature_shapes.keys()):
+            feature_id = all_nwm_reach_inundation_masks_gdf.feature_id.iloc[feature_idx]
+            MP_LOG.trace(f"Processing {name_mid} for {depth_tif_win_path}: feature ID = {feature_id}")
+
+            results_ls = [{"properties": {"extent": 1}, "geometry": s} for s in feature_shapes[feature_idx]]
+
+            # Convert list of shapes to polygon, then dissolve
+            extent_poly = gpd.GeoDataFrame.from_features(results_ls, crs=depth_grid_crs)
+            # -----------------
+
+            try:
+                extent_poly_diss = extent_poly.dissolve(by="extent")
+
+            except AttributeError as ae:
+                # TODO (from v1) why does this happen? I suspect bad geometry. Small extent?
+                msg = "Warning...\n"
+                msg += f"feature_id = {feature_id}; "
+                msg += f"depth_grid = {depth_tif_win_path}\n"
+                msg += f"  Details: {ae}"
+                MP_LOG.warning(msg)
+                MP_LOG.warning(traceback.format_exc())
+                continue
 
-                # Convert list of shapes to polygon, then dissolve
-                extent_poly = gpd.GeoDataFrame.from_features(results_ls, crs=depth_grid_crs)
-                # -----------------
-
-                try:
-                    extent_poly_diss = extent_poly.dissolve(by="extent")
-
-                except AttributeError as ae:
-                    # TODO (from v1) why does this happen? I suspect bad geometry. Small extent?
-                    msg = "Warning...\n"
-                    msg += f"feature_id = {nwm_feature.feature_id}; "
-                    msg += f"depth_grid = {depth_tif_win_path}\n"
-                    msg += f"  Details: {ae}"
-                    MP_LOG.warning(msg)
-                    MP_LOG.warning(traceback.format_exc())
-                    continue
+            # Add the feature_id, profile_num, and code_version columns
+            extent_poly_diss = extent_poly_diss.assign(
+                profile_num=profile_num,
+                version=code_version,
+                unit_name=unit_name,
+                unit_version=unit_version,
+                source_code=source_code,
+                source=source1,
+                crs=crs,
+            )
+            extent_poly_diss = extent_poly_diss.reindex(
+                columns=[
+                    'version',
+                    'unit_name',
+                    'unit_version',
+                    'source_code',
+                    'source',
+                    'crs',
+                    'geometry',
+                    'profile_num',
+                ]
+            )
 
-                # Add the feature_id, profile_num, and code_version columns
-                extent_poly_diss = extent_poly_diss.assign(
-                    profile_num=profile_num,
-                    version=code_version,
-                    unit_name=unit_name,
-                    unit_version=unit_version,
-                    source_code=source_code,
-                    source=source1,
-                    crs=crs,
-                )
-                extent_poly_diss = extent_poly_diss.reindex(
-                    columns=[
-                        'version',
-                        'unit_name',
-                        'unit_version',
-                        'source_code',
-                        'source',
-                        'crs',
-                        'geometry',
-                        'profile_num',
-                    ]
-                )
-                # TODO: Does not exist anymore
-                # extent_poly_diss = extent_poly_diss.drop(columns='extent')
+            rating_curve_df = pd.read_csv(rating_curve_paths[feature_idx])
 
-                rating_curve_df = pd.read_csv(rating_curve_dir)
+            # Join the geometry to the rating curve
+            feature_id_rating_curve_geo = pd.merge(
+                rating_curve_df, extent_poly_diss, on="profile_num", how="right"
+            )
+            geocurve_df_list.append(feature_id_rating_curve_geo)
 
-                # Join the geometry to the rating curve
-                feature_id_rating_curve_geo = pd.merge(
-                    rating_curve_df, extent_poly_diss, on="profile_num", how="right"
-                )
-                geocurve_df_list.append(feature_id_rating_curve_geo)
+        if len(geocurve_df_list) == 0:
+            return pd.DataFrame()  # empty
 
         geocurve_df = pd.concat(geocurve_df_list)
         return geocurve_df
@@ -237,7 +302,10 @@ def mp_process_depth_grid_tif(var_d: dict):
 
 
 # -------------------------------------------------
-def create_geocurves(unit_output_path: str, code_version: str):
+def create_geocurves(unit_output_path: str, code_version: str, write_geocurve_store: bool = False):
+    # If write_geocurve_store is True, a per unit geocurve store (parquet and index) is saved
+    # beside the geocurve csv's. See geocurve_store.py for details.
+
     # Get HUC 8
     dir_name = Path(unit_output_path).name
     huc_name = re.match("^\d{8}", dir_name).group()
@@ -281,6 +349,9 @@ def create_geocurves(unit_output_path: str, code_version: str):
         unit_output_path, sv.R2F_OUTPUT_DIR_FINAL, sv.R2F_OUTPUT_DIR_GEOCURVES
     )
 
+    # only used if we are writing the geocurve store
+    unit_geocurve_gdf_list = []
+
     len_conflated_ras_models = len(conflated_ras_models)
     for index, model in conflated_ras_models.iterrows():
         try:
@@ -514,6 +585,9 @@ def create_geocurves(unit_output_path: str, code_version: str):
                 RLOG.trace(f"Saving: {path_geocurve}")
                 subset_geocurve_df.to_csv(path_geocurve, index=False)
 
+            if write_geocurve_store is True:
+                unit_geocurve_gdf_list.append(geocurve_df.assign(name_mid=name_mid))
+
         except Exception:
             RLOG.error(f"An error occurred while creating geocurves for {model.final_name_key}")
             RLOG.error(traceback.format_exc())
@@ -524,15 +598,21 @@ def create_geocurves(unit_output_path: str, code_version: str):
         RLOG.critical("No geocurve files were created. Program terminated")
         sys.exit(1)
 
+    if write_geocurve_store is True:
+        RLOG.lprint("Creating the geocurve store")
+        gs.write_geocurve_store(unit_geocurve_gdf_list, path_geocurve_folder)
+
 
 # -------------------------------------------------
-def manage_geo_rating_curves_production(ras2fim_huc_dir, overwrite):
+def manage_geo_rating_curves_production(ras2fim_huc_dir, overwrite, write_geocurve_store=False):
     """
     This function sets up the multiprocessed generation of geo version of feature_id-specific rating curves.
 
     Args:
         ras2fim_huc_dir (str): Path to HUC8-level directory storing RAS2FIM outputs for a given run.
-        output_folder (str): The path to the output folder where geo rating curves will be written.
+        overwrite (bool): If True, an existing geocurves folder will be removed and rebuilt.
+        write_geocurve_store (bool): If True, the geocurve store (parquet and index) will also be
+            written to the geocurves folder.
     """
 
     # get the version
@@ -549,6 +629,7 @@ def manage_geo_rating_curves_production(ras2fim_huc_dir, overwrite):
 
     RLOG.lprint(f"  ---(p) ras2fim_huc_dir: {ras2fim_huc_dir}")
     RLOG.lprint(f"  ---(o) overwrite: {overwrite}")
+    RLOG.lprint(f"  ---(s) write_geocurve_store: {write_geocurve_store}")
 
     overall_start_time = datetime.utcnow()
     dt_string = datetime.utcnow().strftime("%m/%d/%Y %H:%M:%S")
@@ -578,7 +659,7 @@ def manage_geo_rating_curves_production(ras2fim_huc_dir, overwrite):
     os.makedirs(geocurves_dir)
 
     # Feed into main geocurve creation function
-    create_geocurves(ras2fim_huc_dir, code_version)
+    create_geocurves(ras2fim_huc_dir, code_version, write_geocurve_store)
 
     # Calculate duration
     RLOG.success("Complete")
@@ -594,6 +675,7 @@ def manage_geo_rating_curves_production(ras2fim_huc_dir, overwrite):
 if __name__ == "__main__":
     # Sample:
     # python create_geocurves.py -p 'c:\ras2fim_data\output_ras2fim\12090301_2277_ble_240216' -o
+    # add -s to also write the geocurve store (parquet and index) used by ras2inundation.py
 
     parser = argparse.ArgumentParser(description="== Produce Geo Rating Curves for RAS2FIM ==")
 
@@ -608,10 +690,19 @@ if __name__ == "__main__":
 
     parser.add_argument("-o", dest="overwrite", help="Overwrite files", required=False, action="store_true")
 
+    parser.add_argument(
+        "-s",
+        dest="write_geocurve_store",
+        help="OPTIONAL: Also write the geocurve store (parquet and index) used by ras2inundation.py",
+        required=False,
+        action="store_true",
+    )
+
     args = vars(parser.parse_args())
 
     overwrite = args["overwrite"]
     ras2fim_huc_dir = args["ras2fim_huc_dir"]
+    write_geocurve_store = args["write_geocurve_store"]
 
     log_file_folder = os.path.join(ras2fim_huc_dir, "logs")
     try:
@@ -627,7 +718,7 @@ if __name__ == "__main__":
         RLOG.setup(os.path.join(log_file_folder, script_file_name + ".log"))
 
         # call main program
-        manage_geo_rating_curves_production(ras2fim_huc_dir, overwrite)
+        manage_geo_rating_curves_production(ras2fim_huc_dir, overwrite, write_geocurve_store)
 
     except Exception:
         RLOG.critical(traceback.format_exc())
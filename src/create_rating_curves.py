@@ -14,6 +14,7 @@ import pandas as pd
 
 # import ras2fim_logger
 import shared_variables as sv
+import x_sections_info_store as xsis
 
 
 # Global Variables
@@ -156,7 +157,9 @@ def fn_create_rating_curves(huc8, path_unit_folder):
 
     path_to_all_x_sections_info = []
     for folders in created_ras_models_folders:
-        path_to_all_xs_info = os.path.join(path_to_step5, folders, f"all_x_sections_info_2nd_{folders}.csv")
+        path_to_all_xs_info = xsis.fn_get_x_sections_info_path(
+            os.path.join(path_to_step5, folders), folders, 2
+        )
 
         path_to_all_x_sections_info.append(path_to_all_xs_info)
 
@@ -173,7 +176,11 @@ def fn_create_rating_curves(huc8, path_unit_folder):
     for infoind in range(len(path_to_all_x_sections_info)):
         model_name_id = path_to_all_x_sections_info[infoind].split("\\")[-2]
         RLOG.lprint(f"Creating rating curves for model {model_name_id}")
-        mid_x_sections_info = pd.read_csv(path_to_all_x_sections_info[infoind])
+        # channel_length is not needed for the rating curves
+        mid_x_sections_info = xsis.fn_read_x_sections_info(
+            [path_to_all_x_sections_info[infoind]],
+            columns=["xs_counter", "fid_xs", "modelid", "Xsection_name", "wse", "discharge", "max_depth"],
+        )
         mid_x_sections_info = mid_x_sections_info.rename(columns={'fid_xs': 'mid_xs', 'modelid': 'model_id'})
 
         # Determinig the number of steps
@@ -218,7 +225,6 @@ def fn_create_rating_curves(huc8, path_unit_folder):
         df_mid_fid.index = range(len(df_mid_fid))
         df_mid_fid.columns = ['fidindx', 'feature_id']
 
-        mid_x_sections_info = mid_x_sections_info.rename(columns={'Unnamed: 0': 'xs_counter'})
         mid_x_sections_info_fid = pd.concat(
             [
                 mid_x_sections_info["mid_xs"],
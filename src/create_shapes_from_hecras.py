@@ -17,6 +17,7 @@ import re
 import sys
 import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from functools import partial
 from multiprocessing import Pool
 from os import path
@@ -25,10 +26,14 @@ import geopandas as gpd
 import h5py
 import numpy as np
 import pandas as pd
+import shapely
 import win32com.client
 from shapely.geometry import LineString
 from shapely.ops import linemerge, split
 
+import hecras_flow_file as hff
+import hecras_project_catalog as hpc
+import model_shapes_cache as msc
 import ras2fim_logger
 import shared_functions as sf
 import shared_variables as sv
@@ -205,6 +210,39 @@ def fn_get_active_geom(str_path_hecras_project_fn2):
         return ""
 
 
+# -------------------------------------------------
+def fn_decode_hdf_strings(arr_values):
+    # Function - converts an array of HDF5 fixed length byte strings to an
+    # array of python strings in one call.
+
+    arr_values = np.asarray(arr_values)
+    if arr_values.dtype.kind == "S":
+        return np.char.decode(arr_values, "UTF-8")
+    return arr_values.astype(str)
+
+
+# -------------------------------------------------
+def fn_get_hdf_polylines(hf, str_hdf_group):
+    # Function - Creates an array of shapely linestrings for all of the polylines
+    # in a geometry HDF group (ie. "Geometry/Cross Sections") in one vectorized call.
+    # Returns None if the group does not have any polyline parts (empty / bad geometry)
+
+    # point maker where each line's points start (and how many points it has)
+    arr_parts = np.array(hf.get(str_hdf_group + "/Polyline Parts"))
+
+    if arr_parts.ndim == 0:
+        return None
+
+    # XY points of all lines, one after the other
+    arr_points = np.array(hf.get(str_hdf_group + "/Polyline Points"))
+
+    # Each line uses the next "point count" points
+    arr_points_per_line = arr_parts[:, 1].astype(np.int64)
+    arr_line_ids = np.repeat(np.arange(len(arr_points_per_line)), arr_points_per_line)
+
+    return shapely.linestrings(arr_points[: len(arr_line_ids), :2], indices=arr_line_ids)
+
+
 # -------------------------------------------------
 def fn_geodataframe_cross_sections(str_path_hecras_project_fn, STR_CRS_MODEL):
     # Fuction - Creates a GeoDataFrame of the cross sections for the
@@ -219,122 +257,50 @@ def fn_geodataframe_cross_sections(str_path_hecras_project_fn, STR_CRS_MODEL):
 
     str_path_to_geom_hdf = file_name + ".hdf"
 
-    if path.exists(str_path_to_geom_hdf):
-        # open the geom hdf file
-        hf = h5py.File(str_path_to_geom_hdf, "r")
-    else:
+    if not path.exists(str_path_to_geom_hdf):
         # run hec-ras and then open the geom file
         fn_open_hecras("", "", str_path_hecras_project_fn)
-        hf = h5py.File(str_path_to_geom_hdf, "r")
 
     # get data from HEC-RAS hdf5 files
-
-    # XY points of the cross section
-    n1 = hf.get("Geometry/Cross Sections/Polyline Points")
-    n1 = np.array(n1)
-
-    # point maker where each stream points start
-    n2 = hf.get("Geometry/Cross Sections/Polyline Parts")
-    n2 = np.array(n2)
-
-    # Attribute data of the streams (reach, river, etc...)
-    n3 = hf.get("Geometry/Cross Sections/Attributes")
-    n3 = np.array(n3)
-
-    # Error handling: edge case, empty (bad) geo
-    if n2.ndim == 0:
-        RLOG.warning("Empty dataframe returned")
-        return gpd.GeoDataFrame()
-
-    # Create a list of  number of points per each stream line
-    list_points_per_cross_section_line = []
-    for row in n2:
-        list_points_per_cross_section_line.append(row[1])
-
-    # Get the name of the river, reach and station
-    list_river_name = []
-    list_reach_name = []
-    list_station = []
-
-    # Older geom hdf5 files do not have data in Geometry/Cross Sections/Attributes
-    if n3.ndim > 0:
-        # cross sections are in new hdf geom format
-        for row in n3:
-            list_river_name.append(row[0])
-            list_reach_name.append(row[1])
-            # Need to check for interpolated cross section
-            # They end with a star
-            str_xs_name = row[2]
-            if str_xs_name[-1] == "*":
-                # cross section is interpolated
-                str_xs_name = str_xs_name[:-1]
-            list_station.append(str_xs_name)
-    else:
-        # older hdf5 geom format
-        n3_river_name = hf.get("Geometry/Cross Sections/River Names")
-        n3_river_name = np.array(n3_river_name)
-        for str_rivername in n3_river_name:
-            list_river_name.append(str_rivername)
-
-        n3_reach_name = hf.get("Geometry/Cross Sections/Reach Names")
-        n3_reach_name = np.array(n3_reach_name)
-        for str_reachname in n3_reach_name:
-            list_reach_name.append(str_reachname)
-
-        n3_stations = hf.get("Geometry/Cross Sections/River Stations")
-        n3_stations = np.array(n3_stations)
-        for str_station in n3_stations:
-            str_xs_name = str_station
-            if str_xs_name[-1] == "*":
-                # cross section is interpolated
-                str_xs_name = str_xs_name[:-1]
-            list_station.append(str_xs_name)
-
-    # Get a list of the points
-    list_line_points_x = []
-    list_line_points_y = []
-
-    for row in n1:
-        list_line_points_x.append(row[0])
-        list_line_points_y.append(row[1])
-
-    cross_section_points = [xy for xy in zip(list_line_points_x, list_line_points_y)]
-
-    # Create an empty geopandas GeoDataFrame
-    gdf_cross_sections = gpd.GeoDataFrame()
-    gdf_cross_sections["geometry"] = None
-    gdf_cross_sections["stream_stn"] = None
-    gdf_cross_sections["river"] = None
-    gdf_cross_sections["reach"] = None
-    gdf_cross_sections["ras_path"] = None
-
-    # set projection from input value
-    gdf_cross_sections.crs = STR_CRS_MODEL
-
-    # Loop through the cross section lines and create GeoDataFrame
-    int_startPoint = 0
-    i = 0
-
-    for int_numPnts in list_points_per_cross_section_line:
-        # Create linesting data with shapely
-        gdf_cross_sections.loc[i, "geometry"] = LineString(
-            cross_section_points[int_startPoint : (int_startPoint + int_numPnts)]
-        )
-
-        # River and Reach - these are numpy bytes and
-        # need to be converted to strings
-        # Note - HEC-RAS truncates values when loaded into the HDF
-
-        gdf_cross_sections.loc[i, "stream_stn"] = list_station[i].decode("UTF-8")
-
-        gdf_cross_sections.loc[i, "river"] = list_river_name[i].decode("UTF-8")
-        gdf_cross_sections.loc[i, "reach"] = list_reach_name[i].decode("UTF-8")
-
-        str_path_to_geom = str_path_to_geom_hdf[:-4]
-        gdf_cross_sections.loc[i, "ras_path"] = str_path_to_geom
-
-        i += 1
-        int_startPoint = int_startPoint + int_numPnts
+    with h5py.File(str_path_to_geom_hdf, "r") as hf:
+        arr_lines = fn_get_hdf_polylines(hf, "Geometry/Cross Sections")
+
+        # Error handling: edge case, empty (bad) geo
+        if arr_lines is None:
+            RLOG.warning("Empty dataframe returned")
+            return gpd.GeoDataFrame()
+
+        # Attribute data of the streams (reach, river, etc...)
+        n3 = np.array(hf.get("Geometry/Cross Sections/Attributes"))
+
+        # Older geom hdf5 files do not have data in Geometry/Cross Sections/Attributes
+        if n3.ndim > 0:
+            # cross sections are in new hdf geom format (river, reach, station are the first 3 fields)
+            arr_river_name = n3[n3.dtype.names[0]]
+            arr_reach_name = n3[n3.dtype.names[1]]
+            arr_station = n3[n3.dtype.names[2]]
+        else:
+            # older hdf5 geom format
+            arr_river_name = np.array(hf.get("Geometry/Cross Sections/River Names"))
+            arr_reach_name = np.array(hf.get("Geometry/Cross Sections/Reach Names"))
+            arr_station = np.array(hf.get("Geometry/Cross Sections/River Stations"))
+
+    # River and Reach - these are numpy bytes and need to be converted to strings
+    # Note - HEC-RAS truncates values when loaded into the HDF
+    # Interpolated cross sections end with a star, which is removed
+    ser_station = pd.Series(fn_decode_hdf_strings(arr_station)).str.replace(r"\*$", "", regex=True)
+
+    gdf_cross_sections = gpd.GeoDataFrame(
+        {
+            "geometry": arr_lines,
+            "stream_stn": ser_station.to_numpy(dtype=object),
+            "river": fn_decode_hdf_strings(arr_river_name).astype(object),
+            "reach": fn_decode_hdf_strings(arr_reach_name).astype(object),
+            "ras_path": str_path_to_geom_hdf[:-4],
+        },
+        geometry="geometry",
+        crs=STR_CRS_MODEL,
+    )
 
     return gdf_cross_sections
 
@@ -346,112 +312,75 @@ def fn_geodataframe_stream_centerline(str_path_hecras_project_fn, STR_CRS_MODEL)
 
     str_path_to_geom_hdf = (fn_get_active_geom(str_path_hecras_project_fn)) + ".hdf"
 
-    if path.exists(str_path_to_geom_hdf):
-        # open the geom hdf file
-        hf = h5py.File(str_path_to_geom_hdf, "r")
-    else:
+    if not path.exists(str_path_to_geom_hdf):
         # run hec-ras and then open the geom file
         fn_open_hecras("", "", str_path_hecras_project_fn)
-        hf = h5py.File(str_path_to_geom_hdf, "r")
-
-    # XY points of the stream centerlines
-    n1 = hf.get("Geometry/River Centerlines/Polyline Points")
-    n1 = np.array(n1)
 
-    # point maker where each stream points start
-    n2 = hf.get("Geometry/River Centerlines/Polyline Parts")
-    n2 = np.array(n2)
+    with h5py.File(str_path_to_geom_hdf, "r") as hf:
+        arr_lines = fn_get_hdf_polylines(hf, "Geometry/River Centerlines")
 
-    # Error handling: edge case, empty (bad) geo
-    if n2.ndim == 0:
-        RLOG.warning(f"Polyline parts not found for model of '{STR_CRS_MODEL}'")
-        return gpd.GeoDataFrame()
-
-    # Get the name of the river and reach
-    list_river_name = []
-    list_reach_name = []
-
-    # Attribute data of the streams (reach, river, etc...)
-    n3 = hf.get("Geometry/River Centerlines/Attributes")
-    n3 = np.array(n3)
+        # Error handling: edge case, empty (bad) geo
+        if arr_lines is None:
+            RLOG.warning(f"Polyline parts not found for model of '{STR_CRS_MODEL}'")
+            return gpd.GeoDataFrame()
 
-    # TODO - MAC - 2021.10.31
-    # Possible error with multiple rivers / reaches in older hdf5 geom
+        # Attribute data of the streams (reach, river, etc...)
+        n3 = np.array(hf.get("Geometry/River Centerlines/Attributes"))
 
-    if n3.ndim == 0:
-        # some hdf files do not have Geometry/River Centerlines/Attributes
-        # This is due to differences in the HEC-RAS versioning
-        # Try an older hdf5 format for geom
-        n3_reach = hf.get("Geometry/River Centerlines/Reach Names")
-        n3_reach = np.array(n3_reach)
+        # TODO - MAC - 2021.10.31
+        # Possible error with multiple rivers / reaches in older hdf5 geom
 
-        n3_river = hf.get("Geometry/River Centerlines/River Names")
-        n3_river = np.array(n3_river)
+        if n3.ndim == 0:
+            # some hdf files do not have Geometry/River Centerlines/Attributes
+            # This is due to differences in the HEC-RAS versioning
+            # Try an older hdf5 format for geom (only the first river and reach are used)
+            n3_reach = np.array(hf.get("Geometry/River Centerlines/Reach Names"))
+            n3_river = np.array(hf.get("Geometry/River Centerlines/River Names"))
 
-        # reach from older format
-        if n3_reach.ndim == 0:
-            list_reach_name.append("Unknown-not-found")
+            arr_reach_name = np.array(["Unknown-not-found"]) if n3_reach.ndim == 0 else n3_reach[:1]
+            arr_river_name = np.array(["Unknown-not-found"]) if n3_river.ndim == 0 else n3_river[:1]
         else:
-            list_reach_name.append(n3_reach[0])
-
-        # river from older format
-        if n3_river.ndim == 0:
-            list_river_name.append("Unknown-not-found")
-        else:
-            list_river_name.append(n3_river[0])
-    else:
-        for row in n3:
-            list_river_name.append(row[0])
-            list_reach_name.append(row[1])
-
-    # Create a list of  number of points per each stream line
-    list_points_per_stream_line = []
-    for row in n2:
-        list_points_per_stream_line.append(row[1])
-
-    # Get a list of the points
-    list_line_points_x = []
-    list_line_points_y = []
-
-    for row in n1:
-        list_line_points_x.append(row[0])
-        list_line_points_y.append(row[1])
-
-    stream_points = [xy for xy in zip(list_line_points_x, list_line_points_y)]
-
-    # Create an empty geopandas GeoDataFrame
-    gdf_streams = gpd.GeoDataFrame()
-    gdf_streams["geometry"] = None
-    gdf_streams["river"] = None
-    gdf_streams["reach"] = None
-    gdf_streams["ras_path"] = None
-
-    # set projection from input value
-    gdf_streams.crs = STR_CRS_MODEL
-
-    # Loop through the stream centerlines and create GeoDataFrame
-    int_startPoint = 0
-    i = 0
+            arr_river_name = n3[n3.dtype.names[0]]
+            arr_reach_name = n3[n3.dtype.names[1]]
+
+    # Write the River and Reach - these are numpy bytes and need to be
+    # converted to strings
+    # Note - RAS truncates these values in the g01 and HDF files
+    gdf_streams = gpd.GeoDataFrame(
+        {
+            "geometry": arr_lines,
+            "river": fn_decode_hdf_strings(arr_river_name).astype(object),
+            "reach": fn_decode_hdf_strings(arr_reach_name).astype(object),
+            "ras_path": str_path_to_geom_hdf[:-4],
+        },
+        geometry="geometry",
+        crs=STR_CRS_MODEL,
+    )
 
-    for int_numPnts in list_points_per_stream_line:
-        # Create linesting data with shapely
-        gdf_streams.loc[i, "geometry"] = LineString(
-            stream_points[int_startPoint : (int_startPoint + int_numPnts)]
-        )
+    return gdf_streams
 
-        # Write the River and Reach - these are numpy bytes and need to be
-        # converted to strings
-        # Note - RAS truncates these values in the g01 and HDF files
-        gdf_streams.loc[i, "river"] = list_river_name[i].decode("UTF-8")
-        gdf_streams.loc[i, "reach"] = list_reach_name[i].decode("UTF-8")
 
-        str_path_to_geom = str_path_to_geom_hdf[:-4]
-        gdf_streams.loc[i, "ras_path"] = str_path_to_geom
+# -------------------------------------------------
+def fn_remove_prj_file_refs(str_prj_path):
+    # Rewrites a HEC-RAS prj file without the "Geom File=", "Flow File=" and "Plan File=" lines
+    # that are not the "01" files (ie. g02, f21), as those files are removed.
+
+    new_file_lines = []
+    with open(str_prj_path, "r") as f:
+        for line in f.readlines():
+            line = line.strip()  # removed new line characters
+            if (
+                line.startswith("Geom File=")
+                or line.startswith("Flow File=")
+                or line.startswith("Plan File=")
+            ):
+                # strip off last three
+                if line[-3:] not in ["g01", "p01", "f01"]:
+                    continue
+            new_file_lines.append(line + "\n")
 
-        i += 1
-        int_startPoint = int_startPoint + int_numPnts
-
-    return gdf_streams
+    with open(str_prj_path, "w") as f:
+        f.writelines(new_file_lines)
 
 
 # -------------------------------------------------
@@ -498,104 +427,48 @@ def fn_get_active_flow(str_path_hecras_project_fn):
 
 
 # -------------------------------------------------
-def fn_get_flow_dataframe(str_path_hecras_flow_fn):
-    # Get pandas dataframe of the flows in the active plan's flow file
-
-    # initalize the dataframe
-    df = pd.DataFrame()
-    df["river"] = []
-    df["reach"] = []
-    df["start_xs"] = []
-    df["max_flow"] = []
-
-    with open(str_path_hecras_flow_fn, "r") as file1:
-        lines = file1.readlines()
-        i = 0  # number of the current row
-
-        for line in lines:
-            if line[:19] == "Number of Profiles=":
-                # determine the number of profiles
-                int_flow_profiles = int(line[19:])
-
-                # determine the number of rows of flow - each row has maximum of 10
-                int_flow_rows = int(int_flow_profiles // 10 + 1)
-
-            if line[:15] == "River Rch & RM=":
-                str_river_reach = line[15:]  # remove first 15 characters
-
-                # split the data on the comma
-                list_river_reach = str_river_reach.split(",")
-
-                # Get from array - use strip to remove whitespace
-                str_river = list_river_reach[0].strip()
-                str_reach = list_river_reach[1].strip()
-                str_start_xs = list_river_reach[2].strip()
-                flt_start_xs = float(str_start_xs)
-
-                # Read the flow values line(s)
-                list_flow_values = []
-
-                # for each line with flow data
-                for j in range(i + 1, i + int_flow_rows + 1):
-                    # get the current line
-                    line_flows = lines[j]
-
-                    # determine the number of values on this
-                    # line from character count
-                    int_val_in_row = int((len(lines[j]) - 1) / 8)
-
-                    # for each value in the row
-                    for k in range(0, int_val_in_row):
-                        # get the flow value (Max of 8 characters)
-                        str_flow = line_flows[k * 8 : k * 8 + 8].strip()
-                        # convert the string to a float
-                        flt_flow = float(str_flow)
-                        # append data to list of flow values
-                        list_flow_values.append(flt_flow)
-
-                # Get the max value in list
-                flt_max_flow = max(list_flow_values)
-
-                # write to dataFrame
-                df_new_row = pd.DataFrame.from_records(
-                    [
-                        {
-                            "river": str_river,
-                            "reach": str_reach,
-                            "start_xs": flt_start_xs,
-                            "max_flow": flt_max_flow,
-                        }
-                    ]
-                )
-                df = pd.concat([df, df_new_row], ignore_index=True)
+def fn_gdf_append_xs_with_max_flow(df_xs_fn, df_flows_fn):
+    # Function - for a list of cross sections, determine the maximum flow
+    # and return as a pandas dataframe
 
-            i += 1
+    # A cross section gets the max flow of the last flow change (in flow file order) on the same
+    # river/reach pair where the xs station is less than (or equal to) the flow change station.
+    # If there isn't one, the max flow is 0.
+    # Instead of comparing every cross section to every flow change, the flow changes of each
+    # river/reach pair are sorted by station and all of its cross sections are found with one search.
 
-    return df
+    arr_max_flows = np.zeros(len(df_xs_fn), dtype=float)
+    arr_xs_rivers = df_xs_fn["river"].to_numpy()
+    arr_xs_reaches = df_xs_fn["reach"].to_numpy()
+    arr_xs_stations = df_xs_fn["stream_stn"].to_numpy(dtype=float)
 
+    # the index is the flow file order
+    df_flows = df_flows_fn.reset_index(drop=True)
+    df_flows = df_flows[df_flows["start_xs"].notna()]
 
-# -------------------------------------------------
-def fn_gdf_append_xs_with_max_flow(df_xs_fn, df_flows_fn):
-    # Function - for a list of cross sections, determine the maximum flow
-    # and return as a pandas dataframe
+    for (str_river, str_reach), df_reach_flows in df_flows.groupby(["river", "reach"], sort=False):
+        arr_is_reach_xs = (arr_xs_rivers == str_river) & (arr_xs_reaches == str_reach)
+        if not arr_is_reach_xs.any():
+            continue
 
-    list_max_flows_per_xs = []
+        df_reach_flows = df_reach_flows.sort_values("start_xs", kind="stable")
+        arr_start_xs = df_reach_flows["start_xs"].to_numpy(dtype=float)
 
-    # for each row in cross section list
-    for index, row in df_xs_fn.iterrows():
-        max_flow_value = 0
+        # for each sorted flow change, the last one in file order of it and all flow changes
+        # with a higher station (all of the flow changes a cross section below it matches)
+        arr_last_flow_idx = np.maximum.accumulate(df_reach_flows.index.to_numpy()[::-1])[::-1]
 
-        # for each row in flow break list
-        for index2, row2 in df_flows_fn.iterrows():
-            # if this is the same river/reach pair
-            if row["river"] == row2["river"] and row["reach"] == row2["reach"]:
-                # if xs station is less than (or equal to) flow break station
-                if row["stream_stn"] <= row2["start_xs"]:
-                    max_flow_value = row2["max_flow"]
+        # the first flow change with a station at or above each cross section station
+        arr_first_match = np.searchsorted(arr_start_xs, arr_xs_stations[arr_is_reach_xs], side="left")
+        arr_has_match = arr_first_match < len(arr_start_xs)
 
-        list_max_flows_per_xs.append(max_flow_value)
+        arr_reach_max_flows = np.zeros(len(arr_first_match), dtype=float)
+        arr_reach_max_flows[arr_has_match] = df_flows.loc[
+            arr_last_flow_idx[arr_first_match[arr_has_match]], "max_flow"
+        ].to_numpy(dtype=float)
+        arr_max_flows[arr_is_reach_xs] = arr_reach_max_flows
 
-    df_xs_fn["max_flow"] = list_max_flows_per_xs
+    df_xs_fn["max_flow"] = arr_max_flows
 
     return df_xs_fn
 
@@ -667,6 +540,108 @@ def fn_cut_stream_downstream(gdf_return_stream_fn, df_xs_fn):
     return gdf_return_stream_fn
 
 
+# -------------------------------------------------
+def mp_read_model_shapes(var_d: dict):
+    """
+    Overview:
+        Reads the stream centerline and the cross sections (with their max flows) of one HEC-RAS
+        model. This is run in a multi-proc pool, so the geometry is returned as WKB arrays and the
+        attributes as plain dataframes, which are much faster to send back than geodataframes.
+
+        If a cache folder is given and the model's files have not changed since it was last read,
+        its shapes come from the cache (see model_shapes_cache.py).
+
+    Inputs:
+        - var_d: dictionary of ras_path, geom_path and flow_path (from the project catalog),
+            projection, cache_dir (None to not use the cache), cache_code_version (see
+            model_shapes_cache.fn_get_code_version), rlog_file_path and log_file_prefix
+
+    Output:
+        A dictionary of:
+            - is_read: False if the model has no cross sections or an error occurred
+            - stream_wkb and stream_attrs: the stream centerline geometry and attributes
+            - xs_wkb and xs_attrs: the cross section geometry and attributes
+            - is_from_cache: True if the shapes came from the cache
+            - read_seconds: how long reading the model took (when it was read, if from the cache)
+            - run_seconds: how long this call took
+    """
+
+    ras_path = var_d["ras_path"]
+    projection = var_d["projection"]
+    cache_dir = var_d["cache_dir"]
+    flt_start_time = time.time()
+    model_shapes = {"is_read": False, "is_from_cache": False}
+
+    try:
+        # The functions used here log to RLOG. In this process, RLOG gets its own temp log file
+        # which is merged back into the parent log when all of the models are read.
+        if var_d["rlog_file_path"] != "":
+            RLOG.MP_Log_setup(var_d["log_file_prefix"], var_d["rlog_file_path"])
+
+        list_model_files = []
+        dict_cache_params = {"projection": projection, "code_version": var_d["cache_code_version"]}
+        if cache_dir is not None:
+            str_geom_path = var_d["geom_path"]
+            if str_geom_path != "":
+                list_model_files = [ras_path, str_geom_path, str_geom_path + ".hdf", var_d["flow_path"]]
+
+            if len(list_model_files) > 0:
+                cached_model_shapes = msc.fn_get_cached_model_shapes(
+                    cache_dir, ras_path, list_model_files, dict_cache_params
+                )
+                if cached_model_shapes is not None:
+                    RLOG.trace(f"Shapes of {ras_path} loaded from the model cache")
+                    cached_model_shapes["is_from_cache"] = True
+                    cached_model_shapes["run_seconds"] = time.time() - flt_start_time
+                    return cached_model_shapes
+
+        gdf_return_stream = fn_geodataframe_stream_centerline(ras_path, projection)
+
+        df_flows = hff.fn_get_flow_dataframe(fn_get_active_flow(ras_path))
+        df_xs = fn_geodataframe_cross_sections(ras_path, projection)
+        if df_xs.empty:
+            RLOG.warning("Empty geometry in " + ras_path)
+            return model_shapes
+
+        # Note: interpolated cross section names (ends with *) are already
+        # fixed in fn_geodataframe_cross_sections
+        df_xs["stream_stn"] = df_xs["stream_stn"].astype(float)
+        gdf_xs_flows = fn_gdf_append_xs_with_max_flow(df_xs, df_flows)
+
+        gdf_return_stream = fn_cut_stream_downstream(gdf_return_stream, df_xs)
+
+        model_shapes["stream_wkb"] = shapely.to_wkb(gdf_return_stream.geometry.values)
+        model_shapes["stream_attrs"] = pd.DataFrame(gdf_return_stream.drop(columns="geometry"))
+        model_shapes["xs_wkb"] = shapely.to_wkb(gdf_xs_flows.geometry.values)
+        model_shapes["xs_attrs"] = pd.DataFrame(gdf_xs_flows.drop(columns="geometry"))
+        model_shapes["is_read"] = True
+        model_shapes["read_seconds"] = time.time() - flt_start_time
+
+        if len(list_model_files) > 0:
+            msc.fn_save_model_shapes(cache_dir, ras_path, list_model_files, dict_cache_params, model_shapes)
+
+    except Exception:
+        RLOG.error(f"An error occurred while processing {ras_path}")
+        RLOG.error(traceback.format_exc())
+
+    model_shapes["run_seconds"] = time.time() - flt_start_time
+    return model_shapes
+
+
+# -------------------------------------------------
+def fn_merge_model_shapes(list_model_shapes, str_shape_type, projection):
+    # Merges the WKB geometry and attributes of all models (see mp_read_model_shapes) for
+    # one shape type ("stream" or "xs") into one geodataframe, with the geometry as the first column
+
+    df_attrs = pd.concat(
+        [model_shapes[f"{str_shape_type}_attrs"] for model_shapes in list_model_shapes], ignore_index=True
+    )
+    arr_wkb = np.concatenate([model_shapes[f"{str_shape_type}_wkb"] for model_shapes in list_model_shapes])
+    df_attrs.insert(0, "geometry", shapely.from_wkb(arr_wkb))
+
+    return gpd.GeoDataFrame(df_attrs, geometry="geometry", crs=projection)
+
+
 # -------------------------------------------------
 # Print iterations progress
 def fn_print_progress_bar(
@@ -810,73 +785,26 @@ def fn_create_shapes_from_hecras(input_models_path, output_shp_files_path, proje
                 if (file_ext != "prj") and (file_ext != "PRJ"):
                     continue
 
-                # -----------------------
-                # Check for valid prj files which might have some lines removed
-                # Don't rely on the fact that the file may or may not have existed
-                is_a_valid_prj_file = True
-                new_file_lines = []  # we will rewrite the file out with the dropped lines if applic
-                has_lines_removed = False
-                with open(str_file_path, 'r') as f:
-                    file_lines = f.readlines()
-                    for idx, line in enumerate(file_lines):
-                        line = line.strip()  # removed new line characters
-                        if any(x in line for x in ["PROJCS", "GEOGCS", "DATUM", "PROJECTION"]):
-                            is_a_valid_prj_file = False
-                            continue
-
-                        if (
-                            line.startswith("Geom File=")
-                            or line.startswith("Flow File=")
-                            or line.startswith("Plan File=")
-                        ):
-                            # strip off last three
-                            last_three_chars = line[-3:]
-                            if (
-                                (last_three_chars != "g01")
-                                and (last_three_chars != "p01")
-                                and (last_three_chars != "f01")
-                            ):
-                                # aka.. can't be g02, g10, f21, etc.
-                                has_lines_removed = True
-                            else:
-                                new_file_lines.append(line + "\n")
-                                # new_file_lines.append(line)
-                        else:
-                            # new_file_lines.append(line + "\n")
-                            new_file_lines.append(line + "\n")
-                # end of the "with"
-
-                if is_a_valid_prj_file:  # it is a valid prj file
-                    list_prj_files.append(str_file_path)
-
-                    if has_lines_removed:  # Then we want to rewrite the file with the lines removed
-                        # Re-write the adjusted prj file.
-                        with open(str_file_path, 'w') as f:
-                            f.writelines(new_file_lines)
+                list_prj_files.append(str_file_path)
 
     # -----
-    # checking to see if 'prj' files are not binary and
-    # valid HEC-RAS prj files.  This should exclude all other
-    # prj files
-    # skip projection files
-    textchars = bytearray({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7F})
-    is_binary_string = lambda bytes: bool(bytes.translate(None, textchars))
-
-    str_check = "Current Plan"
-    list_files_valid_prj = []
-
-    # for str_file_path in list_prj_files:
-    for str_file_path in list_prj_files:
-        if not is_binary_string(open(str_file_path, "rb").read(1024)):
-            with open(str_file_path, "r") as file_prj:
-                b_found_match = False
-
-                for line in file_prj:
-                    if str_check in line:
-                        b_found_match = True
-                        break
-                if b_found_match:
-                    list_files_valid_prj.append(str_file_path)
+    # Classify all of the prj files at one time (in a thread pool, reading only the start of each
+    # file). This excludes binary files and ESRI projection files, leaving the HEC-RAS prj files
+    # (ones with a "Current Plan").
+    list_prj_entries = hpc.fn_get_hecras_project_catalog(list_prj_files)
+
+    for prj_entry in list_prj_entries:
+        if prj_entry["is_binary"] is True or prj_entry["is_projection_file"] is True:
+            continue
+
+        # Rewrite the prj files that have geometry, flow or plan files other than the "01" ones
+        # (aka.. can't be g02, g10, f21, etc.)
+        list_file_refs = prj_entry["geom_files"] + prj_entry["flow_files"] + prj_entry["plan_files"]
+        if any(file_ref[-3:] not in ["g01", "p01", "f01"] for file_ref in list_file_refs):
+            fn_remove_prj_file_refs(prj_entry["prj_path"])
+
+    list_prj_entries = [prj_entry for prj_entry in list_prj_entries if prj_entry["is_hecras_project"] is True]
+    list_files_valid_prj = [prj_entry["prj_path"] for prj_entry in list_prj_entries]
 
     RLOG.lprint(f"Number of valid prj files is {len(list_files_valid_prj)}")
     print()
@@ -884,15 +812,14 @@ def fn_create_shapes_from_hecras(input_models_path, output_shp_files_path, proje
     # Run all the HEC-RAS models that do not have the geom HDF files
     list_models_to_compute = []
 
-    for str_prj in list_files_valid_prj:
-        # print("processing:"+str_prj)
-        file_name = fn_get_active_geom(str_prj)
-        if file_name == "":
+    for prj_entry in list_prj_entries:
+        if prj_entry["geom_path"] == "":
+            RLOG.error(f"The current geometry of {prj_entry['prj_path']} could not be found")
             continue
-        str_path_to_geom_hdf = file_name + ".hdf"
+        str_path_to_geom_hdf = prj_entry["geom_path"] + ".hdf"
         if not path.exists(str_path_to_geom_hdf):
             # the hdf file does not exist - add to list of models to compute
-            list_models_to_compute.append(str_prj)
+            list_models_to_compute.append(prj_entry["prj_path"])
 
     if len(list_models_to_compute) > 0:
         # -------------------------------------------------
@@ -904,7 +831,7 @@ def fn_create_shapes_from_hecras(input_models_path, output_shp_files_path, proje
         log_file_prefix = "fn_open_hecras"
         fn_open_hecras_partial = partial(fn_open_hecras, RLOG.LOG_DEFAULT_FOLDER, log_file_prefix)
         # create a pool of processors
-        num_processors = mp.cpu_count() - 2
+        num_processors = max(1, mp.cpu_count() - 2)
         with Pool(processes=num_processors) as executor:
             # multi-process the HEC-RAS calculation of these models
             executor.map(fn_open_hecras_partial, list_models_to_compute)
@@ -919,57 +846,91 @@ def fn_create_shapes_from_hecras(input_models_path, output_shp_files_path, proje
         RLOG.merge_log_files(RLOG.LOG_FILE_PATH, log_file_prefix)
 
     # -----
-    list_geodataframes_stream = []
-    list_geodataframes_cross_sections = []
+    # Read the streams and cross sections (with max flows) of each model in a multi-proc pool.
+    # The results are put back in the same order as list_files_valid_prj so the output is the
+    # same no matter which model finishes first.
     len_valid_prj_files = len(list_files_valid_prj)
+    log_file_prefix = "mp_read_model_shapes"
+    flt_start_read_models = time.time()
+
+    # Models that have not changed since they were last read can come from the model cache
+    cache_dir = None
+    cache_code_version = None
+    if os.getenv("USE_MODEL_SHAPES_CACHE") == "True":
+        cache_dir = sv.R2F_MODEL_SHAPES_CACHE_DIR
+        cache_code_version = msc.fn_get_code_version()
+        RLOG.lprint(f"Unchanged models will be loaded from the model cache at {cache_dir}")
 
     fn_print_progress_bar(
         0, len_valid_prj_files, prefix="Reading HEC-RAS output", suffix="Complete", length=24
     )
     i = 0
 
-    for ras_path in list_files_valid_prj:
-        try:
-            # print(ras_path)
-            gdf_return_stream = fn_geodataframe_stream_centerline(ras_path, projection)
-
-            df_flows = fn_get_flow_dataframe(fn_get_active_flow(ras_path))
-            df_xs = fn_geodataframe_cross_sections(ras_path, projection)
-            if df_xs.empty:
-                RLOG.warning("Empty geometry in " + ras_path)
-                continue
+    list_model_shapes = [None] * len_valid_prj_files
+    num_processors = max(1, mp.cpu_count() - 2)
+    with ProcessPoolExecutor(max_workers=num_processors) as executor:
+        futures_dict = {}
+        for model_idx, prj_entry in enumerate(list_prj_entries):
+            var_d = {
+                "ras_path": prj_entry["prj_path"],
+                "geom_path": prj_entry["geom_path"],
+                "flow_path": prj_entry["flow_path"],
+                "projection": projection,
+                "cache_dir": cache_dir,
+                "cache_code_version": cache_code_version,
+                "rlog_file_path": RLOG.LOG_DEFAULT_FOLDER,
+                "log_file_prefix": log_file_prefix,
+            }
+            futures_dict[executor.submit(mp_read_model_shapes, var_d)] = model_idx
+
+        for future in as_completed(futures_dict):
+            model_idx = futures_dict[future]
+            try:
+                list_model_shapes[model_idx] = future.result()
+            except Exception:
+                # errors reading a model are caught in mp_read_model_shapes, this is the process failing
+                RLOG.error(f"An error occurred while processing {list_files_valid_prj[model_idx]}")
+                RLOG.error(traceback.format_exc())
 
-            # Fix interpolated cross section names (ends with *)
-            for index, row in df_xs.iterrows():
-                str_check = row["stream_stn"]
-                if str_check[-1] == "*":
-                    # Overwrite the value to remove '*'
-                    df_xs.at[index, "stream_stn"] = str_check[:-1]
-
-            df_xs["stream_stn"] = df_xs["stream_stn"].astype(float)
-            gdf_xs_flows = fn_gdf_append_xs_with_max_flow(df_xs, df_flows)
-
-            gdf_return_stream = fn_cut_stream_downstream(gdf_return_stream, df_xs)
-
-            list_geodataframes_stream.append(gdf_return_stream)
-            list_geodataframes_cross_sections.append(gdf_xs_flows)
-        except Exception:
-            RLOG.error(f"An error occurred while processing {ras_path}")
-            RLOG.error(traceback.format_exc())
-            print("")
-
-        time.sleep(0.03)
-        i += 1
-        fn_print_progress_bar(
-            i, len_valid_prj_files, prefix="Reading HEC-RAS output", suffix="Complete", length=24
+            i += 1
+            fn_print_progress_bar(
+                i, len_valid_prj_files, prefix="Reading HEC-RAS output", suffix="Complete", length=24
+            )
+
+    RLOG.merge_log_files(RLOG.LOG_FILE_PATH, log_file_prefix)
+
+    time_read_models = datetime.timedelta(seconds=(time.time() - flt_start_read_models) // 1)
+    RLOG.lprint(f"Reading {len_valid_prj_files} HEC-RAS models took {time_read_models}")
+
+    if cache_dir is not None:
+        list_cached_models = [
+            model_shapes
+            for model_shapes in list_model_shapes
+            if model_shapes is not None and model_shapes["is_from_cache"] is True
+        ]
+        # The time saved is the processing time of the models (not wall clock time, which
+        # is less as the models are read in parallel)
+        flt_saved_seconds = sum(
+            model_shapes["read_seconds"] - model_shapes["run_seconds"] for model_shapes in list_cached_models
+        )
+        time_saved = datetime.timedelta(seconds=max(flt_saved_seconds, 0) // 1)
+        int_cache_hits = len(list_cached_models)
+        flt_cache_hit_pct = 0 if len_valid_prj_files == 0 else 100 * int_cache_hits / len_valid_prj_files
+        RLOG.lprint(
+            f"{int_cache_hits} of {len_valid_prj_files} models ({flt_cache_hit_pct:.1f}%) were loaded"
+            f" from the model cache, saving about {time_saved} of processing time"
         )
 
-    # Create GeoDataframe of the streams and cross sections
-    gdf_aggregate_streams = gpd.GeoDataFrame(pd.concat(list_geodataframes_stream, ignore_index=True))
+    # drop the models that had no cross sections or failed (already logged)
+    list_model_shapes = [
+        model_shapes
+        for model_shapes in list_model_shapes
+        if model_shapes is not None and model_shapes["is_read"] is True
+    ]
 
-    gdf_aggregate_cross_section = gpd.GeoDataFrame(
-        pd.concat(list_geodataframes_cross_sections, ignore_index=True)
-    )
+    # Create GeoDataframe of the streams and cross sections
+    gdf_aggregate_streams = fn_merge_model_shapes(list_model_shapes, "stream", projection)
+    gdf_aggregate_cross_section = fn_merge_model_shapes(list_model_shapes, "xs", projection)
 
     # Create shapefiles of the streams and cross sections
     gdf_aggregate_streams.to_file(str_path_to_output_streams)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import shared_variables as sv
+
+
+"""
+The geocurve store is a per-unit, columnar copy of all of the geocurve csv's for a unit.
+
+It is made up of two files which live in the final/geocurves folder beside the csv's:
+    - geocurves.parquet: One GeoParquet file of every geocurve record for the unit, sorted by
+        feature_id, then model (name_mid), then discharge. The geometry is saved as WKB and is
+        already reprojected to sv.DEFAULT_RASTER_OUTPUT_CRS (5070).
+    - geocurves_index.csv: One record per feature_id / model (name_mid) combination, saying what
+        row range (row_start inclusive, row_end exclusive) it has in the parquet file.
+
+Using the index, tools like ras2inundation.py can read just the parquet row groups that hold the
+feature_ids they need, without re-parsing WKT or reprojecting on each call.
+"""
+
+# Global Variables
+RLOG = sv.R2F_LOG
+
+# Smaller row groups means less reading per lookup but a slightly larger file.
+GEOCURVE_STORE_ROW_GROUP_SIZE = 5000
+
+
+# -------------------------------------------------
+def geocurve_store_exists(geocurves_dir):
+    """
+    Overview:
+        Returns True if both the geocurve store parquet and its index are in the geocurves_dir.
+    """
+
+    store_file_path = os.path.join(geocurves_dir, sv.R2F_OUTPUT_FILE_GEOCURVE_STORE)
+    index_file_path = os.path.join(geocurves_dir, sv.R2F_OUTPUT_FILE_GEOCURVE_STORE_INDEX)
+    return os.path.exists(store_file_path) and os.path.exists(index_file_path)
+
+
+# -------------------------------------------------
+def write_geocurve_store(geocurve_gdf_list, geocurves_dir):
+    """
+    Overview:
+        Merges all geocurve geodataframes for a unit, reprojects them to sv.DEFAULT_RASTER_OUTPUT_CRS
+        and saves them as the geocurve store (parquet and index) in the geocurves_dir.
+
+    Inputs:
+        - geocurve_gdf_list: list of geodataframes, each one having the same columns as a geocurve
+            csv plus a "name_mid" column (the model key used in the geocurve csv file names).
+        - geocurves_dir: the unit's final/geocurves folder.
+
+    Output:
+        The full path to the parquet file, or None if there were no records to save.
+    """
+
+    if len(geocurve_gdf_list) == 0:
+        RLOG.warning("No geocurve records were available to create the geocurve store")
+        return None
+
+    # Each model can have its own crs, so reproject before they are merged.
+    store_gdf = gpd.GeoDataFrame(
+        pd.concat([gdf.to_crs(sv.DEFAULT_RASTER_OUTPUT_CRS) for gdf in geocurve_gdf_list], ignore_index=True),
+        geometry="geometry",
+        crs=sv.DEFAULT_RASTER_OUTPUT_CRS,
+    )
+
+    store_gdf["crs"] = sv.DEFAULT_RASTER_OUTPUT_CRS
+    store_gdf["feature_id"] = store_gdf["feature_id"].astype("int64")
+
+    # Parquet needs a single type per column. Some of the csv driven columns can be mixed
+    for col_name in store_gdf.columns:
+        if col_name != "geometry" and store_gdf[col_name].dtype == object:
+            store_gdf[col_name] = store_gdf[col_name].astype(str)
+
+    # Sorting makes each feature_id / name_mid combination one contiguous block of rows
+    store_gdf = store_gdf.sort_values(by=["feature_id", "name_mid", "discharge_cfs"]).reset_index(drop=True)
+
+    keys_df = store_gdf[["feature_id", "name_mid"]]
+    is_block_start = (keys_df != keys_df.shift()).any(axis=1).to_numpy()
+    row_starts = np.flatnonzero(is_block_start)
+    row_ends = np.append(row_starts[1:], len(store_gdf))
+
+    index_df = pd.DataFrame(
+        {
+            "feature_id": keys_df["feature_id"].to_numpy()[row_starts],
+            "name_mid": keys_df["name_mid"].to_numpy()[row_starts],
+            "row_start": row_starts,
+            "row_end": row_ends,
+        }
+    )
+
+    store_file_path = os.path.join(geocurves_dir, sv.R2F_OUTPUT_FILE_GEOCURVE_STORE)
+    index_file_path = os.path.join(geocurves_dir, sv.R2F_OUTPUT_FILE_GEOCURVE_STORE_INDEX)
+
+    RLOG.trace(f"Saving geocurve store: {store_file_path}")
+    store_gdf.to_parquet(store_file_path, index=False, row_group_size=GEOCURVE_STORE_ROW_GROUP_SIZE)
+    index_df.to_csv(index_file_path, index=False)
+
+    RLOG.lprint(
+        f"Geocurve store created with {len(store_gdf)} records for {index_df.feature_id.nunique()}"
+        " feature ids"
+    )
+
+    return store_file_path
+
+
+# -------------------------------------------------
+def read_geocurve_store(geocurves_dir, feature_ids, columns=None):
+    """
+    Overview:
+        Loads only the geocurve store records for the requested feature ids. Only the parquet
+        row groups holding those records are read.
+
+        A feature id can have geocurves from more than one model. When that happens, only the
+        records for the last model (sorted by name_mid) are returned so each feature id has
+        one geocurve.
+
+    Inputs:
+        - geocurves_dir: folder holding the geocurve store files.
+        - feature_ids: an iterable of feature ids (int or str)
+        - columns: optional list of columns to load. The "feature_id" and "geometry" columns are
+            always included.
+
+    Output:
+        A geodataframe in sv.DEFAULT_RASTER_OUTPUT_CRS (can be empty)
+    """
+
+    store_file_path = os.path.join(geocurves_dir, sv.R2F_OUTPUT_FILE_GEOCURVE_STORE)
+    index_file_path = os.path.join(geocurves_dir, sv.R2F_OUTPUT_FILE_GEOCURVE_STORE_INDEX)
+
+    if columns is not None:
+        columns = list(dict.fromkeys(["feature_id"] + list(columns) + ["geometry"]))
+
+    feature_ids = pd.to_numeric(pd.Series(list(feature_ids)), errors="coerce").dropna().astype("int64")
+
+    index_df = pd.read_csv(index_file_path, dtype={"feature_id": "int64", "name_mid": str})
+    index_df = index_df.loc[index_df["feature_id"].isin(feature_ids)]
+    index_df = index_df.sort_values(by=["feature_id", "name_mid"]).drop_duplicates(
+        subset="feature_id", keep="last"
+    )
+
+    if len(index_df) == 0:
+        empty_columns = columns if columns is not None else ["feature_id", "geometry"]
+        return gpd.GeoDataFrame(columns=empty_columns, geometry="geometry", crs=sv.DEFAULT_RASTER_OUTPUT_CRS)
+
+    # the global row numbers we want, in store order
+    row_ids = np.concatenate(
+        [np.arange(start, end) for start, end in zip(index_df["row_start"], index_df["row_end"])]
+    )
+
+    parquet_file = pq.ParquetFile(store_file_path)
+    num_row_groups = parquet_file.metadata.num_row_groups
+    rg_num_rows = np.array([parquet_file.metadata.row_group(i).num_rows for i in range(num_row_groups)])
+    rg_starts = np.concatenate([[0], np.cumsum(rg_num_rows)])
+
+    row_group_ids = np.searchsorted(rg_starts, row_ids, side="right") - 1
+    needed_row_groups = np.unique(row_group_ids)
+
+    table = parquet_file.read_row_groups(needed_row_groups.tolist(), columns=columns)
+
+    # Convert the global row numbers to positions in the table of just the row groups we read
+    needed_rg_offsets = np.concatenate([[0], np.cumsum(rg_num_rows[needed_row_groups])])[:-1]
+    table_positions = needed_rg_offsets[np.searchsorted(needed_row_groups, row_group_ids)] + (
+        row_ids - rg_starts[row_group_ids]
+    )
+    store_df = table.take(pa.array(table_positions)).to_pandas()
+
+    store_gdf = gpd.GeoDataFrame(
+        store_df.drop(columns="geometry"),
+        geometry=gpd.GeoSeries.from_wkb(store_df["geometry"], crs=sv.DEFAULT_RASTER_OUTPUT_CRS),
+    )
+
+    return store_gdf
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import os
+
+import pandas as pd
+
+
+"""
+One parser for HEC-RAS steady flow files (.f01, .f02, etc).
+
+A flow file is read line by line, one time, and everything the ras2fim steps need from it is
+pulled out in that one pass:
+    - the number of profiles and the profile names
+    - each "River Rch & RM=" block (river, reach, start cross section and all of its flow values)
+    - the boundary condition values ("Dn Known WS=" and "Dn Slope=" lines)
+
+The results are kept in memory for the life of the process, keyed by the flow file path. Each
+cached record also keeps the file's modified time and size, so if a flow file is rewritten
+(ie. the second pass flow files) it is read again.
+"""
+
+# Global Variables
+# key: absolute flow file path, value: (modified time ns, file size, parsed flow file dict)
+_FLOW_FILE_CACHE = {}
+
+# The number of characters for each flow value, and the max number of values per line
+FLOW_VALUE_WIDTH = 8
+FLOW_VALUES_PER_LINE = 10
+
+
+# -------------------------------------------------
+def fn_parse_flow_file(str_path_hecras_flow_fn):
+    """
+    Overview:
+        Returns the parsed contents of a HEC-RAS steady flow file. If the file has already been
+        parsed in this process and has not changed since, the cached copy is returned.
+
+        Note: The returned dictionary is shared with other callers, so do not change it.
+        Use fn_get_flow_dataframe if you need a dataframe you can change.
+
+    Inputs:
+        - str_path_hecras_flow_fn: path to the flow file
+
+    Output:
+        A dictionary of:
+            - num_profiles: (int) from the "Number of Profiles=" line
+            - profile_names: (list of str) from the "Profile Names=" line
+            - df_flows: dataframe of river, reach, start_xs and max_flow. One row for each
+                  cross section where the flow changes ("River Rch & RM=" line), in file order.
+            - flow_values: list (one per df_flows row) of lists of all of the flow values
+            - dn_known_ws: list of the "Dn Known WS=" values (as str, one per profile)
+            - dn_slope: list of the "Dn Slope=" values (as str, including the line end)
+    """
+
+    str_path = os.path.abspath(str_path_hecras_flow_fn)
+    file_stat = os.stat(str_path)
+
+    cached_flow_file = _FLOW_FILE_CACHE.get(str_path)
+    if (
+        cached_flow_file is not None
+        and cached_flow_file[0] == file_stat.st_mtime_ns
+        and cached_flow_file[1] == file_stat.st_size
+    ):
+        return cached_flow_file[2]
+
+    int_flow_profiles = 0
+    list_profile_names = []
+    list_flow_records = []
+    list_all_flow_values = []
+    list_dn_known_ws = []
+    list_dn_slope = []
+
+    with open(str_path, "r") as hecras_flow_file:
+        for line in hecras_flow_file:
+            if line[:19] == "Number of Profiles=":
+                int_flow_profiles = int(line[19:])
+
+            elif line[:14] == "Profile Names=":
+                list_profile_names = line[14:].strip().split(",")
+
+            elif line[:15] == "River Rch & RM=":
+                # split the data on the comma and use strip to remove whitespace
+                list_river_reach = line[15:].split(",")
+
+                # The flow values follow on the next line(s), a maximum of 10 values
+                # per line, each value 8 characters wide.
+                list_flow_values = []
+                int_flow_rows = int(int_flow_profiles // FLOW_VALUES_PER_LINE + 1)
+                for __ in range(int_flow_rows):
+                    if len(list_flow_values) >= int_flow_profiles:
+                        break
+                    line_flows = next(hecras_flow_file, "").rstrip("\r\n")
+                    int_val_in_row = len(line_flows) // FLOW_VALUE_WIDTH
+                    list_flow_values.extend(
+                        float(line_flows[k * FLOW_VALUE_WIDTH : (k + 1) * FLOW_VALUE_WIDTH])
+                        for k in range(int_val_in_row)
+                    )
+
+                list_flow_records.append(
+                    {
+                        "river": list_river_reach[0].strip(),
+                        "reach": list_river_reach[1].strip(),
+                        "start_xs": float(list_river_reach[2].strip()),
+                        "max_flow": max(list_flow_values),
+                    }
+                )
+                list_all_flow_values.append(list_flow_values)
+
+            elif line[:12] == "Dn Known WS=":
+                list_dn_known_ws.append(line[12:].strip())
+
+            elif line[:8] == "Dn Slope":
+                list_dn_slope.append(line[9:])
+
+    flow_file = {
+        "num_profiles": int_flow_profiles,
+        "profile_names": list_profile_names,
+        "df_flows": pd.DataFrame(list_flow_records, columns=["river", "reach", "start_xs", "max_flow"]),
+        "flow_values": list_all_flow_values,
+        "dn_known_ws": list_dn_known_ws,
+        "dn_slope": list_dn_slope,
+    }
+
+    _FLOW_FILE_CACHE[str_path] = (file_stat.st_mtime_ns, file_stat.st_size, flow_file)
+
+    return flow_file
+
+
+# -------------------------------------------------
+def fn_get_flow_dataframe(str_path_hecras_flow_fn):
+    # Get pandas dataframe (river, reach, start_xs, max_flow) of the flows in a flow file
+    # A copy is returned so the caller can change it.
+    return fn_parse_flow_file(str_path_hecras_flow_fn)["df_flows"].copy()
+
+
+# -------------------------------------------------
+def fn_get_flow_all_values_dataframe(str_path_hecras_flow_fn):
+    # Get a pandas dataframe of all flow values in a flow file. One row for each cross section
+    # where the flow changes and one column for each profile (flow1, flow2, etc)
+    flow_file = fn_parse_flow_file(str_path_hecras_flow_fn)
+
+    df_all_flow_values = pd.DataFrame(flow_file["flow_values"])
+    df_all_flow_values.columns = ["flow" + str(j + 1) for j in range(flow_file["num_profiles"])]
+
+    return df_all_flow_values
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+from functools import lru_cache
+
+import model_shapes_cache as msc
+import shared_variables as sv
+import x_sections_info_store as xsis
+
+
+"""
+Per model checkpoints for create_fim_rasters, so a rerun only runs the models that did not finish
+(or whose inputs have changed) instead of every model in the unit.
+
+When a model finishes a HEC-RAS pass, a checkpoint file is saved in its model folder. It records:
+    - the model's inputs: a fingerprint (size, modified time and sha256) of every file the
+      model folder had before its first pass (the copied parent model plus the created project,
+      plan, geometry and flow files), its terrain and the projection file. Their paths are
+      relative to the unit folder.
+    - the version of the code the model was run with (see fn_get_code_version), so a change to
+      the code that runs the models or reads their results does not use older model outputs.
+    - the outputs of each pass that has finished: the size and modified time of the first pass
+      all_x_sections_info file, and of every file the second pass created or changed
+      (all_x_sections_info_2nd, the depth grids, etc).
+
+On a rerun, the previous model folders are set aside, the model folders are created again as
+usual and each new model folder is checked against its previous checkpoint:
+    - same inputs, and the outputs of both passes are still there, unchanged: the previous model
+      folder is used and the model is not run.
+    - same inputs, but only the first pass outputs are still there: the first pass results are
+      copied to the new model folder and only the second pass is run.
+    - anything else: the model is run from the start.
+
+The inputs are compared by content (a new copy of a file is not a change). The outputs are only
+compared by size and modified time, so checking a finished model does not read its depth grids.
+
+A new unit folder can also use the finished models of an earlier unit folder of the same huc, crs
+and source: they are copied to its previous model folder first (see fn_copy_previous_models) and
+the earlier unit folder is not changed.
+"""
+
+# Global Variables
+# Change this if the checkpoint contents change, so older checkpoints are not used
+CHECKPOINT_VERSION = 3
+
+CHECKPOINT_FILE_NAME = "model_checkpoint.json"
+
+# The previous model folders are moved here on a rerun, until they have been checked
+PREVIOUS_DIR_SUFFIX = "_previous"
+
+# The src files that create and run the models and read their results (see fn_get_code_version)
+MODEL_CHECKPOINT_CODE_FILE_NAMES = [
+    "hecras_flow_file.py",
+    "hecras_model_checkpoints.py",
+    "hecras_plan_results.py",
+    "worker_fim_rasters.py",
+    "x_sections_info_store.py",
+]
+
+
+# -------------------------------------------------
+def __get_checkpoint_path(model_dir):
+    return os.path.join(model_dir, CHECKPOINT_FILE_NAME)
+
+
+# -------------------------------------------------
+def __get_first_pass_output_name(model_folder):
+    return os.path.basename(xsis.fn_get_x_sections_info_path("", model_folder, 1))
+
+
+# -------------------------------------------------
+def __list_model_files(model_dir):
+    # All files in a model folder (including sub folders) except the checkpoint, relative to it
+    list_file_names = []
+    for root, __, file_names in os.walk(model_dir):
+        for file_name in file_names:
+            file_name = os.path.relpath(os.path.join(root, file_name), model_dir)
+            if file_name != CHECKPOINT_FILE_NAME:
+                list_file_names.append(file_name)
+    list_file_names.sort()
+    return list_file_names
+
+
+# -------------------------------------------------
+def __get_output_stats(model_dir, list_file_names):
+    dict_stats = {}
+    for file_name in list_file_names:
+        file_stat = os.stat(os.path.join(model_dir, file_name))
+        dict_stats[file_name] = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns}
+    return dict_stats
+
+
+# -------------------------------------------------
+def __is_outputs_unchanged(model_dir, dict_output_stats):
+    for file_name, prev_stat in dict_output_stats.items():
+        file_path = os.path.join(model_dir, file_name)
+        if os.path.isfile(file_path) is False:
+            return False
+        file_stat = os.stat(file_path)
+        if file_stat.st_size != prev_stat["size"] or file_stat.st_mtime_ns != prev_stat["mtime_ns"]:
+            return False
+    return True
+
+
+# -------------------------------------------------
+def __is_inputs_unchanged(dict_input_fingerprints, dict_prev_fingerprints):
+    if sorted(dict_input_fingerprints.keys()) != sorted(dict_prev_fingerprints.keys()):
+        return False
+
+    for file_path, fingerprint in dict_input_fingerprints.items():
+        prev_fingerprint = dict_prev_fingerprints[file_path]
+        if fingerprint is None or prev_fingerprint is None:
+            if fingerprint != prev_fingerprint:
+                return False
+            continue
+        if (
+            fingerprint["size"] != prev_fingerprint["size"]
+            or fingerprint["sha256"] != prev_fingerprint["sha256"]
+        ):
+            return False
+    return True
+
+
+# -------------------------------------------------
+def __read_checkpoint(model_dir):
+    # Returns the checkpoint of a model folder, or None if it has none (or it can not be used)
+
+    checkpoint_path = __get_checkpoint_path(model_dir)
+    if os.path.exists(checkpoint_path) is False:
+        return None
+
+    try:
+        with open(checkpoint_path, "r") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except Exception:
+        # a bad checkpoint is the same as no checkpoint
+        return None
+
+    if (
+        checkpoint.get("version") != CHECKPOINT_VERSION
+        or checkpoint.get("code_version") != fn_get_code_version()
+    ):
+        return None
+
+    return checkpoint
+
+
+# -------------------------------------------------
+def __write_checkpoint(model_dir, checkpoint):
+    # write to a temp file first so a partly written checkpoint is never used
+    checkpoint_path = __get_checkpoint_path(model_dir)
+    with open(checkpoint_path + ".tmp", "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=2)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+# -------------------------------------------------
+def __new_checkpoint(dict_input_fingerprints):
+    return {
+        "version": CHECKPOINT_VERSION,
+        "code_version": fn_get_code_version(),
+        "inputs": dict_input_fingerprints,
+    }
+
+
+# -------------------------------------------------
+@lru_cache(maxsize=None)
+def fn_get_code_version():
+    """
+    Overview:
+        Returns the version of the code the models are run with: the ras2fim version plus a hash
+        of the src files in MODEL_CHECKPOINT_CODE_FILE_NAMES (see
+        model_shapes_cache.fn_get_code_version). It is only worked out once per process.
+    """
+
+    return msc.fn_get_code_version(MODEL_CHECKPOINT_CODE_FILE_NAMES)
+
+
+# -------------------------------------------------
+def fn_get_model_input_fingerprints(unit_output_folder, model_folder, huc8_num, dict_prev_fingerprints=None):
+    """
+    Overview:
+        Returns the fingerprints of a model's inputs: every file in its model folder (before its
+        first pass), its terrain and the projection file (see the top of this file).
+
+    Inputs:
+        - unit_output_folder: the unit folder
+        - model_folder: the model folder name (ie. 1234_name)
+        - huc8_num: the huc8 (for the projection file name)
+        - dict_prev_fingerprints: OPTIONAL: fingerprints from an earlier checkpoint, so files
+              with the same size and modified time are not hashed again
+
+    Output:
+        A dictionary of file path (relative to the unit folder) -> fingerprint
+        (see model_shapes_cache.fn_get_file_fingerprints)
+    """
+
+    model_dir = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT, model_folder)
+
+    list_file_paths = [os.path.join(model_dir, file_name) for file_name in __list_model_files(model_dir)]
+    # the terrain name is the model id (see worker_fim_rasters.create_2ndpass_files)
+    list_file_paths.append(
+        os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_TERRAIN, model_folder[:5] + ".hdf")
+    )
+    list_file_paths.append(
+        os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_SHAPES_FROM_CONF, huc8_num + "_huc_12_ar.prj")
+    )
+
+    unit_output_folder = os.path.abspath(unit_output_folder)
+    if dict_prev_fingerprints is not None:
+        dict_prev_fingerprints = {
+            os.path.join(unit_output_folder, file_path): fingerprint
+            for file_path, fingerprint in dict_prev_fingerprints.items()
+        }
+
+    dict_fingerprints = msc.fn_get_file_fingerprints(list_file_paths, dict_prev_fingerprints)
+    return {
+        os.path.relpath(file_path, unit_output_folder): fingerprint
+        for file_path, fingerprint in dict_fingerprints.items()
+    }
+
+
+# -------------------------------------------------
+def fn_save_pass_checkpoint(model_dir, model_folder, pass_num, dict_input_fingerprints):
+    """
+    Overview:
+        Saves the checkpoint of a model that has just finished a HEC-RAS pass.
+
+    Inputs:
+        - model_dir: the model folder path
+        - model_folder: the model folder name
+        - pass_num: 1 or 2
+        - dict_input_fingerprints: the model's input fingerprints from before its first pass
+              (see fn_get_model_input_fingerprints)
+    """
+
+    checkpoint = __read_checkpoint(model_dir)
+    if pass_num == 1 or checkpoint is None:
+        checkpoint = __new_checkpoint(dict_input_fingerprints)
+
+    if pass_num == 1:
+        list_output_names = [__get_first_pass_output_name(model_folder)]
+    else:
+        # every file the model folder did not have before the first pass, or that has changed since
+        list_output_names = []
+        for file_name in __list_model_files(model_dir):
+            fingerprint = dict_input_fingerprints.get(
+                os.path.join(sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT, model_folder, file_name)
+            )
+            file_stat = os.stat(os.path.join(model_dir, file_name))
+            if (
+                fingerprint is None
+                or fingerprint["size"] != file_stat.st_size
+                or fingerprint["mtime_ns"] != file_stat.st_mtime_ns
+            ):
+                list_output_names.append(file_name)
+
+    checkpoint[f"pass_{pass_num}_outputs"] = __get_output_stats(model_dir, list_output_names)
+    __write_checkpoint(model_dir, checkpoint)
+
+
+# -------------------------------------------------
+def fn_set_aside_previous_models(unit_output_folder):
+    """
+    Overview:
+        Moves the previous model folders (the HEC-RAS output folder) aside, so the model folders
+        can be created again. Returns the folder they were moved to, which is also where they
+        still are if an earlier rerun stopped before they were all checked.
+
+        Model folders in the HEC-RAS output folder that have a checkpoint (ie. they were finished
+        by an earlier rerun that then stopped) are moved there as well, replacing older copies.
+
+    Inputs:
+        - unit_output_folder: the unit folder
+    """
+
+    path_created_ras_models = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT)
+    path_previous = path_created_ras_models + PREVIOUS_DIR_SUFFIX
+
+    if os.path.exists(path_created_ras_models) is False:
+        return path_previous
+
+    if os.path.exists(path_previous) is False:
+        os.rename(path_created_ras_models, path_previous)
+        return path_previous
+
+    for model_folder in os.listdir(path_created_ras_models):
+        model_dir = os.path.join(path_created_ras_models, model_folder)
+        if __read_checkpoint(model_dir) is None:
+            continue
+        previous_model_dir = os.path.join(path_previous, model_folder)
+        if os.path.exists(previous_model_dir):
+            shutil.rmtree(previous_model_dir)
+        os.rename(model_dir, previous_model_dir)
+
+    shutil.rmtree(path_created_ras_models)
+    return path_previous
+
+
+# -------------------------------------------------
+def fn_copy_previous_models(previous_unit_folder, unit_output_folder):
+    """
+    Overview:
+        Copies the model folders that have a checkpoint from the HEC-RAS output folder of an
+        earlier unit folder to the previous model folder of a new unit folder (see
+        fn_set_aside_previous_models), so step 5 of the new unit can use the ones that are still
+        current. The earlier unit folder is not changed.
+
+    Inputs:
+        - previous_unit_folder: the earlier unit folder
+        - unit_output_folder: the new unit folder
+
+    Output:
+        The number of model folders copied
+    """
+
+    path_source_models = os.path.join(previous_unit_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT)
+    path_previous = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT + PREVIOUS_DIR_SUFFIX)
+
+    if os.path.exists(path_source_models) is False:
+        return 0
+
+    num_models_copied = 0
+    for model_folder in sorted(os.listdir(path_source_models)):
+        model_dir = os.path.join(path_source_models, model_folder)
+        if __read_checkpoint(model_dir) is None:
+            continue
+        # copytree keeps the modified times, so the outputs still match the checkpoint
+        shutil.copytree(model_dir, os.path.join(path_previous, model_folder), dirs_exist_ok=True)
+        num_models_copied += 1
+
+    return num_models_copied
+
+
+# -------------------------------------------------
+def fn_restore_model(unit_output_folder, model_folder, huc8_num, path_previous):
+    """
+    Overview:
+        Checks a newly created model folder against the checkpoint of its previous model folder
+        (see the top of this file) and restores what can be used from it.
+
+    Inputs:
+        - unit_output_folder: the unit folder
+        - model_folder: the model folder name
+        - huc8_num: the huc8
+        - path_previous: the folder the previous model folders were set aside in
+
+    Output:
+        A tuple of:
+            - the number of passes that do not need to be run again (0, 1 or 2)
+            - the model's input fingerprints (for its checkpoints)
+    """
+
+    model_dir = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT, model_folder)
+    previous_model_dir = os.path.join(path_previous, model_folder)
+
+    checkpoint = None
+    if os.path.isdir(previous_model_dir):
+        checkpoint = __read_checkpoint(previous_model_dir)
+
+    dict_prev_fingerprints = None if checkpoint is None else checkpoint["inputs"]
+    dict_input_fingerprints = fn_get_model_input_fingerprints(
+        unit_output_folder, model_folder, huc8_num, dict_prev_fingerprints
+    )
+
+    if checkpoint is None or __is_inputs_unchanged(dict_input_fingerprints, dict_prev_fingerprints) is False:
+        return 0, dict_input_fingerprints
+
+    dict_pass_1_outputs = checkpoint.get("pass_1_outputs")
+    dict_pass_2_outputs = checkpoint.get("pass_2_outputs")
+
+    if dict_pass_2_outputs is not None and __is_outputs_unchanged(previous_model_dir, dict_pass_2_outputs):
+        shutil.rmtree(model_dir)
+        os.rename(previous_model_dir, model_dir)
+        return 2, dict_input_fingerprints
+
+    if dict_pass_1_outputs is not None and __is_outputs_unchanged(previous_model_dir, dict_pass_1_outputs):
+        # copy2 keeps the modified time, so the first pass output still matches the checkpoint
+        for file_name in dict_pass_1_outputs.keys():
+            shutil.copy2(os.path.join(previous_model_dir, file_name), os.path.join(model_dir, file_name))
+        checkpoint = __new_checkpoint(dict_input_fingerprints)
+        checkpoint["pass_1_outputs"] = dict_pass_1_outputs
+        __write_checkpoint(model_dir, checkpoint)
+        return 1, dict_input_fingerprints
+
+    return 0, dict_input_fingerprints
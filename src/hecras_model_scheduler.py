@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+import multiprocessing as mp
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing.connection import wait
+
+import psutil
+
+import hecras_project_catalog as hpc
+
+
+"""
+Runs the HEC-RAS models of a unit in worker processes (see create_fim_rasters).
+
+    - The models are run longest first, using a cost estimate of the number of cross sections
+      times the number of profiles. Starting the big models first means the end of the run is
+      not one big model running on its own while the other workers are idle.
+    - Each model gets a wall clock time limit. A model still running after it is taken as hung:
+      its worker process, and any process it started, is killed and the model is recorded.
+      HEC-RAS itself is not started by the worker (the HEC-RAS controller is a COM server, so
+      windows starts Ras.exe on its own), so the HEC-RAS processes using the model's folder are
+      killed as well (see fn_kill_hecras_processes).
+    - Each model runs in its own process so it can be killed, which a pool (ie.
+      ProcessPoolExecutor) can not do to one task.
+
+The function that runs a model is passed in. It is called in the worker process with the model's
+inputs (a dictionary of keyword arguments) and must be a module level function so it can be
+pickled. A model "completed" if the function returns and "failed" if it raises an exception.
+The function is expected to log its own errors. As it is passed in, the scheduler can be run on
+any machine with a fake function (ie. one that sleeps for a set time, fails or never returns).
+
+Models that fail or time out are written to a candidate bad models list in the same format as
+config/bad_models_list.lst. It is not added to config/bad_models_list.lst automatically, as a
+model can fail for other reasons (ie. a bug in our code). Check the model with the HEC-RAS UI
+tool first.
+"""
+
+# Global Variables
+# A model still running after this is taken as hung (it covers both HEC-RAS passes of a model,
+# see worker_fim_rasters.fn_run_one_ras_model_both_passes)
+MODEL_TIMEOUT_SECONDS = 2 * 60 * 60
+
+# How often (max) the running models are checked for their time limit
+SCHEDULER_POLL_SECONDS = 5
+
+# The line in a HEC-RAS geometry file that starts each node (ie. "Type RM Length L Ch R = 1 ,...")
+# Node type 1 is a cross section (others are culverts, bridges, inline structures, etc)
+GEOM_NODE_LINE_KEY = "Type RM Length L Ch R ="
+
+BAD_MODEL_CANDIDATES_FILE_NAME = "bad_models_list_candidates.lst"
+
+# The HEC-RAS programs that can have a model's files open (lower case)
+HECRAS_PROCESS_NAMES = ["ras.exe", "rassteady.exe", "rasprocess.exe"]
+
+
+# -------------------------------------------------
+def fn_count_cross_sections(str_geom_path):
+    # Returns the number of cross sections in a HEC-RAS geometry file (0 if it can not be read)
+
+    if str_geom_path == "" or os.path.isfile(str_geom_path) is False:
+        return 0
+
+    int_xs_count = 0
+    with open(str_geom_path, "r", errors="ignore") as geom_file:
+        for line in geom_file:
+            if line.startswith(GEOM_NODE_LINE_KEY) and line[len(GEOM_NODE_LINE_KEY) :].strip()[:1] == "1":
+                int_xs_count += 1
+
+    return int_xs_count
+
+
+# -------------------------------------------------
+def fn_get_model_cost(str_ras_projectpath, int_number_of_steps):
+    """
+    Overview:
+        Returns the estimated cost of running a HEC-RAS model: the number of cross sections in
+        the geometry file of its current plan times the number of profiles. Only the order of the
+        costs matters, they are not a time.
+
+    Inputs:
+        - str_ras_projectpath: the HEC-RAS project (.prj) file path
+        - int_number_of_steps: the number of profiles
+    """
+
+    int_xs_count = 0
+    if os.path.isfile(str_ras_projectpath):
+        prj_entry = hpc.fn_classify_prj_file(str_ras_projectpath)
+        int_xs_count = fn_count_cross_sections(prj_entry["geom_path"])
+
+    # A model whose geometry can not be read is still ordered by its number of profiles
+    return max(int_xs_count, 1) * int_number_of_steps
+
+
+# -------------------------------------------------
+def __run_model(fn_run_model, dict_model_inputs):
+    # The worker process. The exit code is all the scheduler needs, the model function logs its
+    # own errors
+    try:
+        fn_run_model(**dict_model_inputs)
+    except Exception:
+        sys.exit(1)
+
+
+# -------------------------------------------------
+def __kill_process_tree(process):
+    # Kills the worker process and any process it started (children first)
+
+    try:
+        list_children = psutil.Process(process.pid).children(recursive=True)
+    except psutil.NoSuchProcess:
+        list_children = []
+
+    for child in list_children:
+        try:
+            child.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+    process.kill()
+    process.join()
+
+
+# -------------------------------------------------
+def __is_process_using_folder(process, str_model_dir):
+    # True if the process has the folder, or a file in it, in its command line or open files
+    try:
+        list_paths = process.cmdline() + [open_file.path for open_file in process.open_files()]
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+    return any(str_model_dir in os.path.normcase(os.path.abspath(path)) for path in list_paths)
+
+
+# -------------------------------------------------
+def fn_kill_hecras_processes(dict_model_inputs):
+    """
+    Overview:
+        Kills the HEC-RAS processes (HECRAS_PROCESS_NAMES) that are using a model's folder, and
+        any process they started. It is used for a hung model, as HEC-RAS is not a child of the
+        model's worker process. Returns the number of processes killed.
+
+    Inputs:
+        - dict_model_inputs: the model's inputs. The model folder is the folder of its
+              "str_ras_projectpath"
+    """
+
+    str_model_dir = os.path.normcase(
+        os.path.abspath(os.path.dirname(dict_model_inputs["str_ras_projectpath"]))
+    )
+
+    list_processes = []
+    for process in psutil.process_iter(["name"]):
+        if (process.info["name"] or "").lower() in HECRAS_PROCESS_NAMES and __is_process_using_folder(
+            process, str_model_dir
+        ):
+            list_processes.append(process)
+
+    int_killed = 0
+    for process in list_processes:
+        try:
+            list_children = process.children(recursive=True)
+        except psutil.NoSuchProcess:
+            continue
+
+        for child in list_children + [process]:
+            try:
+                child.kill()
+                int_killed += 1
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+
+    psutil.wait_procs(list_processes, timeout=10)
+    return int_killed
+
+
+# -------------------------------------------------
+def fn_run_models(
+    list_model_inputs,
+    fn_run_model,
+    num_workers,
+    list_costs=None,
+    timeout_seconds=MODEL_TIMEOUT_SECONDS,
+    poll_seconds=SCHEDULER_POLL_SECONDS,
+    fn_kill_model_processes=None,
+):
+    """
+    Overview:
+        Runs the models longest first (by cost) in up to num_workers processes at a time and kills
+        any model that runs longer than timeout_seconds (see the top of this file).
+
+    Inputs:
+        - list_model_inputs: a dictionary of keyword arguments for fn_run_model per model
+        - fn_run_model: the module level function that runs one model
+        - num_workers: the max number of models running at a time (at least 1 is used)
+        - list_costs: OPTIONAL: the cost of each model. If None, the costs are estimated with
+              fn_get_model_cost from the "str_ras_projectpath" and "int_number_of_steps" inputs
+        - timeout_seconds: the wall clock time limit per model
+        - poll_seconds: the max time between checks of the running models
+        - fn_kill_model_processes: OPTIONAL: called with a hung model's inputs after its worker
+              process is killed, to kill any other process the model started (ie.
+              fn_kill_hecras_processes). It returns the number of processes killed.
+
+    Output:
+        A list of results (dictionaries), in the same order as list_model_inputs:
+            - index: the model's index in list_model_inputs
+            - status: "completed", "failed" or "timed_out"
+            - exit_code: the worker process exit code (None if it timed out)
+            - cost: the model's cost
+            - run_order: the order the model was started in (0 is first)
+            - run_seconds: the wall clock time the model ran for
+            - processes_killed: the number of processes fn_kill_model_processes killed for a
+                  hung model (0 if none)
+    """
+
+    if list_costs is None:
+        list_costs = [
+            fn_get_model_cost(model_inputs["str_ras_projectpath"], model_inputs["int_number_of_steps"])
+            for model_inputs in list_model_inputs
+        ]
+
+    # ie) mp.cpu_count() - 2 on a machine with 2 or fewer cpus would never start a model
+    num_workers = max(1, num_workers)
+
+    # longest first, ties keep their original order
+    queue_model_idxs = deque(sorted(range(len(list_model_inputs)), key=lambda idx: -list_costs[idx]))
+
+    list_results = [None] * len(list_model_inputs)
+    dict_running = {}  # model index -> (process, start time)
+    run_order = 0
+
+    while len(queue_model_idxs) > 0 or len(dict_running) > 0:
+        while len(queue_model_idxs) > 0 and len(dict_running) < num_workers:
+            model_idx = queue_model_idxs.popleft()
+            process = mp.Process(target=__run_model, args=(fn_run_model, list_model_inputs[model_idx]))
+            process.start()
+            dict_running[model_idx] = (process, time.monotonic())
+            list_results[model_idx] = {
+                "index": model_idx,
+                "status": None,
+                "exit_code": None,
+                "cost": list_costs[model_idx],
+                "run_order": run_order,
+                "run_seconds": 0.0,
+                "processes_killed": 0,
+            }
+            run_order += 1
+
+        # Wait for a model to finish, or until the next model reaches its time limit
+        flt_now = time.monotonic()
+        flt_next_timeout = min(start + timeout_seconds for __, start in dict_running.values())
+        flt_wait_seconds = min(max(flt_next_timeout - flt_now, 0), poll_seconds)
+        wait([process.sentinel for process, __ in dict_running.values()], timeout=flt_wait_seconds)
+
+        flt_now = time.monotonic()
+        for model_idx, (process, start) in list(dict_running.items()):
+            if process.exitcode is not None:
+                process.join()
+                status = "completed" if process.exitcode == 0 else "failed"
+                list_results[model_idx]["exit_code"] = process.exitcode
+            elif flt_now - start >= timeout_seconds:
+                __kill_process_tree(process)
+                if fn_kill_model_processes is not None:
+                    try:
+                        list_results[model_idx]["processes_killed"] = fn_kill_model_processes(
+                            list_model_inputs[model_idx]
+                        )
+                    except Exception:
+                        # the model is still recorded as hung, the caller handles its folder
+                        pass
+                status = "timed_out"
+            else:
+                continue
+
+            list_results[model_idx]["status"] = status
+            list_results[model_idx]["run_seconds"] = round(flt_now - start, 1)
+            del dict_running[model_idx]
+
+    return list_results
+
+
+# -------------------------------------------------
+def fn_write_bad_model_candidates(str_file_path, list_candidates, str_heading):
+    """
+    Overview:
+        Appends models to a candidate bad models list, in the same format as
+        config/bad_models_list.lst: a comment with the reason and the model folder name.
+
+    Inputs:
+        - str_file_path: the candidate list file path (created if it does not exist)
+        - list_candidates: a list of (model folder name, reason) tuples
+        - str_heading: a comment line written above the models (ie. the pass number)
+    """
+
+    if len(list_candidates) == 0:
+        return
+
+    with open(str_file_path, "a") as candidates_file:
+        candidates_file.write(f"\n# {str_heading}\n")
+        for model_name, reason in list_candidates:
+            candidates_file.write(f"# {reason}\n")
+            candidates_file.write(f"{model_name}\n")
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import h5py
+import numpy as np
+import pandas as pd
+
+
+"""
+Reads the HEC-RAS steady flow results of a plan from its output hdf file (ie. 1234.p01.hdf).
+
+HEC-RAS writes the results of every cross section and every profile to the plan hdf file when
+the plan is computed. Reading them here, one array per variable, replaces asking the HEC-RAS
+controller for each value of each node and profile, which can take minutes on large models.
+
+The plan hdf has a copy of the geometry, so the cross section names, reach lengths and the
+station / elevation points used to calculate the channel depths are read from it as well.
+
+The HEC-RAS controller version (fn_get_all_x_sections_info_from_hecras) is still used when the
+plan hdf can not be read. It only needs the open controller object, not win32com, so both
+versions can be compared on any OS with a fake controller (see tests/test_hecras_plan_results.py).
+"""
+
+# Global Variables
+HDF_XS_GEOM_PATH = "Geometry/Cross Sections"
+HDF_XS_RESULTS_PATH = "Results/Steady/Output/Output Blocks/Base Output/Steady Profiles/Cross Sections"
+
+
+# -------------------------------------------------
+def __decode_hdf_strings(arr_values):
+    return np.array([value.decode("utf-8", "ignore").strip() for value in arr_values], dtype=object)
+
+
+# -------------------------------------------------
+def fn_get_min_channel_elevations(hf):
+    """
+    Overview:
+        Returns the minimum elevation of the main channel (between the bank stations) of each
+        cross section, calculated from all of the station / elevation points at one time.
+        This is the same as HEC-RAS's "Min Ch El".
+
+    Inputs:
+        - hf: the open plan (or geometry) hdf file
+
+    Output:
+        numpy array of the min channel elevations, one per cross section (geometry order)
+    """
+
+    arr_sta_elev_info = np.array(hf[f"{HDF_XS_GEOM_PATH}/Station Elevation Info"])
+    arr_sta_elev_values = np.array(hf[f"{HDF_XS_GEOM_PATH}/Station Elevation Values"])
+    arr_bank_stations = np.array(hf[f"{HDF_XS_GEOM_PATH}/Bank Stations"])
+
+    # each cross section has a start row and a count of rows in the station / elevation values
+    arr_starts = arr_sta_elev_info[:, 0].astype(np.int64)
+    arr_counts = arr_sta_elev_info[:, 1].astype(np.int64)
+    int_xs_count = len(arr_starts)
+
+    # the row of each point in the station / elevation values and which cross section it is in
+    arr_offsets = np.cumsum(arr_counts) - arr_counts
+    arr_point_rows = np.repeat(arr_starts - arr_offsets, arr_counts) + np.arange(arr_counts.sum())
+    arr_point_xs = np.repeat(np.arange(int_xs_count), arr_counts)
+
+    arr_stations = arr_sta_elev_values[arr_point_rows, 0]
+    arr_elevations = arr_sta_elev_values[arr_point_rows, 1]
+
+    arr_in_channel = (arr_stations >= arr_bank_stations[arr_point_xs, 0]) & (
+        arr_stations <= arr_bank_stations[arr_point_xs, 1]
+    )
+
+    arr_min_channel_elev = np.full(int_xs_count, np.inf)
+    np.minimum.at(arr_min_channel_elev, arr_point_xs, np.where(arr_in_channel, arr_elevations, np.inf))
+
+    # Edge case: no points between the bank stations, use the lowest point of the cross section
+    arr_no_channel = np.isinf(arr_min_channel_elev)
+    if arr_no_channel.any():
+        arr_min_elev = np.full(int_xs_count, np.inf)
+        np.minimum.at(arr_min_elev, arr_point_xs, arr_elevations)
+        arr_min_channel_elev[arr_no_channel] = arr_min_elev[arr_no_channel]
+
+    return arr_min_channel_elev
+
+
+# -------------------------------------------------
+def fn_get_all_x_sections_info(str_path_plan_hdf, str_model_id, int_number_of_steps):
+    """
+    Overview:
+        Creates the all_x_sections_info table (water surface elevation, discharge, max channel
+        depth and channel length of each cross section for each profile) from the plan hdf file.
+
+        It is the same table fn_get_all_x_sections_info_from_hecras creates through the HEC-RAS controller:
+        the cross sections of the first river / reach, profile 1 to int_number_of_steps,
+        one block of rows per profile.
+
+    Inputs:
+        - str_path_plan_hdf: ie) C:\\...\\1234_name\\1234_name.p01.hdf
+        - str_model_id: the model id used in the fid_xs values
+        - int_number_of_steps: the number of profiles
+
+    Output:
+        The all_x_sections_info dataframe (fid_xs, modelid, Xsection_name, wse, discharge,
+        max_depth, channel_length)
+    """
+
+    with h5py.File(str_path_plan_hdf, "r") as hf:
+        arr_xs_attrs = np.array(hf[f"{HDF_XS_GEOM_PATH}/Attributes"])
+
+        # arrays of [profile, cross section]. HEC-RAS saves them as float32, they are float64 (the same
+        # as the HEC-RAS controller values) so the table has the same types either way
+        arr_wse = np.array(hf[f"{HDF_XS_RESULTS_PATH}/Water Surface"], dtype=float)[:int_number_of_steps]
+        arr_flow = np.array(hf[f"{HDF_XS_RESULTS_PATH}/Flow"], dtype=float)[:int_number_of_steps]
+
+        arr_min_channel_elev = fn_get_min_channel_elevations(hf)
+
+    int_xs_count = len(arr_xs_attrs)
+    if arr_wse.shape != (int_number_of_steps, int_xs_count) or arr_flow.shape != arr_wse.shape:
+        raise ValueError(
+            f"The results in {str_path_plan_hdf} do not match its {int_xs_count} cross sections"
+            f" and {int_number_of_steps} profiles"
+        )
+
+    # Only the first river / reach, the same as the HEC-RAS controller nodes (RivID, RchID = 1, 1)
+    arr_river = __decode_hdf_strings(arr_xs_attrs["River"])
+    arr_reach = __decode_hdf_strings(arr_xs_attrs["Reach"])
+    arr_is_first_reach = (arr_river == arr_river[0]) & (arr_reach == arr_reach[0])
+
+    arr_xs_names = __decode_hdf_strings(arr_xs_attrs["RS"])[arr_is_first_reach]
+    arr_channel_length = arr_xs_attrs["Len Channel"][arr_is_first_reach].astype(float)
+    arr_channel_length[arr_channel_length > 1e20] = 0
+
+    arr_wse = arr_wse[:, arr_is_first_reach]
+    arr_flow = arr_flow[:, arr_is_first_reach]
+    arr_max_depth = arr_wse - arr_min_channel_elev[arr_is_first_reach]
+
+    int_reach_xs_count = len(arr_xs_names)
+    arr_fids_xs = np.array([str_model_id + "_" + xs_name for xs_name in arr_xs_names], dtype=object)
+
+    all_x_sections_info = pd.DataFrame(
+        {
+            "fid_xs": np.tile(arr_fids_xs, int_number_of_steps),
+            "modelid": str_model_id,
+            "Xsection_name": np.tile(arr_xs_names, int_number_of_steps),
+            "wse": arr_wse.ravel(),
+            "discharge": arr_flow.ravel(),
+            "max_depth": arr_max_depth.ravel(),
+            "channel_length": np.tile(arr_channel_length, int_number_of_steps),
+        },
+        # one index of 0 to the cross section count for each profile
+        index=np.tile(np.arange(int_reach_xs_count), int_number_of_steps),
+    )
+
+    return all_x_sections_info
+
+
+# -------------------------------------------------
+def fn_get_all_x_sections_info_from_hecras(hec, str_model_id, int_number_of_steps):
+    # Reads the results of each cross section for each profile, one value at a time,
+    # from the open HEC-RAS controller (hec) after the current plan has been computed.
+    # See fn_get_all_x_sections_info for reading them from the plan hdf.
+
+    # ID numbers of the river and the reach
+    RivID, RchID = 1, 1
+
+    # to be populated: number of nodes, list of RS and node types
+    NNod, TabRS, TabNTyp = None, None, None
+
+    # reading project nodes: cross-sections, bridges, culverts, etc.
+    v1, v2, NNod, TabRS, TabNTyp = hec.Geometry_GetNodes(RivID, RchID, NNod, TabRS, TabNTyp)
+
+    # HEC-RAS ID of output variables: Max channel depth, channel reach length,
+    # and water surface elevation
+    int_max_depth_id, int_node_chan_length, int_water_surface_elev, int_q_total = (4, 42, 2, 9)
+
+    # -------------------------------------------------
+    # Saving information for all profiles of each confalated
+    # ras model: water depths, WSE and flows for each XS
+    # -------------------------------------------------
+    # make a list of unique ids using feature id and cross section name
+    all_x_sections_info = pd.DataFrame()
+
+    xsections_fids_xs = [str_model_id + "_" + value.strip() for value in TabRS]
+    xsections_fids = [str_model_id for value in TabRS]
+    xsections_xs = [value.strip() for value in TabRS]
+
+    for int_prof in range(int_number_of_steps):
+        this_profile_x_section_info = pd.DataFrame()
+        this_profile_x_section_info["fid_xs"] = np.array(xsections_fids_xs)
+        this_profile_x_section_info["modelid"] = np.array(xsections_fids)
+        this_profile_x_section_info["Xsection_name"] = np.array(xsections_xs)
+
+        # get a count of the cross sections in the HEC-RAS model
+        int_xs_node_count = 0
+        for i in range(0, NNod):
+            if TabNTyp[i] == "":
+                int_xs_node_count += 1
+
+        # initalize six numpy arrays
+        arr_max_depth = np.empty([int_xs_node_count], dtype=float)
+        arr_channel_length = np.empty([int_xs_node_count], dtype=float)
+        arr_water_surface_elev = np.empty([int_xs_node_count], dtype=float)
+        arr_q_total = np.empty([int_xs_node_count], dtype=float)
+
+        int_count_nodes = 0
+
+        for i in range(0, NNod):
+            if TabNTyp[i] == "":  # this is a XS (not a bridge, culvert, inline, etc...)
+                # reading max depth in cross section
+                (arr_max_depth[int_count_nodes], v1, v2, v3, v4, v5, v6) = hec.Output_NodeOutput(
+                    RivID, RchID, i + 1, 0, int_prof + 1, int_max_depth_id
+                )
+
+                # reading water surface elevation in cross section
+                (arr_water_surface_elev[int_count_nodes], v1, v2, v3, v4, v5, v6) = hec.Output_NodeOutput(
+                    RivID, RchID, i + 1, 0, int_prof + 1, int_water_surface_elev
+                )
+
+                # reading the distance between cross sections (center of channel)
+                (arr_channel_length[int_count_nodes], v1, v2, v3, v4, v5, v6) = hec.Output_NodeOutput(
+                    RivID, RchID, i + 1, 0, int_prof + 1, int_node_chan_length
+                )
+
+                # reading the Q total of the cross section
+                (arr_q_total[int_count_nodes], v1, v2, v3, v4, v5, v6) = hec.Output_NodeOutput(
+                    RivID, RchID, i + 1, 0, int_prof + 1, int_q_total
+                )
+
+                int_count_nodes += 1
+
+        # add wse and q_total for xsections
+        this_profile_x_section_info["wse"] = arr_water_surface_elev
+        this_profile_x_section_info["discharge"] = arr_q_total
+        this_profile_x_section_info["max_depth"] = arr_max_depth
+        this_profile_x_section_info["channel_length"] = arr_channel_length
+
+        all_x_sections_info = pd.concat([all_x_sections_info, this_profile_x_section_info])
+
+        # Revise the last channel length to zero
+        arr_channel_length[len(arr_channel_length) - 1] = 0
+
+    all_x_sections_info.loc[all_x_sections_info["channel_length"] > 1e20, "channel_length"] = 0
+
+    return all_x_sections_info
+
+
+# -------------------------------------------------
+# Runs HEC-RAS
+# For One RAS Model ~ 3 min
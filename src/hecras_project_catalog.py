@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+
+"""
+Finds and classifies the HEC-RAS project (.prj) files in a models folder in one pass.
+
+A model folder can have two kinds of .prj files: the HEC-RAS project file and an ESRI projection
+file. Some models also have binary files with a .prj extension. For each .prj file found, only
+the first part of the file (PRJ_PREFIX_READ_SIZE bytes) is read, and the files are read in a
+thread pool as most of the time is spent waiting on the disk (or network share).
+
+Each .prj file gets one catalog entry (a dictionary):
+    - prj_path: the .prj file path
+    - model_folder: the folder the .prj file is in
+    - is_binary: True if the file is not a text file
+    - is_projection_file: True if it is an ESRI projection file (ie. has PROJCS, DATUM, etc)
+    - is_hecras_project: True if it is a text file with a "Current Plan" line
+    - unit: "meter" (SI Units), "feet" (English Units) or None if not found
+    - plan_files, geom_files, flow_files: the extensions of the "Plan File=", "Geom File=" and
+          "Flow File=" lines (ie. ["g01", "g02"])
+    - plan_path: the current plan file path, or "" if not a HEC-RAS project
+    - geom_path: the current plan's geometry file path (no .hdf), or "" if it can not be found
+    - flow_path: the current plan's flow file path, or "" if it can not be found. Like
+          create_shapes_from_hecras.fn_get_active_flow, it is the .f01 if the plan has no flow file
+"""
+
+# Global Variables
+# HEC-RAS project and plan files are small text files, so this is the whole file for all but
+# the odd model with a very long description
+PRJ_PREFIX_READ_SIZE = 1024 * 256
+BINARY_CHECK_SIZE = 1024
+
+PROJECTION_FILE_KEYWORDS = ["PROJCS", "GEOGCS", "DATUM", "PROJECTION"]
+
+TEXT_CHARS = bytearray({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7F})
+
+
+# -------------------------------------------------
+def __read_file_prefix(file_path):
+    with open(file_path, "rb") as file_to_read:
+        return file_to_read.read(PRJ_PREFIX_READ_SIZE)
+
+
+# -------------------------------------------------
+def __get_line_values(list_lines, str_key):
+    # The values of all lines starting with the key, ie) "Geom File=g01" -> "g01"
+    return [line[len(str_key) :].strip() for line in list_lines if line.startswith(str_key)]
+
+
+# -------------------------------------------------
+def __get_current_plan_files(str_prj_path, str_current_plan):
+    # Reads the current plan and returns the paths of its geometry and flow files
+
+    str_plan_path = str_prj_path[:-3] + str_current_plan
+    if os.path.isfile(str_plan_path) is False:
+        return str_plan_path, "", ""
+
+    list_plan_lines = __read_file_prefix(str_plan_path).decode("utf-8", "ignore").splitlines()
+
+    str_geom_path = ""
+    list_geom_files = __get_line_values(list_plan_lines, "Geom File=")
+    if len(list_geom_files) > 0:
+        str_geom_path = str_prj_path[:-3] + list_geom_files[-1][-3:]
+
+    # Note: defaults to .f01 if no flow file is in the plan (it might not exist)
+    str_current_flow = "f01"
+    list_flow_files = __get_line_values(list_plan_lines, "Flow File=")
+    if len(list_flow_files) > 0:
+        str_current_flow = list_flow_files[-1][-3:]
+    str_flow_path = str_prj_path[:-3] + str_current_flow
+
+    return str_plan_path, str_geom_path, str_flow_path
+
+
+# -------------------------------------------------
+def fn_classify_prj_file(str_prj_path):
+    """
+    Overview:
+        Reads the start of a .prj file (and its current plan if it is a HEC-RAS project) and
+        returns its catalog entry (see the top of this file).
+
+    Inputs:
+        - str_prj_path: the .prj file path
+    """
+
+    prj_entry = {
+        "prj_path": str_prj_path,
+        "model_folder": os.path.dirname(str_prj_path),
+        "is_binary": False,
+        "is_projection_file": False,
+        "is_hecras_project": False,
+        "unit": None,
+        "plan_files": [],
+        "geom_files": [],
+        "flow_files": [],
+        "plan_path": "",
+        "geom_path": "",
+        "flow_path": "",
+    }
+
+    prj_bytes = __read_file_prefix(str_prj_path)
+    if bool(prj_bytes[:BINARY_CHECK_SIZE].translate(None, TEXT_CHARS)):
+        prj_entry["is_binary"] = True
+        return prj_entry
+
+    str_prj_text = prj_bytes.decode("utf-8", "ignore")
+    if any(x in str_prj_text for x in PROJECTION_FILE_KEYWORDS):
+        prj_entry["is_projection_file"] = True
+        return prj_entry
+
+    if re.search("SI Unit", str_prj_text, re.I):
+        prj_entry["unit"] = "meter"
+    elif re.search("English Unit", str_prj_text, re.I):
+        prj_entry["unit"] = "feet"
+
+    list_prj_lines = str_prj_text.splitlines()
+    prj_entry["plan_files"] = __get_line_values(list_prj_lines, "Plan File=")
+    prj_entry["geom_files"] = __get_line_values(list_prj_lines, "Geom File=")
+    prj_entry["flow_files"] = __get_line_values(list_prj_lines, "Flow File=")
+
+    list_current_plans = [line for line in list_prj_lines if "Current Plan=" in line]
+    if len(list_current_plans) == 0:
+        return prj_entry
+
+    prj_entry["is_hecras_project"] = True
+    str_current_plan = list_current_plans[-1].strip()[-3:]
+    plan_path, geom_path, flow_path = __get_current_plan_files(str_prj_path, str_current_plan)
+    prj_entry["plan_path"] = plan_path
+    prj_entry["geom_path"] = geom_path
+    prj_entry["flow_path"] = flow_path
+
+    return prj_entry
+
+
+# -------------------------------------------------
+def fn_find_prj_files(str_models_path):
+    # Returns the paths of all .prj files (any case) in a folder and its sub folders, sorted.
+    # If the path is a file, it is returned on its own.
+
+    if os.path.isfile(str_models_path):
+        return [str_models_path]
+
+    list_prj_files = []
+    for root, __, file_names in os.walk(str_models_path):
+        for file_name in file_names:
+            if os.path.splitext(file_name)[1].lower() == ".prj":
+                list_prj_files.append(os.path.join(root, file_name))
+
+    list_prj_files.sort()
+    return list_prj_files
+
+
+# -------------------------------------------------
+def fn_get_hecras_project_catalog(list_prj_files, num_threads=None):
+    """
+    Overview:
+        Classifies a list of .prj files in a thread pool (see fn_classify_prj_file).
+
+    Inputs:
+        - list_prj_files: list of .prj file paths (ie. from fn_find_prj_files)
+        - num_threads: OPTIONAL: the number of threads, defaults to the ThreadPoolExecutor default
+
+    Output:
+        A list of catalog entries, in the same order as list_prj_files
+    """
+
+    if len(list_prj_files) == 0:
+        return []
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        return list(executor.map(fn_classify_prj_file, list_prj_files))
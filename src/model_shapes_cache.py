@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import pickle
+
+import shared_functions as sf
+
+
+"""
+A local cache of the shapes (stream centerline, cross sections and max flows) read from each
+HEC-RAS model in step 1 (see create_shapes_from_hecras.mp_read_model_shapes).
+
+Each model has one cache file, named after its prj file path. It holds the model's shapes plus
+a fingerprint of each of the model files they were read from (prj, geometry, geometry hdf and
+flow file). When step 1 is run again, a model is only read again if one of its files has changed:
+    - a different size is a change.
+    - the same size and modified time is not a change.
+    - the same size but a different modified time (ie. the model was downloaded again) is
+      checked with a content hash (sha256).
+
+The cache is also keyed by the code the shapes were read with (see fn_get_code_version), so a
+new ras2fim version, or any change to the code that reads the shapes, does not use older cache
+files.
+"""
+
+# Global Variables
+# Change this if the cached shapes change, so older cache files are not used
+MODEL_CACHE_VERSION = 1
+
+HASH_READ_BLOCK_SIZE = 1024 * 1024 * 8
+
+# The src files the cached shapes are read with (see fn_get_code_version)
+MODEL_CACHE_CODE_FILE_NAMES = [
+    "create_shapes_from_hecras.py",
+    "hecras_flow_file.py",
+    "hecras_project_catalog.py",
+    "model_shapes_cache.py",
+    "shared_functions.py",
+]
+
+
+# -------------------------------------------------
+def __get_cache_file_path(cache_dir, str_prj_path):
+    str_prj_path = os.path.abspath(str_prj_path)
+    str_path_hash = hashlib.sha1(str_prj_path.lower().encode("utf-8")).hexdigest()[:16]
+    str_model_name = os.path.basename(os.path.dirname(str_prj_path))
+    return os.path.join(cache_dir, f"{str_model_name}_{str_path_hash}.pkl")
+
+
+# -------------------------------------------------
+def __hash_file(file_path):
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file_to_hash:
+        for block in iter(lambda: file_to_hash.read(HASH_READ_BLOCK_SIZE), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+# -------------------------------------------------
+def fn_get_code_version(list_code_file_names=None):
+    """
+    Overview:
+        Returns the version of the code the shapes are read with, to be added to the cache
+        params: the ras2fim version (from the changelog) plus a hash of the src files in
+        MODEL_CACHE_CODE_FILE_NAMES. A change to any of them, even one not yet in the changelog,
+        is a new code version.
+
+    Inputs:
+        - list_code_file_names: OPTIONAL: other src file names to hash instead
+              (ie. hecras_model_checkpoints.MODEL_CHECKPOINT_CODE_FILE_NAMES)
+    """
+
+    if list_code_file_names is None:
+        list_code_file_names = MODEL_CACHE_CODE_FILE_NAMES
+
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    changelog_path = os.path.join(src_dir, os.pardir, "doc", "CHANGELOG.md")
+
+    code_hash = hashlib.sha256()
+    for file_name in list_code_file_names:
+        code_hash.update(file_name.encode("utf-8"))
+        with open(os.path.join(src_dir, file_name), "rb") as code_file:
+            code_hash.update(code_file.read())
+
+    return f"{sf.get_changelog_version(changelog_path)}_{code_hash.hexdigest()[:16]}"
+
+
+# -------------------------------------------------
+def fn_get_file_fingerprints(list_file_paths, dict_prev_fingerprints=None):
+    """
+    Overview:
+        Returns the size, modified time and content hash of each file. If a file has the same size
+        and modified time as in dict_prev_fingerprints, its previous hash is used and it is not read.
+
+    Inputs:
+        - list_file_paths: list of file paths
+        - dict_prev_fingerprints: OPTIONAL: fingerprints from an earlier call
+
+    Output:
+        A dictionary of file path -> {size, mtime_ns, sha256}. A missing file has a value of None.
+    """
+
+    if dict_prev_fingerprints is None:
+        dict_prev_fingerprints = {}
+
+    dict_fingerprints = {}
+    for file_path in list_file_paths:
+        file_path = os.path.abspath(file_path)
+        if os.path.isfile(file_path) is False:
+            dict_fingerprints[file_path] = None
+            continue
+
+        file_stat = os.stat(file_path)
+        prev_fingerprint = dict_prev_fingerprints.get(file_path)
+        if (
+            prev_fingerprint is not None
+            and prev_fingerprint["size"] == file_stat.st_size
+            and prev_fingerprint["mtime_ns"] == file_stat.st_mtime_ns
+        ):
+            dict_fingerprints[file_path] = prev_fingerprint
+            continue
+
+        dict_fingerprints[file_path] = {
+            "size": file_stat.st_size,
+            "mtime_ns": file_stat.st_mtime_ns,
+            "sha256": __hash_file(file_path),
+        }
+
+    return dict_fingerprints
+
+
+# -------------------------------------------------
+def fn_get_cached_model_shapes(cache_dir, str_prj_path, list_file_paths, dict_params):
+    """
+    Overview:
+        Returns the cached shapes of a model if its files and parameters have not changed since
+        they were cached, otherwise None.
+
+    Inputs:
+        - cache_dir: the cache folder
+        - str_prj_path: the model's prj file path
+        - list_file_paths: the model files the shapes are read from
+        - dict_params: any other values the shapes depend on (ie. the projection)
+    """
+
+    cache_file_path = __get_cache_file_path(cache_dir, str_prj_path)
+    if os.path.exists(cache_file_path) is False:
+        return None
+
+    try:
+        with open(cache_file_path, "rb") as cache_file:
+            cache_entry = pickle.load(cache_file)
+    except Exception:
+        # a bad cache file is just a cache miss
+        return None
+
+    if cache_entry.get("version") != MODEL_CACHE_VERSION or cache_entry.get("params") != dict_params:
+        return None
+
+    dict_prev_fingerprints = cache_entry["fingerprints"]
+    list_abs_file_paths = [os.path.abspath(file_path) for file_path in list_file_paths]
+    if sorted(dict_prev_fingerprints.keys()) != sorted(list_abs_file_paths):
+        return None
+
+    # Compare content hashes (size and modified time are only used to skip hashing)
+    dict_fingerprints = fn_get_file_fingerprints(list_abs_file_paths, dict_prev_fingerprints)
+    for file_path, fingerprint in dict_fingerprints.items():
+        prev_fingerprint = dict_prev_fingerprints[file_path]
+        # a file that is still missing (ie. no geometry hdf) is not a change
+        if fingerprint is None and prev_fingerprint is None:
+            continue
+        if fingerprint is None or prev_fingerprint is None:
+            return None
+        if (
+            fingerprint["size"] != prev_fingerprint["size"]
+            or fingerprint["sha256"] != prev_fingerprint["sha256"]
+        ):
+            return None
+
+    # If a file was only touched, save the new modified time so it is not hashed again next time
+    if dict_fingerprints != dict_prev_fingerprints:
+        cache_entry["fingerprints"] = dict_fingerprints
+        __write_cache_entry(cache_file_path, cache_entry)
+
+    return cache_entry["model_shapes"]
+
+
+# -------------------------------------------------
+def fn_save_model_shapes(cache_dir, str_prj_path, list_file_paths, dict_params, model_shapes):
+    # Saves the shapes of a model (see fn_get_cached_model_shapes for the inputs)
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    cache_entry = {
+        "version": MODEL_CACHE_VERSION,
+        "params": dict_params,
+        "fingerprints": fn_get_file_fingerprints(list_file_paths),
+        "model_shapes": model_shapes,
+    }
+    __write_cache_entry(__get_cache_file_path(cache_dir, str_prj_path), cache_entry)
+
+
+# -------------------------------------------------
+def __write_cache_entry(cache_file_path, cache_entry):
+    # write to a temp file first so a partly written cache file is never used
+    # (the temp name is unique per process as models can share a cache folder)
+    temp_file_path = f"{cache_file_path}.{os.getpid()}.tmp"
+    with open(temp_file_path, "wb") as cache_file:
+        pickle.dump(cache_entry, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file_path, cache_file_path)
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+
+import datetime as dt
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import shared_functions as sf
+import shared_variables as sv
+
+
+"""
+Some of the national datasets in the X-National_Datasets folder are very large and every unit
+only needs its own HUC8 slice of them. This module creates and reads HUC8 partitioned copies of
+those datasets.
+
+The cached copies are created one time by running tools/preprocess_national_datasets.py. If a cache
+does not exist, readers fall back to reading the original national dataset.
+
+nwm_wbd_lookup.nc (NWM recurrence flows):
+    The cache is a folder named "nwm_wbd_lookup_huc8" beside the netCDF file, with one parquet
+    file per huc8 (indexed by feature_id) and an index csv that lists each huc8, its file name
+    and its record count.
+
+nwm_flows.gpkg and WBD_National.gpkg (vector layers):
+    The cache is a folder beside the gpkg, named after it (ie. "WBD_National_huc8"), with one
+    GeoParquet file (shard) per huc8 and a json index. WBD polygons are sharded by their HUC_8
+    value and NWM flowlines by the huc8(s) of their feature_id in nwm_wbd_lookup.nc (flowlines
+    not in the lookup go in a shard named "none"). A flowline in more than one huc8 is in each of
+    those shards, so a read of more than one shard drops the copies by its feature id (ID).
+    Each shard has bounding box columns (bbox_xmin, bbox_ymin, bbox_xmax, bbox_ymax) for each
+    feature, so a bounding box read only loads the features whose box overlaps it.
+    The json index has the layer's crs and the file name, record count and bounds of each shard,
+    so readers only open the shards that have the huc8s or overlap the bounding box they need.
+"""
+
+# Global Variables
+RLOG = sv.R2F_LOG
+
+HUC8_LAYER_CACHE_DIR_SUFFIX = "_huc8"
+HUC8_LAYER_CACHE_INDEX_FILE = "huc8_index.json"
+HUC8_LAYER_UNASSIGNED_SHARD = "none"
+BBOX_COLUMNS = ["bbox_xmin", "bbox_ymin", "bbox_xmax", "bbox_ymax"]
+
+# The id column of the vector layers that can have the same feature in more than one shard
+HUC8_LAYER_ID_COLUMNS = {sv.INPUT_NWM_FLOWS_FILE: "ID"}
+
+
+# -------------------------------------------------
+def fn_create_nwm_wbd_lookup_cache(dir_datasets):
+    """
+    Overview:
+        Loads the full nwm_wbd_lookup.nc one time and saves it as one parquet file per huc8 plus an
+        index csv. Any previous cache is replaced.
+
+    Inputs:
+        - dir_datasets: path to the national datasets folder (ie. X-National_Datasets)
+
+    Output:
+        The path to the cache folder
+    """
+
+    str_netcdf_path = os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_FILE)
+    if os.path.exists(str_netcdf_path) is False:
+        raise FileNotFoundError(f"The nwm wbd lookup file of {str_netcdf_path} does not exist")
+
+    cache_dir = os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_HUC8_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # remove the old index first so a partly written cache is never used
+    index_file_path = os.path.join(cache_dir, sv.INPUT_NWM_WBD_LOOKUP_HUC8_INDEX_FILE)
+    if os.path.exists(index_file_path):
+        os.remove(index_file_path)
+
+    RLOG.lprint(f"Loading {str_netcdf_path}")
+    with xr.open_dataset(str_netcdf_path) as ds:
+        df_all_nwm_streams = ds.to_dataframe()
+
+    df_all_nwm_streams["huc8"] = df_all_nwm_streams["huc8"].astype(str)
+
+    index_records = []
+    for huc8, df_huc8 in df_all_nwm_streams.groupby("huc8", sort=True):
+        file_name = f"nwm_wbd_lookup_{huc8}.parquet"
+        df_huc8.to_parquet(os.path.join(cache_dir, file_name), index=True)
+        index_records.append({"huc8": huc8, "file_name": file_name, "record_count": len(df_huc8)})
+
+    # The index is written last as it is what tells readers the cache is ready
+    df_index = pd.DataFrame(index_records, columns=["huc8", "file_name", "record_count"])
+    df_index.to_csv(index_file_path, index=False)
+
+    RLOG.lprint(f"nwm wbd lookup cache created for {len(df_index)} huc8s at {cache_dir}")
+
+    return cache_dir
+
+
+# -------------------------------------------------
+def fn_load_nwm_wbd_lookup_for_huc8(dir_datasets, huc8):
+    """
+    Overview:
+        Returns the nwm_wbd_lookup records (indexed by feature_id) for just one huc8.
+        If the huc8 partitioned cache exists, only that huc8's parquet file is read.
+        If not, the netCDF file is opened lazily and only the records for the huc8 are loaded.
+
+    Inputs:
+        - dir_datasets: path to the national datasets folder (ie. X-National_Datasets)
+        - huc8: (str) ie. 12090301
+
+    Output:
+        A pandas dataframe with the same columns as the netCDF file (can be empty)
+    """
+
+    start_dt = dt.datetime.utcnow()
+    huc8 = str(huc8)
+
+    cache_dir = os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_HUC8_DIR)
+    index_file_path = os.path.join(cache_dir, sv.INPUT_NWM_WBD_LOOKUP_HUC8_INDEX_FILE)
+
+    if os.path.exists(index_file_path):
+        RLOG.trace(f"Loading nwm wbd lookup records for {huc8} from the huc8 cache")
+        df_index = pd.read_csv(index_file_path, dtype={"huc8": str, "file_name": str})
+        df_huc8_index = df_index.loc[df_index["huc8"] == huc8]
+
+        if len(df_huc8_index) == 0:
+            # keep the columns (from any partition) so the calling code can still merge on it
+            RLOG.warning(f"The nwm wbd lookup cache does not have any records for {huc8}")
+            df_streams_huc_only = pd.read_parquet(os.path.join(cache_dir, df_index["file_name"].iloc[0]))
+            df_streams_huc_only = df_streams_huc_only.iloc[0:0]
+        else:
+            df_streams_huc_only = pd.read_parquet(os.path.join(cache_dir, df_huc8_index["file_name"].iloc[0]))
+
+    else:
+        str_netcdf_path = os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_FILE)
+        RLOG.trace(f"nwm wbd lookup cache not found, loading {huc8} records from {str_netcdf_path}")
+
+        # chunks={} keeps the dataset lazy (dask) so only the huc8 variable is fully read to
+        # find the matching records, then only those records are loaded.
+        with xr.open_dataset(str_netcdf_path, chunks={}) as ds:
+            arr_huc8 = ds["huc8"].values
+            if arr_huc8.dtype.kind == "S":
+                arr_huc8 = np.char.decode(arr_huc8, "UTF-8")
+            arr_huc8 = arr_huc8.astype(str)
+
+            huc8_dim = ds["huc8"].dims[0]
+            ds_huc8 = ds.isel({huc8_dim: np.flatnonzero(arr_huc8 == huc8)})
+            df_streams_huc_only = ds_huc8.load().to_dataframe()
+
+    RLOG.trace(
+        f"nwm wbd lookup records loaded for {huc8}: {len(df_streams_huc_only)} records,"
+        f" {sf.get_date_time_duration_msg(start_dt, dt.datetime.utcnow())}"
+    )
+
+    return df_streams_huc_only
+
+
+# -------------------------------------------------
+def fn_get_huc8_layer_cache_dir(str_layer_path):
+    # The huc8 cache folder of a vector layer, ie) ...\WBD_National.gpkg -> ...\WBD_National_huc8
+    return os.path.splitext(str_layer_path)[0] + HUC8_LAYER_CACHE_DIR_SUFFIX
+
+
+# -------------------------------------------------
+def __load_huc8_layer_index(str_layer_path):
+    # Returns the json index of a vector layer's huc8 cache, or None if there is no cache
+    index_file_path = os.path.join(fn_get_huc8_layer_cache_dir(str_layer_path), HUC8_LAYER_CACHE_INDEX_FILE)
+    if os.path.exists(index_file_path) is False:
+        return None
+
+    with open(index_file_path, "r") as index_file:
+        return json.load(index_file)
+
+
+# -------------------------------------------------
+def __write_huc8_layer_cache(gdf_layer, arr_shard_huc8s, str_layer_path):
+    """
+    Overview:
+        Writes a vector layer as one GeoParquet shard per huc8 plus the json index.
+        Any previous cache is replaced.
+
+    Inputs:
+        - gdf_layer: the full layer
+        - arr_shard_huc8s: the huc8 (str) of the shard each row goes into (same length as gdf_layer)
+        - str_layer_path: the path of the layer (gpkg), the cache folder is created beside it
+    """
+
+    cache_dir = fn_get_huc8_layer_cache_dir(str_layer_path)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # remove the old index first so a partly written cache is never used
+    index_file_path = os.path.join(cache_dir, HUC8_LAYER_CACHE_INDEX_FILE)
+    if os.path.exists(index_file_path):
+        os.remove(index_file_path)
+
+    str_layer_name = os.path.splitext(os.path.basename(str_layer_path))[0]
+
+    # the bounding box covering columns
+    gdf_layer = gdf_layer.copy()
+    gdf_layer[BBOX_COLUMNS] = gdf_layer.geometry.bounds.values
+
+    shard_records = []
+    for huc8, gdf_huc8 in gdf_layer.groupby(np.asarray(arr_shard_huc8s), sort=True):
+        file_name = f"{str_layer_name}_{huc8}.parquet"
+        gdf_huc8.reset_index(drop=True).to_parquet(os.path.join(cache_dir, file_name), index=False)
+        shard_records.append(
+            {
+                "huc8": huc8,
+                "file_name": file_name,
+                "record_count": len(gdf_huc8),
+                "bounds": [
+                    float(gdf_huc8["bbox_xmin"].min()),
+                    float(gdf_huc8["bbox_ymin"].min()),
+                    float(gdf_huc8["bbox_xmax"].max()),
+                    float(gdf_huc8["bbox_ymax"].max()),
+                ],
+            }
+        )
+
+    # The index is written last as it is what tells readers the cache is ready
+    layer_index = {
+        "layer": os.path.basename(str_layer_path),
+        "crs": None if gdf_layer.crs is None else gdf_layer.crs.to_wkt(),
+        "shards": shard_records,
+    }
+    with open(index_file_path + ".tmp", "w") as index_file:
+        json.dump(layer_index, index_file)
+    os.replace(index_file_path + ".tmp", index_file_path)
+
+    RLOG.lprint(f"{str_layer_name} cache created for {len(shard_records)} huc8s at {cache_dir}")
+
+    return cache_dir
+
+
+# -------------------------------------------------
+def fn_create_wbd_huc8_cache(dir_datasets):
+    # Loads the full WBD_National.gpkg (HUC12 polygons) one time and saves it as one GeoParquet
+    # shard per HUC_8 (see the top of this file). Returns the path to the cache folder.
+
+    str_layer_path = os.path.join(dir_datasets, sv.INPUT_WBD_NATIONAL_FILE)
+    if os.path.exists(str_layer_path) is False:
+        raise FileNotFoundError(f"The WBD national file of {str_layer_path} does not exist")
+
+    RLOG.lprint(f"Loading {str_layer_path}")
+    gdf_wbd = gpd.read_file(str_layer_path)
+
+    return __write_huc8_layer_cache(gdf_wbd, gdf_wbd["HUC_8"].astype(str).values, str_layer_path)
+
+
+# -------------------------------------------------
+def fn_create_nwm_flows_huc8_cache(dir_datasets):
+    # Loads the full nwm_flows.gpkg one time and saves it as one GeoParquet shard per huc8, using
+    # the huc8s of each feature_id in nwm_wbd_lookup.nc (see the top of this file).
+    # A flowline in more than one huc8 is in each of those shards. Returns the path to the cache folder.
+
+    str_layer_path = os.path.join(dir_datasets, sv.INPUT_NWM_FLOWS_FILE)
+    if os.path.exists(str_layer_path) is False:
+        raise FileNotFoundError(f"The nwm flows file of {str_layer_path} does not exist")
+
+    str_netcdf_path = os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_FILE)
+    if os.path.exists(str_netcdf_path) is False:
+        raise FileNotFoundError(f"The nwm wbd lookup file of {str_netcdf_path} does not exist")
+
+    RLOG.lprint(f"Loading the feature_id huc8s from {str_netcdf_path}")
+    with xr.open_dataset(str_netcdf_path) as ds:
+        df_feature_huc8s = ds.to_dataframe().reset_index()
+
+    df_feature_huc8s = df_feature_huc8s[["feature_id", "huc8"]].rename(columns={"feature_id": "ID"})
+    df_feature_huc8s["huc8"] = df_feature_huc8s["huc8"].astype(str)
+    df_feature_huc8s = df_feature_huc8s.drop_duplicates()
+
+    RLOG.lprint(f"Loading {str_layer_path}")
+    gdf_nwm_flows = gpd.read_file(str_layer_path)
+
+    gdf_nwm_flows = gdf_nwm_flows.merge(df_feature_huc8s, on="ID", how="left")
+    arr_shard_huc8s = gdf_nwm_flows.pop("huc8").fillna(HUC8_LAYER_UNASSIGNED_SHARD).values
+
+    return __write_huc8_layer_cache(gdf_nwm_flows, arr_shard_huc8s, str_layer_path)
+
+
+# -------------------------------------------------
+def fn_get_huc8_shard_bounds(str_layer_path, huc8):
+    # Returns the bounds (xmin, ymin, xmax, ymax in the layer's crs) of a huc8 in a vector
+    # layer's huc8 cache, or None if there is no cache or the huc8 is not in it.
+
+    layer_index = __load_huc8_layer_index(str_layer_path)
+    if layer_index is None:
+        return None
+
+    for shard in layer_index["shards"]:
+        if shard["huc8"] == str(huc8):
+            return tuple(shard["bounds"])
+
+    return None
+
+
+# -------------------------------------------------
+def fn_read_huc8_layer(str_layer_path, list_huc8s=None, bbox=None, mask=None):
+    """
+    Overview:
+        Reads a national vector layer (ie. nwm_flows.gpkg or WBD_National.gpkg), using its huc8
+        cache if it exists. Only the shards of list_huc8s (if given) whose bounds overlap the bbox
+        (if given) are opened, and only the features whose bounding box overlaps the bbox are loaded.
+
+        If there is no cache, the layer itself is read with the bbox or mask filter. list_huc8s
+        is only used to pick the shards, so the calling code should still filter on its huc8
+        column (ie. HUC_8) if it needs just those huc8s.
+
+    Inputs:
+        - str_layer_path: the path of the layer (gpkg)
+        - list_huc8s: OPTIONAL: list of huc8s (str)
+        - bbox: OPTIONAL: tuple of (xmin, ymin, xmax, ymax) in the layer's crs, or a geodataframe /
+            geoseries (its total bounds are used, reprojected to the layer's crs)
+        - mask: OPTIONAL: a geodataframe / geoseries, used as is when there is no cache.
+            With the cache, its total bounds are used as the bbox.
+
+    Output:
+        A geodataframe with the same columns and crs as the layer. A feature that is in more than
+        one of the shards read (see HUC8_LAYER_ID_COLUMNS) is only in it once.
+    """
+
+    start_dt = dt.datetime.utcnow()
+
+    layer_index = __load_huc8_layer_index(str_layer_path)
+    if layer_index is None:
+        RLOG.trace(f"huc8 cache not found, reading {str_layer_path}")
+        return gpd.read_file(str_layer_path, bbox=bbox, mask=mask)
+
+    if bbox is None and mask is not None:
+        bbox = mask
+
+    if isinstance(bbox, (gpd.GeoDataFrame, gpd.GeoSeries)):
+        if layer_index["crs"] is not None and bbox.crs is not None:
+            bbox = bbox.to_crs(layer_index["crs"])
+        bbox = tuple(bbox.total_bounds)
+
+    cache_dir = fn_get_huc8_layer_cache_dir(str_layer_path)
+
+    if list_huc8s is not None:
+        list_huc8s = [str(huc8) for huc8 in list_huc8s]
+
+    list_shard_files = []
+    for shard in layer_index["shards"]:
+        if list_huc8s is not None and shard["huc8"] not in list_huc8s:
+            continue
+        if bbox is not None:
+            xmin, ymin, xmax, ymax = shard["bounds"]
+            if xmin > bbox[2] or xmax < bbox[0] or ymin > bbox[3] or ymax < bbox[1]:
+                continue
+        list_shard_files.append(os.path.join(cache_dir, shard["file_name"]))
+
+    # the bbox filter is pushed down to the parquet reader, on the bounding box columns
+    read_filters = None
+    if bbox is not None:
+        read_filters = [
+            ("bbox_xmax", ">=", bbox[0]),
+            ("bbox_ymax", ">=", bbox[1]),
+            ("bbox_xmin", "<=", bbox[2]),
+            ("bbox_ymin", "<=", bbox[3]),
+        ]
+
+    list_gdf_shards = [gpd.read_parquet(shard_file, filters=read_filters) for shard_file in list_shard_files]
+
+    if len(list_gdf_shards) == 0:
+        # keep the columns (from any shard) so the calling code can still use them
+        gdf_layer = gpd.read_parquet(os.path.join(cache_dir, layer_index["shards"][0]["file_name"])).iloc[0:0]
+    else:
+        gdf_layer = pd.concat(list_gdf_shards, ignore_index=True)
+
+    # ie) a flowline in two huc8s is in both of their shards
+    id_column = HUC8_LAYER_ID_COLUMNS.get(layer_index["layer"])
+    if id_column is not None and len(list_gdf_shards) > 1:
+        gdf_layer = gdf_layer.drop_duplicates(subset=id_column, ignore_index=True)
+
+    gdf_layer = gdf_layer.drop(columns=BBOX_COLUMNS)
+
+    RLOG.trace(
+        f"{len(gdf_layer)} records read from {len(list_shard_files)} huc8 cache shards of"
+        f" {str_layer_path}, {sf.get_date_time_duration_msg(start_dt, dt.datetime.utcnow())}"
+    )
+
+    return gdf_layer
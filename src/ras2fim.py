@@ -21,9 +21,12 @@ import traceback
 
 import pyproj
 
+import hecras_model_checkpoints as hmc
+import national_datasets_cache as ndc
 import shared_functions as sf
 import shared_validators as val
 import shared_variables as sv
+import step_manifest as sm
 from calculate_all_terrain_stats import fn_calculate_all_terrain_stats
 from clip_dem_from_shape import fn_cut_dems_from_shapes
 from conflate_hecras_to_nwm import fn_conflate_hecras_to_nwm
@@ -117,9 +120,41 @@ def init_and_run_ras2fim(
     unit_folder_name = sf.get_stnd_unit_output_folder_name(huc8, projection, source_code)
     unit_output_path = os.path.join(r2f_output_dir, unit_folder_name)
 
-    if os.path.exists(unit_output_path) is True:
+    # -------------------
+    if str_step_override == "None Specified - starting at the beginning":
+        int_step = 0
+    else:
+        if not str_step_override.isnumeric():
+            raise ValueError("the -o step override is invalid.")
+        else:
+            int_step = int(str_step_override)
+
+    # With step manifests, the latest existing unit folder for this huc / crs / source is
+    # reused (even if made on another day) so steps that have not changed can be skipped.
+    use_step_manifests = os.getenv("USE_STEP_MANIFESTS") == "True"
+    use_model_checkpoints = os.getenv("USE_HECRAS_MODEL_CHECKPOINTS") == "True"
+    previous_unit_path = ""
+    if use_step_manifests is True:
+        existing_unit_path = get_latest_unit_output_path(r2f_output_dir, unit_folder_name)
+        if existing_unit_path != "":
+            unit_output_path = existing_unit_path
+            print(f"Reusing the unit folder of {unit_output_path} (USE_STEP_MANIFESTS is True)")
+
+    elif int_step > 0:
+        # the outputs of the steps before the -o step are used as they are
+        pass
+
+    elif os.path.exists(unit_output_path) is True:
         # raise ValueError(f"The path of {unit_output_path} already exists. Please delete it and restart.")
-        shutil.rmtree(unit_output_path)
+        if use_model_checkpoints is True:
+            # keep its HEC-RAS models so step 5 can skip the ones that finished
+            remove_unit_outputs_except_models(unit_output_path)
+        else:
+            shutil.rmtree(unit_output_path)
+
+    elif use_model_checkpoints is True:
+        # the finished HEC-RAS models of the latest earlier unit folder are copied to the new one
+        previous_unit_path = get_latest_unit_output_path(r2f_output_dir, unit_folder_name)
 
     # -------------------
     # -n  (ie: inputs\\X-National_Datasets)
@@ -151,15 +186,6 @@ def init_and_run_ras2fim(
     else:
         raise ValueError("terrain DEM path has not been set.")
 
-    # -------------------
-    if str_step_override == "None Specified - starting at the beginning":
-        int_step = 0
-    else:
-        if not str_step_override.isnumeric():
-            raise ValueError("the -o step override is invalid.")
-        else:
-            int_step = int(str_step_override)
-
     # ********************************
     # -------------------
     # make the folder only if all other valudation tests pass.
@@ -188,9 +214,17 @@ def init_and_run_ras2fim(
     # setup the logging class (default unit folder path (HUC/CRS))
     # Log file must pre-exist
     log_folder = os.path.join(unit_output_path, "logs")
-    os.mkdir(log_folder)
+    os.makedirs(log_folder, exist_ok=True)
     RLOG.setup(os.path.join(log_folder, "ras2fim.log"))
 
+    # -------------------
+    if previous_unit_path != "":
+        num_models_copied = hmc.fn_copy_previous_models(previous_unit_path, unit_output_path)
+        RLOG.lprint(
+            f"{num_models_copied} HEC-RAS models with a checkpoint were copied from {previous_unit_path}"
+            " (USE_HECRAS_MODEL_CHECKPOINTS is True)"
+        )
+
     """
     # Kept temporarily for development example display purposes, just uncomment and run
 
@@ -240,9 +274,51 @@ def init_and_run_ras2fim(
         int_step,
         output_resolution,
         model_unit,
+        use_step_manifests,
     )
 
 
+# -------------------------------------------------
+def get_latest_unit_output_path(r2f_output_dir, unit_folder_name):
+    # Returns the path to the latest existing unit folder with the same huc, crs and source code
+    # as the unit_folder_name (ie. 12090301_2277_ble_230811 for 12090301_2277_ble_240301)
+    # or an empty string if there are none.
+
+    unit_id = sf.parse_unit_folder_name(unit_folder_name)["key_unit_id"]
+
+    existing_unit_folders = []
+    for folder_name in os.listdir(r2f_output_dir):
+        if os.path.isdir(os.path.join(r2f_output_dir, folder_name)) is False:
+            continue
+        unit_dict = sf.parse_unit_folder_name(folder_name)
+        if "error" in unit_dict or unit_dict["key_unit_id"] != unit_id:
+            continue
+        existing_unit_folders.append((unit_dict["key_unit_version_as_dt"], folder_name))
+
+    if len(existing_unit_folders) == 0:
+        return ""
+
+    return os.path.join(r2f_output_dir, max(existing_unit_folders)[1])
+
+
+# -------------------------------------------------
+def remove_unit_outputs_except_models(unit_output_path):
+    # Removes everything in a unit folder that is being run again from the start, except its
+    # HEC-RAS model folders (and the previous model folders set aside by an earlier run that
+    # stopped, see hecras_model_checkpoints.py).
+
+    keep_names = [sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT + hmc.PREVIOUS_DIR_SUFFIX]
+
+    for name in os.listdir(unit_output_path):
+        if name in keep_names:
+            continue
+        path = os.path.join(unit_output_path, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
 # -------------------------------------------------
 # If you are calling this python file from an another python file, DO NOT call this function first.
 # Call the init_and_run_ras2fim function as it validates inputs and sets up other key variables.
@@ -259,7 +335,12 @@ def fn_run_ras2fim(
     int_step,
     output_resolution,
     model_unit,
+    use_step_manifests=False,
 ):
+    # If use_step_manifests is True, steps 1 to 6 record a manifest of their inputs and outputs
+    # when they finish, and are skipped on the next run if nothing has changed.
+    # See step_manifest.py for details.
+
     start_dt = dt.datetime.utcnow()
 
     print()
@@ -277,13 +358,21 @@ def fn_run_ras2fim(
     RLOG.lprint(f"  ---(r) PATH TO HEC-RAS v6.3: {hecras_engine_path}")
     RLOG.lprint(f"  ---(t) TERRAIN DEM FILE: {terrain_file_path}")
     RLOG.lprint(f"  ---[s] Step to start at: {int_step}")
+    RLOG.lprint(f"  --- Use step manifests: {use_step_manifests}")
     RLOG.lprint(
         "  --- The Ras Models unit" f" (extracted from RAS model prj file and given EPSG code): {model_unit}"
     )
     RLOG.lprint(f"  --- ras2fim started: {sf.get_stnd_date()}")
 
-    # NOTE: Step system does not work as the folder name relies
-    # on dates and that can get out of sync when re-running steps.
+    # NOTE: The int_step system does not work well on its own as the folder name relies
+    # on dates and that can get out of sync when re-running steps. With USE_STEP_MANIFESTS,
+    # the latest unit folder is reused and each step is only rerun if its inputs have changed.
+
+    # Any change to the code version reruns all steps
+    changelog_path = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), os.pardir, 'doc', 'CHANGELOG.md')
+    )
+    code_version = sf.get_changelog_version(changelog_path)
 
     # -------------------------------------------
     # ---- Make the "final" folder now as some modules will write to it through the steps
@@ -302,7 +391,18 @@ def fn_run_ras2fim(
 
     # run the first script (create_shapes_from_hecras)
     if int_step <= 1:
-        fn_create_shapes_from_hecras(input_models_path, dir_shapes_from_hecras, projection)
+        sm.fn_run_step(
+            use_step_manifests,
+            unit_output_path,
+            "step_1_create_shapes_from_hecras",
+            {"code_version": code_version, "projection": projection},
+            [input_models_path],
+            [dir_shapes_from_hecras],
+            fn_create_shapes_from_hecras,
+            input_models_path,
+            dir_shapes_from_hecras,
+            projection,
+        )
     # -------------------------------------------
 
     # ------ Step 2: conflate_hecras_to_nwm -----
@@ -315,8 +415,28 @@ def fn_run_ras2fim(
 
     # run the second script (conflate_hecras_to_nwm)
     if int_step <= 2:
-        fn_conflate_hecras_to_nwm(
-            huc8, dir_shapes_from_hecras, dir_shapes_from_conflation, dir_datasets, unit_output_path
+        sm.fn_run_step(
+            use_step_manifests,
+            unit_output_path,
+            "step_2_conflate_hecras_to_nwm",
+            {"code_version": code_version, "huc8": huc8},
+            [
+                dir_shapes_from_hecras,
+                model_huc_catalog_path,
+                os.path.join(dir_datasets, sv.INPUT_NWM_FLOWS_FILE),
+                ndc.fn_get_huc8_layer_cache_dir(os.path.join(dir_datasets, sv.INPUT_NWM_FLOWS_FILE)),
+                os.path.join(dir_datasets, sv.INPUT_WBD_NATIONAL_FILE),
+                ndc.fn_get_huc8_layer_cache_dir(os.path.join(dir_datasets, sv.INPUT_WBD_NATIONAL_FILE)),
+                os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_FILE),
+                os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_HUC8_DIR),
+            ],
+            [dir_shapes_from_conflation],
+            fn_conflate_hecras_to_nwm,
+            huc8,
+            dir_shapes_from_hecras,
+            dir_shapes_from_conflation,
+            dir_datasets,
+            unit_output_path,
         )
     # -------------------------------------------
 
@@ -336,7 +456,20 @@ def fn_run_ras2fim(
         cross_sections_path = dir_shapes_from_hecras + "\\cross_section_LN_from_ras.shp"
         wbd_national_file_path = os.path.join(dir_datasets, sv.INPUT_WBD_NATIONAL_FILE)
 
-        fn_cut_dems_from_shapes(
+        sm.fn_run_step(
+            use_step_manifests,
+            unit_output_path,
+            "step_3_clip_dem_from_shape",
+            {"code_version": code_version, "huc8": huc8, "model_unit": model_unit},
+            [
+                dir_shapes_from_hecras,
+                conflation_csv_path,
+                wbd_national_file_path,
+                ndc.fn_get_huc8_layer_cache_dir(wbd_national_file_path),
+                terrain_file_path,
+            ],
+            [dir_terrain],
+            fn_cut_dems_from_shapes,
             huc8,
             wbd_national_file_path,
             cross_sections_path,
@@ -361,8 +494,23 @@ def fn_run_ras2fim(
     projection_file_path = os.path.join(dir_shapes_from_conflation, area_prj_file_name)
 
     if int_step <= 4:
-        fn_convert_tif_to_ras_hdf5(
-            hecras_engine_path, dir_terrain, dir_hecras_terrain, projection_file_path, model_unit
+        sm.fn_run_step(
+            use_step_manifests,
+            unit_output_path,
+            "step_4_convert_tif_to_ras_hdf5",
+            {
+                "code_version": code_version,
+                "hecras_engine_path": hecras_engine_path,
+                "model_unit": model_unit,
+            },
+            [dir_terrain, projection_file_path],
+            [dir_hecras_terrain],
+            fn_convert_tif_to_ras_hdf5,
+            hecras_engine_path,
+            dir_terrain,
+            dir_hecras_terrain,
+            projection_file_path,
+            model_unit,
         )
 
     # -------------------------------------------
@@ -372,7 +520,20 @@ def fn_run_ras2fim(
     RLOG.lprint(f"Module Started: {sf.get_stnd_date()}")
 
     if int_step <= 5:
-        fn_create_fim_rasters(huc8, unit_output_path, model_unit)
+        sm.fn_run_step(
+            use_step_manifests,
+            unit_output_path,
+            "step_5_create_fim_rasters",
+            {"code_version": code_version, "huc8": huc8, "model_unit": model_unit},
+            [input_models_path, model_huc_catalog_path, dir_shapes_from_conflation, dir_hecras_terrain],
+            [os.path.join(unit_output_path, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT)],
+            fn_create_fim_rasters,
+            huc8,
+            unit_output_path,
+            model_unit,
+            # model checkpoints let step 5 keep the models that finished in an earlier run
+            is_clear_output_dirs=os.getenv("USE_HECRAS_MODEL_CHECKPOINTS") != "True",
+        )
 
     # -------------------------------------------
     # --- Step 6: create_rating_curves_for_fids ---
@@ -381,7 +542,17 @@ def fn_run_ras2fim(
     RLOG.lprint(f"Module Started: {sf.get_stnd_date()}")
 
     if int_step <= 6:
-        fn_create_rating_curves(huc8, unit_output_path)
+        sm.fn_run_step(
+            use_step_manifests,
+            unit_output_path,
+            "step_6_create_rating_curves",
+            {"code_version": code_version, "huc8": huc8},
+            [dir_shapes_from_conflation, os.path.join(unit_output_path, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT)],
+            [os.path.join(unit_output_path, sv.R2F_OUTPUT_DIR_CREATE_RATING_CURVES)],
+            fn_create_rating_curves,
+            huc8,
+            unit_output_path,
+        )
 
     # -------------------------------------------------
     # calculate terrain statistics for HEC-RAS models
@@ -402,7 +573,12 @@ def fn_run_ras2fim(
         print()
         RLOG.notice("+++++++ Processing: STEP: Producing Geocurves +++++++")
         RLOG.lprint(f"Module Started: {sf.get_stnd_date()}")
-        manage_geo_rating_curves_production(unit_output_path, overwrite=False)
+        # overwrite as the unit folder might be reused (USE_STEP_MANIFESTS)
+        manage_geo_rating_curves_production(
+            unit_output_path,
+            overwrite=True,
+            write_geocurve_store=(os.getenv("PRODUCE_GEOCURVE_STORE") == "True"),
+        )
 
     # -------------------------------------------------
     if os.getenv("CREATE_RAS_DOMAIN_POLYGONS") == "True":
@@ -417,7 +593,7 @@ def fn_run_ras2fim(
         conflation_csv_path = os.path.join(dir_shapes_from_conflation, "%s_stream_qc_fid_xs.csv" % huc8)
 
         output_polygon_dir = os.path.join(r2f_final_dir, sv.R2F_OUTPUT_DIR_DOMAIN_POLYGONS)
-        os.mkdir(output_polygon_dir)
+        os.makedirs(output_polygon_dir, exist_ok=True)
 
         fn_make_domain_polygons(
             xsections_shp_file_path,
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import fnmatch
 import json
 import os
 import platform
@@ -20,6 +19,7 @@ from dotenv import load_dotenv
 from rasterio.warp import Resampling, calculate_default_transform, reproject
 from tqdm import tqdm
 
+import hecras_project_catalog as hpc
 import shared_validators as val
 import shared_variables as sv
 from r2f_errors import ModelUnitError
@@ -98,28 +98,15 @@ def model_unit_from_ras_prj(str_ras_path_arg):
 
     unit = None
     ras_prj_files = []
-    if os.path.isdir(str_ras_path_arg):
-        for root, dirnames, filenames in os.walk(str_ras_path_arg):
-            for filename in fnmatch.filter(filenames, "*.[Pp][Rr][Jj]"):
-                with open(os.path.join(root, filename)) as f:
-                    first_file_line = f.readline()
-
-                # skip projection files
-                if any(x in first_file_line for x in ["PROJCS", "GEOGCS", "DATUM", "PROJECTION"]):
-                    continue
-                ras_prj_files.append(os.path.join(root, filename))
-    elif os.path.isfile(str_ras_path_arg):
-        ras_prj_files.append(str_ras_path_arg)
-
-    units_found = []
-    for ras_prj_file in ras_prj_files:
-        with open(ras_prj_file) as f:
-            file_contents = f.read()
-
-        if re.search("SI Unit", file_contents, re.I):
-            units_found.append("meter")
-        elif re.search("English Unit", file_contents, re.I):
-            units_found.append("feet")
+    if os.path.exists(str_ras_path_arg):
+        ras_prj_files = hpc.fn_find_prj_files(str_ras_path_arg)
+
+    # projection and binary files have no unit
+    units_found = [
+        prj_entry["unit"]
+        for prj_entry in hpc.fn_get_hecras_project_catalog(ras_prj_files)
+        if prj_entry["unit"] is not None
+    ]
 
     try:
         if len(set(units_found)) == 0:  # if no unit specified in any of the RAS models
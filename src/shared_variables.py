@@ -22,6 +22,8 @@ ROOT_DIR_INPUTS = os.path.join(DEFAULT_BASE_DIR, "inputs")
 INPUT_DEFAULT_X_NATIONAL_DS_DIR = os.path.join(ROOT_DIR_INPUTS, "X-National_Datasets")
 INPUT_NWM_FLOWS_FILE = "nwm_flows.gpkg"
 INPUT_NWM_WBD_LOOKUP_FILE = "nwm_wbd_lookup.nc"
+INPUT_NWM_WBD_LOOKUP_HUC8_DIR = "nwm_wbd_lookup_huc8"  # huc8 cache of the nwm_wbd_lookup.nc
+INPUT_NWM_WBD_LOOKUP_HUC8_INDEX_FILE = "nwm_wbd_lookup_index.csv"
 INPUT_WBD_NATIONAL_FILE = "WBD_National.gpkg"
 INPUT_NWM_CATCHMENTS_FILE = "nwm_catchments.gpkg"
 INPUT_LEVEE_PROT_AREA_FILE_PATH = os.path.join(
@@ -40,6 +42,8 @@ DEFAULT_OWP_RAS_MODELS_MODEL_PATH = os.path.join(DEFAULT_BASE_DIR, "OWP_ras_mode
 DEFAULT_RSF_MODELS_CATALOG_FILE = os.path.join(
     DEFAULT_BASE_DIR, "OWP_ras_models", "OWP_ras_models_catalog_[].csv"
 )
+# shapes read from each model in step 1, reused if the model has not changed (see model_shapes_cache.py)
+R2F_MODEL_SHAPES_CACHE_DIR = os.path.join(DEFAULT_BASE_DIR, "cache", "model_shapes")
 
 # RAS2FIM OUTPUT FOLDERS
 R2F_DEFAULT_OUTPUT_MODELS = os.path.join(DEFAULT_BASE_DIR, "output_ras2fim")
@@ -48,12 +52,17 @@ R2F_OUTPUT_DIR_SHAPES_FROM_CONF = "02_csv_shapes_from_conflation"
 R2F_OUTPUT_DIR_TERRAIN = "03_terrain"
 R2F_OUTPUT_DIR_HECRAS_TERRAIN = "04_hecras_terrain"
 R2F_OUTPUT_DIR_HECRAS_OUTPUT = "05_hecras_output"
+# models that failed or hung in create_fim_rasters are moved here (see hecras_model_scheduler.py)
+R2F_OUTPUT_DIR_HECRAS_QUARANTINE = "05_hecras_output_quarantine"
 R2F_OUTPUT_DIR_CREATE_RATING_CURVES = "06_create_rating_curves"
+R2F_OUTPUT_DIR_STEP_MANIFESTS = "step_manifests"
 
 R2F_OUTPUT_DIR_METRIC_RATING_CURVES = "Rating_Curve"
 R2F_OUTPUT_DIR_METRIC_CROSS_SECTIONS = "Cross_Sections"
 R2F_OUTPUT_DIR_FINAL = "final"
 R2F_OUTPUT_DIR_GEOCURVES = "geo_rating_curves"
+R2F_OUTPUT_FILE_GEOCURVE_STORE = "geocurves.parquet"
+R2F_OUTPUT_FILE_GEOCURVE_STORE_INDEX = "geocurves_index.csv"
 R2F_OUTPUT_DIR_DOMAIN_POLYGONS = "models_domain"
 R2F_OUTPUT_DIR_RAS2RELEASE = os.path.join(DEFAULT_BASE_DIR, "ras2fim_releases")
 
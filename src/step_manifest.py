@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import shared_functions as sf
+import shared_variables as sv
+
+
+"""
+Step manifests let ras2fim.py skip steps that have already been run for a unit.
+
+When a step finishes, a manifest (json) is saved in the unit's step_manifests folder. It records:
+    - the step parameters (ie. huc8, model unit, ras2fim version)
+    - a content hash (sha256) of every input file the step used
+    - a content hash of every output file the step created
+
+When the unit is run again, a step is skipped if its manifest still matches: same parameters,
+same input contents and its outputs are still there, unchanged. As each step's outputs are the
+next step's inputs, a change (ie. one changed model) reruns the first step it affects and then only
+the steps downstream of it that see a changed input.
+
+The manifests are per step, not per model: each step runs all of the unit's models in one call, so
+a step that has to run again, runs for all models (step 5 model checkpoints, see
+hecras_model_checkpoints.py, are per model).
+
+Hashing large files (terrain, national datasets) takes time, so the hash of each file is also
+saved in the step_manifests/file_hashes.json file with its size and modified time. If neither
+has changed, the saved hash is used and the file is not read again.
+"""
+
+# Global Variables
+RLOG = sv.R2F_LOG
+
+HASH_CACHE_FILE_NAME = "file_hashes.json"
+HASH_READ_BLOCK_SIZE = 1024 * 1024 * 8
+
+
+# -------------------------------------------------
+def __get_manifest_dir(unit_output_path):
+    return os.path.join(unit_output_path, sv.R2F_OUTPUT_DIR_STEP_MANIFESTS)
+
+
+# -------------------------------------------------
+def __get_manifest_path(unit_output_path, step_name):
+    return os.path.join(__get_manifest_dir(unit_output_path), f"{step_name}.json")
+
+
+# -------------------------------------------------
+def __hash_file(file_path):
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file_to_hash:
+        for block in iter(lambda: file_to_hash.read(HASH_READ_BLOCK_SIZE), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+# -------------------------------------------------
+def fn_get_fingerprints(unit_output_path, paths):
+    """
+    Overview:
+        Returns the content hash of every file in the list of paths. A path can be a file or a
+        folder (all files in it, including sub folders, are included).
+
+    Inputs:
+        - unit_output_path: the unit folder (for the saved file hashes)
+        - paths: list of file and / or folder paths
+
+    Output:
+        A dictionary of file path -> sha256. If a path does not exist, it is included with a
+        value of None so a missing input or output is a change.
+    """
+
+    manifest_dir = __get_manifest_dir(unit_output_path)
+    os.makedirs(manifest_dir, exist_ok=True)
+
+    hash_cache_path = os.path.join(manifest_dir, HASH_CACHE_FILE_NAME)
+    hash_cache = {}
+    if os.path.exists(hash_cache_path):
+        with open(hash_cache_path, "r") as hash_cache_file:
+            hash_cache = json.load(hash_cache_file)
+
+    fingerprints = {}
+    for path in paths:
+        path = os.path.abspath(path)
+
+        if os.path.isdir(path):
+            file_paths = []
+            for root, __, file_names in os.walk(path):
+                file_paths.extend(os.path.join(root, file_name) for file_name in file_names)
+            file_paths.sort()
+        elif os.path.isfile(path):
+            file_paths = [path]
+        else:
+            fingerprints[path] = None
+            continue
+
+        for file_path in file_paths:
+            file_stat = os.stat(file_path)
+            cached_hash = hash_cache.get(file_path)
+            if (
+                cached_hash is None
+                or cached_hash["size"] != file_stat.st_size
+                or cached_hash["mtime_ns"] != file_stat.st_mtime_ns
+            ):
+                RLOG.trace(f"Hashing {file_path}")
+                cached_hash = {
+                    "size": file_stat.st_size,
+                    "mtime_ns": file_stat.st_mtime_ns,
+                    "sha256": __hash_file(file_path),
+                }
+                hash_cache[file_path] = cached_hash
+
+            fingerprints[file_path] = cached_hash["sha256"]
+
+    with open(hash_cache_path, "w") as hash_cache_file:
+        json.dump(hash_cache, hash_cache_file)
+
+    return fingerprints
+
+
+# -------------------------------------------------
+def fn_is_step_current(unit_output_path, step_name, step_params, input_paths, output_paths):
+    """
+    Overview:
+        Returns True if the step has a manifest and its parameters, input contents and output
+        contents all still match it, meaning the step does not need to be run again.
+
+    Inputs:
+        - unit_output_path: the unit folder
+        - step_name: (str) ie. step_3_clip_dem_from_shape
+        - step_params: dictionary of the step parameters (json serializable)
+        - input_paths: list of file and / or folder paths the step reads
+        - output_paths: list of file and / or folder paths the step creates
+    """
+
+    manifest_path = __get_manifest_path(unit_output_path, step_name)
+    if os.path.exists(manifest_path) is False:
+        RLOG.trace(f"{step_name}: no step manifest found")
+        return False
+
+    with open(manifest_path, "r") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    # json round trip so tuples, etc compare the same way as when they were saved
+    if manifest.get("params") != json.loads(json.dumps(step_params)):
+        RLOG.lprint(f"{step_name}: parameters have changed since the last run")
+        return False
+
+    if manifest.get("inputs") != fn_get_fingerprints(unit_output_path, input_paths):
+        RLOG.lprint(f"{step_name}: inputs have changed since the last run")
+        return False
+
+    if manifest.get("outputs") != fn_get_fingerprints(unit_output_path, output_paths):
+        RLOG.lprint(f"{step_name}: outputs have changed or are missing since the last run")
+        return False
+
+    return True
+
+
+# -------------------------------------------------
+def fn_save_step_manifest(unit_output_path, step_name, step_params, input_paths, output_paths):
+    # Saves the manifest for a step that has just finished.
+
+    manifest = {
+        "step": step_name,
+        "params": json.loads(json.dumps(step_params)),
+        "inputs": fn_get_fingerprints(unit_output_path, input_paths),
+        "outputs": fn_get_fingerprints(unit_output_path, output_paths),
+        "completed": sf.get_stnd_date(),
+    }
+
+    # write to a temp file first so a partly written manifest is never used
+    manifest_path = __get_manifest_path(unit_output_path, step_name)
+    with open(manifest_path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+# -------------------------------------------------
+def fn_run_step(
+    use_step_manifests,
+    unit_output_path,
+    step_name,
+    step_params,
+    input_paths,
+    output_dirs,
+    step_function,
+    *args,
+    is_clear_output_dirs=True,
+):
+    """
+    Overview:
+        Runs a ras2fim step, unless step manifests are being used and the step's manifest
+        still matches (see fn_is_step_current), in which case the step is skipped.
+
+        When step manifests are being used and the step has to run, its manifest is removed
+        and its output folders are emptied first, so a failed or stopped step is never skipped
+        on the next run. Steps that clean up their own outputs (ie. step 5 with model
+        checkpoints) can keep them with is_clear_output_dirs=False.
+
+    Inputs:
+        - use_step_manifests: (bool) if False, the step is always run (and no manifest is saved)
+        - unit_output_path: the unit folder
+        - step_name: (str) ie. step_3_clip_dem_from_shape
+        - step_params: dictionary of the step parameters (json serializable)
+        - input_paths: list of file and / or folder paths the step reads
+        - output_dirs: list of folders the step creates its outputs in
+        - step_function: the step function, called with *args
+        - is_clear_output_dirs: OPTIONAL: if False, the output folders are not emptied first
+    """
+
+    if use_step_manifests is False:
+        step_function(*args)
+        return
+
+    if fn_is_step_current(unit_output_path, step_name, step_params, input_paths, output_dirs):
+        RLOG.success(f"{step_name} skipped: its inputs and outputs have not changed since its last run")
+        return
+
+    manifest_path = __get_manifest_path(unit_output_path, step_name)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    for output_dir in output_dirs:
+        if is_clear_output_dirs is False:
+            os.makedirs(output_dir, exist_ok=True)
+            continue
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+            # shutil.rmtree is not instant, it sends a command to windows, so do a quick time out here
+            # so sometimes mkdir can fail if rmtree isn't done
+            time.sleep(1)
+        os.mkdir(output_dir)
+
+    step_function(*args)
+
+    fn_save_step_manifest(unit_output_path, step_name, step_params, input_paths, output_dirs)
@@ -15,9 +15,13 @@ import pandas as pd
 import win32com.client
 from scipy.interpolate import interp1d
 
+import hecras_flow_file as hff
+import hecras_model_checkpoints as hmc
+import hecras_plan_results as hpr
 import ras2fim_logger
 import shared_functions as sf
 import shared_variables as sv
+import x_sections_info_store as xsis
 
 
 # Global Variables
@@ -85,83 +89,6 @@ def fn_format_flow_values(list_flow):
     return str_all_flows
 
 
-# -------------------------------------------------
-def fn_get_flow_dataframe(str_path_hecras_flow_fn):
-    # Get pandas dataframe of the flows in the active plan's flow file
-
-    # initalize the dataframe
-    df = pd.DataFrame()
-    df['river'] = []
-    df['reach'] = []
-    df['start_xs'] = []
-    df['max_flow'] = []
-
-    with open(str_path_hecras_flow_fn, 'r') as hecras_flow_file:
-        hecras_flow_lines = hecras_flow_file.readlines()
-        i = 0  # number of the current row
-
-        for line in hecras_flow_lines:
-            if line[:19] == 'Number of Profiles=':
-                # determine the number of profiles
-                int_flow_profiles = int(line[19:])
-
-                # determine the number of rows of flow - each row has maximum of 10
-                int_flow_rows = int(int_flow_profiles // 10 + 1)
-
-            if line[:15] == 'River Rch & RM=':
-                str_river_reach = line[15:]  # remove first 15 characters
-
-                # split the data on the comma
-                list_river_reach = str_river_reach.split(",")
-
-                # Get from array - use strip to remove whitespace
-                str_river = list_river_reach[0].strip()
-                str_reach = list_river_reach[1].strip()
-                str_start_xs = list_river_reach[2].strip()
-                flt_start_xs = float(str_start_xs)
-
-                # Read the flow values line(s)
-                list_flow_values = []
-
-                # for each line with flow data
-                for j in range(i + 1, i + int_flow_rows + 1):
-                    # get the current line
-                    line_flows = hecras_flow_lines[j]
-
-                    # determine the number of values on this
-                    # line from character count
-                    int_val_in_row = int((len(hecras_flow_lines[j]) - 1) / 8)
-
-                    # for each value in the row
-                    for k in range(0, int_val_in_row):
-                        # get the flow value (Max of 8 characters)
-                        str_flow = line_flows[k * 8 : k * 8 + 8].strip()
-                        # convert the string to a float
-                        flt_flow = float(str_flow)
-                        # append data to list of flow values
-                        list_flow_values.append(flt_flow)
-
-                # Get the max value in list
-                flt_max_flow = max(list_flow_values)
-
-                # write to dataFrame
-                df_new_row = pd.DataFrame.from_records(
-                    [
-                        {
-                            "river": str_river,
-                            "reach": str_reach,
-                            "start_xs": flt_start_xs,
-                            "max_flow": flt_max_flow,
-                        }
-                    ]
-                )
-                df = pd.concat([df, df_new_row], ignore_index=True)
-
-            i += 1
-
-    return df
-
-
 # -------------------------------------------------
 # Reading original parent models flow and geometry files
 # with WSE and normal depth (ND, slope) BCs
@@ -183,29 +110,15 @@ def create_list_of_paths_flow_geometry_files_4each_BCs(path_to_conflated_streams
     ls_path_flowfiles = [paths[:-3] + "f01" for paths in path_conflated_models]
 
     # List of flow file paths
-    # Water surface elevation BC
+    # Water surface elevation BC and Normal depth BC
     ls_path_to_flow_file_wse = []
-    for fpath in ls_path_flowfiles:
-        with open(fpath, 'r') as file_flow:
-            lines_flow = file_flow.readlines()
-
-            for flines in lines_flow:
-                if flines[:11] == "Dn Known WS":
-                    ls_path_to_flow_file_wse.append(fpath)
-                    break
-            file_flow.close()
-
-    # Normal depth BC
     ls_path_to_flow_file_nd = []
-    for fpath2 in ls_path_flowfiles:
-        with open(fpath2, 'r') as file_flow2:
-            lines_flow2 = file_flow2.readlines()
-
-            for flines2 in lines_flow2:
-                if flines2[:8] == "Dn Slope":
-                    ls_path_to_flow_file_nd.append(fpath2)
-                    break
-            file_flow2.close()
+    for fpath in ls_path_flowfiles:
+        flow_file = hff.fn_parse_flow_file(fpath)
+        if len(flow_file["dn_known_ws"]) > 0:
+            ls_path_to_flow_file_wse.append(fpath)
+        if len(flow_file["dn_slope"]) > 0:
+            ls_path_to_flow_file_nd.append(fpath)
 
     # List of geometry file paths
     ls_path_to_geo_file_wse = []
@@ -227,263 +140,275 @@ def create_list_of_paths_flow_geometry_files_4each_BCs(path_to_conflated_streams
 
 
 # -------------------------------------------------
-# Compute BC (75 flows/WSE) for the parent RAS models with WSE BC
-def compute_boundray_condition_wse(
-    int_fn_starting_flow, int_number_of_steps, ls_path_to_flow_file_wse, ls_path_to_geo_file_wse
-):
-    list_bc_target_xs_huc8 = []
+# Finding the min elevation of the last cross section (target XS for min elevation)
+# in a parent model's geometry file, for the WSE BC
+def get_min_elev_last_xs(str_path_hecras_geo_fn):
+    with open(str_path_hecras_geo_fn, 'r') as file_geo:
+        lines_geo = file_geo.readlines()
+
+    # Line number and river station of each node (cross sections, bridges, etc)
+    list_node_lines = []
+    for j, geoline in enumerate(lines_geo):
+        if geoline[:14] == 'Type RM Length':
+            target_line = geoline.split(",")
+            list_node_lines.append((j, int(target_line[1])))
+
+    # Last XS for min elevation (the last node in the file)
+    str_target_xs_min_elev = list_node_lines[-1][1]
+
+    # -------------------------------------------------
+    # Finding the geometry lines for the last XS
+    # (if more than one node has its river station, the last of them)
+    j = [j for j, counter_xs1 in list_node_lines if counter_xs1 == str_target_xs_min_elev][-1]
+
+    # read "XS GIS Cut Line" for the target xs
+    tls = j + 4  # "XS GIS Cut Line" line number
+    num_xs_cut_line = int(lines_geo[tls][16:])  # number of xs cut lines
+
+    if num_xs_cut_line % 2 != 0:  # if num_xs_cut_line is odd
+        num_xs_cut_line2 = num_xs_cut_line + 1
+        num_sta_elev_line0 = tls + 1 + (num_xs_cut_line2 / 2)
+    else:
+        num_sta_elev_line0 = tls + 1 + (num_xs_cut_line / 2)
+
+    if lines_geo[int(num_sta_elev_line0)][0:9] == "#Sta/Elev":
+        num_sta_elev_line = num_sta_elev_line0
+    else:
+        num_sta_elev_line = num_sta_elev_line0 + 1
+
+    sta_elev_line = lines_geo[int(num_sta_elev_line)]
+    num_stat_elev = int(sta_elev_line[10:])
+
+    if num_stat_elev % 5 == 0:  # 10 numbers in each row
+        len_stat_elev_ls = [
+            int(num_sta_elev_line + 1),
+            int(num_sta_elev_line + 1 + (num_stat_elev / 5)),
+        ]  # 5 station/elev sets per each row
+    else:
+        len_stat_elev_ls = [
+            int(num_sta_elev_line + 1),
+            int(num_sta_elev_line + 1 + 1 + int(num_stat_elev / 5)),
+        ]
+
+    # Finding the min elevation from the target XS's station/elevation list
+    stat_elev_ls = lines_geo[len_stat_elev_ls[0] : len_stat_elev_ls[1]]
+
+    flt_stat_elev_ls = []
+    for sel in range(len(stat_elev_ls)):
+        sel_line = [float(sell) for sell in re.findall('.{1,8}', stat_elev_ls[sel])]
+        flt_stat_elev_ls.append(sel_line)
+
+    # One row per line, padded with nan (10 numbers in each full row)
+    flt_stat_elev_nan = np.full([len(flt_stat_elev_ls), max(len(sel) for sel in flt_stat_elev_ls)], np.nan)
+    for sel, sel_line in enumerate(flt_stat_elev_ls):
+        flt_stat_elev_nan[sel, : len(sel_line)] = sel_line
+
+    num_stat_elev_nan = int(len(flt_stat_elev_nan) * 5)
+    flt_stat_elev_ls_rsh = np.reshape(flt_stat_elev_nan, [num_stat_elev_nan, 2])
+    flt_stat_elev = flt_stat_elev_ls_rsh[~np.isnan(flt_stat_elev_ls_rsh).any(axis=1)]
+
+    return min(flt_stat_elev[:, 1])
+
+
+# -------------------------------------------------
+# Get the observed flows and WSEs of a parent model's WSE BC (the known WSE of each profile
+# and the flow of the last xs in which flow changes), sorted by flow, with the min elevation
+# point of its last XS first
+def get_wse_bc_observations(str_path_hecras_flow_fn, str_path_hecras_geo_fn):
+    flow_file = hff.fn_parse_flow_file(str_path_hecras_flow_fn)
+    int_flow_profiles = flow_file["num_profiles"]
+
+    # All flow data of the last xs in which flow changes (the target xs)
+    arr_target_xs_flows = np.array(flow_file["flow_values"][-1], dtype=float)
+
+    # Get the WSE for the boundray condition (known WSE)
+    arr_target_xs_wse = np.array([float(WSE) for WSE in flow_file["dn_known_ws"]])
+
+    if len(arr_target_xs_flows) != int_flow_profiles or len(arr_target_xs_wse) != int_flow_profiles:
+        raise ValueError(
+            f"{str_path_hecras_flow_fn} has {int_flow_profiles} profiles, but {len(arr_target_xs_flows)}"
+            f" flows at its last flow change xs and {len(arr_target_xs_wse)} known WSEs"
+        )
+
+    # sorted the same as pandas sort_values (quicksort)
+    arr_sort = np.argsort(arr_target_xs_flows, kind="quicksort")
+
+    min_elev_target_xs = get_min_elev_last_xs(str_path_hecras_geo_fn)
+
+    arr_discharge = np.concatenate([[0.01], arr_target_xs_flows[arr_sort]])
+    arr_stage = np.concatenate([[min_elev_target_xs], arr_target_xs_wse[arr_sort]])
+
+    return arr_discharge, arr_stage
+
+
+# -------------------------------------------------
+def polyfit_2nd_degree_stack(arr_x, arr_y):
+    # np.polyfit(x, y, 2) for each row (model) of 2d arrays of points, all at once.
+    # It has the same column scaling and rcond as np.polyfit, but is solved with
+    # a stack of pseudo inverses, as np.linalg.lstsq can only do one fit at a time
+    int_num_points = arr_x.shape[1]
+
+    arr_lhs = np.stack([arr_x * arr_x, arr_x, np.ones_like(arr_x)], axis=2)
+    arr_scale = np.sqrt((arr_lhs * arr_lhs).sum(axis=1))
+    arr_lhs = arr_lhs / arr_scale[:, np.newaxis, :]
+
+    flt_rcond = int_num_points * np.finfo(arr_x.dtype).eps
+    arr_coeffs = np.matmul(np.linalg.pinv(arr_lhs, rcond=flt_rcond), arr_y[:, :, np.newaxis])[:, :, 0]
+
+    return arr_coeffs / arr_scale
+
+
+# -------------------------------------------------
+def polyfit_2nd_degree_by_model(arr_x, arr_y):
+    # polyfit_2nd_degree_stack, but a model that can not be fitted (ie. a NaN in its points)
+    # gets NaN coefficients instead of failing the fit of all the other models.
     try:
-        for path_in in range(len(ls_path_to_flow_file_wse)):
-            RLOG.trace(f"Computing WSE boundary conditions for {ls_path_to_flow_file_wse[path_in]}")
-            # Get max flow for each xs in which flow changes in a dataframe format
-            max_flow_df_wse = fn_get_flow_dataframe(ls_path_to_flow_file_wse[path_in])
+        return polyfit_2nd_degree_stack(arr_x, arr_y)
+    except np.linalg.LinAlgError:
+        pass
 
-            # -------------------------------------------------
-            # Create firstpass flow dataframe for each xs in which flow changes
-            # Water surface elevation BC
-            first_pass_flows_xs_wse = []
-            for num_xs in range(len(max_flow_df_wse)):
-                int_fn_max_flow = int(max_flow_df_wse['max_flow'][num_xs])
-                list_first_pass_flows = fn_create_firstpass_flowlist(
-                    int_fn_starting_flow, int_fn_max_flow, int_number_of_steps
-                )
-                first_pass_flows_xs_wse.append(list_first_pass_flows)
+    # fit the models one at a time to find the ones that can not be fitted
+    arr_coeffs = np.full([arr_x.shape[0], 3], np.nan)
+    for idx in range(arr_x.shape[0]):
+        try:
+            arr_coeffs[idx] = polyfit_2nd_degree_stack(arr_x[idx : idx + 1], arr_y[idx : idx + 1])[0]
+        except np.linalg.LinAlgError:
+            pass
 
-            first_pass_flows_xs_wse_df = pd.DataFrame(first_pass_flows_xs_wse).T
-            first_pass_flows_xs_wse_df.columns = [int(j) for j in max_flow_df_wse['start_xs']]
+    return arr_coeffs
 
-            # -------------------------------------------------
-            # Get all flow data from the current plan's (parent models) flow file
-            # and save it in a pandas dataframe for
-            # Water surface elevation BC
-            str_path_hecras_flow_fn = ls_path_to_flow_file_wse[path_in]
-
-            with open(str_path_hecras_flow_fn, 'r') as hecras_flow_file:
-                hecras_flow_lines = hecras_flow_file.readlines()
-                i = 0  # number of the current row
-                list_all_flow_values = []
-
-                for line in hecras_flow_lines:
-                    if line[:19] == 'Number of Profiles=':
-                        # determine the number of profiles
-                        int_flow_profiles = int(line[19:])
-
-                        # determine the number of rows of flow - each row has maximum of 10
-                        int_flow_rows = int(int_flow_profiles // 10 + 1)
-
-                    if line[:15] == 'River Rch & RM=':
-                        # Read the flow values line(s)
-                        list_flow_values = []
-
-                        # for each line with flow data
-                        for j in range(i + 1, i + int_flow_rows + 1):
-                            # get the current line
-                            line_flows = hecras_flow_lines[j]
-
-                            # determine the number of values on this
-                            # line from character count
-                            int_val_in_row = int((len(hecras_flow_lines[j]) - 1) / 8)
-
-                            # for each value in the row
-                            for k in range(0, int_val_in_row):
-                                # get the flow value (Max of 8 characters)
-                                str_flow = line_flows[k * 8 : k * 8 + 8].strip()
-                                # convert the string to a float
-                                flt_flow = float(str_flow)
-                                # append data to list of flow values
-                                list_flow_values.append(flt_flow)
-
-                        # print(list_flow_values)
-                        list_all_flow_values.append(list_flow_values)
-
-                    i += 1
-
-                df_all_flow_values = pd.DataFrame(list_all_flow_values)
-                column_names = ['flow' + str(j + 1) for j in range(int_flow_profiles)]
-                df_all_flow_values.columns = column_names
-
-                all_flow_info_df = pd.concat([max_flow_df_wse, df_all_flow_values], axis=1)
-                target_xs = int(list(all_flow_info_df['start_xs'])[-1])  # last xs in which flow changes
-                # str_target_xs = str(target_xs)
-
-                # -------------------------------------------------
-                # All flow data dataframe for the boundary condition of known WSE
-                target_xs_flows = df_all_flow_values.iloc[-1]
-                target_xs_flows_df = pd.DataFrame(target_xs_flows)
-                target_xs_flows_df.index = [k for k in range(int_flow_profiles)]
-                target_xs_flows_df.columns = ['discharge']
-
-                # Get the WSE for the boundray condition (known WSE)
-                target_xs_wse = []
-                for line in hecras_flow_lines:
-                    if line[:12] == 'Dn Known WS=':
-                        # determine the number of profiles
-                        WSE = float(line[12:])
-                        target_xs_wse.append(WSE)
-
-                target_xs_wse_df = pd.DataFrame(target_xs_wse, columns=['wse'])
-
-                # Dataframe of known WSE BC (flow and wse)
-                bc_df = pd.concat([target_xs_flows_df, target_xs_wse_df], axis=1)
-                bc_sort_df = bc_df.sort_values(by=['discharge'])
-
-                hecras_flow_file.close()
 
-            # -------------------------------------------------
-            # Finding the last cross section (target XS for min elevation)
-            # Water surface elevation BC
-            str_path_hecras_geo_fn = ls_path_to_geo_file_wse[path_in]  #
+# -------------------------------------------------
+def fit_wse_boundary_conditions(list_discharge, list_stage, arr_flows1st):
+    """
+    Overview:
+        Fits the WSE BC rating curves of many models at once and predicts the WSE BC of each
+        of their first pass flows.
+
+        Each model gets two 2nd degree polynomials: one through its first 4 points (the min
+        elevation point and the 3 lowest flows) for the flows up to the knot point (its lowest
+        observed flow), and one through all of its points but the min elevation point for the
+        flows above it. If the predicted WSE drops anywhere, the WSEs from the first drop on are
+        replaced with a straight line from that WSE to the last predicted WSE.
+
+    Inputs:
+        - list_discharge: for each model, an array of its observed flows, sorted, with the min
+              elevation point (0.01) first (see get_wse_bc_observations)
+        - list_stage: for each model, an array of its observed WSEs, in the same order
+        - arr_flows1st: 2d array (models x steps) of the first pass flows of each model's
+              last xs in which flow changes (the target xs)
+
+    Output:
+        2d array (models x steps) of the WSE BCs for the first pass flows. The rows of models
+        that could not be fitted (ie. a NaN in their points) are all NaN.
+    """
+
+    int_num_models, int_number_of_steps = arr_flows1st.shape
+
+    arr_coeffs = np.zeros([int_num_models, 3])
+    arr_coeffs2 = np.zeros([int_num_models, 3])
+    arr_knot_point = np.zeros(int_num_models)
+
+    knot_ind = 1
+
+    # The models are fitted in groups with the same number of points
+    arr_num_points = np.array([len(discharge) for discharge in list_discharge])
+    for int_num_points in np.unique(arr_num_points):
+        arr_model_idxs = np.flatnonzero(arr_num_points == int_num_points)
+        arr_discharge = np.stack([list_discharge[idx] for idx in arr_model_idxs])
+        arr_stage = np.stack([list_stage[idx] for idx in arr_model_idxs])
+
+        arr_coeffs[arr_model_idxs] = polyfit_2nd_degree_by_model(arr_discharge[:, :4], arr_stage[:, :4])
+        arr_coeffs2[arr_model_idxs] = polyfit_2nd_degree_by_model(
+            arr_discharge[:, knot_ind:], arr_stage[:, knot_ind:]
+        )
+        arr_knot_point[arr_model_idxs] = arr_discharge[:, knot_ind]
 
-            with open(str_path_hecras_geo_fn, 'r') as file_geo:
-                lines_geo = file_geo.readlines()
-                for gline in lines_geo:
-                    if gline[:14] == 'Type RM Length':
-                        target_line = gline.split(",")
-                        counter_xs = int(target_line[1])
+    # -------------------------------------------------
+    # Predicting WSE for the first pass flows (the same as np.poly1d)
+    arr_is_below_knot = arr_flows1st <= arr_knot_point[:, np.newaxis]
+    arr_coeffs_flows = np.where(
+        arr_is_below_knot[:, :, np.newaxis], arr_coeffs[:, np.newaxis, :], arr_coeffs2[:, np.newaxis, :]
+    )
+    arr_pred_wse = (
+        arr_coeffs_flows[:, :, 0] * arr_flows1st + arr_coeffs_flows[:, :, 1]
+    ) * arr_flows1st + arr_coeffs_flows[:, :, 2]
 
-            # Last XS for min elevation
-            str_target_xs_min_elev = counter_xs
+    # -------------------------------------------------
+    # Generating a monotonic wse for the first pass flow
+    arr_is_drop = arr_pred_wse[:, 1:] < arr_pred_wse[:, :-1]
+    arr_has_drop = arr_is_drop.any(axis=1)
+    arr_nm_ind = np.where(arr_has_drop, arr_is_drop.argmax(axis=1), int_number_of_steps)
 
-            # -------------------------------------------------
-            # Finding the geometry lines for the last XS
-            # Water surface elevation BC
-            j = 0
-            for geoline in lines_geo:
-                if geoline[:14] == 'Type RM Length':
-                    target_line = geoline.split(",")
-                    counter_xs1 = int(target_line[1])
-
-                    if counter_xs1 == int(str_target_xs_min_elev):  # str_target_xs
-                        # read "XS GIS Cut Line" for the target xs
-
-                        tls = j + 4  # "XS GIS Cut Line" line number
-                        num_xs_cut_line = int(lines_geo[tls][16:])  # number of xs cut lines
-
-                        if num_xs_cut_line % 2 != 0:  # if num_xs_cut_line is odd
-                            num_xs_cut_line2 = num_xs_cut_line + 1
-                            num_sta_elev_line0 = tls + 1 + (num_xs_cut_line2 / 2)
-                        else:
-                            num_sta_elev_line0 = tls + 1 + (num_xs_cut_line / 2)
-
-                        if lines_geo[int(num_sta_elev_line0)][0:9] == "#Sta/Elev":
-                            num_sta_elev_line = num_sta_elev_line0
-                        else:
-                            num_sta_elev_line = num_sta_elev_line0 + 1
-
-                        sta_elev_line = lines_geo[int(num_sta_elev_line)]
-                        num_stat_elev = int(sta_elev_line[10:])
-                        # print(num_stat_elev)
-
-                        if num_stat_elev % 5 == 0:  # 10 numbers in each row
-                            len_stat_elev_ls = [
-                                int(num_sta_elev_line + 1),
-                                int(num_sta_elev_line + 1 + (num_stat_elev / 5)),
-                            ]  # 5 station/elev sets per each row
-                        else:
-                            len_stat_elev_ls = [
-                                int(num_sta_elev_line + 1),
-                                int(num_sta_elev_line + 1 + 1 + int(num_stat_elev / 5)),
-                            ]
-
-                j += 1
-
-            # Finding the min elevation from the target XS's station/elevation list
-            stat_elev_ls = lines_geo[len_stat_elev_ls[0] : len_stat_elev_ls[1]]
-
-            flt_stat_elev_ls = []
-            for sel in range(len(stat_elev_ls)):
-                sel_line = [float(sell) for sell in re.findall('.{1,8}', stat_elev_ls[sel])]
-                flt_stat_elev_ls.append(sel_line)
-
-            flt_stat_elev_nan_df = pd.DataFrame(flt_stat_elev_ls)
-            num_stat_elev_nan = int(len(flt_stat_elev_nan_df) * 5)
-            flt_stat_elev_ls_rsh = np.reshape(flt_stat_elev_nan_df, [num_stat_elev_nan, 2])
-            flt_stat_elev_df = pd.DataFrame(flt_stat_elev_ls_rsh, columns=['sta', 'elev']).dropna()
-
-            min_elev_target_xs = min(flt_stat_elev_df['elev'])
+    arr_model_rows = np.arange(int_num_models)
+    arr_nm_ind_clip = np.minimum(arr_nm_ind, int_number_of_steps - 1)
+    arr_nm_wse_1st = arr_pred_wse[arr_model_rows, arr_nm_ind_clip]
+    arr_delta_indx = np.maximum(int_number_of_steps - arr_nm_ind, 1)
+    arr_delta_wse = (arr_pred_wse[:, -1] - arr_nm_wse_1st) / arr_delta_indx
 
-            # -------------------------------------------------
-            # WSE boundary condition (bc) dataframe plus min elevation point
-            min_elev_flow_df = pd.DataFrame([0.01, min_elev_target_xs]).T
-            min_elev_flow_df.columns = ['discharge', 'wse']
+    arr_di = np.arange(int_number_of_steps)[np.newaxis, :] - arr_nm_ind[:, np.newaxis]
+    arr_gen_mont_wse = arr_nm_wse_1st[:, np.newaxis] + arr_di * arr_delta_wse[:, np.newaxis]
 
-            bc_observ_flow_wse_df = pd.concat([min_elev_flow_df, bc_sort_df], ignore_index=True)
+    return np.where(arr_di < 0, arr_pred_wse, arr_gen_mont_wse)
 
-            # -------------------------------------------------
-            # Computing WSE BC rating curve
-            stage = bc_observ_flow_wse_df['wse']
-            discharge = bc_observ_flow_wse_df['discharge']
-
-            # curve_fit
-            z = np.polyfit(discharge[:4], stage[:4], 2)
-            poly_func = np.poly1d(z)
-            # prediction and r-squared
-            # pred1 = poly_func(discharge[:4])
-            # r2_1 = round(r2_score(stage[:4], pred1), 3)
-
-            knot_ind = 1
-            # curve_fit
-            z2 = np.polyfit(discharge[knot_ind:], stage[knot_ind:], 2)
-            poly_func2 = np.poly1d(z2)
-            # prediction and r-squared
-            # pred2 = poly_func2(discharge[knot_ind:])
-            # r2_2 = round(r2_score(stage[knot_ind:], pred2), 3)
 
-            # -------------------------------------------------
-            # Generating BC for the first pass flow
-            flows1st_target_xs = first_pass_flows_xs_wse_df[target_xs]
-
-            # Finding the knot point for the target xs and predicting WSE
-            knot_point = discharge[knot_ind]
-            pred_wse_flows1st_target_xs = []
-            for flows_1st in flows1st_target_xs:
-                if flows_1st <= knot_point:
-                    pred_wse_flow1st = poly_func(flows_1st)
-                else:
-                    pred_wse_flow1st = poly_func2(flows_1st)
-                pred_wse_flows1st_target_xs.append(pred_wse_flow1st)
+# -------------------------------------------------
+# Compute BC (75 flows/WSE) for the parent RAS models with WSE BC
+def compute_boundray_condition_wse(
+    int_fn_starting_flow, int_number_of_steps, ls_path_to_flow_file_wse, ls_path_to_geo_file_wse
+):
+    # The flow and geometry files are read one model at a time, then the rating curves of all
+    # models are fitted at once (see fit_wse_boundary_conditions).
+    # Returns a list in the same order as ls_path_to_flow_file_wse. A model whose BCs could not
+    # be computed is logged and gets None.
+    list_bc_target_xs_huc8 = [None] * len(ls_path_to_flow_file_wse)
+
+    list_model_idxs = []
+    list_flows1st_target_xs = []
+    list_discharge = []
+    list_stage = []
+    for path_in in range(len(ls_path_to_flow_file_wse)):
+        try:
+            RLOG.trace(f"Computing WSE boundary conditions for {ls_path_to_flow_file_wse[path_in]}")
+            # Get max flow for each xs in which flow changes in a dataframe format
+            max_flow_df_wse = hff.fn_get_flow_dataframe(ls_path_to_flow_file_wse[path_in])
 
             # -------------------------------------------------
-            # Generating a monotonic wse for the first pass flow
-            nm_in1 = []
-            for wsei in range(len(pred_wse_flows1st_target_xs) - 1):
-                if pred_wse_flows1st_target_xs[wsei + 1] < pred_wse_flows1st_target_xs[wsei]:
-                    nm_in1.append(wsei)
-                    break
-
-            if len(nm_in1) > 0:
-                pred_wse_nm = pred_wse_flows1st_target_xs[nm_in1[0]]
-                nm_in = [nm_in1[0]]
-                nm = 0
-                for wsei2 in range(len(pred_wse_flows1st_target_xs) - nm_in1[0]):
-                    if pred_wse_flows1st_target_xs[nm + nm_in1[0]] < pred_wse_nm:
-                        nm_in.append(nm + nm_in1[0])
-                    nm += 1
-
-                nm_wse_1st = pred_wse_flows1st_target_xs[nm_in1[0]]
-                wse_last = pred_wse_flows1st_target_xs[-1]
-
-                delta_wse = (wse_last - nm_wse_1st) / (int_number_of_steps - nm_in1[0])
-                delta_indx = int_number_of_steps - nm_in1[0]
-
-                gen_mont_wse = [nm_wse_1st + (di) * delta_wse for di in range(delta_indx)]
-                mont_wse = pred_wse_flows1st_target_xs[: nm_in1[0]]
-
-                pred_wse_mont = pd.concat(
-                    [pd.DataFrame(mont_wse), pd.DataFrame(gen_mont_wse)], ignore_index=True
-                )
+            # Create firstpass flows for the last xs in which flow changes (target xs)
+            int_fn_max_flow = int(max_flow_df_wse['max_flow'].iloc[-1])
+            list_first_pass_flows = fn_create_firstpass_flowlist(
+                int_fn_starting_flow, int_fn_max_flow, int_number_of_steps
+            )
 
-                bc_target_xs_col = pd.concat([flows1st_target_xs, pred_wse_mont], axis=1)
-            else:
-                bc_target_xs_col = pd.concat(
-                    [flows1st_target_xs, pd.DataFrame(pred_wse_flows1st_target_xs)], axis=1
-                )
+            discharge, stage = get_wse_bc_observations(
+                ls_path_to_flow_file_wse[path_in], ls_path_to_geo_file_wse[path_in]
+            )
+        except Exception:
+            RLOG.error(f"Computing WSE boundary conditions failed for {ls_path_to_flow_file_wse[path_in]}")
+            RLOG.error(traceback.format_exc())
+            continue
 
-            bc_target_xs = bc_target_xs_col.set_axis(['discharge', 'wse'], axis=1)
+        list_model_idxs.append(path_in)
+        list_flows1st_target_xs.append(list_first_pass_flows)
+        list_discharge.append(discharge)
+        list_stage.append(stage)
 
-            list_bc_target_xs_huc8.append(bc_target_xs)
-    except Exception:
-        RLOG.error(traceback.format_exc())
+    if len(list_model_idxs) == 0:
+        return list_bc_target_xs_huc8
+
+    arr_bc_wse = fit_wse_boundary_conditions(list_discharge, list_stage, np.array(list_flows1st_target_xs))
+
+    for fit_idx, path_in in enumerate(list_model_idxs):
+        if bool(np.isfinite(arr_bc_wse[fit_idx]).all()) is False:
+            RLOG.error(
+                "The WSE boundary condition rating curve could not be fitted for"
+                f" {ls_path_to_flow_file_wse[path_in]} (its observed flows or WSEs are not valid)"
+            )
+            continue
+
+        list_bc_target_xs_huc8[path_in] = pd.DataFrame(
+            {"discharge": list_flows1st_target_xs[fit_idx], "wse": arr_bc_wse[fit_idx]}
+        )
 
     # TODO optimize k-not point
 
@@ -500,7 +425,7 @@ def compute_boundray_condition_nd(int_fn_starting_flow, int_number_of_steps, ls_
     for path_in in range(len(ls_path_to_flow_file_nd)):
         # Get max flow for each xs in which flow changes in a dataframe format
         # path_in = 1
-        max_flow_df_nd = fn_get_flow_dataframe(ls_path_to_flow_file_nd[path_in])
+        max_flow_df_nd = hff.fn_get_flow_dataframe(ls_path_to_flow_file_nd[path_in])
 
         # Number of XSs where flow changes for each ras model with normal depth BC
         list_num_of_flow_change_xs_nd.append(len(max_flow_df_nd['start_xs']))
@@ -522,15 +447,9 @@ def compute_boundray_condition_nd(int_fn_starting_flow, int_number_of_steps, ls_
         list_first_pass_flows_xs_nd.append(first_pass_flows_xs_nd)
 
         # read the slope from parent ras model
-        with open(ls_path_to_flow_file_nd[path_in], 'r') as file_flow2:
-            lines_flow2 = file_flow2.readlines()
-
-            for flines2 in lines_flow2:
-                if flines2[:8] == "Dn Slope":
-                    list_str_slope_bc_nd.append(flines2[9:])
-                    break
-
-            file_flow2.close()
+        list_dn_slope = hff.fn_parse_flow_file(ls_path_to_flow_file_nd[path_in])["dn_slope"]
+        if len(list_dn_slope) > 0:
+            list_str_slope_bc_nd.append(list_dn_slope[0])
 
     return list_first_pass_flows_xs_nd, list_str_slope_bc_nd
 
@@ -620,26 +539,14 @@ def create_ras_flow_file_nd(
                 break
 
         # Get max flow for each xs in which flow changes in a dataframe format
-        max_flow_df_nd = fn_get_flow_dataframe(ls_path_to_flow_file_nd[path_in])
+        max_flow_df_nd = hff.fn_get_flow_dataframe(ls_path_to_flow_file_nd[path_in])
 
         # Number of XSs where flow changes for each ras model with normal depth BC
         int_num_of_flow_change_xs_nd = len(max_flow_df_nd['start_xs'])
 
-        # All text up to the first cross section - Header of the Flow File
-        with open(ls_path_to_flow_file_nd[path_in]) as flow_file2:  # str_read_geom_file_path
-            flowfile_contents2 = flow_file2.read()
-
-        # Get River, reach and Upstream XS for flow file
-        pattern_river = re.compile(r"River Rch & RM=.*")
-        matches_river = pattern_river.finditer(flowfile_contents2)
-
-        for match in matches_river:
-            str_river_reach = flowfile_contents2[match.start() : match.end()]
-            # split the data on the comma
-            list_river_reach_s = str_river_reach.split(",")
-            # Get from array - use strip to remove whitespace
-            str_river = list_river_reach_s[0].strip()
-            str_reach = list_river_reach_s[1].strip()
+        # Get River and reach (of the last cross section where the flow changes) for flow file
+        str_river = "River Rch & RM=" + max_flow_df_nd['river'].iloc[-1]
+        str_reach = max_flow_df_nd['reach'].iloc[-1]
 
         # -------------------------------------------------
         # Write the flow file for normal depth BC
@@ -738,6 +645,12 @@ def create_ras_flow_file_wse(
     path_to_parent_ras = pathlib.PurePath(path_conflated_models[0]).parents[1]
 
     for path_in in range(len(ls_path_to_flow_file_wse)):
+        bc_target_xs = list_bc_target_xs_huc8[path_in]
+        if bc_target_xs is None:
+            # its BCs could not be computed (see compute_boundray_condition_wse), so it is not run
+            RLOG.warning(f"No HEC-RAS model is created for {ls_path_to_flow_file_wse[path_in]}")
+            continue
+
         path_to_flow_file_wse_splt = ls_path_to_flow_file_wse[path_in].split("\\")
 
         model_ids = str(
@@ -776,7 +689,7 @@ def create_ras_flow_file_wse(
         # Water surface elevation BC
 
         # Get max flow for each xs in which flow changes in a dataframe format
-        max_flow_df_wse = fn_get_flow_dataframe(ls_path_to_flow_file_wse[path_in])
+        max_flow_df_wse = hff.fn_get_flow_dataframe(ls_path_to_flow_file_wse[path_in])
 
         first_pass_flows_xs_wse = []
         for num_xs in range(len(max_flow_df_wse)):
@@ -789,21 +702,9 @@ def create_ras_flow_file_wse(
         # -------------------------------------------------
         # Writing the HEC-RAS Flow file for WSE BC
 
-        # All text up to the first cross section - Header of the Flow File
-        with open(ls_path_to_flow_file_wse[path_in]) as flow_file:  # str_read_geom_file_path
-            flowfile_contents = flow_file.read()
-
-        # Get River, reach and Upstream XS for flow file
-        pattern_river = re.compile(r"River Rch & RM=.*")
-        matches_river = pattern_river.finditer(flowfile_contents)
-
-        for match in matches_river:
-            str_river_reach = flowfile_contents[match.start() : match.end()]
-            # split the data on the comma
-            list_river_reach_s = str_river_reach.split(",")
-            # Get from array - use strip to remove whitespace
-            str_river = list_river_reach_s[0].strip()
-            str_reach = list_river_reach_s[1].strip()
+        # Get River and reach (of the last cross section where the flow changes) for flow file
+        str_river = "River Rch & RM=" + max_flow_df_wse['river'].iloc[-1]
+        str_reach = max_flow_df_wse['reach'].iloc[-1]
 
         # -------------------------------------------------
         # Write the flow file
@@ -829,8 +730,6 @@ def create_ras_flow_file_wse(
 
             str_flowfile += fn_format_flow_values(list_firstflows) + "\n"
 
-        bc_target_xs = list_bc_target_xs_huc8[path_in]
-
         for m in range(int_number_of_steps):
             str_flowfile += "Boundary for River Rch & Prof#="
 
@@ -1190,9 +1089,6 @@ def create_hecras_files(huc8_num, int_fn_starting_flow, int_number_of_steps, uni
     # create_ras_mapper_xml(huc8_num, int_number_of_steps, unit_output_folder, model_unit)
 
 
-# -------------------------------------------------
-# Runs HEC-RAS
-# For One RAS Model ~ 3 min
 # -------------------------------------------------
 def fn_run_hecras(str_ras_projectpath, int_number_of_steps):
     try:
@@ -1214,86 +1110,25 @@ def fn_run_hecras(str_ras_projectpath, int_number_of_steps):
         # computations of the current plan
         v1, NMsg, TabMsg, v2 = hec.Compute_CurrentPlan(NMsg, TabMsg, block)
 
-        # ID numbers of the river and the reach
-        RivID, RchID = 1, 1
-
-        # to be populated: number of nodes, list of RS and node types
-        NNod, TabRS, TabNTyp = None, None, None
-
-        # reading project nodes: cross-sections, bridges, culverts, etc.
-        v1, v2, NNod, TabRS, TabNTyp = hec.Geometry_GetNodes(RivID, RchID, NNod, TabRS, TabNTyp)
-
-        # HEC-RAS ID of output variables: Max channel depth, channel reach length,
-        # and water surface elevation
-        int_max_depth_id, int_node_chan_length, int_water_surface_elev, int_q_total = (4, 42, 2, 9)
+        all_x_sections_info = None
+        if os.getenv("READ_HECRAS_RESULTS_FROM_HDF") == "True":
+            # The plan hdf is named after the project file with the current plan (p01)
+            str_path_plan_hdf = os.path.splitext(str_ras_projectpath)[0] + ".p01.hdf"
+            try:
+                all_x_sections_info = hpr.fn_get_all_x_sections_info(
+                    str_path_plan_hdf, str_model_id, int_number_of_steps
+                )
+            except Exception:
+                MP_LOG.warning(
+                    f"Unable to read the results from {str_path_plan_hdf}."
+                    " They will be read through the HEC-RAS controller instead."
+                )
+                MP_LOG.warning(traceback.format_exc())
 
-        # -------------------------------------------------
-        # Saving information for all profiles of each confalated
-        # ras model: water depths, WSE and flows for each XS
-        # -------------------------------------------------
-        # make a list of unique ids using feature id and cross section name
-        all_x_sections_info = pd.DataFrame()
-
-        xsections_fids_xs = [str_model_id + "_" + value.strip() for value in TabRS]
-        xsections_fids = [str_model_id for value in TabRS]
-        xsections_xs = [value.strip() for value in TabRS]
-
-        for int_prof in range(int_number_of_steps):
-            this_profile_x_section_info = pd.DataFrame()
-            this_profile_x_section_info["fid_xs"] = np.array(xsections_fids_xs)
-            this_profile_x_section_info["modelid"] = np.array(xsections_fids)
-            this_profile_x_section_info["Xsection_name"] = np.array(xsections_xs)
-
-            # get a count of the cross sections in the HEC-RAS model
-            int_xs_node_count = 0
-            for i in range(0, NNod):
-                if TabNTyp[i] == "":
-                    int_xs_node_count += 1
-
-            # initalize six numpy arrays
-            arr_max_depth = np.empty([int_xs_node_count], dtype=float)
-            arr_channel_length = np.empty([int_xs_node_count], dtype=float)
-            arr_water_surface_elev = np.empty([int_xs_node_count], dtype=float)
-            arr_q_total = np.empty([int_xs_node_count], dtype=float)
-
-            int_count_nodes = 0
-
-            for i in range(0, NNod):
-                if TabNTyp[i] == "":  # this is a XS (not a bridge, culvert, inline, etc...)
-                    # reading max depth in cross section
-                    (arr_max_depth[int_count_nodes], v1, v2, v3, v4, v5, v6) = hec.Output_NodeOutput(
-                        RivID, RchID, i + 1, 0, int_prof + 1, int_max_depth_id
-                    )
-
-                    # reading water surface elevation in cross section
-                    (arr_water_surface_elev[int_count_nodes], v1, v2, v3, v4, v5, v6) = hec.Output_NodeOutput(
-                        RivID, RchID, i + 1, 0, int_prof + 1, int_water_surface_elev
-                    )
-
-                    # reading the distance between cross sections (center of channel)
-                    (arr_channel_length[int_count_nodes], v1, v2, v3, v4, v5, v6) = hec.Output_NodeOutput(
-                        RivID, RchID, i + 1, 0, int_prof + 1, int_node_chan_length
-                    )
-
-                    # reading the Q total of the cross section
-                    (arr_q_total[int_count_nodes], v1, v2, v3, v4, v5, v6) = hec.Output_NodeOutput(
-                        RivID, RchID, i + 1, 0, int_prof + 1, int_q_total
-                    )
-
-                    int_count_nodes += 1
-
-            # add wse and q_total for xsections
-            this_profile_x_section_info["wse"] = arr_water_surface_elev
-            this_profile_x_section_info["discharge"] = arr_q_total
-            this_profile_x_section_info["max_depth"] = arr_max_depth
-            this_profile_x_section_info["channel_length"] = arr_channel_length
-
-            all_x_sections_info = pd.concat([all_x_sections_info, this_profile_x_section_info])
-
-            # Revise the last channel length to zero
-            arr_channel_length[len(arr_channel_length) - 1] = 0
-
-        all_x_sections_info["channel_length"][all_x_sections_info["channel_length"] > 1e20] = 0
+        if all_x_sections_info is None:
+            all_x_sections_info = hpr.fn_get_all_x_sections_info_from_hecras(
+                hec, str_model_id, int_number_of_steps
+            )
 
         hec.QuitRas()  # close HEC-RAS
 
@@ -1326,344 +1161,258 @@ def fn_run_hecras(str_ras_projectpath, int_number_of_steps):
 
 
 # -------------------------------------------------
-# Create all datasets required to create 2nd-pass
-# flow and rasmaps HEC-RAS files
+# Create the datasets required to create the 2nd-pass
+# flow and rasmap HEC-RAS files of a model
 # -------------------------------------------------
-def create_datasets_2ndpass(unit_output_folder, flt_interval):
-    path_to_1st_pass_output = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT)
-
-    folder_1stpass_models = os.listdir(path_to_1st_pass_output)
-
-    ls_number_of_steps_2ndpass = [0] * len(folder_1stpass_models)
-    ls_ls_second_pass_flows_xs = [0] * len(folder_1stpass_models)
-    ls_second_pass_flows_xs_df = [0] * len(folder_1stpass_models)
-    nsindx = 0
-    for folder in folder_1stpass_models:
-        RLOG.lprint("Computing number of the steps and flow profiles for " + folder + " model")
-        path_all_x_sections_info = os.path.join(
-            path_to_1st_pass_output, folder, "all_x_sections_info_" + folder + ".csv"
-        )
-        all_x_sections_info = pd.read_csv(path_all_x_sections_info)
-
-        # Number of the cross sections on the river
-        num_xs_creek = len(all_x_sections_info[all_x_sections_info.columns[0]].drop_duplicates(keep='first'))
+def create_datasets_2ndpass(all_x_sections_info, flt_interval):
+    # all_x_sections_info: the model's first pass results, as read from its all_x_sections_info file
+    # Returns the number of 2nd-pass profiles, the 2nd-pass flows of each XS where flow changes
+    # and the same flows as a dataframe (one column per XS)
 
-        # Index of peak flows (75th flow)
-        ind_xs_ds = len(all_x_sections_info)
-        ind_xs_us = len(all_x_sections_info) - num_xs_creek
+    # Number of the cross sections on the river
+    num_xs_creek = len(all_x_sections_info[all_x_sections_info.columns[0]].drop_duplicates(keep='first'))
 
-        # Peak depth in all cross sections
-        peak_depths_all_xss_info = all_x_sections_info.iloc[ind_xs_us:ind_xs_ds]
-        peak_flows_all_xss = all_x_sections_info["discharge"][ind_xs_us:ind_xs_ds]
-        all_xss = all_x_sections_info["Xsection_name"][ind_xs_us:ind_xs_ds]
-
-        # -------------------------------------------------
-        # Create a list of the simulated first pass flows at XS that has max depth
-        max_depth = max(peak_depths_all_xss_info["max_depth"])
-        cond_mdf = peak_depths_all_xss_info["max_depth"] == max_depth
+    # Index of peak flows (75th flow)
+    ind_xs_ds = len(all_x_sections_info)
+    ind_xs_us = len(all_x_sections_info) - num_xs_creek
 
-        # Cross sections that have the max depth # flow
-        target_xs = peak_depths_all_xss_info[cond_mdf]["Xsection_name"].iloc[0]
+    # Peak depth in all cross sections
+    peak_depths_all_xss_info = all_x_sections_info.iloc[ind_xs_us:ind_xs_ds]
+    peak_flows_all_xss = all_x_sections_info["discharge"][ind_xs_us:ind_xs_ds]
+    all_xss = all_x_sections_info["Xsection_name"][ind_xs_us:ind_xs_ds]
 
-        # Depth and WSE at XS with the max depth
-        cond_md_ar = all_x_sections_info["Xsection_name"] == target_xs
-        list_flow_steps = all_x_sections_info[cond_md_ar]["discharge"]
-        list_depth_steps = all_x_sections_info[cond_md_ar]["max_depth"]
+    # -------------------------------------------------
+    # Create a list of the simulated first pass flows at XS that has max depth
+    max_depth = max(peak_depths_all_xss_info["max_depth"])
+    cond_mdf = peak_depths_all_xss_info["max_depth"] == max_depth
 
-        all_x_sections_info = None
+    # Cross sections that have the max depth # flow
+    target_xs = peak_depths_all_xss_info[cond_mdf]["Xsection_name"].iloc[0]
 
-        # Peak flow in all cross sections in which flow changes
-        ls_peak_flows = peak_flows_all_xss.drop_duplicates(keep='first')
-        ind_targ_xs = ls_peak_flows.index
-        target_XSs_name = all_xss[ind_targ_xs]
+    # Depth and WSE at XS with the max depth
+    cond_md_ar = all_x_sections_info["Xsection_name"] == target_xs
+    list_flow_steps = all_x_sections_info[cond_md_ar]["discharge"]
+    list_depth_steps = all_x_sections_info[cond_md_ar]["max_depth"]
 
-        df_peak_flows_xs = pd.concat([ls_peak_flows, target_XSs_name], axis=1)
-        df_peak_flows_xs.index = range(len(df_peak_flows_xs))
+    # Peak flow in all cross sections in which flow changes
+    ls_peak_flows = peak_flows_all_xss.drop_duplicates(keep='first')
+    ind_targ_xs = ls_peak_flows.index
+    target_XSs_name = all_xss[ind_targ_xs]
 
-        ls_peak_flows = None
+    df_peak_flows_xs = pd.concat([ls_peak_flows, target_XSs_name], axis=1)
+    df_peak_flows_xs.index = range(len(df_peak_flows_xs))
 
-        # -------------------------------------------------
-        # Use linear interpolator (f1) to find flows coresponding to half
-        # a foot WSE intervals at Xss with the max flow (target reach)
-        f1 = interp1d(list_depth_steps, list_flow_steps)
+    ls_peak_flows = None
 
-        # Get the max value of the Averge Depth List
-        int_max_depth = int(max(list_depth_steps) // flt_interval)
-        # Get the min value of Average Depth List
-        int_min_depth = int((min(list_depth_steps) // flt_interval) + 1)
+    # -------------------------------------------------
+    # Use linear interpolator (f1) to find flows coresponding to half
+    # a foot WSE intervals at Xss with the max flow (target reach)
+    f1 = interp1d(list_depth_steps, list_flow_steps)
 
-        # -------------------------------------------------
-        # Compute interpolated flow valuse at 0.5 foot interval depth
-        list_step_profiles = []
-        # Create a list of the profiles at desired increments
-        for i in range(int_max_depth - int_min_depth + 1):
-            int_depth_interval = (i + int_min_depth) * flt_interval
+    # Get the max value of the Averge Depth List
+    int_max_depth = int(max(list_depth_steps) // flt_interval)
+    # Get the min value of Average Depth List
+    int_min_depth = int((min(list_depth_steps) // flt_interval) + 1)
 
-            # round this to nearest 1/100th
-            int_depth_interval = round(int_depth_interval, 2)
+    # -------------------------------------------------
+    # Compute interpolated flow valuse at 0.5 foot interval depth
+    list_step_profiles = []
+    # Create a list of the profiles at desired increments
+    for i in range(int_max_depth - int_min_depth + 1):
+        int_depth_interval = (i + int_min_depth) * flt_interval
 
-            list_step_profiles.append(int_depth_interval)
+        # round this to nearest 1/100th
+        int_depth_interval = round(int_depth_interval, 2)
 
-        # get interpolated flow values of interval depths
-        arr_step_flows = f1(list_step_profiles)
-        list_step_flows = arr_step_flows.tolist()
+        list_step_profiles.append(int_depth_interval)
 
-        # convert list of interpolated float values to integer list
-        list_int_step_flows = [round(x1, 3) for x1 in list_step_flows]
+    # get interpolated flow values of interval depths
+    arr_step_flows = f1(list_step_profiles)
+    list_step_flows = arr_step_flows.tolist()
 
-        # -------------------------------------------------
-        # Generate 2nd-pass flow profiles for all XSs in which
-        # flow changes based on new number_of_steps_2ndpass
-        # -------------------------------------------------
-        int_number_of_steps_2ndpass = len(list_int_step_flows)
+    # convert list of interpolated float values to integer list
+    list_int_step_flows = [round(x1, 3) for x1 in list_step_flows]
 
-        # -------------------------------------------------
-        # Create second-pass flow dataframe for each xs where flow changes
-        # 2nd pass flow ratio
-        second_pass_ratio = [float(flows) / max(list_int_step_flows) for flows in list_int_step_flows]
+    # -------------------------------------------------
+    # Generate 2nd-pass flow profiles for all XSs in which
+    # flow changes based on new number_of_steps_2ndpass
+    # -------------------------------------------------
+    int_number_of_steps_2ndpass = len(list_int_step_flows)
 
-        ls_second_pass_flows_xs = []
-        for num_q in range(len(df_peak_flows_xs)):
-            int_max_flow2 = df_peak_flows_xs["discharge"][num_q]
-            list_2nd_pass_flows2 = [int_max_flow2 * ratio for ratio in second_pass_ratio]
-            ls_second_pass_flows_xs.append(list_2nd_pass_flows2)
+    # -------------------------------------------------
+    # Create second-pass flow dataframe for each xs where flow changes
+    # 2nd pass flow ratio
+    second_pass_ratio = [float(flows) / max(list_int_step_flows) for flows in list_int_step_flows]
 
-        ls_ls_second_pass_flows_xs[nsindx] = ls_second_pass_flows_xs
-        ls_number_of_steps_2ndpass[nsindx] = int_number_of_steps_2ndpass
+    ls_second_pass_flows_xs = []
+    for num_q in range(len(df_peak_flows_xs)):
+        int_max_flow2 = df_peak_flows_xs["discharge"][num_q]
+        list_2nd_pass_flows2 = [int_max_flow2 * ratio for ratio in second_pass_ratio]
+        ls_second_pass_flows_xs.append(list_2nd_pass_flows2)
 
-        second_pass_flows_xs_df = pd.DataFrame(ls_second_pass_flows_xs).T
-        second_pass_flows_xs_df.columns = [int(k1) for k1 in df_peak_flows_xs["Xsection_name"]]
-        ls_second_pass_flows_xs_df[nsindx] = second_pass_flows_xs_df
+    second_pass_flows_xs_df = pd.DataFrame(ls_second_pass_flows_xs).T
+    second_pass_flows_xs_df.columns = [int(k1) for k1 in df_peak_flows_xs["Xsection_name"]]
 
-        nsindx += 1
+    return int_number_of_steps_2ndpass, ls_second_pass_flows_xs, second_pass_flows_xs_df
 
-    return ls_number_of_steps_2ndpass, ls_ls_second_pass_flows_xs, ls_second_pass_flows_xs_df
 
+# -------------------------------------------------
+# Compute the 2nd-pass boundary condition of a model
+# -------------------------------------------------
+def compute_boundray_condition_2ndpass(all_x_sections_info, second_pass_flows_xs_df, flow_file_1st):
+    # flow_file_1st: the parsed 1st-pass flow file (see hecras_flow_file.fn_parse_flow_file)
+    # Returns the normal depth slope (None if the BC is not normal depth) and the 2nd-pass
+    # WSE at the last XS (None if the BC is not a known WSE)
 
-def compute_boundray_condition_2ndpass(unit_output_folder, ls_second_pass_flows_xs_df):
-    path_to_1st_pass_output = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT)
-    folder_1stpass_models = os.listdir(path_to_1st_pass_output)
+    slope_bc_nd = None
+    wse_2nd_last_xs = None
 
-    ls_slope_bc_nd = []
-    ls_wse_2nd_last_xs = []
-    for fldr in range(len(folder_1stpass_models)):
-        folder = folder_1stpass_models[fldr]
-        RLOG.lprint("Computing Boundray Conditions for " + folder + " model")
+    # -------------------------------------------------
+    # Read boundary condition from 1st pass flow file
+    # and generate BC for the 2nd pass flow
+    # -------------------------------------------------
+    second_pass_flows_xs_df = pd.DataFrame(
+        np.sort(second_pass_flows_xs_df.values, axis=0),
+        index=second_pass_flows_xs_df.index,
+        columns=second_pass_flows_xs_df.columns,
+    )
 
-        path_all_x_sections_info = os.path.join(
-            path_to_1st_pass_output, folder, "all_x_sections_info_" + folder + ".csv"
-        )
-        all_x_sections_info = pd.read_csv(path_all_x_sections_info)
+    # When BC is WSE
+    if len(flow_file_1st["dn_known_ws"]) > 0:
+        # First Xs where flow changes on the last reach
+        last_xs = second_pass_flows_xs_df.columns[-1]
+        # 2nd pass flow profile at that Xs where flow changes
+        last_xs_flow_prof = second_pass_flows_xs_df[last_xs]
+        ls_last_xs_flow_prof = [fps for fps in last_xs_flow_prof]
 
         # -------------------------------------------------
-        # Read boundary condition from 1st pass flow file
-        # and generate BC for the 2nd pass flow
+        # Use a linear interpolater to estimate WSE BC for the 2nd pass flow
         # -------------------------------------------------
-        second_pass_flows_xs_df0 = ls_second_pass_flows_xs_df[fldr]
-        second_pass_flows_xs_df = pd.DataFrame(
-            np.sort(second_pass_flows_xs_df0.values, axis=0),
-            index=second_pass_flows_xs_df0.index,
-            columns=second_pass_flows_xs_df0.columns,
-        )
-
-        path_1stpass_flow_file = os.path.join(path_to_1st_pass_output, folder, folder[6:] + ".f01")
-
-        with open(path_1stpass_flow_file, 'r') as file_flow_1st:
-            lines_flow_1st = file_flow_1st.readlines()
-
-            for line_1st in lines_flow_1st:
-                # When BC is WSE
-                if line_1st[:11] == "Dn Known WS":
-                    # First Xs where flow changes on the last reach
-                    last_xs = second_pass_flows_xs_df.columns[-1]
-                    # 2nd pass flow profile at that Xs where flow changes
-                    last_xs_flow_prof = second_pass_flows_xs_df[last_xs]
-                    ls_last_xs_flow_prof = [fps for fps in last_xs_flow_prof]
-
-                    # -------------------------------------------------
-                    # Use a linear interpolater to estimate WSE BC for the 2nd pass flow
-                    # -------------------------------------------------
-                    # First pass flow and wse steps for the first Xs
-                    # where flow changes on the last reach
-                    cond_flxs = all_x_sections_info["Xsection_name"] == last_xs
-
-                    flow_steps_1st_lastxs = all_x_sections_info[cond_flxs]["discharge"]
-                    ls_flow_steps_1st_lastxs = [fs1ls for fs1ls in flow_steps_1st_lastxs]
-
-                    wse_steps_1st_lastxs = all_x_sections_info[cond_flxs]["wse"]
-                    ls_wse_steps_1st_lastxs = [ws1ls for ws1ls in wse_steps_1st_lastxs]
+        # First pass flow and wse steps for the first Xs
+        # where flow changes on the last reach
+        cond_flxs = all_x_sections_info["Xsection_name"] == last_xs
 
-                    # -------------------------------------------------
-                    # Use a linear interpolator to estimate the WSE as a BC at the last reach
-                    # This is based on first pass flow hecras run
-                    f21 = interp1d(ls_flow_steps_1st_lastxs, ls_wse_steps_1st_lastxs)
+        flow_steps_1st_lastxs = all_x_sections_info[cond_flxs]["discharge"]
+        ls_flow_steps_1st_lastxs = [fs1ls for fs1ls in flow_steps_1st_lastxs]
 
-                    wse_2nd_last_xs = pd.DataFrame(f21(ls_last_xs_flow_prof), columns=['wse'])
+        wse_steps_1st_lastxs = all_x_sections_info[cond_flxs]["wse"]
+        ls_wse_steps_1st_lastxs = [ws1ls for ws1ls in wse_steps_1st_lastxs]
 
-                    ls_wse_2nd_last_xs.append(wse_2nd_last_xs)
-                    # delta_wse_last_xs = wse_2nd_last_xs.diff()
-                    break
-
-            file_flow_1st.close()
-
-        with open(path_1stpass_flow_file, 'r') as file_flow_1st2:
-            lines_flow_1st2 = file_flow_1st2.readlines()
-
-            for line_1st2 in lines_flow_1st2:
-                # When BC is slope
-                if line_1st2[:8] == "Dn Slope":
-                    slope_bc_nd = line_1st2[9:]
-
-                    ls_slope_bc_nd.append(slope_bc_nd)
+        # -------------------------------------------------
+        # Use a linear interpolator to estimate the WSE as a BC at the last reach
+        # This is based on first pass flow hecras run
+        f21 = interp1d(ls_flow_steps_1st_lastxs, ls_wse_steps_1st_lastxs)
 
-                    break
+        wse_2nd_last_xs = pd.DataFrame(f21(ls_last_xs_flow_prof), columns=['wse'])
+        # delta_wse_last_xs = wse_2nd_last_xs.diff()
 
-            file_flow_1st2.close()
+    # When BC is slope
+    if len(flow_file_1st["dn_slope"]) > 0:
+        slope_bc_nd = flow_file_1st["dn_slope"][0]
 
-    return ls_slope_bc_nd, ls_wse_2nd_last_xs
+    return slope_bc_nd, wse_2nd_last_xs
 
 
 # -------------------------------------------------
-# Create all second-pass flow files for conflated ras models
+# Create the second-pass flow file of a conflated ras model
 # -------------------------------------------------
-def create_all_2ndpass_flow_files(
-    unit_output_folder,
-    ls_number_of_steps_2ndpass,
-    ls_ls_second_pass_flows_xs,
-    ls_slope_bc_nd,
-    ls_wse_2nd_last_xs,
+def create_2ndpass_flow_file(
+    path_flow_file,
+    all_x_sections_info,
+    int_number_of_steps_2ndpass,
+    ls_second_pass_flows_xs,
+    flow_file_1st,
+    slope_bc_nd,
+    wse_2nd_last_xs,
 ):
-    RLOG.trace("Start create_all_2ndpass_flow_files")
+    # Replaces the 1st-pass flow file (path_flow_file, parsed as flow_file_1st)
 
-    path_to_1st_pass_output = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT)
-
-    folder_1stpass_models = os.listdir(path_to_1st_pass_output)
-    counter1 = 0
-    counter2 = 0
-    counter3 = 0
-    for folder in folder_1stpass_models:
-        # Create a dataframe of peak flows in all XSs where flow changes
-        path_all_x_sections_info = os.path.join(
-            path_to_1st_pass_output, folder, "all_x_sections_info_" + folder + ".csv"
-        )
-        RLOG.trace(f"all_x_section_info_(folder).csv is {path_all_x_sections_info}")
-        all_x_sections_info = pd.read_csv(path_all_x_sections_info)
-
-        # Number of the cross sections on the river
-        num_xs_creek = len(all_x_sections_info[all_x_sections_info.columns[0]].drop_duplicates(keep='first'))
+    # Create a dataframe of peak flows in all XSs where flow changes
+    # Number of the cross sections on the river
+    num_xs_creek = len(all_x_sections_info[all_x_sections_info.columns[0]].drop_duplicates(keep='first'))
 
-        # Index of peak flows (75th flow)
-        ind_xs_ds = len(all_x_sections_info)
-        ind_xs_us = len(all_x_sections_info) - num_xs_creek
+    # Index of peak flows (75th flow)
+    ind_xs_ds = len(all_x_sections_info)
+    ind_xs_us = len(all_x_sections_info) - num_xs_creek
 
-        # Peak depth in all cross sections
-        peak_flows_all_xss = all_x_sections_info["discharge"][ind_xs_us:ind_xs_ds]
-        all_xss = all_x_sections_info["Xsection_name"][ind_xs_us:ind_xs_ds]
+    # Peak depth in all cross sections
+    peak_flows_all_xss = all_x_sections_info["discharge"][ind_xs_us:ind_xs_ds]
+    all_xss = all_x_sections_info["Xsection_name"][ind_xs_us:ind_xs_ds]
 
-        ls_peak_flows = peak_flows_all_xss.drop_duplicates(keep='first')
-        ind_targ_xs = ls_peak_flows.index
-        target_XSs_name = all_xss[ind_targ_xs]
-
-        df_peak_flows_xs = pd.concat([ls_peak_flows, target_XSs_name], axis=1)
-        df_peak_flows_xs.index = range(len(df_peak_flows_xs))
-
-        max_flow_df = df_peak_flows_xs["discharge"]
-
-        # Number of XSs where flow changes for each ras model with normal depth BC
-        int_num_of_flow_change_xs = len(max_flow_df)
+    ls_peak_flows = peak_flows_all_xss.drop_duplicates(keep='first')
+    ind_targ_xs = ls_peak_flows.index
+    target_XSs_name = all_xss[ind_targ_xs]
 
-        # read the 1st-pass flow file
-        path_1stpass_flow_file = os.path.join(path_to_1st_pass_output, folder, folder[6:] + ".f01")
+    df_peak_flows_xs = pd.concat([ls_peak_flows, target_XSs_name], axis=1)
+    df_peak_flows_xs.index = range(len(df_peak_flows_xs))
 
-        int_number_of_steps_2ndpass = ls_number_of_steps_2ndpass[counter1]
-        ls_second_pass_flows_xs = ls_ls_second_pass_flows_xs[counter1]
+    max_flow_df = df_peak_flows_xs["discharge"]
 
-        # Profile names for 2nd pass flows
-        list_profiles = range(int_number_of_steps_2ndpass)
-        str_suffix = "_ft"
-        profile_names = fn_create_profile_names(list_profiles, str_suffix)
+    # Number of XSs where flow changes for each ras model with normal depth BC
+    int_num_of_flow_change_xs = len(max_flow_df)
 
-        # All text up to the first cross section - Header of the Flow File
-        with open(path_1stpass_flow_file) as file_flow_1st3:
-            flowfile_contents = file_flow_1st3.read()
+    # Profile names for 2nd pass flows
+    list_profiles = range(int_number_of_steps_2ndpass)
+    str_suffix = "_ft"
+    profile_names = fn_create_profile_names(list_profiles, str_suffix)
 
-        # Get River, reach and Upstream XS for flow file
-        pattern_river = re.compile(r"River Rch & RM=.*")
-        matches_river = pattern_river.finditer(flowfile_contents)
+    # Get River and reach (of the last cross section where the flow changes) for flow file
+    str_river = "River Rch & RM=" + flow_file_1st["df_flows"]['river'].iloc[-1]
+    str_reach = flow_file_1st["df_flows"]['reach'].iloc[-1]
+    is_bc_known_wse = len(flow_file_1st["dn_known_ws"]) > 0
 
-        for match in matches_river:
-            str_river_reach = flowfile_contents[match.start() : match.end()]
-            # split the data on the comma
-            list_river_reach_s = str_river_reach.split(",")
-            # Get from array - use strip to remove whitespace
-            str_river = list_river_reach_s[0].strip()
-            str_reach = list_river_reach_s[1].strip()
-
-        # -------------------------------------------------
-        # Write the flow file for normal depth BC
-        str_flowfile2 = "Flow Title="
-        str_flowfile2 += str_river[15:] + "\n"
-        str_flowfile2 += "Program Version=6.3" + "\n"
-        str_flowfile2 += "BEGIN FILE DESCRIPTION:" + "\n"
-        str_flowfile2 += "Flow File - Created from Base Level Engineering"
-        str_flowfile2 += " data for Flood Inundation Library" + "\n"
-        str_flowfile2 += "END FILE DESCRIPTION:" + "\n"
-        str_flowfile2 += "Number of Profiles= " + str(int_number_of_steps_2ndpass) + "\n"
-        str_flowfile2 += profile_names + "\n"
-
-        for fc2 in range(int_num_of_flow_change_xs):
-            # list of the second pass flows
-            ls_second_pass_flows_xs2 = sorted(ls_second_pass_flows_xs[fc2])
-            ls_second_pass_flows_xs_int = [int(y1) for y1 in ls_second_pass_flows_xs2]
-            ls_second_pass_flows_xs_int = [1 if y2 == 0 else y2 for y2 in ls_second_pass_flows_xs_int]
+    # -------------------------------------------------
+    # Write the flow file for normal depth BC
+    str_flowfile2 = "Flow Title="
+    str_flowfile2 += str_river[15:] + "\n"
+    str_flowfile2 += "Program Version=6.3" + "\n"
+    str_flowfile2 += "BEGIN FILE DESCRIPTION:" + "\n"
+    str_flowfile2 += "Flow File - Created from Base Level Engineering"
+    str_flowfile2 += " data for Flood Inundation Library" + "\n"
+    str_flowfile2 += "END FILE DESCRIPTION:" + "\n"
+    str_flowfile2 += "Number of Profiles= " + str(int_number_of_steps_2ndpass) + "\n"
+    str_flowfile2 += profile_names + "\n"
 
-            list_firstflows2 = ls_second_pass_flows_xs_int
+    for fc2 in range(int_num_of_flow_change_xs):
+        # list of the second pass flows
+        ls_second_pass_flows_xs2 = sorted(ls_second_pass_flows_xs[fc2])
+        ls_second_pass_flows_xs_int = [int(y1) for y1 in ls_second_pass_flows_xs2]
+        ls_second_pass_flows_xs_int = [1 if y2 == 0 else y2 for y2 in ls_second_pass_flows_xs_int]
 
-            str_xs_upstream_nd = str(int(df_peak_flows_xs['Xsection_name'][fc2]))
-            str_flowfile2 += str_river + "," + str_reach + "," + str_xs_upstream_nd + "\n"
+        list_firstflows2 = ls_second_pass_flows_xs_int
 
-            str_flowfile2 += fn_format_flow_values(list_firstflows2) + "\n"
+        str_xs_upstream_nd = str(int(df_peak_flows_xs['Xsection_name'][fc2]))
+        str_flowfile2 += str_river + "," + str_reach + "," + str_xs_upstream_nd + "\n"
 
-        for m2 in range(int_number_of_steps_2ndpass):
-            str_flowfile2 += "Boundary for River Rch & Prof#="
+        str_flowfile2 += fn_format_flow_values(list_firstflows2) + "\n"
 
-            str_flowfile2 += str_river[15:] + "," + str_reach + ", " + str(m2 + 1) + "\n"
+    for m2 in range(int_number_of_steps_2ndpass):
+        str_flowfile2 += "Boundary for River Rch & Prof#="
 
-            str_flowfile2 += "Up Type= 0 " + "\n"
+        str_flowfile2 += str_river[15:] + "," + str_reach + ", " + str(m2 + 1) + "\n"
 
-            if 'Dn Known WS' in flowfile_contents:
-                wse_2nd_last_xs = ls_wse_2nd_last_xs[counter3]
-                str_flowfile2 += "Dn Type= 1 " + "\n"
-                str_known_ws = str(round(wse_2nd_last_xs['wse'][m2], 2))
-                str_flowfile2 += "Dn Known WS=" + str_known_ws + "\n"
-            else:
-                slope_bc_nd = ls_slope_bc_nd[counter2]
-                str_flowfile2 += "Dn Type= 3 " + "\n"
-                str_flowfile2 += "Dn Slope=" + slope_bc_nd
+        str_flowfile2 += "Up Type= 0 " + "\n"
 
-        if 'Dn Known WS' in flowfile_contents:
-            counter3 += 1
+        if is_bc_known_wse:
+            str_flowfile2 += "Dn Type= 1 " + "\n"
+            str_known_ws = str(round(wse_2nd_last_xs['wse'][m2], 2))
+            str_flowfile2 += "Dn Known WS=" + str_known_ws + "\n"
         else:
-            counter2 += 1
-
-        str_flowfile2 += "DSS Import StartDate=" + "\n"
-        str_flowfile2 += "DSS Import StartTime=" + "\n"
-        str_flowfile2 += "DSS Import EndDate=" + "\n"
-        str_flowfile2 += "DSS Import EndTime=" + "\n"
-        str_flowfile2 += "DSS Import GetInterval= 0 " + "\n"
-        str_flowfile2 += "DSS Import Interval=" + "\n"
-        str_flowfile2 += "DSS Import GetPeak= 0 " + "\n"
-        str_flowfile2 += "DSS Import FillOption= 0 " + "\n"
-
-        new_flow_file_path_v2 = os.path.join(path_1stpass_flow_file)
-        with open(new_flow_file_path_v2, "w") as file2:
-            file2.write(str_flowfile2)
-            file2.close()
+            str_flowfile2 += "Dn Type= 3 " + "\n"
+            str_flowfile2 += "Dn Slope=" + slope_bc_nd
 
-            file_flow_1st3.close()
+    str_flowfile2 += "DSS Import StartDate=" + "\n"
+    str_flowfile2 += "DSS Import StartTime=" + "\n"
+    str_flowfile2 += "DSS Import EndDate=" + "\n"
+    str_flowfile2 += "DSS Import EndTime=" + "\n"
+    str_flowfile2 += "DSS Import GetInterval= 0 " + "\n"
+    str_flowfile2 += "DSS Import Interval=" + "\n"
+    str_flowfile2 += "DSS Import GetPeak= 0 " + "\n"
+    str_flowfile2 += "DSS Import FillOption= 0 " + "\n"
 
-        counter1 += 1
-    RLOG.trace("End create_all_2ndpass_flow_files")
+    with open(path_flow_file, "w") as file2:
+        file2.write(str_flowfile2)
+        file2.close()
 
 
 # -------------------------------------------------
@@ -1803,49 +1552,67 @@ def create_2ndpass_rasmap_file(
 
 
 # -------------------------------------------------
-# Create a second-pass rasmap file for all conflated ras models
+# Create the second-pass datasets, flow file and rasmap
+# file of a conflated ras model from its first-pass results
 # -------------------------------------------------
-def create_all_2ndpass_rasmap_files(unit_output_folder, huc8_num, model_unit, ls_number_of_steps_2ndpass):
+def create_2ndpass_files(unit_output_folder, model_folder, huc8_num, model_unit, flt_interval):
+    # Returns the number of 2nd-pass profiles (steps) of the model
+
     path_to_1st_pass_output = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT)
 
-    RLOG.trace("start create_all_2ndpass_rasmap_files")
+    MP_LOG.lprint(f"Creating the second-pass HEC-RAS files for {model_folder} model")
 
-    folder_1stpass_models = os.listdir(path_to_1st_pass_output)
+    path_all_x_sections_info = xsis.fn_get_x_sections_info_path(
+        os.path.join(path_to_1st_pass_output, model_folder), model_folder, 1
+    )
+    MP_LOG.trace(f"all_x_section_info_(folder).parquet is {path_all_x_sections_info}")
+    all_x_sections_info = xsis.fn_read_x_sections_info([path_all_x_sections_info])
 
-    nsindx = 0
-    for folder in folder_1stpass_models:
-        RLOG.trace(f"-- idx = {nsindx} -- folder = {folder}")
-        str_river_id_fn = folder[6:]
-        terrain_names = folder[:5]
+    (int_number_of_steps_2ndpass, ls_second_pass_flows_xs, second_pass_flows_xs_df) = create_datasets_2ndpass(
+        all_x_sections_info, flt_interval
+    )
 
-        str_path_to_terrain = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_TERRAIN)
-        str_path_to_projection = os.path.join(
-            unit_output_folder, sv.R2F_OUTPUT_DIR_SHAPES_FROM_CONF, huc8_num + "_huc_12_ar.prj"
-        )
+    path_1stpass_flow_file = os.path.join(path_to_1st_pass_output, model_folder, model_folder[6:] + ".f01")
+    flow_file_1st = hff.fn_parse_flow_file(path_1stpass_flow_file)
 
-        path_rasmap = os.path.join(path_to_1st_pass_output, folder, folder[6:] + ".rasmap")
+    slope_bc_nd, wse_2nd_last_xs = compute_boundray_condition_2ndpass(
+        all_x_sections_info, second_pass_flows_xs_df, flow_file_1st
+    )
 
-        int_number_of_steps_2ndpass = ls_number_of_steps_2ndpass[nsindx]
-        if int_number_of_steps_2ndpass == 0:
-            RLOG.error(
-                f"create_all_2ndpass_rasmap_files [folder index = {nsindx}] :"
-                " has no int_number_of_steps_2ndpass elements"
-            )
-            continue
+    create_2ndpass_flow_file(
+        path_1stpass_flow_file,
+        all_x_sections_info,
+        int_number_of_steps_2ndpass,
+        ls_second_pass_flows_xs,
+        flow_file_1st,
+        slope_bc_nd,
+        wse_2nd_last_xs,
+    )
 
-        create_2ndpass_rasmap_file(
-            model_unit,
-            int_number_of_steps_2ndpass,
-            str_path_to_projection,
-            str_path_to_terrain,
-            str_river_id_fn,
-            terrain_names,
-            path_rasmap,
-        )
+    if int_number_of_steps_2ndpass == 0:
+        MP_LOG.error(f"create_2ndpass_files [{model_folder}] : has no int_number_of_steps_2ndpass elements")
+        return int_number_of_steps_2ndpass
+
+    str_path_to_terrain = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_TERRAIN)
+    str_path_to_projection = os.path.join(
+        unit_output_folder, sv.R2F_OUTPUT_DIR_SHAPES_FROM_CONF, huc8_num + "_huc_12_ar.prj"
+    )
+    path_rasmap = os.path.join(path_to_1st_pass_output, model_folder, model_folder[6:] + ".rasmap")
+
+    create_2ndpass_rasmap_file(
+        model_unit,
+        int_number_of_steps_2ndpass,
+        str_path_to_projection,
+        str_path_to_terrain,
+        model_folder[6:],
+        model_folder[:5],
+        path_rasmap,
+    )
 
-        nsindx += 1
+    return int_number_of_steps_2ndpass
 
 
+# -------------------------------------------------
 def fn_run_one_ras_model(
     str_ras_projectpath,
     int_number_of_steps,
@@ -1875,22 +1642,96 @@ def fn_run_one_ras_model(
             unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT, model_folder
         )
 
-        if pass_num == 1:
-            path_all_x_sections_info = os.path.join(
-                path_to_all_x_sections_info, "all_x_sections_info" + "_" + model_folder + ".csv"
-            )
+        path_all_x_sections_info = xsis.fn_get_x_sections_info_path(
+            path_to_all_x_sections_info, model_folder, pass_num
+        )
+
+        xsis.fn_write_x_sections_info(all_x_sections_info, path_all_x_sections_info)
+
+        MP_LOG.lprint(f"Processing {model_folder} model completed")
 
+    except Exception:
+        if ras2fim_logger.LOG_SYSTEM_IS_SETUP is True:
+            MP_LOG.error(traceback.format_exc())
         else:
-            path_all_x_sections_info = os.path.join(
-                path_to_all_x_sections_info, "all_x_sections_info_2nd" + "_" + model_folder + ".csv"
-            )
+            print(traceback.format_exc())
+        # re-raise it so the model scheduler records the model as failed
+        raise
 
-        all_x_sections_info.to_csv(path_all_x_sections_info)
 
-        MP_LOG.lprint(f"Processing {model_folder} model completed")
+# -------------------------------------------------
+def fn_run_one_ras_model_both_passes(
+    str_ras_projectpath,
+    int_number_of_steps,
+    model_folder,
+    unit_output_folder,
+    huc8_num,
+    model_unit,
+    flt_interval,
+    log_default_folder,
+    log_file_prefix,
+    index_number,
+    total_number_models,
+    is_first_pass_done=False,
+    dict_input_fingerprints=None,
+):
+    """
+    Overview:
+        Runs the first pass of a model, creates its second-pass files from the results and runs
+        the second pass, all in the one worker. A model does not wait for the other models'
+        first passes before its second pass, so the workers are not idle at the end of the
+        first pass (see create_fim_rasters).
+
+    Inputs:
+        - The same as fn_run_one_ras_model (int_number_of_steps is the number of first-pass
+              steps), plus the huc8_num, model_unit and flt_interval for create_2ndpass_files.
+        - is_first_pass_done: OPTIONAL: if True, the first pass results were restored from a
+              checkpoint, so only the second pass is run
+        - dict_input_fingerprints: OPTIONAL: the model's input fingerprints. If given, a
+              checkpoint is saved after each pass (see hecras_model_checkpoints.py)
+    """
+
+    model_dir = os.path.join(unit_output_folder, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT, model_folder)
+
+    if is_first_pass_done is False:
+        fn_run_one_ras_model(
+            str_ras_projectpath,
+            int_number_of_steps,
+            model_folder,
+            unit_output_folder,
+            log_default_folder,
+            log_file_prefix,
+            index_number,
+            total_number_models,
+            1,
+        )
 
+        if dict_input_fingerprints is not None:
+            hmc.fn_save_pass_checkpoint(model_dir, model_folder, 1, dict_input_fingerprints)
+
+    try:
+        int_number_of_steps_2ndpass = create_2ndpass_files(
+            unit_output_folder, model_folder, huc8_num, model_unit, flt_interval
+        )
     except Exception:
         if ras2fim_logger.LOG_SYSTEM_IS_SETUP is True:
             MP_LOG.error(traceback.format_exc())
         else:
             print(traceback.format_exc())
+        # re-raise it so the model scheduler records the model as failed
+        raise
+
+    fn_run_one_ras_model(
+        str_ras_projectpath,
+        int_number_of_steps_2ndpass,
+        model_folder,
+        unit_output_folder,
+        log_default_folder,
+        log_file_prefix,
+        index_number,
+        total_number_models,
+        2,
+    )
+
+    if dict_input_fingerprints is not None:
+        hmc.fn_save_pass_checkpoint(model_dir, model_folder, 2, dict_input_fingerprints)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+"""
+Stores the all_x_sections_info tables (the HEC-RAS results of each cross section for each profile,
+see worker_fim_rasters.fn_run_one_ras_model) as typed parquet files instead of csv files.
+
+Each model has one file per HEC-RAS pass in its model folder, named after the model folder and the
+pass, ie) 1234_name/all_x_sections_info_1234_name.parquet (first pass) and
+all_x_sections_info_2nd_1234_name.parquet (second pass). Keeping them in the model folders means
+they stay with the rest of the model outputs (checkpoints, quarantine, step manifests).
+
+The files of any number of models can be read as one dataframe (fn_read_x_sections_info). Units
+made before the parquet files only have the csv files (same names, with .csv), so they are read
+when a parquet file is missing.
+
+All columns have a set type (X_SECTIONS_INFO_SCHEMA). The cross section names are stored as text,
+as they are in HEC-RAS (ie. "1234.5*" for an interpolated cross section), and the xs_counter column
+is the cross section's number in its profile (the csv files had it as their unnamed first column).
+"""
+
+# Global Variables
+X_SECTIONS_INFO_SCHEMA = pa.schema(
+    [
+        ("xs_counter", pa.int32()),
+        ("fid_xs", pa.string()),
+        ("modelid", pa.int64()),
+        ("Xsection_name", pa.string()),
+        ("wse", pa.float64()),
+        ("discharge", pa.float64()),
+        ("max_depth", pa.float64()),
+        ("channel_length", pa.float64()),
+    ]
+)
+
+X_SECTIONS_INFO_COMPRESSION = "zstd"
+
+
+# -------------------------------------------------
+def fn_get_x_sections_info_path(model_dir, model_folder, pass_num):
+    # Returns the path of a model's all_x_sections_info file for a HEC-RAS pass (1 or 2)
+
+    if pass_num == 1:
+        file_name = "all_x_sections_info_" + model_folder + ".parquet"
+    else:
+        file_name = "all_x_sections_info_2nd_" + model_folder + ".parquet"
+
+    return os.path.join(model_dir, file_name)
+
+
+# -------------------------------------------------
+def __to_x_sections_info_table(all_x_sections_info):
+    # The all_x_sections_info dataframe as a pyarrow table with the X_SECTIONS_INFO_SCHEMA types
+
+    df_x_sections_info = all_x_sections_info.rename_axis("xs_counter").reset_index()
+    df_x_sections_info["Xsection_name"] = df_x_sections_info["Xsection_name"].astype(str)
+    df_x_sections_info["modelid"] = df_x_sections_info["modelid"].astype("int64")
+
+    return pa.Table.from_pandas(
+        df_x_sections_info[X_SECTIONS_INFO_SCHEMA.names], schema=X_SECTIONS_INFO_SCHEMA, preserve_index=False
+    )
+
+
+# -------------------------------------------------
+def __read_x_sections_info_csv(str_path, columns):
+    # Reads the csv file that was saved instead of the str_path parquet file before the parquet
+    # files. Its unnamed first column is the xs_counter.
+
+    str_csv_path = os.path.splitext(str_path)[0] + ".csv"
+    if os.path.exists(str_csv_path) is False:
+        raise FileNotFoundError(f"Neither {str_path} nor {str_csv_path} exist")
+
+    # the names are kept as text, the same as in the parquet files
+    all_x_sections_info = pd.read_csv(str_csv_path, index_col=0, dtype={"fid_xs": str, "Xsection_name": str})
+    table = __to_x_sections_info_table(all_x_sections_info)
+    if columns is not None:
+        table = table.select(columns)
+
+    return table
+
+
+# -------------------------------------------------
+def fn_write_x_sections_info(all_x_sections_info, str_path):
+    """
+    Overview:
+        Saves an all_x_sections_info dataframe (see hecras_plan_results.fn_get_all_x_sections_info)
+        as a parquet file with the X_SECTIONS_INFO_SCHEMA column types.
+
+    Inputs:
+        - all_x_sections_info: the dataframe. Its index is the cross section number in its profile
+        - str_path: the parquet file path (see fn_get_x_sections_info_path)
+    """
+
+    table = __to_x_sections_info_table(all_x_sections_info)
+
+    # write to a temp file first so a partly written file is never read
+    pq.write_table(table, str_path + ".tmp", compression=X_SECTIONS_INFO_COMPRESSION)
+    os.replace(str_path + ".tmp", str_path)
+
+
+# -------------------------------------------------
+def fn_read_x_sections_info(list_paths, columns=None):
+    """
+    Overview:
+        Reads the all_x_sections_info files of one or more models as one dataframe, in the same
+        order as list_paths and with the rows of each file in their saved order.
+
+        The cross section names are numbers if they all can be (the same as reading the csv files
+        did), otherwise they are left as text.
+
+        If a parquet file does not exist, its model's csv file (from a unit made before the
+        parquet files) is read instead.
+
+    Inputs:
+        - list_paths: a list of all_x_sections_info parquet file paths (see fn_get_x_sections_info_path)
+        - columns: OPTIONAL: the columns to read (default: all)
+    """
+
+    if all(os.path.exists(str_path) for str_path in list_paths):
+        dataset = ds.dataset(list_paths, schema=X_SECTIONS_INFO_SCHEMA, format="parquet")
+        table = dataset.to_table(columns=columns)
+    else:
+        list_tables = []
+        for str_path in list_paths:
+            if os.path.exists(str_path):
+                list_tables.append(pq.read_table(str_path, columns=columns, schema=X_SECTIONS_INFO_SCHEMA))
+            else:
+                list_tables.append(__read_x_sections_info_csv(str_path, columns))
+        table = pa.concat_tables(list_tables)
+
+    df_x_sections_info = table.to_pandas()
+
+    if "Xsection_name" in table.column_names:
+        # each name is there once per profile, so only the unique names are converted
+        arr_names = table.column("Xsection_name").combine_chunks().dictionary_encode()
+        try:
+            arr_unique_names = pd.to_numeric(arr_names.dictionary.to_pandas()).to_numpy()
+            df_x_sections_info["Xsection_name"] = arr_unique_names[arr_names.indices.to_numpy()]
+        except ValueError:
+            pass
+
+    return df_x_sections_info
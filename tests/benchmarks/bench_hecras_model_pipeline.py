@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src")))
+import numpy as np
+
+import hecras_model_scheduler as hms
+
+
+"""
+Compares the makespan and worker use of step 5's two ways of running the HEC-RAS passes, with a
+stand in backend (each pass sleeps for its model's run time):
+    - "barrier": the first pass of every model, then the second-pass files of every model built
+      one at a time in the main process, then the second pass of every model (before v2.0.25.0).
+    - "pipelined": one job per model that runs its first pass, builds its own second-pass files
+      and runs its second pass (create_fim_rasters since v2.0.25.0).
+
+Both run through hecras_model_scheduler.fn_run_models, longest first. The first-pass run times
+are skewed (lognormal), and each second pass takes 1 to 1.6 times as long as its first pass.
+Worker use is the total sleep time over (workers x makespan).
+
+Sample usage:
+    python tests/benchmarks/bench_hecras_model_pipeline.py -m 36 -w 6 -s 1 2 3
+"""
+
+
+# -------------------------------------------------
+def fake_run_pass(flt_run_seconds):
+    time.sleep(flt_run_seconds)
+
+
+# -------------------------------------------------
+def fake_run_both_passes(flt_first_pass_seconds, flt_prep_seconds, flt_second_pass_seconds):
+    time.sleep(flt_first_pass_seconds)
+    time.sleep(flt_prep_seconds)
+    time.sleep(flt_second_pass_seconds)
+
+
+# -------------------------------------------------
+def __run_barrier(arr_first_pass, arr_second_pass, flt_prep_seconds, num_workers):
+    flt_start_time = time.monotonic()
+    hms.fn_run_models(
+        [{"flt_run_seconds": run_seconds} for run_seconds in arr_first_pass],
+        fake_run_pass,
+        num_workers,
+        list_costs=list(arr_first_pass),
+    )
+    # the second-pass files, one model at a time
+    time.sleep(flt_prep_seconds * len(arr_first_pass))
+    hms.fn_run_models(
+        [{"flt_run_seconds": run_seconds} for run_seconds in arr_second_pass],
+        fake_run_pass,
+        num_workers,
+        list_costs=list(arr_second_pass),
+    )
+    return time.monotonic() - flt_start_time
+
+
+# -------------------------------------------------
+def __run_pipelined(arr_first_pass, arr_second_pass, flt_prep_seconds, num_workers):
+    flt_start_time = time.monotonic()
+    hms.fn_run_models(
+        [
+            {
+                "flt_first_pass_seconds": first_pass_seconds,
+                "flt_prep_seconds": flt_prep_seconds,
+                "flt_second_pass_seconds": second_pass_seconds,
+            }
+            for first_pass_seconds, second_pass_seconds in zip(arr_first_pass, arr_second_pass)
+        ],
+        fake_run_both_passes,
+        num_workers,
+        list_costs=list(arr_first_pass),
+    )
+    return time.monotonic() - flt_start_time
+
+
+# -------------------------------------------------
+def bench_hecras_model_pipeline(num_models, num_workers, list_seeds, flt_prep_seconds):
+    print(
+        f"{num_models} models, {num_workers} workers, {flt_prep_seconds} sec of second-pass files per model"
+    )
+    print()
+    print(
+        f"{'seed':<6}{'work (sec)':>12}{'longest model':>15}{'lower bound':>13}"
+        f"{'barrier':>10}{'use':>6}{'pipelined':>11}{'use':>6}"
+    )
+
+    for seed in list_seeds:
+        rng = np.random.default_rng(seed)
+        arr_first_pass = np.round(rng.lognormal(-1.2, 0.9, num_models), 3)
+        arr_second_pass = np.round(arr_first_pass * rng.uniform(1.0, 1.6, num_models), 3)
+
+        flt_work_seconds = float(arr_first_pass.sum() + arr_second_pass.sum() + flt_prep_seconds * num_models)
+        flt_longest_model = float((arr_first_pass + arr_second_pass).max())
+        flt_lower_bound = max(flt_work_seconds / num_workers, flt_longest_model)
+
+        flt_barrier = __run_barrier(arr_first_pass, arr_second_pass, flt_prep_seconds, num_workers)
+        flt_pipelined = __run_pipelined(arr_first_pass, arr_second_pass, flt_prep_seconds, num_workers)
+
+        print(
+            f"{seed:<6}{flt_work_seconds:>12.1f}{flt_longest_model:>15.1f}{flt_lower_bound:>13.2f}"
+            f"{flt_barrier:>10.2f}{flt_work_seconds / (num_workers * flt_barrier):>6.0%}"
+            f"{flt_pipelined:>11.2f}{flt_work_seconds / (num_workers * flt_pipelined):>6.0%}"
+        )
+
+
+# -------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the barrier and pipelined HEC-RAS passes")
+    parser.add_argument("-m", dest="num_models", help="number of models", default=36, type=int)
+    parser.add_argument("-w", dest="num_workers", help="number of workers", default=6, type=int)
+    parser.add_argument("-s", dest="list_seeds", help="random seeds", default=[1, 2, 3], type=int, nargs="+")
+    parser.add_argument(
+        "-p", dest="flt_prep_seconds", help="second-pass files time per model (sec)", default=0.02, type=float
+    )
+    args = parser.parse_args()
+
+    bench_hecras_model_pipeline(args.num_models, args.num_workers, args.list_seeds, args.flt_prep_seconds)
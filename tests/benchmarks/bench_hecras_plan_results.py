@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pandas as pd
+from fake_hecras import FakeHecrasController, SyntheticModel
+
+import hecras_plan_results as hpr
+
+
+"""
+Compares the time to read the all_x_sections_info table of one model:
+    - "controller": hecras_plan_results.fn_get_all_x_sections_info_from_hecras, through a fake
+      HEC-RAS controller that waits the given delay on each Output_NodeOutput call (a COM round
+      trip to HEC-RAS; measure yours to get the number for your machine).
+    - "plan hdf": hecras_plan_results.fn_get_all_x_sections_info, from a synthetic plan hdf file.
+
+Both tables are checked to be the same.
+
+Sample usage:
+    python tests/benchmarks/bench_hecras_plan_results.py -x 300 -p 76 -d 0.5
+"""
+
+
+# -------------------------------------------------
+def bench_hecras_plan_results(num_xs, num_profiles, call_delay_ms):
+    model = SyntheticModel(num_xs, num_profiles)
+    controller = FakeHecrasController(model, call_delay_ms / 1000)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        str_path_plan_hdf = os.path.join(temp_dir, "1234_Big Creek.p01.hdf")
+        model.write_plan_hdf(str_path_plan_hdf)
+
+        start_time = time.perf_counter()
+        df_hdf = hpr.fn_get_all_x_sections_info(str_path_plan_hdf, "1234", num_profiles)
+        hdf_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    df_controller = hpr.fn_get_all_x_sections_info_from_hecras(controller, "1234", num_profiles)
+    controller_seconds = time.perf_counter() - start_time
+
+    pd.testing.assert_frame_equal(df_hdf, df_controller)
+
+    print(
+        f"Synthetic model: {num_xs} cross sections x {num_profiles} profiles,"
+        f" {call_delay_ms} ms per HEC-RAS controller call"
+    )
+    print()
+    print(f"{'read':<12}{'calls':>10}{'seconds':>10}")
+    print(f"{'controller':<12}{controller.num_output_calls:>10}{controller_seconds:>10.2f}")
+    print(f"{'plan hdf':<12}{'':>10}{hdf_seconds:>10.2f}")
+    print()
+    print("The tables are the same")
+
+
+# -------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of reading the HEC-RAS results from the plan hdf")
+    parser.add_argument("-x", dest="num_xs", help="number of cross sections", default=300, type=int)
+    parser.add_argument("-p", dest="num_profiles", help="number of profiles", default=76, type=int)
+    parser.add_argument(
+        "-d", dest="call_delay_ms", help="delay of each HEC-RAS controller call (ms)", default=0.5, type=float
+    )
+    args = parser.parse_args()
+
+    bench_hecras_plan_results(args.num_xs, args.num_profiles, args.call_delay_ms)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src")))
+import national_datasets_cache as ndc
+import shared_variables as sv
+
+
+"""
+Compares the load time and peak memory (RSS) of the nwm_wbd_lookup records of one huc8, read:
+    - "full": the way conflation read them before the huc8 cache (the full netCDF to a dataframe,
+      then filtered to the huc8).
+    - "lazy": national_datasets_cache.fn_load_nwm_wbd_lookup_for_huc8 without the cache.
+    - "cache": national_datasets_cache.fn_load_nwm_wbd_lookup_for_huc8 with the cache.
+
+A synthetic national table is created first (by default 2,000 huc8s of 1,000 feature ids each,
+with the same variables as nwm_wbd_lookup.nc). Each read runs in its own python process so its
+peak memory is its own.
+
+Sample usage:
+    python tests/benchmarks/bench_nwm_wbd_lookup_cache.py -n 2000 -f 1000
+"""
+
+RECURRENCE_COLUMNS = ["recurr_1_5_cms", "recurr_5_0_cms", "recurr_10_0_cms", "recurr_25_0_cms"]
+
+
+# -------------------------------------------------
+def __get_peak_rss_mb():
+    if sys.platform == "win32":
+        import psutil
+
+        return psutil.Process().memory_info().peak_wset / 1024**2
+
+    # VmHWM, as ru_maxrss can keep the peak of the parent process from before the exec
+    with open("/proc/self/status", "r") as status_file:
+        for line in status_file:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+# -------------------------------------------------
+def __create_national_table(dir_datasets, num_huc8s, num_features):
+    import numpy as np
+    import xarray as xr
+
+    rng = np.random.default_rng(0)
+    num_rows = num_huc8s * num_features
+    arr_huc8s = np.repeat([f"{12000000 + huc_num:08d}" for huc_num in range(num_huc8s)], num_features)
+
+    data_vars = {"huc8": ("feature_id", arr_huc8s.astype(object))}
+    for column in RECURRENCE_COLUMNS:
+        data_vars[column] = ("feature_id", rng.random(num_rows) * 1000)
+    ds = xr.Dataset(data_vars, coords={"feature_id": np.arange(1, num_rows + 1)})
+    ds.to_netcdf(os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_FILE))
+
+    return arr_huc8s[num_rows // 2]
+
+
+# -------------------------------------------------
+def __measure(mode, dir_datasets, huc8):
+    # Runs in its own process (see __run_measure), prints the results as json
+
+    start_time = time.perf_counter()
+    if mode == "full":
+        import xarray as xr
+
+        with xr.open_dataset(os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_FILE)) as ds:
+            df_all_nwm_streams = ds.to_dataframe()
+        df_streams_huc_only = df_all_nwm_streams.loc[df_all_nwm_streams["huc8"] == huc8]
+    else:
+        df_streams_huc_only = ndc.fn_load_nwm_wbd_lookup_for_huc8(dir_datasets, huc8)
+    load_seconds = time.perf_counter() - start_time
+
+    print(
+        json.dumps(
+            {"seconds": load_seconds, "peak_rss_mb": __get_peak_rss_mb(), "records": len(df_streams_huc_only)}
+        )
+    )
+
+
+# -------------------------------------------------
+def __run_measure(mode, dir_datasets, huc8):
+    result = subprocess.run(
+        [sys.executable, __file__, "-m", mode, "-d", dir_datasets, "-w", huc8],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# -------------------------------------------------
+def bench_nwm_wbd_lookup_cache(num_huc8s, num_features):
+    with tempfile.TemporaryDirectory() as dir_datasets:
+        huc8 = __create_national_table(dir_datasets, num_huc8s, num_features)
+        nc_size_mb = os.path.getsize(os.path.join(dir_datasets, sv.INPUT_NWM_WBD_LOOKUP_FILE)) / 1024**2
+        print(
+            f"Synthetic nwm_wbd_lookup.nc: {num_huc8s} huc8s x {num_features} feature ids"
+            f" ({nc_size_mb:.0f} MB), reading huc8 {huc8}"
+        )
+
+        dict_results = {}
+        dict_results["full"] = __run_measure("full", dir_datasets, huc8)
+        dict_results["lazy"] = __run_measure("lazy", dir_datasets, huc8)
+
+        start_time = time.perf_counter()
+        ndc.fn_create_nwm_wbd_lookup_cache(dir_datasets)
+        print(f"Creating the huc8 cache (one time): {time.perf_counter() - start_time:.1f} sec")
+
+        dict_results["cache"] = __run_measure("cache", dir_datasets, huc8)
+
+    print()
+    print(f"{'read':<8}{'records':>10}{'seconds':>10}{'peak RSS (MB)':>16}")
+    for mode, result in dict_results.items():
+        print(f"{mode:<8}{result['records']:>10}{result['seconds']:>10.2f}{result['peak_rss_mb']:>16.0f}")
+
+
+# -------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the nwm_wbd_lookup huc8 cache")
+    parser.add_argument("-n", dest="num_huc8s", help="number of huc8s", default=2000, type=int)
+    parser.add_argument("-f", dest="num_features", help="feature ids per huc8", default=1000, type=int)
+    # used by __run_measure
+    parser.add_argument("-m", dest="mode", help=argparse.SUPPRESS, default=None)
+    parser.add_argument("-d", dest="dir_datasets", help=argparse.SUPPRESS, default=None)
+    parser.add_argument("-w", dest="huc8", help=argparse.SUPPRESS, default=None)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        __measure(args.mode, args.dir_datasets, args.huc8)
+    else:
+        bench_nwm_wbd_lookup_cache(args.num_huc8s, args.num_features)
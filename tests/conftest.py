@@ -0,0 +1,9 @@
+import os
+import sys
+
+
+# The src and tools modules import each other by name (the same as when they are run from their
+# own folders), so both folders are added to the path.
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TESTS_DIR, os.pardir, "src"))
+sys.path.append(os.path.join(TESTS_DIR, os.pardir, "tools"))
@@ -0,0 +1,167 @@
+import os
+import subprocess
+import sys
+import time
+
+import h5py
+import numpy as np
+
+import hecras_plan_results as hpr
+
+
+"""
+A synthetic HEC-RAS steady flow model, saved as a plan hdf file (the same layout and types as
+HEC-RAS 6 writes) and served by a fake HEC-RAS controller that answers Geometry_GetNodes and
+Output_NodeOutput from the same values, with an optional delay for each call.
+
+Also a fake model run (fake_run_model) with a scripted run time, failure or hang, for the
+hecras_model_scheduler.
+
+Used by tests/test_hecras_plan_results.py, tests/test_hecras_model_scheduler.py and
+tests/benchmarks/bench_hecras_plan_results.py.
+"""
+
+# HEC-RAS controller output variable ids (see hecras_plan_results.fn_get_all_x_sections_info_from_hecras)
+WSE_ID, MAX_DEPTH_ID, Q_TOTAL_ID, CHANNEL_LENGTH_ID = 2, 4, 9, 42
+
+
+# -------------------------------------------------
+class SyntheticModel:
+    """
+    The cross sections of the first reach (the one the results are read for), then the cross
+    sections of a second reach, which are not read.
+    """
+
+    def __init__(self, num_xs, num_profiles, num_xs_second_reach=3, seed=0):
+        rng = np.random.default_rng(seed)
+        self.num_xs = num_xs
+        self.num_profiles = num_profiles
+        num_all_xs = num_xs + num_xs_second_reach
+
+        self.rivers = ["Big Creek"] * num_all_xs
+        self.reaches = ["Upper"] * num_xs + ["Lower"] * num_xs_second_reach
+        arr_stations = np.sort(rng.choice(np.arange(100, 100000), num_all_xs, replace=False))[::-1] / 10
+        self.xs_names = [f"{station:g}" for station in arr_stations]
+        self.xs_names[1] += "*"  # an interpolated cross section
+
+        self.channel_lengths = rng.uniform(20, 500, num_all_xs).astype("float32")
+        self.channel_lengths[num_xs - 1] = 0  # the last cross section of the reach
+        self.channel_lengths[2] = 1e30  # HEC-RAS's "no value"
+
+        # station / elevation points, with the channel between the bank stations
+        self.sta_elev_info = []
+        list_points = []
+        self.bank_stations = []
+        for xs_idx in range(num_all_xs):
+            num_points = int(rng.integers(6, 40))
+            arr_sta = np.sort(rng.uniform(0, 1000, num_points))
+            arr_elev = rng.uniform(300, 330, num_points)
+            if xs_idx == 3:
+                # no points between the bank stations
+                bank_stations = [arr_sta[2] + 0.01, arr_sta[2] + 0.02]
+            else:
+                bank_stations = [arr_sta[num_points // 3], arr_sta[2 * num_points // 3]]
+            self.sta_elev_info.append([len(list_points), num_points])
+            list_points.extend(zip(arr_sta, arr_elev))
+            self.bank_stations.append(bank_stations)
+        self.sta_elev_values = np.array(list_points, dtype="float32")
+        self.sta_elev_info = np.array(self.sta_elev_info, dtype="int32")
+        self.bank_stations = np.array(self.bank_stations, dtype="float32")
+
+        # results of [profile, cross section]
+        self.flows = np.sort(rng.uniform(1, 50000, (num_profiles, 1)), axis=0) * np.ones(num_all_xs)
+        self.flows = self.flows.astype("float32")
+        self.wses = (330 + rng.uniform(0, 20, (num_profiles, num_all_xs))).astype("float32")
+
+    def get_min_channel_elevation(self, xs_idx):
+        # One cross section at a time, as the reference for the vectorized version
+        start, count = self.sta_elev_info[xs_idx]
+        arr_points = self.sta_elev_values[start : start + count].astype(float)
+        left, right = self.bank_stations[xs_idx]
+        arr_in_channel = (arr_points[:, 0] >= left) & (arr_points[:, 0] <= right)
+        if arr_in_channel.any():
+            return arr_points[arr_in_channel, 1].min()
+        return arr_points[:, 1].min()
+
+    def write_plan_hdf(self, str_path_plan_hdf):
+        arr_attrs = np.array(
+            list(zip(self.rivers, self.reaches, self.xs_names, self.channel_lengths)),
+            dtype=[("River", "S16"), ("Reach", "S16"), ("RS", "S8"), ("Len Channel", "<f4")],
+        )
+        with h5py.File(str_path_plan_hdf, "w") as hf:
+            hf.create_dataset(f"{hpr.HDF_XS_GEOM_PATH}/Attributes", data=arr_attrs)
+            hf.create_dataset(f"{hpr.HDF_XS_GEOM_PATH}/Station Elevation Info", data=self.sta_elev_info)
+            hf.create_dataset(f"{hpr.HDF_XS_GEOM_PATH}/Station Elevation Values", data=self.sta_elev_values)
+            hf.create_dataset(f"{hpr.HDF_XS_GEOM_PATH}/Bank Stations", data=self.bank_stations)
+            hf.create_dataset(f"{hpr.HDF_XS_RESULTS_PATH}/Water Surface", data=self.wses)
+            hf.create_dataset(f"{hpr.HDF_XS_RESULTS_PATH}/Flow", data=self.flows)
+
+
+# -------------------------------------------------
+class FakeHecrasController:
+    """
+    Answers the HEC-RAS controller calls of fn_get_all_x_sections_info_from_hecras from a
+    SyntheticModel. Each Output_NodeOutput call waits call_delay_seconds, like a COM round trip.
+    """
+
+    def __init__(self, model, call_delay_seconds=0.0):
+        self.model = model
+        self.call_delay_seconds = call_delay_seconds
+        self.num_output_calls = 0
+
+    def Geometry_GetNodes(self, riv_id, rch_id, num_nodes, tab_rs, tab_node_types):
+        # the nodes of river 1 / reach 1, names padded the same way HEC-RAS pads them
+        list_names = [f"{xs_name:<8}" for xs_name in self.model.xs_names[: self.model.num_xs]]
+        return None, None, len(list_names), tuple(list_names), tuple([""] * len(list_names))
+
+    def Output_NodeOutput(self, riv_id, rch_id, node_id, up_dn, prof_id, var_id):
+        self.num_output_calls += 1
+        if self.call_delay_seconds > 0:
+            time.sleep(self.call_delay_seconds)
+
+        xs_idx = node_id - 1
+        wse = float(self.model.wses[prof_id - 1, xs_idx])
+        if var_id == WSE_ID:
+            value = wse
+        elif var_id == MAX_DEPTH_ID:
+            value = wse - self.model.get_min_channel_elevation(xs_idx)
+        elif var_id == Q_TOTAL_ID:
+            value = float(self.model.flows[prof_id - 1, xs_idx])
+        elif var_id == CHANNEL_LENGTH_ID:
+            value = float(self.model.channel_lengths[xs_idx])
+        else:
+            raise ValueError(f"Unknown output variable id {var_id}")
+
+        return value, None, None, None, None, None, None
+
+
+# -------------------------------------------------
+def fake_run_model(
+    str_ras_projectpath, int_number_of_steps, str_log_path, flt_run_seconds=0.0, str_action=""
+):
+    """
+    Stands in for worker_fim_rasters.fn_run_one_ras_model in the hecras_model_scheduler. Appends
+    "start|end <model folder name> <time>" lines to str_log_path, and then:
+        - str_action "": sleeps flt_run_seconds
+        - str_action "fail": sleeps flt_run_seconds, then raises an exception
+        - str_action "hang": starts a child process (like HEC-RAS), writes "child <pid>" to the
+          log and never returns
+    """
+
+    str_model_name = os.path.basename(os.path.dirname(str_ras_projectpath))
+    with open(str_log_path, "a") as log_file:
+        log_file.write(f"start {str_model_name} {time.time()}\n")
+
+    if str_action == "hang":
+        child_process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(600)"])
+        with open(str_log_path, "a") as log_file:
+            log_file.write(f"child {child_process.pid} 0\n")
+        while True:
+            time.sleep(1)
+
+    time.sleep(flt_run_seconds)
+    if str_action == "fail":
+        raise Exception(f"{str_model_name} failed")
+
+    with open(str_log_path, "a") as log_file:
+        log_file.write(f"end {str_model_name} {time.time()}\n")
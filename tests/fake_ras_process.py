@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+
+
+"""
+A stand in for RasProcess.exe CreateTerrain, with the same arguments:
+    fake_ras_process.py CreateTerrain units=Feet stitch=true prj=... out=...\\1234.hdf ...\\1234.tif
+
+What it does depends on the text in the DEM (tif) file:
+    - "sleep <seconds>": waits, then writes the terrain (hdf) and its companion vrt file
+    - "fail": writes a partial terrain, then prints an error and returns 2
+    - "hang": writes a partial terrain, then never finishes
+
+If the FAKE_RAS_PROCESS_LOG environment variable is set, the start and end times of each
+conversion are appended to that file (one "start|end <dem name> <time>" line each).
+
+Used by tests/test_convert_tif_to_ras_hdf5.py.
+"""
+
+
+# -------------------------------------------------
+def __log(event, str_dem_path):
+    str_log_path = os.environ.get("FAKE_RAS_PROCESS_LOG")
+    if str_log_path is None:
+        return
+    with open(str_log_path, "a") as log_file:
+        log_file.write(f"{event} {os.path.basename(str_dem_path)} {time.time()}\n")
+
+
+# -------------------------------------------------
+def fake_create_terrain(list_args):
+    if list_args[0] != "CreateTerrain":
+        print(f"Unknown command {list_args[0]}", file=sys.stderr)
+        return 1
+
+    dict_args = dict(arg.split("=", 1) for arg in list_args[1:-1])
+    str_out_file_path = dict_args["out"]
+    str_dem_path = list_args[-1]
+    with open(str_dem_path, "r") as dem_file:
+        list_actions = dem_file.read().split()
+
+    __log("start", str_dem_path)
+    with open(str_out_file_path, "w") as out_file:
+        out_file.write("partial terrain")
+
+    if list_actions[0] == "fail":
+        print(f"Could not read {str_dem_path}", file=sys.stderr)
+        return 2
+    if list_actions[0] == "hang":
+        while True:
+            time.sleep(1)
+
+    time.sleep(float(list_actions[1]))
+    with open(str_out_file_path, "w") as out_file:
+        out_file.write(f"terrain units={dict_args['units']} prj={dict_args['prj']}")
+    with open(os.path.splitext(str_out_file_path)[0] + ".vrt", "w") as vrt_file:
+        vrt_file.write("vrt")
+    __log("end", str_dem_path)
+    return 0
+
+
+# -------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(fake_create_terrain(sys.argv[1:]))
@@ -0,0 +1,140 @@
+import os
+
+import geopandas as gpd
+import numpy as np
+import pyproj
+import pytest
+import rasterio
+import rioxarray
+import xarray as xr
+from rasterio.transform import from_origin
+from shapely.geometry import Polygon, mapping
+
+import clip_dem_from_shape as cdfs
+
+
+"""
+Checks that the windowed clip of clip_dem_from_shape.mp_clip_dem_for_model gives the same DEM as
+the clip it replaced (reproject the full DEM with rioxarray, then rio.clip it).
+
+Two differences are expected, and the checks allow for them:
+    - Every no data pixel is now written as -9999 (the nodata value of the output). The old clip
+      wrote NaN (source DEM without a nodata value) or the source nodata value (meter models)
+      under the -9999 nodata tag.
+    - GDAL's nearest neighbour warp uses an approximate transformer (error threshold 0.125 pixel)
+      computed per chunk, so reading only a window can pick the next source pixel (a value, or
+      no data) where the pixel center is within that distance of a source pixel edge.
+"""
+
+DEM_CRS = "EPSG:4269"
+MODEL_CRS = "EPSG:2277"
+DEM_ORIGIN = (-97.9, 30.5)
+DEM_RES = 1 / 10800  # 1/3 arc second, the 3DEP DEM resolution
+WARP_ERROR_THRESHOLD = 0.125
+
+
+# -------------------------------------------------
+def __create_dem(dem_path, nodata):
+    rng = np.random.default_rng(1)
+    arr_dem = (rng.random((600, 800)) * 100 + 200).astype("float32")
+    if nodata is not None:
+        arr_dem[:20, :30] = nodata
+        arr_dem[200:260, 250:320] = nodata  # inside the model domain
+
+    with rasterio.open(
+        dem_path,
+        "w",
+        driver="GTiff",
+        height=arr_dem.shape[0],
+        width=arr_dem.shape[1],
+        count=1,
+        dtype="float32",
+        crs=DEM_CRS,
+        transform=from_origin(*DEM_ORIGIN, DEM_RES, DEM_RES),
+        nodata=nodata,
+    ) as dst:
+        dst.write(arr_dem, 1)
+
+
+# -------------------------------------------------
+def __old_clip_dem(terrain_file_path, model_geometries, model_crs, model_unit, str_dem_out):
+    # The clip of fn_cut_dems_from_shapes before the windowed clip
+    dem = rioxarray.open_rasterio(terrain_file_path)
+    dem = dem.rio.reproject(model_crs)
+    clipped_dem = dem.rio.clip(model_geometries)
+    if model_unit == "feet":
+        clipped_dem = xr.where(
+            clipped_dem == clipped_dem.rio.nodata, cdfs.INT_NO_DATA_VAL, clipped_dem * 3.28084
+        )
+    clipped_dem = clipped_dem.assign_attrs({"_FillValue": cdfs.INT_NO_DATA_VAL})
+    if clipped_dem.rio.crs is None:
+        clipped_dem.rio.write_crs(model_crs, inplace=True)
+    clipped_dem.rio.to_raster(str_dem_out, compress="lzw", dtype="float32")
+
+
+# -------------------------------------------------
+def __get_distance_to_dem_pixel_edge(transform, shape):
+    # For each output pixel center, the distance (in DEM pixels) to the nearest DEM pixel edge
+    arr_rows, arr_cols = np.indices(shape)
+    arr_x, arr_y = transform * (arr_cols + 0.5, arr_rows + 0.5)
+    transformer = pyproj.Transformer.from_crs(MODEL_CRS, DEM_CRS, always_xy=True)
+    arr_lon, arr_lat = transformer.transform(arr_x, arr_y)
+    arr_dem_cols, arr_dem_rows = ~from_origin(*DEM_ORIGIN, DEM_RES, DEM_RES) * (arr_lon, arr_lat)
+
+    arr_distance = np.ones(shape)
+    for arr_position in [arr_dem_cols, arr_dem_rows]:
+        arr_fraction = arr_position - np.floor(arr_position)
+        arr_distance = np.minimum(arr_distance, np.minimum(arr_fraction, 1 - arr_fraction))
+    return arr_distance
+
+
+# -------------------------------------------------
+@pytest.mark.parametrize("model_unit", ["meter", "feet"])
+@pytest.mark.parametrize("nodata", [-999999.0, None])
+def test_windowed_clip_matches_the_old_clip(tmp_path, nodata, model_unit):
+    dem_path = str(tmp_path / "dem.tif")
+    __create_dem(dem_path, nodata)
+
+    domain = Polygon([(-97.88, 30.49), (-97.85, 30.48), (-97.86, 30.46), (-97.89, 30.47)])
+    model_geometries = list(gpd.GeoSeries([domain], crs=DEM_CRS).to_crs(MODEL_CRS).apply(mapping))
+
+    str_old_dem = str(tmp_path / "old.tif")
+    __old_clip_dem(dem_path, model_geometries, MODEL_CRS, model_unit, str_old_dem)
+
+    output_dir = str(tmp_path / "new")
+    os.makedirs(output_dir)
+    var_d = {
+        "model_id": 1,
+        "model_geometries": model_geometries,
+        "model_crs": pyproj.CRS(MODEL_CRS).to_wkt(),
+        "terrain_file_path": dem_path,
+        "output_dir": output_dir,
+        "model_unit": model_unit,
+        "log_file_prefix": "mp_clip_dem_for_model",
+        "rlog_file_path": str(tmp_path),
+    }
+    assert cdfs.mp_clip_dem_for_model(var_d) is True
+
+    with rasterio.open(str_old_dem) as old_dem, rasterio.open(os.path.join(output_dir, "1.tif")) as new_dem:
+        assert new_dem.crs == old_dem.crs
+        assert new_dem.transform.almost_equals(old_dem.transform, precision=1e-6)
+        assert new_dem.nodata == old_dem.nodata == cdfs.INT_NO_DATA_VAL
+        assert new_dem.dtypes == old_dem.dtypes == ("float32",)
+        assert new_dem.profile["compress"] == old_dem.profile["compress"]
+        arr_old = old_dem.read(1)
+        arr_new = new_dem.read(1)
+        transform = new_dem.transform
+
+    assert arr_new.shape == arr_old.shape
+
+    arr_old_nodata = np.isnan(arr_old) | (arr_old == cdfs.INT_NO_DATA_VAL)
+    if nodata is not None:
+        arr_old_nodata |= arr_old == nodata
+    arr_new_nodata = arr_new == cdfs.INT_NO_DATA_VAL
+    assert arr_new_nodata.sum() > arr_new_nodata[0].size  # the pixels outside the model domain
+
+    arr_both_valid = ~arr_new_nodata & ~arr_old_nodata
+    arr_differs = (arr_new_nodata != arr_old_nodata) | ((arr_new != arr_old) & arr_both_valid)
+    arr_distance = __get_distance_to_dem_pixel_edge(transform, arr_new.shape)
+    assert (arr_distance[arr_differs] < WARP_ERROR_THRESHOLD).all()
+    assert arr_differs.sum() < 0.05 * arr_differs.size
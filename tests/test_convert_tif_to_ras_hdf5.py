@@ -0,0 +1,103 @@
+import os
+import sys
+
+import convert_tif_to_ras_hdf5 as cth
+
+
+"""
+Runs batches of terrain conversions through convert_tif_to_ras_hdf5.fn_run_conversion_jobs with
+a stand in converter (tests/fake_ras_process.py) that simulates run times, failures and hangs.
+"""
+
+FAKE_RAS_PROCESS_PATH = os.path.join(os.path.dirname(__file__), "fake_ras_process.py")
+
+
+# -------------------------------------------------
+def __create_jobs(tmp_path, dict_dem_actions):
+    # one job for each dem, the same as fn_convert_tif_to_ras_hdf5 makes them
+    dem_dir = tmp_path / "03_terrain"
+    out_dir = tmp_path / "04_hecras_terrain"
+    os.makedirs(dem_dir, exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
+
+    list_conversion_jobs = []
+    for dem_name, dem_action in dict_dem_actions.items():
+        dem_path = str(dem_dir / f"{dem_name}.tif")
+        out_file_path = str(out_dir / f"{dem_name}.hdf")
+        with open(dem_path, "w") as dem_file:
+            dem_file.write(dem_action)
+
+        cmd = cth.fn_get_create_terrain_cmd("RasProcess.exe", "feet", "huc.prj", out_file_path, dem_path)
+        # the stand in is a python script, so it is run by python
+        cmd = [sys.executable, FAKE_RAS_PROCESS_PATH] + cmd[1:]
+        list_conversion_jobs.append({"source": dem_path, "output": out_file_path, "cmd": cmd})
+
+    return list_conversion_jobs
+
+
+# -------------------------------------------------
+def __get_max_running(str_log_path):
+    # the most conversions that were running at the same time
+    list_events = []
+    with open(str_log_path, "r") as log_file:
+        for line in log_file:
+            event, dem_name, event_time = line.split()
+            list_events.append((float(event_time), 1 if event == "start" else -1))
+
+    int_running = int_max_running = 0
+    for event_time, change in sorted(list_events):
+        int_running += change
+        int_max_running = max(int_max_running, int_running)
+    return int_max_running
+
+
+# -------------------------------------------------
+def test_jobs_run_at_most_num_workers_at_a_time(tmp_path, monkeypatch):
+    str_log_path = str(tmp_path / "fake_ras_process.log")
+    monkeypatch.setenv("FAKE_RAS_PROCESS_LOG", str_log_path)
+    list_conversion_jobs = __create_jobs(tmp_path, {f"{1000 + num}": "sleep 0.5" for num in range(8)})
+
+    list_results = cth.fn_run_conversion_jobs(list_conversion_jobs, num_workers=3)
+
+    assert [result["status"] for result in list_results] == ["converted"] * 8
+    assert [result["output"] for result in list_results] == [job["output"] for job in list_conversion_jobs]
+    with open(list_conversion_jobs[0]["output"], "r") as out_file:
+        assert out_file.read() == "terrain units=Feet prj=huc.prj"
+    assert 1 < __get_max_running(str_log_path) <= 3
+
+
+# -------------------------------------------------
+def test_failures_and_timeouts_do_not_stop_the_batch(tmp_path):
+    list_conversion_jobs = __create_jobs(
+        tmp_path, {"1000": "sleep 0.1", "1001": "fail", "1002": "hang", "1003": "sleep 0.1"}
+    )
+
+    list_results = cth.fn_run_conversion_jobs(list_conversion_jobs, num_workers=2, timeout_seconds=2)
+
+    assert [result["status"] for result in list_results] == ["converted", "failed", "timed_out", "converted"]
+    assert "return code of 2" in list_results[1]["error"]
+    assert "Could not read" in list_results[1]["error"]
+    assert list_results[2]["error"] == "timed out after 2 seconds"
+
+    # the partial terrains of the failed and timed out jobs were removed
+    assert sorted(os.listdir(tmp_path / "04_hecras_terrain")) == [
+        "1000.hdf",
+        "1000.vrt",
+        "1003.hdf",
+        "1003.vrt",
+    ]
+
+
+# -------------------------------------------------
+def test_rerun_skips_the_terrains_that_are_current(tmp_path):
+    list_conversion_jobs = __create_jobs(tmp_path, {"1000": "sleep 0.1", "1001": "fail", "1002": "sleep 0.1"})
+    cth.fn_run_conversion_jobs(list_conversion_jobs, num_workers=2)
+
+    # 1001 is fixed and 1002's dem is newer than its terrain
+    with open(list_conversion_jobs[1]["source"], "w") as dem_file:
+        dem_file.write("sleep 0.1")
+    flt_terrain_time = os.path.getmtime(list_conversion_jobs[2]["output"])
+    os.utime(list_conversion_jobs[2]["source"], (flt_terrain_time + 10, flt_terrain_time + 10))
+
+    list_results = cth.fn_run_conversion_jobs(list_conversion_jobs, num_workers=2)
+    assert [result["status"] for result in list_results] == ["skipped", "converted", "converted"]
@@ -0,0 +1,172 @@
+import os
+import shutil
+
+import hecras_model_checkpoints as hmc
+import shared_variables as sv
+
+
+"""
+Runs step 5 with a fake HEC-RAS backend (it writes the files of each pass instead of running
+HEC-RAS), interrupts it, and checks which passes of which models a rerun has to run.
+"""
+
+HUC8 = "12090301"
+MODEL_FOLDERS = [f"{10000 + model_num}_River {model_num}" for model_num in range(6)]
+
+
+# -------------------------------------------------
+def __create_model_folder(unit_dir, model_folder):
+    # What worker_fim_rasters.create_hecras_files creates for a model before its first pass
+    model_dir = os.path.join(unit_dir, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT, model_folder)
+    os.makedirs(model_dir)
+    name = model_folder[6:]
+    for extension in [".g01", ".f01", ".p01", ".prj"]:
+        with open(os.path.join(model_dir, name + extension), "w") as model_file:
+            model_file.write(f"{model_folder} {extension}\n")
+
+
+# -------------------------------------------------
+def __create_unit(unit_dir):
+    # The step 2 and step 4 outputs the checkpoints use
+    os.makedirs(os.path.join(unit_dir, sv.R2F_OUTPUT_DIR_HECRAS_TERRAIN))
+    os.makedirs(os.path.join(unit_dir, sv.R2F_OUTPUT_DIR_SHAPES_FROM_CONF))
+    with open(
+        os.path.join(unit_dir, sv.R2F_OUTPUT_DIR_SHAPES_FROM_CONF, HUC8 + "_huc_12_ar.prj"), "w"
+    ) as prj:
+        prj.write("projection")
+    for model_folder in MODEL_FOLDERS:
+        with open(
+            os.path.join(unit_dir, sv.R2F_OUTPUT_DIR_HECRAS_TERRAIN, model_folder[:5] + ".hdf"), "w"
+        ) as hdf:
+            hdf.write(f"terrain {model_folder}")
+
+
+# -------------------------------------------------
+def __fake_run_model(unit_dir, model_folder, is_first_pass_done, dict_input_fingerprints, num_passes_to_run):
+    # Writes the outputs of each pass and saves its checkpoint, the same as
+    # worker_fim_rasters.fn_run_one_ras_model_both_passes
+    model_dir = os.path.join(unit_dir, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT, model_folder)
+    name = model_folder[6:]
+
+    if is_first_pass_done is False:
+        with open(os.path.join(model_dir, f"all_x_sections_info_{model_folder}.parquet"), "w") as out_file:
+            out_file.write("first pass")
+        hmc.fn_save_pass_checkpoint(model_dir, model_folder, 1, dict_input_fingerprints)
+
+    if num_passes_to_run < 2:
+        return
+
+    os.makedirs(os.path.join(model_dir, name + "_2nd"))
+    with open(os.path.join(model_dir, name + "_2nd", "Depth (flow_0ft).tif"), "w") as depth_grid:
+        depth_grid.write("depth")
+    with open(os.path.join(model_dir, f"all_x_sections_info_2nd_{model_folder}.parquet"), "w") as out_file:
+        out_file.write("second pass")
+    hmc.fn_save_pass_checkpoint(model_dir, model_folder, 2, dict_input_fingerprints)
+
+
+# -------------------------------------------------
+def __run_step_5(unit_dir, dict_passes_to_run=None):
+    """
+    The checkpoint part of create_fim_rasters.fn_create_fim_rasters, with the fake backend.
+
+    dict_passes_to_run: model folder -> the number of passes the model gets to run before the
+        run is interrupted (0 or 1). Models not in it run to the end.
+
+    Returns: model folder -> the number of passes that did not need to be run (0, 1 or 2)
+    """
+    if dict_passes_to_run is None:
+        dict_passes_to_run = {}
+
+    path_previous = hmc.fn_set_aside_previous_models(unit_dir)
+    for model_folder in MODEL_FOLDERS:
+        __create_model_folder(unit_dir, model_folder)
+
+    dict_checkpoints = {}
+    for model_folder in MODEL_FOLDERS:
+        dict_checkpoints[model_folder] = hmc.fn_restore_model(unit_dir, model_folder, HUC8, path_previous)
+    if os.path.exists(path_previous):
+        shutil.rmtree(path_previous)
+
+    for model_folder, (num_passes_done, dict_input_fingerprints) in dict_checkpoints.items():
+        num_passes_to_run = dict_passes_to_run.get(model_folder, 2)
+        if num_passes_done == 2 or num_passes_to_run == 0:
+            continue
+        __fake_run_model(
+            unit_dir, model_folder, num_passes_done == 1, dict_input_fingerprints, num_passes_to_run
+        )
+
+    return {model_folder: checkpoint[0] for model_folder, checkpoint in dict_checkpoints.items()}
+
+
+# -------------------------------------------------
+def __run_interrupted_unit(unit_dir):
+    # models 0 to 3 finish, model 4 only finishes its first pass and model 5 does not start
+    __create_unit(unit_dir)
+    __run_step_5(unit_dir, {MODEL_FOLDERS[4]: 1, MODEL_FOLDERS[5]: 0})
+
+
+# -------------------------------------------------
+def test_rerun_after_interruption_only_runs_unfinished_passes(tmp_path):
+    unit_dir = str(tmp_path / "12090301_2277_ble_240301")
+    __run_interrupted_unit(unit_dir)
+
+    dict_passes_done = __run_step_5(unit_dir)
+    assert list(dict_passes_done.values()) == [2, 2, 2, 2, 1, 0]
+
+    # everything finished, so nothing runs again
+    dict_passes_done = __run_step_5(unit_dir)
+    assert list(dict_passes_done.values()) == [2] * len(MODEL_FOLDERS)
+
+
+# -------------------------------------------------
+def test_changed_inputs_and_missing_outputs_are_run_again(tmp_path):
+    unit_dir = str(tmp_path / "12090301_2277_ble_240301")
+    __create_unit(unit_dir)
+    __run_step_5(unit_dir)
+
+    # a changed terrain runs its model from the start
+    with open(os.path.join(unit_dir, sv.R2F_OUTPUT_DIR_HECRAS_TERRAIN, "10001.hdf"), "w") as hdf:
+        hdf.write("new terrain")
+    # a missing depth grid runs the second pass again
+    model_dir = os.path.join(unit_dir, sv.R2F_OUTPUT_DIR_HECRAS_OUTPUT, MODEL_FOLDERS[2])
+    os.remove(os.path.join(model_dir, "River 2_2nd", "Depth (flow_0ft).tif"))
+
+    dict_passes_done = __run_step_5(unit_dir)
+    assert list(dict_passes_done.values()) == [2, 0, 1, 2, 2, 2]
+
+
+# -------------------------------------------------
+def test_new_code_version_runs_every_model_again(tmp_path, monkeypatch):
+    unit_dir = str(tmp_path / "12090301_2277_ble_240301")
+    __create_unit(unit_dir)
+    __run_step_5(unit_dir)
+
+    monkeypatch.setattr(hmc, "fn_get_code_version", lambda: "v9.9.9.9_changed")
+
+    dict_passes_done = __run_step_5(unit_dir)
+    assert list(dict_passes_done.values()) == [0] * len(MODEL_FOLDERS)
+
+
+# -------------------------------------------------
+def test_new_unit_folder_uses_a_copy_of_the_earlier_models(tmp_path):
+    earlier_unit_dir = str(tmp_path / "12090301_2277_ble_240301")
+    __run_interrupted_unit(earlier_unit_dir)
+
+    def list_files(folder):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), folder)
+            for root, __, names in os.walk(folder)
+            for name in names
+        )
+
+    list_earlier_files = list_files(earlier_unit_dir)
+
+    unit_dir = str(tmp_path / "12090301_2277_ble_240302")
+    __create_unit(unit_dir)
+    assert hmc.fn_copy_previous_models(earlier_unit_dir, unit_dir) == 5
+
+    dict_passes_done = __run_step_5(unit_dir)
+    assert list(dict_passes_done.values()) == [2, 2, 2, 2, 1, 0]
+
+    # the earlier unit folder has not been changed
+    assert list_files(earlier_unit_dir) == list_earlier_files
@@ -0,0 +1,157 @@
+import os
+import time
+
+import psutil
+from fake_hecras import fake_run_model
+
+import hecras_model_scheduler as hms
+
+
+"""
+Runs synthetic models through hecras_model_scheduler.fn_run_models with a fake model run
+(fake_hecras.fake_run_model) that has scripted run times, failures and hangs.
+"""
+
+
+# -------------------------------------------------
+def __create_model(models_dir, model_name, num_xs):
+    # A HEC-RAS project with a current plan and a geometry of num_xs cross sections and a bridge
+    model_dir = os.path.join(models_dir, model_name)
+    os.makedirs(model_dir)
+    str_prj_path = os.path.join(model_dir, f"{model_name}.prj")
+    with open(str_prj_path, "w") as prj_file:
+        prj_file.write(f"Proj Title={model_name}\nCurrent Plan=p01\nEnglish Units\n")
+    with open(os.path.join(model_dir, f"{model_name}.p01"), "w") as plan_file:
+        plan_file.write("Plan Title=plan\nGeom File=g01\nFlow File=f01\n")
+    with open(os.path.join(model_dir, f"{model_name}.g01"), "w") as geom_file:
+        geom_file.write("Geom Title=geom\n")
+        for xs_num in range(num_xs):
+            geom_file.write(f"Type RM Length L Ch R = 1 ,{5000 - xs_num * 10}  ,10,10,10\n")
+        geom_file.write("Type RM Length L Ch R = 3 ,4005  ,10,10,10\n")
+    return str_prj_path
+
+
+# -------------------------------------------------
+def __read_log(str_log_path):
+    # list of (event, model name or pid, time), in time order
+    list_events = []
+    with open(str_log_path, "r") as log_file:
+        for line in log_file:
+            event, name, event_time = line.split()
+            list_events.append((event, name, float(event_time)))
+    return list_events
+
+
+# -------------------------------------------------
+def __is_process_stopped(pid, timeout_seconds=5):
+    # A killed process can be a zombie until its new parent reaps it
+    flt_end_time = time.time() + timeout_seconds
+    while time.time() < flt_end_time:
+        try:
+            if psutil.Process(pid).status() == psutil.STATUS_ZOMBIE:
+                return True
+        except psutil.NoSuchProcess:
+            return True
+        time.sleep(0.1)
+    return False
+
+
+# -------------------------------------------------
+def test_models_run_longest_first(tmp_path):
+    str_log_path = str(tmp_path / "models.log")
+    list_model_inputs = []
+    for model_name, num_xs, num_steps in [
+        ("small", 5, 10),
+        ("big", 40, 10),
+        ("medium", 20, 10),
+        ("long", 5, 90),
+    ]:
+        list_model_inputs.append(
+            {
+                "str_ras_projectpath": __create_model(str(tmp_path), model_name, num_xs),
+                "int_number_of_steps": num_steps,
+                "str_log_path": str_log_path,
+            }
+        )
+
+    assert hms.fn_count_cross_sections(os.path.join(tmp_path, "big", "big.g01")) == 40
+
+    list_results = hms.fn_run_models(list_model_inputs, fake_run_model, 1, poll_seconds=0.1)
+
+    assert [result["cost"] for result in list_results] == [50, 400, 200, 450]
+    assert [result["run_order"] for result in list_results] == [3, 1, 2, 0]
+    assert [result["status"] for result in list_results] == ["completed"] * 4
+    list_started = [name for event, name, __ in __read_log(str_log_path) if event == "start"]
+    assert list_started == ["long", "big", "medium", "small"]
+
+
+# -------------------------------------------------
+def test_failed_and_hung_models_are_recorded(tmp_path):
+    str_log_path = str(tmp_path / "models.log")
+    list_model_inputs = []
+    for model_name, str_action in [
+        ("1000_ok", ""),
+        ("1001_fails", "fail"),
+        ("1002_hangs", "hang"),
+        ("1003_ok", ""),
+    ]:
+        list_model_inputs.append(
+            {
+                "str_ras_projectpath": os.path.join(tmp_path, model_name, f"{model_name}.prj"),
+                "int_number_of_steps": 10,
+                "str_log_path": str_log_path,
+                "flt_run_seconds": 0.2,
+                "str_action": str_action,
+            }
+        )
+
+    list_killed_models = []
+
+    def fn_kill_model_processes(dict_model_inputs):
+        list_killed_models.append(dict_model_inputs["str_ras_projectpath"])
+        return 0
+
+    list_results = hms.fn_run_models(
+        list_model_inputs,
+        fake_run_model,
+        2,
+        list_costs=[1, 1, 1, 1],
+        timeout_seconds=1.5,
+        poll_seconds=0.1,
+        fn_kill_model_processes=fn_kill_model_processes,
+    )
+
+    assert [result["status"] for result in list_results] == ["completed", "failed", "timed_out", "completed"]
+    assert [result["exit_code"] for result in list_results] == [0, 1, None, 0]
+    assert list_results[2]["run_seconds"] >= 1.5
+    assert list_killed_models == [list_model_inputs[2]["str_ras_projectpath"]]
+
+    # the hung model's child process (ie. HEC-RAS) was killed with it
+    list_child_pids = [int(name) for event, name, __ in __read_log(str_log_path) if event == "child"]
+    assert len(list_child_pids) == 1
+    assert __is_process_stopped(list_child_pids[0])
+
+    # the other models kept running while the model hung
+    list_ended = [name for event, name, __ in __read_log(str_log_path) if event == "end"]
+    assert sorted(list_ended) == ["1000_ok", "1003_ok"]
+
+
+# -------------------------------------------------
+def test_bad_model_candidates_use_the_bad_models_list_format(tmp_path):
+    str_file_path = str(tmp_path / hms.BAD_MODEL_CANDIDATES_FILE_NAME)
+    hms.fn_write_bad_model_candidates(str_file_path, [], "Pass 1")
+    assert os.path.exists(str_file_path) is False
+
+    hms.fn_write_bad_model_candidates(str_file_path, [("1001_fails", "failed (exit code 1)")], "Pass 1")
+    hms.fn_write_bad_model_candidates(
+        str_file_path, [("1002_hangs", "timed out after 7200 seconds")], "Pass 2"
+    )
+
+    # read the same way as shared_functions.get_bad_models_list reads config/bad_models_list.lst
+    with open(str_file_path, "r") as candidates_file:
+        list_lines = [line.strip() for line in candidates_file]
+    assert [line for line in list_lines if line != "" and line.startswith("#") is False] == [
+        "1001_fails",
+        "1002_hangs",
+    ]
+    assert "# timed out after 7200 seconds" in list_lines
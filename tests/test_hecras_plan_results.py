@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+from fake_hecras import FakeHecrasController, SyntheticModel
+
+import hecras_plan_results as hpr
+
+
+"""
+Checks that the all_x_sections_info table read from a synthetic plan hdf file is the same as the
+one read one value at a time through a fake HEC-RAS controller.
+"""
+
+
+# -------------------------------------------------
+@pytest.mark.parametrize("num_xs, num_profiles", [(12, 5), (40, 76)])
+def test_plan_hdf_results_match_the_hecras_controller(tmp_path, num_xs, num_profiles):
+    model = SyntheticModel(num_xs, num_profiles)
+    str_path_plan_hdf = str(tmp_path / "1234_Big Creek.p01.hdf")
+    model.write_plan_hdf(str_path_plan_hdf)
+
+    df_hdf = hpr.fn_get_all_x_sections_info(str_path_plan_hdf, "1234", num_profiles)
+
+    controller = FakeHecrasController(model)
+    df_controller = hpr.fn_get_all_x_sections_info_from_hecras(controller, "1234", num_profiles)
+    assert controller.num_output_calls == 4 * num_xs * num_profiles
+
+    pd.testing.assert_frame_equal(df_hdf, df_controller)
+    assert len(df_hdf) == num_xs * num_profiles
+    assert df_hdf["Xsection_name"].iloc[1].endswith("*")
+    assert (df_hdf["channel_length"] < 1e20).all()
+
+
+# -------------------------------------------------
+def test_plan_hdf_with_other_profile_count_raises(tmp_path):
+    model = SyntheticModel(10, 5)
+    str_path_plan_hdf = str(tmp_path / "1234_Big Creek.p01.hdf")
+    model.write_plan_hdf(str_path_plan_hdf)
+
+    with pytest.raises(ValueError):
+        hpr.fn_get_all_x_sections_info(str_path_plan_hdf, "1234", 6)
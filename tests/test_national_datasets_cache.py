@@ -0,0 +1,77 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from shapely.geometry import LineString
+
+import national_datasets_cache as ndc
+import shared_variables as sv
+
+
+"""
+Creates the huc8 caches of a small synthetic set of national datasets and checks that reading
+them gives the same records as reading the national datasets themselves.
+"""
+
+HUC8_A = "12090301"
+HUC8_B = "12090302"
+
+
+# -------------------------------------------------
+@pytest.fixture
+def dir_datasets(tmp_path):
+    # feature 2 crosses from huc8 A into huc8 B, so it is in the lookup (and the flows cache) twice
+    ds_lookup = xr.Dataset(
+        {
+            "huc8": ("feature_id", np.array([HUC8_A, HUC8_A, HUC8_B, HUC8_B], dtype=object)),
+            "recurr_2_0_cms": ("feature_id", np.array([1.5, 2.5, 2.5, 3.5])),
+        },
+        coords={"feature_id": [1, 2, 2, 3]},
+    )
+    ds_lookup.to_netcdf(tmp_path / sv.INPUT_NWM_WBD_LOOKUP_FILE)
+
+    gdf_flows = gpd.GeoDataFrame(
+        {"ID": [1, 2, 3, 4]},
+        geometry=[
+            LineString([(0, 0), (4, 0)]),
+            LineString([(4, 0), (6, 0)]),
+            LineString([(6, 0), (10, 0)]),
+            LineString([(20, 20), (21, 21)]),
+        ],
+        crs="EPSG:5070",
+    )
+    gdf_flows.to_file(tmp_path / sv.INPUT_NWM_FLOWS_FILE, driver="GPKG")
+
+    return str(tmp_path)
+
+
+# -------------------------------------------------
+def test_flowline_in_two_huc8s_is_read_once(dir_datasets):
+    str_layer_path = f"{dir_datasets}/{sv.INPUT_NWM_FLOWS_FILE}"
+    ndc.fn_create_nwm_flows_huc8_cache(dir_datasets)
+
+    gdf_both = ndc.fn_read_huc8_layer(str_layer_path, list_huc8s=[HUC8_A, HUC8_B])
+    assert sorted(gdf_both["ID"]) == [1, 2, 3]
+
+    gdf_bbox = ndc.fn_read_huc8_layer(str_layer_path, bbox=(0, -1, 10, 1))
+    gdf_gpkg = gpd.read_file(str_layer_path, bbox=(0, -1, 10, 1))
+    assert sorted(gdf_bbox["ID"]) == sorted(gdf_gpkg["ID"]) == [1, 2, 3]
+    assert list(gdf_bbox.columns) == list(gdf_gpkg.columns)
+
+    # one shard still has its copy of the shared flowline
+    gdf_a = ndc.fn_read_huc8_layer(str_layer_path, list_huc8s=[HUC8_A])
+    assert sorted(gdf_a["ID"]) == [1, 2]
+
+
+# -------------------------------------------------
+def test_nwm_wbd_lookup_cache_matches_the_netcdf(dir_datasets):
+    df_no_cache = ndc.fn_load_nwm_wbd_lookup_for_huc8(dir_datasets, HUC8_B)
+
+    ndc.fn_create_nwm_wbd_lookup_cache(dir_datasets)
+    df_cache = ndc.fn_load_nwm_wbd_lookup_for_huc8(dir_datasets, HUC8_B)
+
+    assert list(df_cache.index) == list(df_no_cache.index) == [2, 3]
+    pd.testing.assert_series_equal(
+        df_cache["recurr_2_0_cms"], df_no_cache["recurr_2_0_cms"], check_names=False, check_index_type=False
+    )
@@ -0,0 +1,117 @@
+import os
+
+import boto3
+import pytest
+import s3_shared_functions as s3_sf
+from moto import mock_aws
+
+
+"""
+Uploads a unit folder to a mocked S3 bucket (moto), changes the unit, and syncs the S3 folder to
+it the way ras_unit_to_s3 overwrites an existing unit folder.
+"""
+
+BUCKET_NAME = "ras2fim-test"
+S3_FOLDER = "output_ras2fim"
+UNIT_FOLDER_NAME = "12090301_2277_ble_230923"
+
+
+# -------------------------------------------------
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET_NAME)
+        yield client
+
+
+# -------------------------------------------------
+def __write_file(unit_dir, rel_path, text):
+    file_path = os.path.join(unit_dir, rel_path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as out_file:
+        out_file.write(text)
+
+
+# -------------------------------------------------
+def __get_s3_files(s3_client):
+    # key (relative to the unit folder) -> contents
+    dict_files = {}
+    for s3_item in s3_sf.get_file_list(BUCKET_NAME, f"{S3_FOLDER}/{UNIT_FOLDER_NAME}"):
+        response = s3_client.get_object(
+            Bucket=BUCKET_NAME, Key=f"{S3_FOLDER}/{UNIT_FOLDER_NAME}/{s3_item['key']}"
+        )
+        dict_files[s3_item["key"]] = response["Body"].read().decode()
+    return dict_files
+
+
+# -------------------------------------------------
+def test_existing_unit_folder_is_synced(tmp_path, s3_client, monkeypatch):
+    unit_dir = str(tmp_path / UNIT_FOLDER_NAME)
+    __write_file(unit_dir, "README.txt", "readme")
+    __write_file(unit_dir, "final/rating_curve.csv", "rating curve v1")
+    __write_file(unit_dir, "final/old_only.csv", "removed from the new unit")
+    __write_file(unit_dir, "06_create_rating_curves/1234.csv", "model 1234")
+    s3_sf.upload_folder_to_s3(unit_dir, BUCKET_NAME, S3_FOLDER, UNIT_FOLDER_NAME)
+
+    # the new version of the unit
+    __write_file(unit_dir, "final/rating_curve.csv", "rating curve v2")
+    os.remove(os.path.join(unit_dir, "final", "old_only.csv"))
+    __write_file(unit_dir, "final/new_only.csv", "new")
+    __write_file(unit_dir, "ras_unit_to_s3.log", "not uploaded")
+
+    list_uploaded_files = []
+    get_s3_client = s3_sf.get_s3_client
+
+    def get_recording_s3_client():
+        client = get_s3_client()
+        upload_file = client.upload_file
+
+        def recording_upload_file(src_file_path, *args, **kwargs):
+            list_uploaded_files.append(os.path.relpath(src_file_path, unit_dir).replace("\\", "/"))
+            return upload_file(src_file_path, *args, **kwargs)
+
+        client.upload_file = recording_upload_file
+        return client
+
+    monkeypatch.setattr(s3_sf, "get_s3_client", get_recording_s3_client)
+
+    s3_sf.upload_folder_to_s3(
+        unit_dir,
+        BUCKET_NAME,
+        S3_FOLDER,
+        UNIT_FOLDER_NAME,
+        skip_files=[os.path.join(unit_dir, "ras_unit_to_s3.log")],
+        skip_unchanged_files=True,
+        delete_removed_files=True,
+    )
+
+    # only the changed and new files were uploaded
+    assert sorted(list_uploaded_files) == ["final/new_only.csv", "final/rating_curve.csv"]
+    assert __get_s3_files(s3_client) == {
+        "README.txt": "readme",
+        "final/rating_curve.csv": "rating curve v2",
+        "final/new_only.csv": "new",
+        "06_create_rating_curves/1234.csv": "model 1234",
+    }
+
+
+# -------------------------------------------------
+def test_other_folders_with_the_same_prefix_are_not_deleted(tmp_path, s3_client):
+    # ie) 12090301_2277_ble_2309231 starts with the unit folder name, but is not the unit folder
+    s3_client.put_object(
+        Bucket=BUCKET_NAME, Key=f"{S3_FOLDER}/{UNIT_FOLDER_NAME}1/README.txt", Body=b"other unit"
+    )
+
+    unit_dir = str(tmp_path / UNIT_FOLDER_NAME)
+    __write_file(unit_dir, "README.txt", "readme")
+    s3_sf.upload_folder_to_s3(unit_dir, BUCKET_NAME, S3_FOLDER, UNIT_FOLDER_NAME, delete_removed_files=True)
+
+    response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=S3_FOLDER)
+    assert sorted(item["Key"] for item in response["Contents"]) == [
+        f"{S3_FOLDER}/{UNIT_FOLDER_NAME}/README.txt",
+        f"{S3_FOLDER}/{UNIT_FOLDER_NAME}1/README.txt",
+    ]
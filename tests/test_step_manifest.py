@@ -0,0 +1,159 @@
+import os
+
+import pytest
+
+import step_manifest as sm
+
+
+"""
+Runs a synthetic unit through step_manifest.fn_run_step with a stub compute backend (the steps
+copy text files instead of running conflation, HEC-RAS, etc), changes it, and checks which steps
+are run again.
+
+The stub unit has three steps, the same shape as ras2fim's steps:
+    - step_1_models: reads the source models, writes one output per model (ie. conflation)
+    - step_2_results: reads step 1's outputs, writes one result per model (ie. HEC-RAS)
+    - step_3_terrain: reads the terrain only (ie. DEM clipping)
+"""
+
+STEP_PARAMS = {"huc8": "12090301", "model_unit": "feet"}
+
+
+# -------------------------------------------------
+@pytest.fixture(autouse=True)
+def no_rmtree_wait(monkeypatch):
+    # fn_run_step waits a second after emptying an output folder (for windows)
+    monkeypatch.setattr(sm.time, "sleep", lambda seconds: None)
+
+
+# -------------------------------------------------
+class StubUnit:
+    def __init__(self, root_dir):
+        self.unit_dir = os.path.join(root_dir, "12090301_2277_ble_240301")
+        self.models_dir = os.path.join(root_dir, "models")
+        self.terrain_path = os.path.join(root_dir, "terrain.tif")
+        self.step_1_dir = os.path.join(self.unit_dir, "01_models")
+        self.step_2_dir = os.path.join(self.unit_dir, "02_results")
+        self.step_3_dir = os.path.join(self.unit_dir, "03_terrain")
+        self.list_steps_run = []
+        self.fail_step = None
+
+        os.makedirs(self.unit_dir)
+        os.makedirs(self.models_dir)
+        for model_num in range(3):
+            self.write_model(model_num, f"model {model_num} geometry")
+        with open(self.terrain_path, "w") as terrain_file:
+            terrain_file.write("terrain")
+
+    def write_model(self, model_num, text):
+        with open(os.path.join(self.models_dir, f"{model_num}.g01"), "w") as model_file:
+            model_file.write(text)
+
+    def __copy_files(self, step_name, src_dir, dst_dir, suffix):
+        self.list_steps_run.append(step_name)
+        for file_name in sorted(os.listdir(src_dir)):
+            with open(os.path.join(src_dir, file_name), "r") as src_file:
+                text = src_file.read()
+            if self.fail_step == step_name:
+                raise Exception(f"{step_name} stopped")
+            # step 1 only keeps the first two words, so some model changes do not change its output
+            if step_name == "step_1_models":
+                text = text.split()[0] + " " + text.split()[1]
+            with open(os.path.join(dst_dir, os.path.splitext(file_name)[0] + suffix), "w") as dst_file:
+                dst_file.write(text + suffix)
+
+    def step_1(self):
+        self.__copy_files("step_1_models", self.models_dir, self.step_1_dir, ".conflated")
+
+    def step_2(self):
+        self.__copy_files("step_2_results", self.step_1_dir, self.step_2_dir, ".result")
+
+    def step_3(self):
+        self.list_steps_run.append("step_3_terrain")
+        with open(os.path.join(self.step_3_dir, "clipped.tif"), "w") as dem_file:
+            dem_file.write("clipped terrain")
+
+    def run(self, step_params=STEP_PARAMS):
+        # The same as ras2fim.fn_run_ras2fim does for each step. Returns the steps that were run.
+        self.list_steps_run = []
+        sm.fn_run_step(
+            True,
+            self.unit_dir,
+            "step_1_models",
+            step_params,
+            [self.models_dir],
+            [self.step_1_dir],
+            self.step_1,
+        )
+        sm.fn_run_step(
+            True,
+            self.unit_dir,
+            "step_2_results",
+            step_params,
+            [self.step_1_dir],
+            [self.step_2_dir],
+            self.step_2,
+        )
+        sm.fn_run_step(
+            True,
+            self.unit_dir,
+            "step_3_terrain",
+            step_params,
+            [self.terrain_path],
+            [self.step_3_dir],
+            self.step_3,
+        )
+        return self.list_steps_run
+
+
+# -------------------------------------------------
+def test_unchanged_unit_skips_every_step(tmp_path):
+    unit = StubUnit(str(tmp_path))
+    assert unit.run() == ["step_1_models", "step_2_results", "step_3_terrain"]
+    assert unit.run() == []
+
+
+# -------------------------------------------------
+def test_changed_model_reruns_only_the_steps_downstream_of_it(tmp_path):
+    unit = StubUnit(str(tmp_path))
+    unit.run()
+
+    # changes model 1's step 1 output, so step 2 runs again. The terrain step does not use it.
+    unit.write_model(1, "model changed geometry")
+    assert unit.run() == ["step_1_models", "step_2_results"]
+    with open(os.path.join(unit.step_2_dir, "1.result"), "r") as result_file:
+        assert result_file.read() == "model changed.conflated.result"
+
+    # a change that step 1 drops gives the same step 1 outputs, so step 2 is skipped
+    unit.write_model(1, "model changed geometry, again")
+    assert unit.run() == ["step_1_models"]
+
+
+# -------------------------------------------------
+def test_missing_output_or_new_params_reruns_the_step(tmp_path):
+    unit = StubUnit(str(tmp_path))
+    unit.run()
+
+    os.remove(os.path.join(unit.step_3_dir, "clipped.tif"))
+    assert unit.run() == ["step_3_terrain"]
+
+    assert unit.run(dict(STEP_PARAMS, model_unit="meter")) == [
+        "step_1_models",
+        "step_2_results",
+        "step_3_terrain",
+    ]
+
+
+# -------------------------------------------------
+def test_stopped_step_is_run_again(tmp_path):
+    unit = StubUnit(str(tmp_path))
+    unit.run()
+    unit.write_model(2, "model two")
+
+    unit.fail_step = "step_2_results"
+    with pytest.raises(Exception, match="step_2_results stopped"):
+        unit.run()
+
+    # step 1 finished and saved its manifest, step 2 did not
+    unit.fail_step = None
+    assert unit.run() == ["step_2_results"]
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import x_sections_info_store as xsis
+
+
+"""
+Checks that the all_x_sections_info parquet files, and the csv files of units made before them,
+are read back as the same dataframe.
+"""
+
+
+# -------------------------------------------------
+def __create_x_sections_info(model_id, list_xs_names, num_profiles):
+    # The same layout as hecras_plan_results.fn_get_all_x_sections_info: one block of rows per
+    # profile, each indexed by the cross section's number in the profile
+    list_profiles = []
+    for profile_num in range(num_profiles):
+        list_profiles.append(
+            pd.DataFrame(
+                {
+                    "fid_xs": [f"{model_id}_{xs_name}" for xs_name in list_xs_names],
+                    "modelid": model_id,
+                    "Xsection_name": list_xs_names,
+                    "wse": np.linspace(100, 101, len(list_xs_names)) + profile_num,
+                    "discharge": np.full(len(list_xs_names), 10.5 * (profile_num + 1)),
+                    "max_depth": np.linspace(1, 2, len(list_xs_names)) + profile_num / 3,
+                    "channel_length": np.full(len(list_xs_names), 50.25),
+                }
+            )
+        )
+    return pd.concat(list_profiles)
+
+
+# -------------------------------------------------
+@pytest.mark.parametrize(
+    "list_xs_names",
+    [["5230", "4120.5", "3000"], ["5230", "4120.5*", "3000"]],
+    ids=["numbers", "interpolated"],
+)
+def test_csv_of_an_older_unit_reads_the_same_as_parquet(tmp_path, list_xs_names):
+    list_parquet_paths = []
+    for model_id, model_folder in [(1234, "1234_name"), (1235, "1235_other")]:
+        model_dir = tmp_path / model_folder
+        os.makedirs(model_dir)
+        all_x_sections_info = __create_x_sections_info(model_id, list_xs_names, 3)
+
+        str_path = xsis.fn_get_x_sections_info_path(str(model_dir), model_folder, 2)
+        xsis.fn_write_x_sections_info(all_x_sections_info, str_path)
+        # what step 5 saved before the parquet files
+        all_x_sections_info.to_csv(os.path.splitext(str_path)[0] + ".csv")
+        list_parquet_paths.append(str_path)
+
+    df_parquet = xsis.fn_read_x_sections_info(list_parquet_paths)
+    assert list(df_parquet.columns) == xsis.X_SECTIONS_INFO_SCHEMA.names
+    assert len(df_parquet) == 2 * 3 * len(list_xs_names)
+
+    # the second model only has its csv file
+    os.remove(list_parquet_paths[1])
+    df_mixed = xsis.fn_read_x_sections_info(list_parquet_paths)
+    pd.testing.assert_frame_equal(df_mixed, df_parquet)
+
+    # an older unit, with no parquet files
+    os.remove(list_parquet_paths[0])
+    df_csv = xsis.fn_read_x_sections_info(list_parquet_paths)
+    pd.testing.assert_frame_equal(df_csv, df_parquet)
+
+    list_columns = ["xs_counter", "Xsection_name", "discharge"]
+    pd.testing.assert_frame_equal(
+        xsis.fn_read_x_sections_info(list_parquet_paths, columns=list_columns), df_parquet[list_columns]
+    )
+
+
+# -------------------------------------------------
+def test_missing_parquet_and_csv_raises(tmp_path):
+    str_path = xsis.fn_get_x_sections_info_path(str(tmp_path), "1234_name", 1)
+    with pytest.raises(FileNotFoundError):
+        xsis.fn_read_x_sections_info([str_path])
@@ -1,12 +1,16 @@
 import argparse
+import math
+import multiprocessing as mp
 import os
 import sys
 import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
 
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+import psutil
 import rioxarray as rxr
 from geocube.api.core import make_geocube
 from gval.utils.loading_datasets import adjust_memory_strategy
@@ -18,6 +22,10 @@ import shared_variables as sv
 
 RLOG = sv.R2F_LOG
 
+# A new evaluation is not started while the computer has less free memory than this (in GB),
+# unless no other evaluations are running
+EVAL_MIN_AVAILABLE_MEMORY_GB = 4
+
 adjust_memory_strategy("normal")
 
 
@@ -132,6 +140,152 @@ def evaluate_unit_results(
     RLOG.lprint(f"Evaluation output files saved to {output_dir}")
 
 
+# -------------------------------------------------
+def __get_eval_result(eval_args, ex=None):
+    # The result of one evaluation in a batch. If ex (the exception) is None, it was successful.
+    # Only strings are returned as not all exceptions can be passed back from a worker process.
+    result = {
+        "unit_name": eval_args["unit_name"],
+        "output_dir": eval_args["output_dir"],
+        "error_type": None,
+        "error_msg": None,
+        "error_details": None,
+    }
+    if ex is not None:
+        result["error_type"] = type(ex).__name__
+        result["error_msg"] = str(ex)
+        result["error_details"] = "".join(traceback.format_exception(type(ex), ex, ex.__traceback__))
+    return result
+
+
+# -------------------------------------------------
+def mp_evaluate_unit_results(var_d: dict):
+    """
+    Overview:
+        The multi-proc wrapper for evaluate_unit_results. Errors are not raised, they are returned,
+        so one failed evaluation does not stop the rest of the batch.
+
+    Inputs:
+        - var_d: dictionary of
+            - eval_args: dictionary of the evaluate_unit_results arguments
+            - rlog_file_path: folder of the parent log file (empty if the parent log is not setup)
+            - log_file_prefix: prefix of this process's temp log file
+
+    Output:
+        A dictionary of unit_name, output_dir, error_type, error_msg and error_details.
+        The error values are None if the evaluation was successful.
+    """
+
+    eval_args = var_d["eval_args"]
+
+    try:
+        # evaluate_unit_results logs to RLOG. In this process, RLOG gets its own temp log file
+        # which is merged back into the parent log when the batch is done.
+        if var_d["rlog_file_path"] != "":
+            RLOG.MP_Log_setup(var_d["log_file_prefix"], var_d["rlog_file_path"])
+
+        evaluate_unit_results(**eval_args)
+
+    except Exception as ex:
+        return __get_eval_result(eval_args, ex)
+
+    return __get_eval_result(eval_args)
+
+
+# -------------------------------------------------
+def evaluate_unit_results_batch(
+    eval_args_list, num_workers=None, min_available_memory_gb=EVAL_MIN_AVAILABLE_MEMORY_GB
+):
+    """
+    Overview:
+        Runs evaluate_unit_results for each set of arguments in eval_args_list at the same time
+        using multi processing.
+
+        Evaluations are started as workers become free, but a new one is only started when the
+        computer has at least min_available_memory_gb of free memory (or nothing else is running).
+        Each evaluation loads a benchmark raster and rasterizes its inundation polygons, so running
+        too many at once can run the computer out of memory.
+
+        An evaluation that fails does not stop the others. Its error is returned in its result.
+
+    Inputs:
+        - eval_args_list: list of dictionaries of evaluate_unit_results arguments
+            (inundation_polygons, model_domain_polygons, benchmark_raster, unit_name, output_dir)
+        - num_workers: max number of evaluations run at the same time.
+            Defaults to 85% of the cpu count.
+        - min_available_memory_gb: see above.
+
+    Output:
+        A list of result dictionaries (see mp_evaluate_unit_results), in the same order as
+        eval_args_list.
+    """
+
+    num_evals = len(eval_args_list)
+    if num_evals == 0:
+        return []
+
+    if num_workers is None:
+        num_workers = round(math.floor(mp.cpu_count() * 0.85))
+    num_workers = max(1, min(num_workers, num_evals))
+
+    RLOG.lprint(f"Running {num_evals} evaluations with up to {num_workers} at a time")
+
+    log_file_prefix = "mp_evaluate_unit_results"
+    results = [None] * num_evals
+    running_futures = {}  # future: index in eval_args_list
+    next_idx = 0
+    num_done = 0
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        while num_done < num_evals:
+            # start as many evaluations as we have workers and memory for
+            while next_idx < num_evals and len(running_futures) < num_workers:
+                available_memory_gb = psutil.virtual_memory().available / (1024**3)
+                if len(running_futures) > 0 and available_memory_gb < min_available_memory_gb:
+                    RLOG.trace(
+                        f"Only {available_memory_gb:.1f} GB of memory available. Waiting for a"
+                        " running evaluation to finish before starting another"
+                    )
+                    break
+
+                var_d = {
+                    "eval_args": eval_args_list[next_idx],
+                    "rlog_file_path": RLOG.LOG_DEFAULT_FOLDER,
+                    "log_file_prefix": log_file_prefix,
+                }
+                try:
+                    future = executor.submit(mp_evaluate_unit_results, var_d)
+                    running_futures[future] = next_idx
+                except Exception as ex:
+                    # ie) the pool is broken as a worker was killed
+                    results[next_idx] = __get_eval_result(eval_args_list[next_idx], ex)
+                    num_done += 1
+                next_idx += 1
+
+            if len(running_futures) == 0:
+                continue
+
+            done_futures, __ = wait(running_futures, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                eval_idx = running_futures.pop(future)
+                try:
+                    results[eval_idx] = future.result()
+                except Exception as ex:
+                    # the evaluation errors are caught in the worker, so this is the process
+                    # itself failing (ie. out of memory)
+                    results[eval_idx] = __get_eval_result(eval_args_list[eval_idx], ex)
+                num_done += 1
+                RLOG.lprint(
+                    f"-- {num_done} of {num_evals} evaluations done ({results[eval_idx]['unit_name']})"
+                )
+
+    # Now merge the temp evaluation log files back into the parent log
+    if RLOG.LOG_FILE_PATH != "":
+        RLOG.merge_log_files(RLOG.LOG_FILE_PATH, log_file_prefix)
+
+    return results
+
+
 # -------------------------------------------------
 if __name__ == '__main__':
     """
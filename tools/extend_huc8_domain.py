@@ -8,6 +8,7 @@ import geopandas as gpd
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+import national_datasets_cache as ndc
 import shared_validators as val
 import shared_variables as sv
 from shared_functions import get_date_time_duration_msg, get_stnd_date
@@ -59,8 +60,11 @@ def fn_extend_huc8_domain(target_huc8, path_wbd_huc12s_gpkg, output_path, run_by
         # ------------
         print()
         print(" *** Stand by, this may take up to 10 mins depending on computer resources")
-        # read wbd huc12s
-        wbd_huc12s = gpd.read_file(path_wbd_huc12s_gpkg)[['geometry', 'HUC_8', 'HUC_12']]
+        # read wbd huc12s. If the WBD huc8 cache has been made (tools/preprocess_national_datasets.py),
+        # only the huc8 shards that overlap the target huc8 are read (the domain can not go past them)
+        tpl_huc8_bounds = ndc.fn_get_huc8_shard_bounds(path_wbd_huc12s_gpkg, target_huc8)
+        wbd_huc12s = ndc.fn_read_huc8_layer(path_wbd_huc12s_gpkg, bbox=tpl_huc8_bounds)
+        wbd_huc12s = wbd_huc12s[['geometry', 'HUC_8', 'HUC_12']]
 
         # make sure the huc_8 values are read as string
         wbd_huc12s['HUC_8'] = wbd_huc12s['HUC_8'].astype(str)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime as dt
+import os
+import sys
+import traceback
+
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+import national_datasets_cache as ndc
+import shared_variables as sv
+from shared_functions import get_date_time_duration_msg, get_stnd_date
+
+
+# Global Variables
+RLOG = sv.R2F_LOG
+
+
+# -------------------------------------------------
+def fn_preprocess_national_datasets(dir_datasets):
+    '''
+    Overview:
+        This is a one time (or whenever the national datasets change) preprocessing tool.
+        It creates HUC8 partitioned caches of some of the large national datasets so ras2fim
+        units only need to read the HUC8 they are working on. See src/national_datasets_cache.py.
+
+        Caches created:
+            - nwm_wbd_lookup.nc  -> nwm_wbd_lookup_huc8 folder
+            - WBD_National.gpkg  -> WBD_National_huc8 folder (GeoParquet shards)
+            - nwm_flows.gpkg     -> nwm_flows_huc8 folder (GeoParquet shards)
+
+        If a cache does not exist, ras2fim still works but reads the original national dataset.
+
+    Inputs:
+        - dir_datasets: path to the national datasets folder (ie. X-National_Datasets)
+    '''
+
+    print()
+    start_dt = dt.datetime.utcnow()
+
+    RLOG.lprint("****************************************")
+    RLOG.notice("==== Preprocess national datasets ===")
+    RLOG.lprint(f"    Started (UTC): {get_stnd_date()}")
+    RLOG.lprint(f"  --- (-n) Path to national datasets: {dir_datasets}")
+    RLOG.lprint("+-----------------------------------------------------------------+")
+
+    if os.path.exists(dir_datasets) is False:
+        raise ValueError(f"The national datasets folder of {dir_datasets} does not exist")
+
+    print()
+    print(" *** Stand by, this may take a number of minutes depending on computer resources")
+    ndc.fn_create_nwm_wbd_lookup_cache(dir_datasets)
+    ndc.fn_create_wbd_huc8_cache(dir_datasets)
+    ndc.fn_create_nwm_flows_huc8_cache(dir_datasets)
+
+    RLOG.lprint("--------------------------------------")
+    RLOG.success(f" - National datasets preprocessing complete: {get_stnd_date()}")
+    dur_msg = get_date_time_duration_msg(start_dt, dt.datetime.utcnow())
+    RLOG.lprint(dur_msg)
+    print()
+
+
+# -------------------------------------------------
+if __name__ == "__main__":
+    # Sample usage showing min args.
+    #     python preprocess_national_datasets.py
+
+    # Sample usage showing all args.
+    #     python preprocess_national_datasets.py
+    #     -n 'C:\my_ras_folder\inputs\X-National_Datasets'
+
+    parser = argparse.ArgumentParser(description="==== Preprocess national datasets ===")
+
+    parser.add_argument(
+        "-n",
+        dest="dir_datasets",
+        help="OPTIONAL: path to the national datasets folder."
+        f" Defaults to {sv.INPUT_DEFAULT_X_NATIONAL_DS_DIR}",
+        default=sv.INPUT_DEFAULT_X_NATIONAL_DS_DIR,
+        required=False,
+        metavar="",
+    )
+
+    args = vars(parser.parse_args())
+
+    log_file_folder = sv.DEFAULT_LOG_FOLDER_PATH
+    try:
+        # Catch all exceptions through the script if it came
+        # from command line.
+        # Note.. this code block is only needed here if you are calling from command line.
+        # Otherwise, the script calling one of the functions in here is assumed
+        # to have setup the logger.
+
+        # creates the log file name as the script name
+        script_file_name = os.path.basename(__file__).split('.')[0]
+        # Assumes RLOG has been added as a global var.
+        RLOG.setup(os.path.join(log_file_folder, script_file_name + ".log"))
+
+        # call main program
+        fn_preprocess_national_datasets(**args)
+
+        print(f"log files saved to {RLOG.LOG_FILE_PATH}")
+
+    except Exception:
+        RLOG.critical(traceback.format_exc())
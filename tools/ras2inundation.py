@@ -10,10 +10,10 @@ from pathlib import Path
 
 import geopandas as gpd
 import pandas as pd
-from shapely import wkt
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+import geocurve_store as gs
 import shared_variables as sv
 from shared_functions import get_date_time_duration_msg, get_date_with_milli, get_stnd_date
 
@@ -34,6 +34,12 @@ def produce_inundation_from_geocurves(geocurves_dir, flow_file, output_inundatio
             e.g. C:\ras2fim_data\inputs\X-National_Datasets\nwm21_17C_recurr_100_0_cms.csv
         - output_inundation_poly_dir:
             e.g. C:\ras2fim_data\gval\evaluations\12030106_2276_ble\230926\inundation_polys
+
+    If the geocurves_dir has a geocurve store (see src/geocurve_store.py), it is used and only
+    the geocurves for the feature ids in the flow file are loaded. If not, the geocurve csv's are used.
+
+    To inundate more than one flow file against the same geocurves, use
+    produce_inundation_from_geocurves_batch as the geocurves are then only loaded once.
     """
 
     start_dt = dt.datetime.utcnow()
@@ -56,6 +62,44 @@ def produce_inundation_from_geocurves(geocurves_dir, flow_file, output_inundatio
         RLOG.trace(f"  (-t): output inundation gkpg {output_inundation_poly}")
         RLOG.trace(f" --- Start: {dt_string} (UTC time) ")
 
+    produce_inundation_from_geocurves_batch(geocurves_dir, [(flow_file, output_inundation_poly)], verbose)
+
+    dur_msg = get_date_time_duration_msg(start_dt, dt.datetime.utcnow())
+    if verbose is True:
+        print()
+        RLOG.lprint("--------------------------------------")
+        RLOG.success(f"Process completed: {get_stnd_date()}")
+        print(f"log files saved to {RLOG.LOG_FILE_PATH}")
+        print()
+        RLOG.lprint(dur_msg)
+        print()
+    else:  # trace does trace
+        RLOG.trace(f"Process completed: {get_stnd_date()}")
+        RLOG.trace(dur_msg)
+
+
+# -------------------------------------------------
+def produce_inundation_from_geocurves_batch(geocurves_dir, flow_files_and_outputs, verbose=True):
+    r"""
+    Overview:
+        Produces inundation for many flow files against one set of RAS2FIM geocurves.
+        The flow files are all read first, then the geocurves for all of their feature ids are
+        loaded (and their geometry parsed and reprojected) just one time and shared by each
+        flow file's inundation.
+
+    Inputs:
+        - geocurves_dir: Path to directory containing RAS2FIM unit geocurves
+            e.g. C:\ras2fim_data\output_ras2fim\12030106_2276_ble_230926\final\geocurves
+        - flow_files_and_outputs: list of tuples of (flow_file, output_inundation_poly)
+            - flow_file: Discharges in CMS as a CSV file. "feature_id" and "discharge" columns
+            - output_inundation_poly: Path and file name to the output inundation gpkg
+        - verbose: if False, most messages are only written to the log file
+
+    Output:
+        A list of the output_inundation_poly paths created. If no feature ids in a flow file match
+        the geocurves, no output is created for it.
+    """
+
     # -------------------------
     # Validation
     # Check that geocurves_dir exists
@@ -63,30 +107,130 @@ def produce_inundation_from_geocurves(geocurves_dir, flow_file, output_inundatio
     if not os.path.exists(geocurves_dir):
         raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), geocurves_dir)
 
-    # check that output file name has extension of gpkg
-    if not Path(output_inundation_poly).suffix == '.gpkg':
-        raise TypeError("The output file must have gpkg extension.")
+    for flow_file, output_inundation_poly in flow_files_and_outputs:
+        # check that output file name has extension of gpkg
+        if not Path(output_inundation_poly).suffix == '.gpkg':
+            raise TypeError("The output file must have gpkg extension.")
+
+        # Check that flow file exists
+        if not os.path.exists(flow_file):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), flow_file)
+
+    # -------------------------
+    # Read all of the flow files first so we know which feature ids to load geocurves for
+    flow_file_dfs = [__read_flow_file(flow_file) for flow_file, __ in flow_files_and_outputs]
+    if len(flow_file_dfs) == 0:
+        return []
+    all_feature_ids = pd.concat([flow_file_df['feature_id'] for flow_file_df in flow_file_dfs]).unique()
+
+    if verbose is True:
+        RLOG.lprint("Compiling feature_ids info (discharge, stage, geometry) ... ")
+
+    if gs.geocurve_store_exists(geocurves_dir):
+        RLOG.lprint("Using the geocurve store to load geocurves")
+        geocurves_gdf, ras2fim_version = __load_geocurves_from_store(geocurves_dir, all_feature_ids)
+    else:
+        geocurves_gdf, ras2fim_version = __load_geocurves_from_csvs(geocurves_dir, all_feature_ids)
+
+    # -------------------------
+    created_inundation_polys = []
+    for (flow_file, output_inundation_poly), flow_file_df in zip(flow_files_and_outputs, flow_file_dfs):
+        RLOG.trace(f"Creating inundation for flow file {flow_file}")
+
+        gdf = __get_inundation_gdf(geocurves_gdf, flow_file_df)
+        if gdf is None:
+            continue
+
+        output_inundation_folder = os.path.split(output_inundation_poly)[0]
+        if not os.path.exists(output_inundation_folder):
+            os.makedirs(output_inundation_folder)
+
+        RLOG.lprint("Creating output gpkg file: " + output_inundation_poly)
+
+        # add version number before saving
+        gdf['version'] = ras2fim_version
+        gdf['process_date'] = dt.datetime.utcnow().strftime("%m/%d/%Y %H:%M")
+        gdf.to_file(output_inundation_poly, driver="GPKG")
+
+        created_inundation_polys.append(output_inundation_poly)
+
+    return created_inundation_polys
+
+
+# -------------------------------------------------
+def __read_flow_file(flow_file):
+    # Returns the flow file's feature_id (as int64) and discharge columns, one record per feature id
+
+    flow_file_df = pd.read_csv(flow_file)
+    flow_file_df['feature_id'] = pd.to_numeric(flow_file_df['feature_id'], errors='coerce')
+    flow_file_df = flow_file_df.dropna(subset=['feature_id'])
+    flow_file_df['feature_id'] = flow_file_df['feature_id'].astype('int64')
+    flow_file_df = flow_file_df.drop_duplicates(subset='feature_id', keep='last')
+
+    return flow_file_df[['feature_id', 'discharge']]
+
+
+# -------------------------------------------------
+def __get_inundation_gdf(geocurves_gdf, flow_file_df):
+    """
+    Overview:
+        Finds the inundation polygon for each flow file feature id, being the geocurve record
+        with the discharge closest to the flow file discharge.
+
+    Output:
+        A geodataframe (in sv.DEFAULT_RASTER_OUTPUT_CRS) or None if no feature ids matched.
+    """
+
+    geocurve_gdf = geocurves_gdf.merge(flow_file_df, on='feature_id', how='inner').reset_index(drop=True)
+    if len(geocurve_gdf) == 0:
+        return None
+
+    discharge_diff = geocurve_gdf["discharge_cms"].sub(geocurve_gdf["discharge"]).abs()
+    row_idxs = discharge_diff.groupby(geocurve_gdf["feature_id"]).idxmin()
+    subset_gdf = geocurve_gdf.loc[row_idxs]
+
+    gdf = gpd.GeoDataFrame(
+        {
+            "feature_id": subset_gdf["feature_id"].astype(str).to_numpy(),
+            "discharge_cms": subset_gdf["discharge"].to_numpy(),
+            "geometry": subset_gdf.geometry.to_numpy(),
+            "stage_m": subset_gdf["stage_m"].to_numpy(),
+        },
+        geometry='geometry',
+        crs=sv.DEFAULT_RASTER_OUTPUT_CRS,
+    )
 
-    # Check that flow file exists
-    if not os.path.exists(flow_file):
-        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), flow_file)
+    return gdf
 
-    output_inundation_folder = os.path.split(output_inundation_poly)[0]
-    if not os.path.exists(output_inundation_folder):
-        os.makedirs(os.path.split(output_inundation_poly)[0])
+
+# -------------------------------------------------
+def __load_geocurves_from_csvs(geocurves_dir, feature_ids):
+    """
+    Overview:
+        Loads the geocurve records for the feature ids by reading the individual geocurve csv's.
+        Only the csv's for the requested feature ids are read. Their geometry is parsed and
+        reprojected one time.
+
+    Output:
+        A tuple of a geodataframe (feature_id, discharge_cms, stage_m, geometry) in
+        sv.DEFAULT_RASTER_OUTPUT_CRS (can be empty), and the ras2fim version.
+    """
 
     # Create dictionary of available feature_id geocurve full paths.
-    geocurves_list = list(Path(geocurves_dir).glob("*curve*.csv"))
+    # (the geocurve store index csv also matches the pattern, but is not a geocurve)
+    geocurves_list = [
+        geocurve_path
+        for geocurve_path in Path(geocurves_dir).glob("*curve*.csv")
+        if geocurve_path.name != sv.R2F_OUTPUT_FILE_GEOCURVE_STORE_INDEX
+    ]
     if len(geocurves_list) == 0:
         msg = "Error: Make sure you have specified a correct directory with at least one geocurve csv file."
         RLOG.critical(msg)
         raise Exception(msg)
 
     geocurve_path_dictionary = {}
-    available_feature_id_list = []
     for geocurve_path in geocurves_list:
         feature_id = geocurve_path.name.split("_")[0]
-        available_feature_id_list.append(feature_id)
         geocurve_path_dictionary.update({feature_id: {"path": str(geocurve_path)}})
 
     RLOG.lprint("Completed creating a dictionary of available feature_ids and geocurve files.")
@@ -109,73 +253,63 @@ def produce_inundation_from_geocurves(geocurves_dir, flow_file, output_inundatio
     else:
         RLOG.warning("Failed to derive ras2fim version from geocurve files.")
 
-    # Open flow_file to detemine feature_ids to process
-    flow_file_df = pd.read_csv(flow_file)
-    flow_file_df['feature_id'] = flow_file_df['feature_id'].astype(str)
-    flow_file_df.set_index('feature_id', inplace=True)
-
-    # compile each feature id info (discharge, stage, and geometry) into a dictionary
-    if verbose is True:
-        RLOG.lprint("Compiling feature_ids info (discharge, stage, geometry) ... ")
-    feature_id_polygon_path_dict = {}
-
-    for feature_id in available_feature_id_list:
-        # Get discharge and path to geometry file
-        try:
-            # see if the a record exists for this feature id (lots won't)
-            flow_discharge_cms = flow_file_df.loc[feature_id, "discharge"]
-            geocurve_file_path = geocurve_path_dictionary[str(feature_id)]["path"]
-        except KeyError:
-            # don't log it.. there will be tons
+    # only the geocurves for the requested feature ids (lots won't have one)
+    geocurve_dfs = []
+    for feature_id in feature_ids:
+        geocurve_file_path = geocurve_path_dictionary.get(str(feature_id))
+        if geocurve_file_path is None:
             continue
 
-        # Use interpolation to find the row in geocurve_df that corresponds to the discharge_value
-        geocurve_df = pd.read_csv(geocurve_file_path)
-        row_idx = geocurve_df["discharge_cms"].sub(flow_discharge_cms).abs().idxmin()
-        subset_geocurve = geocurve_df.iloc[row_idx]
-        polygon_geometry = wkt.loads(subset_geocurve["geometry"])
-        stage_m = subset_geocurve["stage_m"]
-
-        feature_id_polygon_path_dict.update(
-            {
-                feature_id: {
-                    "discharge_cms": flow_discharge_cms,
-                    "geometry": polygon_geometry,
-                    "stage_m": stage_m,
-                }
-            }
+        geocurve_df = pd.read_csv(
+            geocurve_file_path["path"], usecols=["discharge_cms", "stage_m", "geometry"]
         )
+        geocurve_dfs.append(geocurve_df.assign(feature_id=feature_id))
 
-    if len(feature_id_polygon_path_dict) == 0:
-        return
+    if len(geocurve_dfs) == 0:
+        empty_gdf = gpd.GeoDataFrame(
+            columns=["feature_id", "discharge_cms", "stage_m", "geometry"],
+            geometry="geometry",
+            crs=sv.DEFAULT_RASTER_OUTPUT_CRS,
+        )
+        return empty_gdf, ras2fim_version
 
-    RLOG.lprint("Creating output gpkg file: " + output_inundation_poly)
-    df = pd.DataFrame.from_dict(feature_id_polygon_path_dict, orient='index').reset_index()
-    df.rename(columns={'index': 'feature_id'}, inplace=True)
-    gdf = gpd.GeoDataFrame(df, geometry='geometry', crs=features_crs)
+    geocurves_df = pd.concat(geocurve_dfs, ignore_index=True)
+    geocurves_df['feature_id'] = geocurves_df['feature_id'].astype('int64')
 
     # We know the flow files are based in 5070, so we wil make sure the geocurves are as well
     # they may not necessarily
     # Reproject the gdf to our default crs
-    gdf = gdf.to_crs(sv.DEFAULT_RASTER_OUTPUT_CRS)
+    geocurves_gdf = gpd.GeoDataFrame(
+        geocurves_df.drop(columns="geometry"),
+        geometry=gpd.GeoSeries.from_wkt(geocurves_df["geometry"], crs=features_crs),
+    ).to_crs(sv.DEFAULT_RASTER_OUTPUT_CRS)
 
-    # add version number before saving
-    gdf['version'] = ras2fim_version
-    gdf['process_date'] = dt.datetime.utcnow().strftime("%m/%d/%Y %H:%M")
-    gdf.to_file(output_inundation_poly, driver="GPKG")
+    return geocurves_gdf, ras2fim_version
 
-    dur_msg = get_date_time_duration_msg(start_dt, dt.datetime.utcnow())
-    if verbose is True:
-        print()
-        RLOG.lprint("--------------------------------------")
-        RLOG.success(f"Process completed: {get_stnd_date()}")
-        print(f"log files saved to {RLOG.LOG_FILE_PATH}")
-        print()
-        RLOG.lprint(dur_msg)
-        print()
-    else:  # trace does trace
-        RLOG.trace(f"Process completed: {get_stnd_date()}")
-        RLOG.trace(dur_msg)
+
+# -------------------------------------------------
+def __load_geocurves_from_store(geocurves_dir, feature_ids):
+    """
+    Overview:
+        Loads the geocurve records for the feature ids, reading only the geocurve store records
+        for those feature ids. The store is already in sv.DEFAULT_RASTER_OUTPUT_CRS so no
+        reprojection is needed.
+
+    Output:
+        A tuple of a geodataframe (feature_id, discharge_cms, stage_m, version, geometry) in
+        sv.DEFAULT_RASTER_OUTPUT_CRS (can be empty), and the ras2fim version (None if empty).
+    """
+
+    geocurves_gdf = gs.read_geocurve_store(
+        geocurves_dir, feature_ids, columns=["discharge_cms", "stage_m", "version"]
+    )
+
+    if len(geocurves_gdf) == 0:
+        return geocurves_gdf, None
+
+    ras2fim_version = geocurves_gdf["version"].iloc[0]
+
+    return geocurves_gdf, ras2fim_version
 
 
 # -------------------------------------------------
@@ -314,7 +314,17 @@ def __create_hydrovis_package(local_rel_folder, local_unit_folders):
 
         unit_gc_folder = os.path.join(unit_folder, sv.R2F_OUTPUT_DIR_GEOCURVES)
         if os.path.exists(unit_gc_folder):
-            shutil.copytree(unit_gc_folder, full_hv_gc_folder, dirs_exist_ok=True)
+            # The geocurve store (see src/geocurve_store.py) has the same file names in each unit,
+            # so merging the units would leave only the last unit's store. It is not copied, and
+            # the HydroVIS folder only has the geocurve csv's of all of the units.
+            shutil.copytree(
+                unit_gc_folder,
+                full_hv_gc_folder,
+                dirs_exist_ok=True,
+                ignore=shutil.ignore_patterns(
+                    sv.R2F_OUTPUT_FILE_GEOCURVE_STORE, sv.R2F_OUTPUT_FILE_GEOCURVE_STORE_INDEX
+                ),
+            )
         else:
             RLOG.warning(f"{sv.R2F_OUTPUT_DIR_GEOCURVES} folder not found for folder {unit_folder}")
 
@@ -274,7 +274,7 @@ def __process_upload(bucket_name, src_unit_dir, unit_folder_name, s3_output_path
 
         elif action == TRACKER_ACTIONS[2]:  # (overwriting_prev)
             # Overwrite the pre-existing same named folder with the incoming version.
-            # We need to delete the original folder so we don't leave junk it int.
+            # Files that are not in the incoming version are deleted so we don't leave junk in it.
             # RLOG.debug(f"action is {TRACKER_ACTIONS[2]}")
             __overwrite_s3_existing_folder(src_unit_dir, bucket_name, unit_folder_name, skip_files)
 
@@ -560,7 +560,9 @@ def __overwrite_s3_existing_folder(src_unit_dir, bucket_name, unit_folder_name,
         Maybe they loaded it yesterday, forgot they did it and are try to reload it again.
         We gave them the option to overwrite the current output_ras2fim folder just in case.
 
-        So we need to delete the existing and reload the new one (same name of course)
+        So the existing folder is synced to the new one (same name of course): files that are
+        unchanged (same size and ETag) are not uploaded again, changed and new files are uploaded,
+        then the S3 files that are not in the new unit are deleted.
     Inputs:
         - src_unit_dir: eg. c:\ras2fim_data\output_ras2fim\12030202_102739_230810
         - bucket_name: {your bucket name}
@@ -569,21 +571,20 @@ def __overwrite_s3_existing_folder(src_unit_dir, bucket_name, unit_folder_name,
     """
     s3_folder_path = f"{sv.S3_RAS_UNITS_OUTPUT_FOLDER}/{unit_folder_name}"
 
-    RLOG.notice("***  NOTE: we will delete the original directory, then upload the new unit")
+    RLOG.notice(
+        f"***  NOTE: {s3_folder_path} will be synced to the new unit. Files that are not in the new unit"
+        " will be deleted after the upload."
+    )
     print()
 
-    RLOG.lprint(f"Deleting {s3_folder_path}")
-    s3_sf.delete_s3_folder(bucket_name, s3_folder_path)
-
-    # Yes.. if it deletes but fails to upload the new one, we have a problem.
-    # TODO: maybe ?? - make a temp copy somewhere (not in archives root folder), then delete
-    #  it from the original existing path, then load the new one, then delete the temp copy.
-    # if upload fails, copy back from temp ??
-
-    RLOG.lprint(f"Uploading {src_unit_dir} to {sv.S3_RAS_UNITS_OUTPUT_FOLDER}")
-
     s3_sf.upload_folder_to_s3(
-        src_unit_dir, bucket_name, sv.S3_RAS_UNITS_OUTPUT_FOLDER, unit_folder_name, skip_files
+        src_unit_dir,
+        bucket_name,
+        sv.S3_RAS_UNITS_OUTPUT_FOLDER,
+        unit_folder_name,
+        skip_files,
+        skip_unchanged_files=True,
+        delete_removed_files=True,
     )
 
     # TRACKER_ACTIONS[2] = overwriting_prev
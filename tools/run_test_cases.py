@@ -18,7 +18,7 @@ import rioxarray.exceptions as rxe
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 import ras2inundation as ri
 import s3_shared_functions as s3_sf
-from evaluate_ras2fim_unit import evaluate_unit_results
+from evaluate_ras2fim_unit import evaluate_unit_results_batch
 
 import shared_functions as sf
 import shared_variables as sv
@@ -304,6 +304,9 @@ def __run_tests(
     code_version = models_gdf.iloc[0]["version"]
     metric_files = []
     trg_inun_file_path = trg_inun_file_path
+
+    # First, figure out all of the evaluations to be run, then run them all at the same time.
+    bench_tests = []  # one dictionary per evaluation: bench_name_details, data_details, eval_args
     for b_flow_file in bench_flow_files:
         bench_name_details = parse_bench_file_name(b_flow_file, local_benchmark_data_path)
 
@@ -344,24 +347,39 @@ def __run_tests(
             RLOG.critical(err_msg)
             raise ex
 
-        # Feb 21, 2024: For reasons unknown, when using VSCode debug,
-        # it throws exceptions for evaluate_unit_results.
-        # Fix: run it via command line, come back, temp disable this part and continue.
-        try:
-            data_details = f" inundation_poly_path is {inundation_poly_path},"
+        data_details = (
+            f" inundation_poly_path is {inundation_poly_path},"
             f" src_models_domain_extent_file is {src_models_domain_extent_file},"
             f" bench_extent_raster is {bench_extent_raster_path},"
             f" unit_folder_name is {unit_folder_name}"
+        )
 
-            evaluate_unit_results(
-                inundation_poly_path,
-                src_models_domain_extent_file,
-                bench_extent_raster_path,
-                unit_eval_name,
-                eval_output_folder,
-            )
+        bench_tests.append(
+            {
+                "bench_name_details": bench_name_details,
+                "data_details": data_details,
+                "eval_args": {
+                    "inundation_polygons": inundation_poly_path,
+                    "model_domain_polygons": src_models_domain_extent_file,
+                    "benchmark_raster": bench_extent_raster_path,
+                    "unit_name": unit_eval_name,
+                    "output_dir": eval_output_folder,
+                },
+            }
+        )
+
+    # Feb 21, 2024: For reasons unknown, when using VSCode debug,
+    # it throws exceptions for evaluate_unit_results.
+    # Fix: run it via command line, come back, temp disable this part and continue.
+    eval_results = evaluate_unit_results_batch([bench_test["eval_args"] for bench_test in bench_tests])
+
+    num_eval_errors = 0
+    for bench_test, eval_result in zip(bench_tests, eval_results):
+        bench_name_details = bench_test["bench_name_details"]
+        data_details = bench_test["data_details"]
+        eval_output_folder = eval_result["output_dir"]
 
-        except gue.RastersDontIntersect:
+        if eval_result["error_type"] == gue.RastersDontIntersect.__name__:
             RLOG.warning(
                 f"An issue occured while running gval results for {unit_folder_name};"
                 " Rasters don't spatially intersect. This will be very common with ras2fim."
@@ -369,7 +387,7 @@ def __run_tests(
             RLOG.warning(data_details)
             continue
 
-        except rxe.NoDataInBounds:
+        if eval_result["error_type"] == rxe.NoDataInBounds.__name__:
             RLOG.warning(
                 f"An issue occured while running gval results for {unit_folder_name};"
                 " No data found in bounds. This is generally acceptable"
@@ -378,16 +396,15 @@ def __run_tests(
             RLOG.warning(data_details)
             continue
 
-        except Exception as ex:
-            # re-raise but check if it is includes phrase 'Rasters don't spatially intersect'
+        if eval_result["error_type"] is not None:
+            # check if it is includes phrase 'Rasters don't spatially intersect'
             # so we can give a better error message.
-            # Add context data and RLOG.
 
             # Some error messages coming from eval will say No data found in bounds.
             # This is an acceptable and semi common error. It just means there are not
             # any models that are fitting in the benchmark boundaries.
             # We will just log them and continue
-            if "Rasters don't spatially intersec" in ex.args[0]:
+            if "Rasters don't spatially intersec" in eval_result["error_msg"]:
                 RLOG.warning(
                     f"An issue occured while running gval results for {unit_folder_name};"
                     " The rasters don't spatially interset. This is generally acceptable"
@@ -396,9 +413,12 @@ def __run_tests(
                 RLOG.warning(data_details)
                 continue
 
+            # Log it and keep going with the rest of the benchmarks. If they all fail, we stop below.
             RLOG.critical(f"An error occured while running gval results for {unit_folder_name};")
             RLOG.critical(data_details)
-            raise ex
+            RLOG.critical(eval_result["error_details"])
+            num_eval_errors += 1
+            continue
 
         # before coping around and merging HUC / GVAL results, pull the "version" column
         # from models_domain (dissoved)
@@ -459,6 +479,9 @@ def __run_tests(
 
         metric_files.append(metrics_file_path)
 
+    if num_eval_errors > 0 and num_eval_errors == len(bench_tests):
+        raise Exception(f"All gval evaluations for {unit_folder_name} failed. See the log for details.")
+
     return metric_files
 
 
@@ -666,6 +689,10 @@ def inundate_files(flow_files, src_geocurves_path, trg_inun_file_path, local_ben
     # inundation files.
     inundation_files = []
 
+    # (bench_file, trg_file_path) for each benchmark file, all inundated in one batch so the
+    # geocurves are only loaded one time.
+    bench_files_and_outputs = []
+
     for bench_file in flow_files:
         # the key is that it is sort.
         # Figure out adjusted path
@@ -678,7 +705,6 @@ def inundate_files(flow_files, src_geocurves_path, trg_inun_file_path, local_ben
         # a dictionary
         bench_name_details = parse_bench_file_name(bench_file, local_benchmark_data_path)
 
-        print()
         RLOG.notice(
             "----- Inundating files for benchmark source :"
             f" {bench_name_details['source']} - {bench_name_details['magnitude']} ---------"
@@ -693,11 +719,13 @@ def inundate_files(flow_files, src_geocurves_path, trg_inun_file_path, local_ben
         # inun_file_name = inun_file_name.replace(strip_pattern, "")
         trg_file_path = os.path.join(trg_inun_file_path, inun_file_name)
 
-        print(f"... Inundation Starting for : {bench_file}")
-        # it will display/log errors and critical errors
-        ri.produce_inundation_from_geocurves(src_geocurves_path, bench_file, trg_file_path, False)
-        # print(f"... Inundation Complete : {b_file}")
+        bench_files_and_outputs.append((bench_file, trg_file_path))
+
+    print(f"... Inundation Starting for {len(bench_files_and_outputs)} benchmark files")
+    # it will display/log errors and critical errors
+    ri.produce_inundation_from_geocurves_batch(src_geocurves_path, bench_files_and_outputs, False)
 
+    for bench_file, trg_file_path in bench_files_and_outputs:
         # we need to assume it did inundate if applicable
         # Not all will inundate depending if it found matching features in the flow files.
         # Some batches are two small to find matching features.
@@ -706,7 +734,7 @@ def inundate_files(flow_files, src_geocurves_path, trg_inun_file_path, local_ben
         else:
             print()
             RLOG.warning(
-                f"An inundation file was not created for {inun_file_name}. One possiblity is"
+                f"An inundation file was not created for {os.path.basename(trg_file_path)}. One possiblity is"
                 " that could be a result of a small number of unit output rating curves."
                 " This is not necessarily a concern."
             )
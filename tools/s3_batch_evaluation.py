@@ -8,7 +8,7 @@ from glob import glob
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 import s3_shared_functions as s3_sf
-from evaluate_ras2fim_unit import evaluate_unit_results
+from evaluate_ras2fim_unit import evaluate_unit_results_batch
 
 import shared_functions as sf
 import shared_variables as sv
@@ -364,10 +364,18 @@ def run_batch_evaluations(
                                 )
                             print()
 
-    # Run ras2fim model evaluation
-    for kwargs in eval_args:
-        # RLOG.lprint(f"Processing evaluation for ras2fim output unit {kwargs['unit_name']}")
-        evaluate_unit_results(**kwargs)
+    # Run ras2fim model evaluations, all at the same time.
+    # An evaluation that fails is logged and does not stop the rest.
+    eval_results = evaluate_unit_results_batch(eval_args)
+    failed_results = [result for result in eval_results if result["error_type"] is not None]
+    for result in failed_results:
+        RLOG.error(f"An error occured while running the evaluation for {result['unit_name']}")
+        RLOG.error(result["error_details"])
+
+    if len(failed_results) > 0:
+        RLOG.warning(
+            f"{len(failed_results)} of {len(eval_results)} evaluations failed. See the log for details."
+        )
 
     if not eval_args:
         RLOG.warning("No valid combinations found, check inputs and try again.")
@@ -2,6 +2,8 @@
 
 import datetime as dt
 import fnmatch
+import hashlib
+import math
 import os
 import sys
 import traceback
@@ -10,9 +12,11 @@ from datetime import datetime
 from functools import partial
 
 import boto3
+import botocore.config
 import botocore.exceptions
 import colored as cl
 import tqdm
+from boto3.s3.transfer import TransferConfig
 from botocore.client import ClientError
 
 
@@ -24,6 +28,95 @@ from shared_functions import get_date_time_duration_msg
 # Global Variables
 RLOG = sv.R2F_LOG
 
+# Files at or over the multipart threshold (mostly rasters and HEC-RAS hdf's) are uploaded and
+# downloaded in parts, with a number of parts going at the same time.
+S3_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+S3_MULTIPART_CHUNKSIZE = 64 * 1024 * 1024
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD, multipart_chunksize=S3_MULTIPART_CHUNKSIZE, max_concurrency=8
+)
+
+# boto3's default part size. Files uploaded before S3_TRANSFER_CONFIG was used have parts of this size.
+S3_DEFAULT_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+
+# Each file thread can have a number of part threads, so the client needs a bigger connection pool.
+S3_MAX_POOL_CONNECTIONS = 50
+
+HASH_READ_BLOCK_SIZE = 1024 * 1024 * 8
+
+
+# -------------------------------------------------
+def get_s3_client():
+    # A s3 client that can be shared by many threads (ie. multipart transfers in file threads)
+    return boto3.client("s3", config=botocore.config.Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS))
+
+
+# -------------------------------------------------
+def calc_local_etag(file_path, part_size=None):
+    """
+    Overview:
+        Calculates the ETag S3 gives a file when it is uploaded (unencrypted or SSE-S3).
+        For a file uploaded in one part, it is the md5 of the file.
+        For a file uploaded in parts, it is the md5 of all of the parts' md5's, followed by
+        a dash and the number of parts. ie) 3858f62230ac3c915f300c664312c11f-9
+
+    Inputs:
+        - file_path: local file path
+        - part_size: the part size (bytes) the file was uploaded with. If None, it is calculated as
+            a one part upload.
+    """
+
+    if part_size is None:
+        file_hash = hashlib.md5()
+        with open(file_path, "rb") as local_file:
+            for block in iter(lambda: local_file.read(HASH_READ_BLOCK_SIZE), b""):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+
+    part_digests = []
+    with open(file_path, "rb") as local_file:
+        for part in iter(lambda: local_file.read(part_size), b""):
+            part_digests.append(hashlib.md5(part).digest())
+
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+# -------------------------------------------------
+def is_local_file_same_as_s3(file_path, s3_size, s3_etag):
+    """
+    Overview:
+        Checks if a local file has the same contents as a S3 file, using the S3 file's size and ETag
+        (see get_file_list). The size is checked first, so the local file is only read if it is
+        the same size.
+
+        A multipart ETag does not say what part size was used, so the local ETag is calculated with
+        the part sizes we upload with (S3_MULTIPART_CHUNKSIZE and boto3's default), using the one
+        that gives the same number of parts.
+
+    Output:
+        True if they match. False if they don't or the local file does not exist.
+    """
+
+    if os.path.isfile(file_path) is False:
+        return False
+
+    file_size = os.path.getsize(file_path)
+    if file_size != s3_size:
+        return False
+
+    s3_etag = s3_etag.strip('"')
+
+    if "-" not in s3_etag:
+        return calc_local_etag(file_path) == s3_etag
+
+    num_s3_parts = int(s3_etag.split("-")[1])
+    for part_size in [S3_MULTIPART_CHUNKSIZE, S3_DEFAULT_MULTIPART_CHUNKSIZE]:
+        if math.ceil(file_size / part_size) == num_s3_parts:
+            if calc_local_etag(file_path, part_size) == s3_etag:
+                return True
+
+    return False
+
 
 # -------------------------------------------------
 def upload_file_to_s3(src_path, full_s3_path_and_file_name):
@@ -60,7 +153,7 @@ def upload_file_to_s3(src_path, full_s3_path_and_file_name):
         client = boto3.client("s3")
 
         with open(src_path, "rb"):
-            client.upload_file(src_path, bucket_name, s3_key_path)
+            client.upload_file(src_path, bucket_name, s3_key_path, Config=S3_TRANSFER_CONFIG)
 
     except botocore.exceptions.NoCredentialsError:
         RLOG.critical("-----------------")
@@ -78,7 +171,25 @@ def upload_file_to_s3(src_path, full_s3_path_and_file_name):
 
 
 # -------------------------------------------------
-def upload_folder_to_s3(src_path, bucket_name, s3_folder_path, unit_folder_name, skip_files=[]):
+def __delete_s3_keys(s3_client, bucket_name, list_keys):
+    # Deletes S3 files (by key), up to 1000 per request (the delete_objects max)
+    for start_idx in range(0, len(list_keys), 1000):
+        objects = [{"Key": key} for key in list_keys[start_idx : start_idx + 1000]]
+        response = s3_client.delete_objects(Bucket=bucket_name, Delete={"Objects": objects, "Quiet": True})
+        for error in response.get("Errors", []):
+            RLOG.error(f"Unable to delete s3://{bucket_name}/{error['Key']} : {error['Message']}")
+
+
+# -------------------------------------------------
+def upload_folder_to_s3(
+    src_path,
+    bucket_name,
+    s3_folder_path,
+    unit_folder_name,
+    skip_files=[],
+    skip_unchanged_files=True,
+    delete_removed_files=False,
+):
     """
     Input
         - src_path: e.g c:\ras2fim_data\output_ras2fim\12030202_102739_230810
@@ -86,6 +197,11 @@ def upload_folder_to_s3(src_path, bucket_name, s3_folder_path, unit_folder_name,
         - s3_folder_path: e.g.  output_ras2fim or output_ras2fim_archive
         - unit_folder_name:  12030105_2276_230810 (slash stripped off the end)
         - skip_files: files we don't want uploaded. (fully pathed)
+        - skip_unchanged_files: If True, files already in the S3 folder with the same size and
+            ETag (same contents) are not uploaded again.
+        - delete_removed_files: If True, files in the S3 folder that are not in the src folder (or
+            are in skip_files) are deleted after the upload, so the S3 folder ends up the same as
+            the src folder. If False, they are left as is.
 
     Notes:
         - if the file names starts with three underscores, it will not be uploaded to S3.
@@ -101,13 +217,27 @@ def upload_folder_to_s3(src_path, bucket_name, s3_folder_path, unit_folder_name,
     RLOG.notice("Hang in there. This can take between 2 to 10 mins depending on folder size")
 
     # nested function
-    def __upload_file(s3_client, bucket_name, src_file_path, target_file_path):
+    def __upload_file(s3_client, bucket_name, src_file_path, target_file_path, s3_file_details):
+        # returns False if the file was not uploaded as it is unchanged
+        if s3_file_details is not None and is_local_file_same_as_s3(
+            src_file_path, s3_file_details["size"], s3_file_details["etag"]
+        ):
+            return False
+
         with open(src_file_path, "rb"):
             # s3.Bucket(bucket_name).put_object(Key=s3_key_path, Body=data)
-            s3_client.upload_file(src_file_path, bucket_name, target_file_path)
+            s3_client.upload_file(src_file_path, bucket_name, target_file_path, Config=S3_TRANSFER_CONFIG)
+        return True
 
     try:
-        client = boto3.client("s3")
+        client = get_s3_client()
+
+        # the files already in the s3 folder (by key) with their sizes and etags
+        s3_existing_files = {}
+        if (skip_unchanged_files is True) or (delete_removed_files is True):
+            s3_unit_folder_path = f"{s3_folder_path}/{unit_folder_name}"
+            for s3_item in get_file_list(bucket_name, s3_unit_folder_path):
+                s3_existing_files[f"{s3_unit_folder_path}/{s3_item['key']}"] = s3_item
 
         s3_files = []  # a list of dictionaries (src file path, targ file path)
 
@@ -136,6 +266,9 @@ def upload_folder_to_s3(src_path, bucket_name, s3_folder_path, unit_folder_name,
                     'bucket_name': bucket_name,
                     'src_file_path': src_file_path,
                     'target_file_path': s3_key_path,
+                    's3_file_details': s3_existing_files.get(s3_key_path)
+                    if skip_unchanged_files is True
+                    else None,
                 }
                 # adds a dict to the list
                 s3_files.append(item)
@@ -147,14 +280,19 @@ def upload_folder_to_s3(src_path, bucket_name, s3_folder_path, unit_folder_name,
         # As we are threading, we can add more than one thread per proc, but for calc purposes
         # and to not overload the systems or internet pipe, so it is hardcoded at max of 20 for now.
         num_workers = 20
-        total_cpus_available = os.cpu_count() - 2
+        total_cpus_available = max(1, os.cpu_count() - 2)
         if total_cpus_available < num_workers:
             num_workers = total_cpus_available
 
         RLOG.lprint(f"Number of files to be uploaded is {len(s3_files)}")
         print(" ... This may take a few minutes, stand by")
         RLOG.lprint(f" ... Uploading with {num_workers} workers")
+        if skip_unchanged_files is True:
+            RLOG.lprint(
+                f" ... {len(s3_existing_files)} files are already in S3. Unchanged files will be skipped"
+            )
 
+        num_skipped = 0
         with tqdm.tqdm(total=len(s3_files)) as pbar:
             with futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
                 executor_dict = {}
@@ -176,11 +314,22 @@ def upload_folder_to_s3(src_path, bucket_name, s3_folder_path, unit_folder_name,
                             RLOG.error(future_exception)
                             # raise future_exception
                             # supress error
+                        elif future_result.result() is False:
+                            num_skipped += 1
                     pbar.update(1)
 
+        if skip_unchanged_files is True:
+            RLOG.lprint(f" ... {num_skipped} unchanged files were not uploaded again")
         RLOG.lprint(" ... Uploading complete")
         print()
 
+        if delete_removed_files is True:
+            # only after the upload, so a failed upload does not leave the S3 folder half empty
+            uploaded_keys = set(upload_file_args['target_file_path'] for upload_file_args in s3_files)
+            removed_keys = sorted(set(s3_existing_files.keys()) - uploaded_keys)
+            RLOG.lprint(f" ... Deleting {len(removed_keys)} S3 files that are no longer in {src_path}")
+            __delete_s3_keys(client, bucket_name, removed_keys)
+
     except botocore.exceptions.NoCredentialsError:
         print("-----------------")
         RLOG.critical(
@@ -249,7 +398,7 @@ def delete_s3_folder(bucket_name, s3_folder_path):
         # As we are threading, we can add more than one thread per proc, but for calc purposes
         # and to not overload the systems or internet pipe, so it is hardcoded at max of 20 for now.
         num_workers = 20
-        total_cpus_available = os.cpu_count() - 2
+        total_cpus_available = max(1, os.cpu_count() - 2)
         if total_cpus_available < num_workers:
             num_workers = total_cpus_available
 
@@ -362,7 +511,7 @@ def move_s3_folder_in_bucket(bucket_name, s3_src_folder_path, s3_target_folder_p
         # As we are threading, we can add more than one thread per proc, but for calc purposes
         # and to not overload the systems or internet pipe, so it is hardcoded at max of 20 for now.
         num_workers = 20
-        total_cpus_available = os.cpu_count() - 2
+        total_cpus_available = max(1, os.cpu_count() - 2)
         if total_cpus_available < num_workers:
             num_workers = total_cpus_available
 
@@ -577,8 +726,9 @@ def download_single_folder(
         RLOG.lprint(f"Downloading files/folders from  {full_src_path}")
 
     try:
-        s3_client = boto3.client('s3')
+        s3_client = get_s3_client()
         num_fails = 0
+        num_skipped = 0
 
         download_args = []
         use_multi_thread = num_of_workers != 1
@@ -592,10 +742,13 @@ def download_single_folder(
                 "s3_file": src_file,
                 "trg_file": trg_file,
                 "s3_client": s3_client,
+                "s3_size": s3_item["size"],
+                "s3_etag": s3_item["etag"],
             }
             if use_multi_thread is False:  # no MT here, just serially
                 try:
-                    download_one_file(**args)
+                    if download_one_file(**args) is False:
+                        num_skipped += 1
                 except Exception:
                     # assumes download_one_file logged it
                     num_fails = +1
@@ -626,8 +779,13 @@ def download_single_folder(
                                 RLOG.error(future_exception)
                                 # raise future_exception
                                 # supress error
+                            elif future_result.result() is False:
+                                num_skipped += 1
                         pbar.update(1)
 
+        if num_skipped > 0:
+            RLOG.lprint(f"--- {num_skipped} files were already downloaded and unchanged, so were skipped")
+
         if is_verbose:
             RLOG.notice(
                 f"--- Download complete from {full_src_path}\n"
@@ -739,7 +897,14 @@ def download_files_from_list(bucket_name, lst_files, is_verbose):
 
 
 # -------------------------------------------------
-def download_one_file(bucket_name: str, s3_file: str, trg_file: str, s3_client: boto3 = None):
+def download_one_file(
+    bucket_name: str,
+    s3_file: str,
+    trg_file: str,
+    s3_client: boto3 = None,
+    s3_size: int = None,
+    s3_etag: str = None,
+):
     """
     Download a single file from S3
     Args:
@@ -748,8 +913,18 @@ def download_one_file(bucket_name: str, s3_file: str, trg_file: str, s3_client:
             e.g. output_ras2fim/12030101_2276_ble_230925/myfile.txt
         trg_file (str):
         s3_client (boto3.client):
+        s3_size (int): OPTIONAL: size of the S3 file (see get_file_list)
+        s3_etag (str): OPTIONAL: ETag of the S3 file (see get_file_list)
+            If the size and etag are given and the trg_file already has the same contents,
+            it is not downloaded again.
+    Returns:
+        False if the file was not downloaded as it is unchanged, otherwise True
     """
     try:
+        if s3_size is not None and s3_etag is not None:
+            if is_local_file_same_as_s3(trg_file, s3_size, s3_etag):
+                return False
+
         # Why extract the directory name? the key might have subfolder
         # names right in the key
         # print(f"... trg_file is {trg_file}")
@@ -770,7 +945,9 @@ def download_one_file(bucket_name: str, s3_file: str, trg_file: str, s3_client:
             s3_client = boto3.client('s3')
 
         with open(trg_file, 'wb') as f:
-            s3_client.download_fileobj(Bucket=bucket_name, Key=s3_file, Fileobj=f)
+            s3_client.download_fileobj(Bucket=bucket_name, Key=s3_file, Fileobj=f, Config=S3_TRANSFER_CONFIG)
+
+        return True
 
     except Exception:
         # we need context to this.
@@ -796,6 +973,8 @@ def get_file_list(bucket_name, s3_src_folder_path, search_key="", is_verbose=Fal
                     ie) 1262811_UNT 213 in Village Cr Washd_g01_1689773310/UNT 213 in Village Cr Washd.r01
             - The second value is the full "url" of it
                 ie) s3://ras2fim-dev/OWP_ras_models/models-12030105-full/1262811_UNT...r01
+            - "size": file size in bytes
+            - "etag": the S3 ETag of the file (quotes stripped)
     """
 
     # Examples:
@@ -852,11 +1031,13 @@ def get_file_list(bucket_name, s3_src_folder_path, search_key="", is_verbose=Fal
             for result in contents:
                 key = result.get("Key")
                 key_adj = key.replace(s3_src_folder_path, "")
-                if search_key == "":
-                    item = {"key": key_adj, "url": f"s3://{bucket_name}/{s3_src_folder_path}{key_adj}"}
-                    s3_items.append(item)
-                elif fnmatch.fnmatch(key_adj, search_key) is True:
-                    item = {"key": key_adj, "url": f"s3://{bucket_name}/{s3_src_folder_path}{key_adj}"}
+                if search_key == "" or fnmatch.fnmatch(key_adj, search_key) is True:
+                    item = {
+                        "key": key_adj,
+                        "url": f"s3://{bucket_name}/{s3_src_folder_path}{key_adj}",
+                        "size": result.get("Size"),
+                        "etag": result.get("ETag", "").strip('"'),
+                    }
                     s3_items.append(item)
                 # no else needed
 